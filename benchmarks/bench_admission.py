@@ -0,0 +1,116 @@
+"""
+Parses large synthetic compounds with and without a memory budget, reporting the time
+taken and the peak RSS of skid and it's workers (sampled from /proc)
+
+Usage:
+    bench_admission.py [--files <n>] [--size <mb>] [--processes <n>] [--budget <size>]
+
+Options:
+    --files=<n>         Number of compounds (default: 16)
+    --size=<mb>         Size of each compound in MB (default: 20)
+    --processes=<n>     Worker processes (default: 8)
+    --budget=<size>     Memory budget (default: 1G)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import tempfile
+import threading
+from typing import Dict, List
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.doxygen import find_structs
+from skid.utils import admission
+
+CODELINE = (
+    '<codeline lineno="{0}"><highlight class="normal">static<sp/>int<sp/>value_{0}<sp/>=<sp/>'
+    "{0};</highlight></codeline>\n"
+)
+
+
+def write_compounds(directory: str, files: int, size: int) -> List[str]:
+    """ Compounds made of program listing lines, the bulk of a real compound """
+    locations = list()
+    for i in range(files):
+        location = os.path.join(directory, f"compound_{i}.xml")
+        with open(location, "w") as xml_f:
+            xml_f.write('<?xml version="1.0"?>\n<doxygen><compounddef><programlisting>\n')
+            line = 0
+            while xml_f.tell() < size:
+                xml_f.write(CODELINE.format(line))
+                line += 1
+            xml_f.write("</programlisting></compounddef></doxygen>\n")
+        locations.append(location)
+    return locations
+
+
+def tree_rss(pid: int) -> int:
+    """ The RSS of a process and it's children in bytes """
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/statm") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+def peak_rss_of(func) -> int:
+    """ Runs func while sampling the RSS of this process tree, returns the peak """
+    peak = [0]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.01):
+            peak[0] = max(peak[0], tree_rss(os.getpid()))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        func()
+    finally:
+        stop.set()
+        sampler.join()
+    return peak[0]
+
+
+def main(args):
+    setup_logging()
+    files = int(args["--files"] or 16)
+    size = int(args["--size"] or 20) << 20
+    processes = int(args["--processes"] or 8)
+    budget = admission.parse_size(args["--budget"] or "1G")
+
+    timings: Dict[str, float] = dict()
+    peaks: Dict[str, int] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = tuple(write_compounds(directory, files, size))
+        for name, limit in (("unlimited", 1 << 50), (f"budget {budget >> 20} MB", budget)):
+            admission.set_budget(limit)
+
+            def parse():
+                list(find_structs.iter_fileop_structs_by_file(xml_files, processes))
+
+            with timed(timings, name):
+                peaks[name] = peak_rss_of(parse)
+        admission.set_budget(None)
+
+    report(f"Parsing {files} x {size >> 20} MB compounds with {processes} processes", timings)
+    print("")
+    for name, peak in peaks.items():
+        print(f"{name:<40} {peak >> 20:>8} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,87 @@
+"""
+Compares generating ioctl argument buffers one at a time with struct.pack against the
+numpy batches of skid.fuzzer.arguments, using the layout of struct watchdog_info
+
+Usage:
+    bench_arguments.py [--count <n>] [--batch <n>]
+
+Options:
+    --count=<n>     Number of argument buffers to generate (default: 200000)
+    --batch=<n>     Buffers per numpy batch (default: 4096)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import random
+import struct
+
+import numpy as np  # type: ignore
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.fuzzer import arguments
+from skid.interface_recovery.ioctl import evaluator
+from skid.interface_recovery.ioctl.layouts import Member
+
+WATCHDOG_INFO = struct.Struct("<II32s")
+
+
+def watchdog_consts() -> evaluator.ConstantEvaluator:
+    table = evaluator.ConstantTable()
+    table.records["watchdog_info"] = evaluator.Record(
+        "struct",
+        (
+            Member("options", "__u32"),
+            Member("firmware_version", "__u32"),
+            Member("identity", "__u8", ("32",)),
+        ),
+    )
+    return evaluator.ConstantEvaluator(table)
+
+
+def scalar_value(boundaries, bits: int) -> int:
+    """ The same boundary or random choice the numpy generator makes, for one value """
+    if random.random() < arguments.BOUNDARY_RATE:
+        return random.choice(boundaries)
+    return random.getrandbits(bits)
+
+
+def generate_with_struct(count: int) -> int:
+    u32 = [int(value) for value in arguments.boundary_values(np.dtype("<u4"))]
+    u8 = [int(value) for value in arguments.boundary_values(np.dtype("u1"))]
+    total = 0
+    for _ in range(count):
+        identity = bytes(scalar_value(u8, 8) for _ in range(32))
+        buffer = WATCHDOG_INFO.pack(scalar_value(u32, 32), scalar_value(u32, 32), identity)
+        total += len(buffer)
+    return total
+
+
+def generate_with_numpy(count: int, batch_size: int) -> int:
+    generator = arguments.ArgumentGenerator("struct watchdog_info", watchdog_consts())
+    total = 0
+    while count > 0:
+        batch = generator.generate(min(batch_size, count))
+        for i in range(len(batch)):
+            total += batch[i].nbytes
+        count -= len(batch)
+    return total
+
+
+def main(args):
+    setup_logging()
+    count = int(args["--count"] or 200000)
+    batch_size = int(args["--batch"] or 4096)
+    results = dict()
+    with timed(results, "struct.pack per buffer"):
+        generate_with_struct(count)
+    with timed(results, f"numpy batches of {batch_size}"):
+        generate_with_numpy(count, batch_size)
+    report(f"Generating {count} struct watchdog_info buffers", results)
+    for name, seconds in results.items():
+        print(f"{name:<40} {count / seconds:>10.0f}/s")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
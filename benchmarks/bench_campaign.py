@@ -0,0 +1,108 @@
+"""
+Compares splitting a campaign's calls across handlers evenly, by the static score of
+each handler (see fuzzer.campaign) and by the score adjusted toward the handlers that
+keep producing new outcomes
+
+Each stand-in handler has a number of reachable outcomes that grows with it's size,
+every call reaches one of them with the rarer ones harder to hit (a Zipf distribution).
+Some large handlers are shallow (mostly a table of trivial getters) so the static score
+overrates them, the report is the number of distinct outcomes found:
+
+    even        every handler gets the same share
+    static      shares follow the scores
+    adaptive    shares start from the scores and follow the yield of new outcomes
+
+Usage:
+    bench_campaign.py [--handlers <n>] [--budget <n>] [--slice <n>] [--seed <n>]
+
+Options:
+    --handlers=<n>      Number of stand-in handlers (default: 200)
+    --budget=<n>        Total calls across the campaign (default: 1000000)
+    --slice=<n>         Calls split across the handlers per round (default: 20000)
+    --seed=<n>          Random seed (default: 0)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+from typing import Dict, List, NamedTuple
+
+import numpy as np  # type: ignore
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.fuzzer import campaign
+from skid.fuzzer.campaign import HandlerFeatures
+
+# Fraction of the handlers that are large but have few outcomes
+SHALLOW_RATE = 0.2
+
+
+class Handler(NamedTuple):
+    features: HandlerFeatures
+    outcomes: int
+
+
+def stand_in_handlers(count: int, rng: np.random.Generator) -> List[Handler]:
+    handlers = list()
+    for _ in range(count):
+        lines = int(rng.lognormal(4, 1.2)) + 5
+        commands = max(1, int(lines / rng.uniform(8, 30)))
+        features = HandlerFeatures(
+            lines=lines,
+            callees=int(lines / rng.uniform(3, 10)),
+            copies=int(commands * rng.uniform(0, 1)),
+            commands=commands,
+        )
+        outcomes = commands * 2 + int(lines * rng.uniform(0.2, 1))
+        if rng.random() < SHALLOW_RATE:
+            outcomes = commands + 1
+        handlers.append(Handler(features, outcomes))
+    return handlers
+
+
+def run(strategy: str, handlers: List[Handler], args: Dict) -> int:
+    rng = np.random.default_rng(args["seed"])
+    targets = [str(i) for i in range(len(handlers))]
+    if strategy == "even":
+        scores = [1.0] * len(handlers)
+    else:
+        scores = [campaign.score(handler.features) for handler in handlers]
+    scheduler = campaign.CampaignScheduler(
+        targets, scores, adapt_rate=campaign.ADAPT_RATE if strategy == "adaptive" else 0
+    )
+
+    for _ in range(args["budget"] // args["slice"]):
+        for target, calls in scheduler.allocate(args["slice"]).items():
+            outcomes = handlers[int(target)].outcomes
+            reached = rng.zipf(1.5, size=calls) - 1
+            scheduler.record(target, reached[reached < outcomes].tolist(), calls)
+    return int(scheduler.discovered.sum())
+
+
+def main(args):
+    setup_logging()
+    options = {
+        "handlers": int(args["--handlers"] or 200),
+        "budget": int(args["--budget"] or 1000000),
+        "slice": int(args["--slice"] or 20000),
+        "seed": int(args["--seed"] or 0),
+    }
+    handlers = stand_in_handlers(options["handlers"], np.random.default_rng(options["seed"]))
+    reachable = sum(handler.outcomes for handler in handlers)
+
+    timings: Dict[str, float] = dict()
+    results = dict()
+    for strategy in ("even", "static", "adaptive"):
+        with timed(timings, strategy):
+            results[strategy] = run(strategy, handlers, options)
+    report(f"{options['budget']} calls across {options['handlers']} handlers", timings)
+
+    print("")
+    print(f"{'strategy':<20} {'outcomes found':>16} {'of reachable':>14}")
+    for strategy, found in results.items():
+        print(f"{strategy:<20} {found:>16} {found / reachable:>14.3f}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
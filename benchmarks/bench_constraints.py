@@ -0,0 +1,156 @@
+"""
+Compares how many generated arguments get past the checks of a stand-in handler with
+and without the constraints found in it's body (see doxygen.find_constraints):
+
+    case FOO_SUBMIT:
+        if (copy_from_user(&req, argp, sizeof(req)))
+            return -EFAULT;
+        if (req.magic != REQ_MAGIC || req.flags & ~REQ_FLAGS)
+            return -EINVAL;
+        if (req.len > FOO_MAX_LEN)
+            return -EINVAL;
+        switch (req.type) { case REQ_READ: case REQ_WRITE: ... default: return -EINVAL; }
+
+Then times finding the constraints of the example handler in copies of the example
+compound without the cache and again with the cache from a first run. The files are
+still read and the callees found to compute the key, the cache saves the analysis
+
+Usage:
+    bench_constraints.py [--count <n>] [--copies <n>] [--seed <n>]
+
+Options:
+    --count=<n>         Arguments generated with each generator (default: 100000)
+    --copies=<n>        Copies of the example compound (default: 100)
+    --seed=<n>          Random seed (default: 0)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict
+
+import numpy as np  # type: ignore
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.fuzzer import arguments
+from skid.interface_recovery.doxygen import find_constraints
+from skid.interface_recovery.ioctl import evaluator, request
+from skid.interface_recovery.ioctl.evaluator import Macro, Record
+from skid.interface_recovery.ioctl.layouts import Member
+
+COMPOUND = "tests/resources/example_c_file.xml"
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+HANDLER = """
+static long foo_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+    void __user *argp = (void __user *)arg;
+    struct foo_req req;
+
+    switch (cmd) {
+    case FOO_SUBMIT:
+        if (copy_from_user(&req, argp, sizeof(req)))
+            return -EFAULT;
+        if (req.magic != REQ_MAGIC || req.flags & ~REQ_FLAGS)
+            return -EINVAL;
+        if (req.len > FOO_MAX_LEN)
+            return -EINVAL;
+        switch (req.type) {
+        case REQ_READ:
+        case REQ_WRITE:
+            return 0;
+        default:
+            return -EINVAL;
+        }
+    }
+    return -ENOTTY;
+}
+"""
+
+MACROS = {"REQ_MAGIC": "0xf00dcafe", "REQ_FLAGS": "0x7", "FOO_MAX_LEN": "4096"}
+MACROS.update({"REQ_READ": "1", "REQ_WRITE": "2"})
+
+
+def constant_evaluator() -> evaluator.ConstantEvaluator:
+    table = evaluator.ConstantTable()
+    for name, value in MACROS.items():
+        table.macros[name] = Macro(name, None, value)
+    table.records["foo_req"] = Record(
+        "struct",
+        (
+            Member("magic", "__u32"),
+            Member("flags", "__u32"),
+            Member("len", "__u32"),
+            Member("type", "__u16"),
+        ),
+    )
+    return evaluator.ConstantEvaluator(table)
+
+
+def passed(array: np.ndarray) -> Dict[str, float]:
+    """ The fraction of the arguments that get past each check of the handler """
+    checks = array["magic"] == int(MACROS["REQ_MAGIC"], 16)
+    checks &= (array["flags"] & ~np.uint32(int(MACROS["REQ_FLAGS"], 16))) == 0
+    results = {"magic and flags": float(np.mean(checks))}
+    checks &= array["len"] <= int(MACROS["FOO_MAX_LEN"])
+    results["and length"] = float(np.mean(checks))
+    checks &= np.isin(array["type"], (1, 2))
+    results["and type (returns 0)"] = float(np.mean(checks))
+    return results
+
+
+def extract_all(xml_files, cache_loc) -> None:
+    for xml_file in xml_files:
+        if cache_loc is None:
+            # The copies are the same handler, forget it so each copy is analysed
+            find_constraints.configure(None)
+        assert len(find_constraints.find_constraints_in_file((xml_file, [REFID]))) == 1
+
+
+def main(args):
+    setup_logging()
+    count = int(args["--count"] or 100000)
+    copies = int(args["--copies"] or 100)
+    seed = int(args["--seed"] or 0)
+
+    consts = constant_evaluator()
+    command = request.IoctlCommand("FOO_SUBMIT", 0x400E4601, "write", 0x46, 1, 14, "struct foo_req")
+    body = list(enumerate(HANDLER.splitlines(), 1))
+    handler = find_constraints.extract(body)
+    hints = arguments.hints_for_commands(handler, consts, [command])
+
+    results = dict()
+    for name, generator_hints in (("without constraints", None), ("with constraints", hints)):
+        generators = arguments.generators_for_commands([command], consts, seed, generator_hints)
+        results[name] = passed(generators[command.name].generate(count).array)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = list()
+        for i in range(copies):
+            xml_files.append(os.path.join(directory, f"{i}_{os.path.basename(COMPOUND)}"))
+            shutil.copy(COMPOUND, xml_files[-1])
+        cache_loc = os.path.join(directory, "constraints.cache")
+
+        with timed(timings, "extract (no cache)"):
+            extract_all(xml_files, None)
+        find_constraints.configure(cache_loc)
+        extract_all(xml_files[:1], cache_loc)
+        with timed(timings, "extract (cached)"):
+            find_constraints.configure(cache_loc)
+            extract_all(xml_files, cache_loc)
+
+    report(f"Constraints of {copies} handlers", timings)
+    print("")
+    checks = list(next(iter(results.values())))
+    print(f"{'generator':<24}" + "".join(f"{check:>22}" for check in checks))
+    for name, result in results.items():
+        print(f"{name:<24}" + "".join(f"{result[check]:>22.4f}" for check in checks))
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
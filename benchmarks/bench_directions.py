@@ -0,0 +1,91 @@
+"""
+Times inferring the argument direction and size of every command over copies of the
+example compounds, in this process and in the worker pool, then reports how many
+commands the handler disagrees with _IOC_DIR/_IOC_SIZE for and how many calls the
+fuzzer would make with a buffer that's too small or the wrong way round (each of
+those returns EFAULT before the handler gets to do anything)
+
+Usage:
+    bench_directions.py [--copies <n>] [--processes <n>]
+
+Options:
+    --copies=<n>            Copies of the example driver (default: 200)
+    --processes=<n>         Worker processes (default: the number of cpus)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.doxygen import doxygen, find_directions
+from skid.interface_recovery.ioctl import request
+
+DRIVER = "tests/resources/example_c_file.xml"
+HEADERS = {
+    "watchdog_8h.xml": "tests/resources/uapi/example_watchdog_h.xml",
+    "structwatchdog__info.xml": "tests/resources/uapi/example_struct.xml",
+}
+
+
+def copy_compounds(directory: str, copies: int):
+    xml_files = list()
+    for name, resource in HEADERS.items():
+        xml_files.append(os.path.join(directory, name))
+        shutil.copy(resource, xml_files[-1])
+    with open(DRIVER) as driver_f:
+        driver = driver_f.read()
+    for i in range(copies):
+        # Every copy is it's own compound with it's own handler
+        xml_files.append(os.path.join(directory, f"example{i}__driver_8c.xml"))
+        with open(xml_files[-1], "w") as copy_f:
+            copy_f.write(driver.replace("example__driver_8c", f"example{i}__driver_8c"))
+    return tuple(sorted(xml_files))
+
+
+def wrong_buffers(ioc: request.IoctlCommand, access: find_directions.ArgumentAccess) -> int:
+    """ 1 if allocating from _IOC alone misses a direction the handler copies """
+    ioc_bits = find_directions.direction_bits(ioc.direction)
+    body_bits = find_directions.direction_bits(access.direction)
+    return int(body_bits & ~ioc_bits != 0)
+
+
+def main(args):
+    setup_logging()
+    copies = int(args["--copies"] or 200)
+    processes = int(args["--processes"]) if args["--processes"] else None
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = copy_compounds(directory, copies)
+        fileop_structs = doxygen.find_fileop_structs(xml_files, processes)
+        consts = doxygen.get_constant_evaluator(xml_files, processes)
+        commands = doxygen.resolve_ioctl_commands(xml_files, fileop_structs, processes, consts)
+
+        with timed(timings, "infer (1 process)"):
+            serial = find_directions.find_directions(xml_files, fileop_structs, 1)
+        with timed(timings, "infer (pool)"):
+            assert find_directions.find_directions(xml_files, fileop_structs, processes) == serial
+
+    disagree = wrong = total = 0
+    for refid, handler_commands in commands.items():
+        by_command = {access.command: access for access in serial[refid]}
+        for command in handler_commands:
+            total += 1
+            _, agrees = find_directions.reconcile(command, by_command[command.name], consts)
+            disagree += not agrees
+            wrong += wrong_buffers(command, by_command[command.name])
+
+    report(f"{copies} handlers, {total} commands", timings)
+    print(f"{'disagree with _IOC':<40} {disagree:>11}")
+    print(f"{'wrong way buffers from _IOC alone':<40} {wrong:>11}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
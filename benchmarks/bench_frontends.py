@@ -0,0 +1,85 @@
+"""
+Compares the doxygen, libclang and scan frontends on the same source tree, the clang
+frontend is skipped if there is no compilation database
+
+Usage:
+    bench_frontends.py --source <path> [--compile-commands <path>] [--processes <n>]
+
+Options:
+    --source=<path>             Source tree, for the kernel a built tree
+    --compile-commands=<path>   compile_commands.json (default: <source>/compile_commands.json)
+    --processes=<n>             Number of worker processes (default: cpu count)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery import api
+from skid.interface_recovery.doxygen import doxygen
+
+
+def record_key(record):
+    """
+    Records are matched without the refid, the clang refid is a USR and the scan refid is
+    empty, how many of the matched records share doxygen's refid is reported separately
+    """
+    return (os.path.basename(record["file_path"]), record["struct_name"], record["fop_type"],
+            record["function"])
+
+
+def main(args):
+    setup_logging()
+    processes = int(args["--processes"]) if args["--processes"] else None
+    results = dict()
+
+    options = api.RecoveryOptions(
+        source=args["--source"], reuse=doxygen.REUSE_NEVER, processes=processes, validate=False
+    )
+    with timed(results, "doxygen: run doxygen"):
+        xml_files = api.prepare(options)
+    with timed(results, "doxygen: find file_operations"):
+        doxygen_records = list(api.recover(options, xml_files=xml_files))
+    results["doxygen: total"] = sum(results.values())
+
+    records = {"doxygen": doxygen_records}
+
+    options = api.RecoveryOptions(
+        source=args["--source"],
+        frontend=api.FRONTEND_CLANG,
+        compile_commands=args["--compile-commands"],
+        processes=processes,
+    )
+    if os.path.exists(options.compile_commands_location):
+        with timed(results, "clang: parse and find file_operations"):
+            records["clang"] = list(api.recover(options))
+
+    options = api.RecoveryOptions(
+        source=args["--source"], frontend=api.FRONTEND_SCAN, processes=processes
+    )
+    with timed(results, "scan: tokenize and find file_operations"):
+        records["scan"] = list(api.recover(options))
+
+    report("Frontend comparison", results)
+
+    doxygen_keys = {record_key(r) for r in records["doxygen"]}
+    doxygen_refids = {record_key(r): r["refid"] for r in records["doxygen"]}
+    print("")
+    for frontend, frontend_records in records.items():
+        keys = {record_key(r) for r in frontend_records}
+        print(f"{frontend} records: {len(keys)}")
+        if frontend == "doxygen":
+            continue
+        print(f"    found by both {frontend} and doxygen: {len(doxygen_keys & keys)}")
+        same = sum(doxygen_refids.get(record_key(r)) == r["refid"] for r in frontend_records)
+        print(f"    with doxygen's refid (can be joined with commands): {same}")
+        print(f"    only doxygen: {len(doxygen_keys - keys)}")
+        print(f"    only {frontend}: {len(keys - doxygen_keys)}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
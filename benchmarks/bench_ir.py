@@ -0,0 +1,88 @@
+"""
+Times running every extractor over copies of the example compounds as XML against the
+same compounds transcoded into the IR (see doxygen.ir), in this process so the time is
+the cpu each re-analysis costs, and compares the bytes each has to read
+
+Usage:
+    bench_ir.py [--copies <n>]
+
+Options:
+    --copies=<n>            Copies of each example compound (default: 100)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.doxygen import (
+    find_commands,
+    find_constants,
+    find_structs,
+    ir,
+    xml_archive,
+    xml_utils,
+)
+
+COMPOUNDS = (
+    "tests/resources/example_c_file.xml",
+    "tests/resources/uapi/example_watchdog_h.xml",
+    "tests/resources/uapi/example_struct.xml",
+)
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+
+def extract(xml_files):
+    found = list()
+    for xml_file in xml_files:
+        found.append(
+            (
+                find_structs.find_fileop_structs_in_file(xml_file),
+                find_constants.find_constants_in_file(xml_file),
+                find_commands.find_commands_in_file((xml_file, [REFID])),
+                xml_utils.xml_file_has_header((xml_file, "linux/fs.h"))[0],
+            )
+        )
+    return found
+
+
+def main(args):
+    setup_logging()
+    copies = int(args["--copies"] or 100)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = list()
+        for i in range(copies):
+            for compound in COMPOUNDS:
+                xml_files.append(os.path.join(directory, f"{i}_{os.path.basename(compound)}"))
+                shutil.copy(compound, xml_files[-1])
+        # In the order transcode returns them
+        xml_files = tuple(sorted(xml_files))
+        ir_loc = os.path.join(directory, "xml.skidir")
+
+        with timed(timings, "extract from XML"):
+            expected = extract(xml_files)
+        with timed(timings, "transcode (first run)"):
+            ir_files = ir.transcode(xml_files, ir_loc, processes=1)
+        with timed(timings, "transcode (unchanged)"):
+            assert ir.transcode(xml_files, ir_loc, processes=1) == ir_files
+        with timed(timings, "extract from IR"):
+            assert extract(ir_files) == expected
+
+        xml_bytes = sum(xml_archive.sizes(xml_files))
+        ir_bytes = sum(xml_archive.sizes(ir_files))
+
+    report(f"{len(xml_files)} compounds", timings)
+    print(f"{'bytes of XML':<40} {xml_bytes:>11}")
+    print(f"{'bytes of IR':<40} {ir_bytes:>11} ({xml_bytes / ir_bytes:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,126 @@
+"""
+Measures the logging overhead per file, with the root logger at INFO (the default) and
+at DEBUG (-v or -w):
+
+    eager           logger.debug(f"Finding structs in {xml_file}")
+    lazy            logger.debug("Finding structs in %s", xml_file)
+    workers         lazy, from pool workers through the QueueListener in skid.utils.logs
+    log_results     json.dumps of every struct, eager vs guarded by isEnabledFor
+
+Usage:
+    bench_logging.py [--files <n>] [--processes <n>]
+
+Options:
+    --files=<n>         Number of simulated files (default: 100000)
+    --processes=<n>     Number of worker processes (default: cpu count)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import logging
+import time
+from typing import Dict
+
+from docopt import docopt
+
+from benchmarks.common import report
+from skid.utils import logs
+
+logger = logging.getLogger("skid.bench")
+
+XML_FILE = "/tmp/doxygen/xml/alim1535__wdt_8c.xml"
+
+STRUCT = {
+    "file_path": "/home/luke/linux/drivers/watchdog/alim1535_wdt.c",
+    "line_number": 314,
+    "struct_name": "ali_fops",
+    "fop_type": "unlocked_ioctl",
+    "function": "ali_ioctl",
+    "refid": "alim1535__wdt_8c_1a1838d5548ab68027163a91b8dc87a337",
+}
+
+
+def setup_logging(level: int) -> None:
+    """ The same handlers as skid.py, the stream handler only shows warnings """
+    root = logging.getLogger("")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+    file_handler = logging.FileHandler("/tmp/skid-bench.log", "w+")
+    file_handler.setFormatter(
+        logging.Formatter("%(levelname)-8s [%(filename)s:%(lineno)d] %(message)s")
+    )
+    file_handler.setLevel(level)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.WARNING)
+    root.addHandler(file_handler)
+    root.addHandler(stream_handler)
+
+
+def eager(files: int) -> None:
+    for i in range(files):
+        # pylint: disable=logging-fstring-interpolation
+        logger.debug(f"Finding structs in {XML_FILE}:{i}")
+
+
+def lazy(files: int) -> None:
+    for i in range(files):
+        logger.debug("Finding structs in %s:%s", XML_FILE, i)
+
+
+def lazy_chunk(args) -> int:
+    start, end = args
+    lazy(end - start)
+    return end - start
+
+
+def workers(files: int, processes) -> None:
+    chunks = [(start, min(start + 1000, files)) for start in range(0, files, 1000)]
+    with logs.listening():
+        with logs.pool(processes) as pool:
+            sum(pool.imap_unordered(lazy_chunk, chunks))
+
+
+def log_results_eager(structs) -> None:
+    logger.debug(json.dumps(structs, indent=4))
+
+
+def log_results_guarded(structs) -> None:
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s", json.dumps(structs, indent=4))
+
+
+def per_file(seconds: float, files: int) -> float:
+    return seconds / files * 1e6
+
+
+def main(args):
+    files = int(args["--files"] or 100000)
+    processes = int(args["--processes"]) if args["--processes"] else None
+    structs = [dict(STRUCT, line_number=i) for i in range(files // 10)]
+
+    results: Dict[str, float] = dict()
+    for name, level in (("INFO", logging.INFO), ("DEBUG", logging.DEBUG)):
+        setup_logging(level)
+        for label, run in (
+            ("eager", lambda: eager(files)),
+            ("lazy", lambda: lazy(files)),
+            ("workers", lambda: workers(files, processes)),
+            ("log_results eager", lambda: log_results_eager(structs)),
+            ("log_results guarded", lambda: log_results_guarded(structs)),
+        ):
+            start = time.perf_counter()
+            run()
+            results[f"{name}: {label}"] = time.perf_counter() - start
+
+    report(f"Logging {files} files ({len(structs)} structs for log_results)", results)
+    print("")
+    for name, seconds in results.items():
+        count = len(structs) if "log_results" in name else files
+        print(f"{name:<40} {per_file(seconds, count):>10.2f}us per file")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,117 @@
+"""
+Compares uniform random command selection with the errno feedback scheduler against a
+stand-in driver, reporting how many executions it takes to first reach each rare outcome
+
+The stand-in driver handles a few commands out of many candidates, the rest return
+ENOTTY. Of the handled commands most reject nearly every argument with EINVAL and a few
+rarely reach something deeper:
+
+    HANDLED_0       EINVAL, success 20% of the time
+    HANDLED_1       EINVAL, EFAULT 5% of the time
+    HANDLED_2       EINVAL, EBUSY 1% of the time
+    HANDLED_3       EINVAL, EIO 0.5% of the time
+    ...             EINVAL
+    UNKNOWN_*       ENOTTY
+
+Usage:
+    bench_scheduler.py [--budget <n>] [--batch <n>] [--unknown <n>] [--seed <n>]
+
+Options:
+    --budget=<n>    Number of ioctl calls (default: 200000)
+    --batch=<n>     Calls per scheduling batch (default: 256)
+    --unknown=<n>   Number of commands the driver doesn't handle (default: 200)
+    --seed=<n>      Random seed (default: 0)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import errno
+from typing import Dict
+
+import numpy as np  # type: ignore
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.fuzzer import scheduler
+
+HANDLED = 10
+
+# (command index, outcome, probability)
+RARE_OUTCOMES = (
+    (0, scheduler.SUCCESS, 0.2),
+    (1, errno.EFAULT, 0.05),
+    (2, errno.EBUSY, 0.01),
+    (3, errno.EIO, 0.005),
+)
+
+
+class StandInDriver:
+    """ Vectorised stand-in for an ioctl handler, commands 0..HANDLED-1 are handled """
+
+    def __init__(self, seed: int):
+        self.rng = np.random.default_rng(seed)
+
+    def execute(self, commands: np.ndarray) -> np.ndarray:
+        outcomes = np.where(commands < HANDLED, errno.EINVAL, errno.ENOTTY)
+        for command, code, probability in RARE_OUTCOMES:
+            hit = (commands == command) & (self.rng.random(len(commands)) < probability)
+            outcomes[hit] = code
+        return outcomes
+
+
+def run(strategy: str, budget: int, batch: int, unknown: int, seed: int) -> Dict[str, float]:
+    """ Returns the number of executions before each rare outcome was first reached """
+    arms = [scheduler.Arm(f"HANDLED_{i}") for i in range(HANDLED)]
+    arms += [scheduler.Arm(f"UNKNOWN_{i}") for i in range(unknown)]
+    sched = scheduler.ErrnoScheduler(arms, seed=seed)
+    driver = StandInDriver(seed)
+    rng = np.random.default_rng(seed)
+
+    first_seen: Dict[str, float] = dict()
+    rare_hits = 0
+    executed = 0
+    while executed < budget:
+        if strategy == "uniform":
+            chosen = rng.integers(len(arms), size=batch)
+        else:
+            chosen = sched.choose(batch)
+        outcomes = driver.execute(chosen)
+        sched.record(chosen, outcomes)
+
+        for command, code, _ in RARE_OUTCOMES:
+            hits = np.flatnonzero((chosen == command) & (outcomes == code))
+            name = f"{scheduler.outcome_name(code)} from HANDLED_{command}"
+            if len(hits) > 0 and name not in first_seen:
+                first_seen[name] = executed + hits[0] + 1
+            rare_hits += len(hits)
+        executed += batch
+
+    for command, code, _ in RARE_OUTCOMES:
+        first_seen.setdefault(f"{scheduler.outcome_name(code)} from HANDLED_{command}", np.inf)
+    first_seen["rare outcomes reached"] = rare_hits
+    return first_seen
+
+
+def main(args):
+    setup_logging()
+    budget = int(args["--budget"] or 200000)
+    batch = int(args["--batch"] or 256)
+    unknown = int(args["--unknown"] or 200)
+    seed = int(args["--seed"] or 0)
+
+    timings: Dict[str, float] = dict()
+    results = dict()
+    for strategy in ("uniform", "scheduler"):
+        with timed(timings, strategy):
+            results[strategy] = run(strategy, budget, batch, unknown, seed)
+    report(f"Scheduling {budget} calls over {HANDLED + unknown} commands", timings)
+
+    print("")
+    print(f"{'executions until first':<40} {'uniform':>12} {'scheduler':>12}")
+    for name in results["uniform"]:
+        print(f"{name:<40} {results['uniform'][name]:>12.0f} {results['scheduler'][name]:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,146 @@
+"""
+Compares independent random ioctl calls with dependency-aware sequences against a stand-in
+driver where each step only succeeds once the one before it has in the same open:
+
+    case STEP_0:                            case STEP_2:
+        priv->state_0 = 1;                      if (!priv->state_1)
+        return 0;                                   return -EINVAL;
+                                                priv->state_2 = 1;
+                                                return 0;
+
+The rest of the commands always return EINVAL. Each strategy gets the same number of
+sequences (opens of the device), the report is the deepest step reached and how many
+calls reached it:
+
+    independent     random commands, no dependencies
+    runtime         dependencies learned from the outcomes after each batch
+    static          dependencies from the body of the handler
+    static+cache    the static dependencies, starting from the cached states
+
+Usage:
+    bench_sequences.py [--depth <n>] [--noise <n>] [--sequences <n>] [--seed <n>]
+
+Options:
+    --depth=<n>         Number of steps in the chain (default: 6)
+    --noise=<n>         Number of commands outside of the chain (default: 20)
+    --sequences=<n>     Sequences per strategy (default: 5000)
+    --seed=<n>          Random seed (default: 0)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import errno
+import os
+import tempfile
+from typing import Dict, List
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.fuzzer import probe, sequences
+from skid.interface_recovery.ioctl import request
+
+BATCH = 100
+
+
+def handler_body(depth: int, noise: int) -> List:
+    """ The source of the stand-in handler as (line number, code) """
+    lines = [
+        "static long bench_ioctl(struct file *file, unsigned int cmd, unsigned long arg)",
+        "{",
+        "    struct bench_priv *priv = file->private_data;",
+        "    switch (cmd) {",
+    ]
+    for step in range(depth):
+        lines.append(f"    case STEP_{step}:")
+        if step > 0:
+            lines += [f"        if (!priv->state_{step - 1})", "            return -EINVAL;"]
+        lines += [f"        priv->state_{step} = 1;", "        return 0;"]
+    for i in range(noise):
+        lines += [f"    case NOISE_{i}:", "        return -EINVAL;"]
+    lines += ["    default:", "        return -ENOTTY;", "    }", "}"]
+    return list(enumerate(lines, 1))
+
+
+class ChainDevice(probe.Device):
+    """ STEP_n succeeds once STEP_n-1 has succeeded since the device was opened """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.reached = -1
+
+    def ioctl(self, number: int, address: int) -> int:
+        if number >= self.depth:
+            return -errno.EINVAL
+        if number > self.reached + 1:
+            return -errno.EINVAL
+        self.reached = max(self.reached, number)
+        return 0
+
+
+def run(strategy: str, args: Dict, cache_loc: str) -> Dict[str, float]:
+    depth, noise = args["depth"], args["noise"]
+    names = [f"STEP_{step}" for step in range(depth)] + [f"NOISE_{i}" for i in range(noise)]
+    commands = {name: request.decode(name, i) for i, name in enumerate(names)}
+
+    dependencies: List[sequences.Dependency] = list()
+    if strategy.startswith("static"):
+        dependencies = sequences.static_dependencies(handler_body(depth, noise))
+    cache = sequences.SequenceCache("/dev/bench", names, cache_loc)
+    generator = sequences.SequenceGenerator(names, dependencies, seed=args["seed"])
+    learner = sequences.DependencyLearner(names)
+
+    deepest = -1
+    deepest_calls = 0
+    calls = 0
+    for _ in range(args["sequences"] // BATCH):
+        if strategy == "static+cache":
+            generator.cached = cache.deepest()
+        for sequence in generator.generate_batch(BATCH):
+            outcomes = sequences.run_sequence(
+                lambda: ChainDevice(depth), sequences.to_calls(sequence, commands, dict())
+            )
+            calls += len(sequence)
+            learner.observe(sequence, outcomes)
+            cache.add(sequence, outcomes)
+            for name, code in zip(sequence, outcomes):
+                step = names.index(name)
+                if code == 0 and step < depth:
+                    if step > deepest:
+                        deepest, deepest_calls = step, 0
+                    deepest_calls += step == deepest
+        if strategy == "runtime":
+            generator.add_dependencies(learner.dependencies())
+    return {"calls": calls, "deepest step": deepest, "calls reaching it": deepest_calls}
+
+
+def main(args):
+    setup_logging()
+    options = {
+        "depth": int(args["--depth"] or 6),
+        "noise": int(args["--noise"] or 20),
+        "sequences": int(args["--sequences"] or 5000),
+        "seed": int(args["--seed"] or 0),
+    }
+
+    timings: Dict[str, float] = dict()
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for strategy in ("independent", "runtime", "static", "static+cache"):
+            with timed(timings, strategy):
+                cache_loc = os.path.join(directory, f"{strategy}.json")
+                results[strategy] = run(strategy, options, cache_loc)
+    report(f"{options['sequences']} sequences over a {options['depth']} step chain", timings)
+
+    print("")
+    print(f"{'strategy':<20} {'calls':>10} {'deepest step':>14} {'calls reaching it':>18}")
+    for strategy, result in results.items():
+        print(
+            f"{strategy:<20} {result['calls']:>10} {result['deepest step']:>14} "
+            f"{result['calls reaching it']:>18}"
+        )
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,131 @@
+"""
+Times the SQLite export of a kernel sized set of interfaces and a few queries against
+it, compared with inserting a row at a time (a SELECT for every id and the indexes in
+place from the start)
+
+Usage:
+    bench_sqlite.py [--handlers <n>] [--database <path>]
+
+Options:
+    --handlers=<n>      Number of file_operations handlers (default: 20000)
+    --database=<path>   Where to write the database (default: /tmp/skid-bench.db)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.export import sqlite
+from skid.interface_recovery.ioctl import request
+
+COMMANDS_PER_HANDLER = 8
+
+
+def interfaces(handlers: int) -> Tuple[List[Dict[str, Any]], Dict[str, Tuple]]:
+    """ Every driver has an unlocked_ioctl handler and a third use compat_ptr_ioctl """
+    records, commands = list(), dict()
+    for i in range(handlers):
+        directory = ("drivers/staging" if i % 10 == 0 else "drivers") + f"/subsystem{i % 200}"
+        file_path = f"{directory}/driver{i}.c"
+        records.append(
+            {
+                "function": f"driver{i}_ioctl",
+                "refid": f"driver{i}_8c_1a",
+                "struct_name": f"driver{i}_fops",
+                "struct_line_number": 100 + i % 500,
+                "file_path": file_path,
+                "fop_type": "unlocked_ioctl",
+            }
+        )
+        if i % 3 == 0:
+            compat = {"function": "compat_ptr_ioctl", "refid": "", "fop_type": "compat_ioctl"}
+            records.append({**records[-1], **compat})
+        commands[f"driver{i}_8c_1a"] = tuple(
+            request.decode(f"DRIVER{i}_CMD{j}", 0xC0040000 | (i % 256) << 8 | j, "int")
+            for j in range(COMMANDS_PER_HANDLER)
+        )
+    return records, commands
+
+
+def row_at_a_time(records, database: str, commands) -> None:
+    """ The straightforward export, looking up the id of everything that's referenced """
+    if os.path.exists(database):
+        os.remove(database)
+    connection = sqlite3.connect(database)
+    connection.executescript(sqlite.SCHEMA + sqlite.INDEXES)
+
+    def get_id(table: str, **values) -> int:
+        where = " AND ".join(f"{column} = ?" for column in values)
+        row = connection.execute(f"SELECT id FROM {table} WHERE {where}", tuple(values.values()))
+        found = row.fetchone()
+        if found is not None:
+            return found[0]
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" * len(values))
+        cursor = connection.execute(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(values.values())
+        )
+        return cursor.lastrowid
+
+    with connection:
+        for record in records:
+            file_id = get_id(
+                "files", path=record["file_path"], directory=os.path.dirname(record["file_path"])
+            )
+            struct_id = get_id(
+                "fops_structs",
+                file_id=file_id,
+                name=record["struct_name"],
+                line=record["struct_line_number"],
+            )
+            exists = connection.execute(
+                "SELECT id FROM functions WHERE name = ? AND refid = ?",
+                (record["function"], record["refid"]),
+            ).fetchone()
+            function_id = get_id("functions", name=record["function"], refid=record["refid"])
+            if exists is None:
+                for c in commands.get(record["refid"], ()) if record["refid"] else ():
+                    connection.execute(
+                        "INSERT INTO commands (function_id, name, number, direction, size, "
+                        "argument) VALUES (?, ?, ?, ?, ?, ?)",
+                        (function_id, c.name, c.number, c.direction, c.size, c.argument),
+                    )
+            connection.execute(
+                "INSERT INTO handlers (struct_id, fop_type, function_id) VALUES (?, ?, ?)",
+                (struct_id, record["fop_type"], function_id),
+            )
+    connection.close()
+
+
+def main(args):
+    setup_logging()
+    handlers = int(args["--handlers"] or 20000)
+    database = args["--database"] or "/tmp/skid-bench.db"
+    records, commands = interfaces(handlers)
+
+    timings: Dict[str, float] = dict()
+    with timed(timings, "export row at a time"):
+        row_at_a_time(records, database, commands)
+    with timed(timings, "export batched"):
+        sqlite.export(records, database, commands)
+
+    with timed(timings, "query compat_ptr_ioctl"):
+        compat = sqlite.query(database, fop_type="compat_ioctl", function="compat_ptr_ioctl")
+    with timed(timings, "query drivers/staging/*"):
+        staging = sqlite.query(database, path="drivers/staging/*")
+    with timed(timings, "query command number"):
+        by_number = sqlite.query(database, command=hex(0xC0040000 | 7 << 8 | 3))
+
+    report(f"Exporting {len(records)} handlers", timings)
+    print("")
+    print(f"{len(compat)} compat_ptr_ioctl, {len(staging)} staging, {len(by_number)} by number")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,68 @@
+"""
+Times the extractors run one after the other against the same extractors run as
+concurrent stages (see skid.utils.stages) sharing the worker budget, over copies of
+the example compound
+
+Usage:
+    bench_stages.py [--files <n>] [--processes <n>]
+
+Options:
+    --files=<n>             Number of compounds (default: 400)
+    --processes=<n>         Worker processes (default: 8)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery import api, entry
+from skid.interface_recovery.doxygen import doxygen
+from skid.utils import stages
+
+COMPOUND = "tests/resources/example_c_file.xml"
+
+
+def sequential(xml_files, processes):
+    fileop_structs = doxygen.find_fileop_structs(xml_files, processes)
+    consts = doxygen.get_constant_evaluator(xml_files, processes)
+    commands = doxygen.resolve_ioctl_commands(xml_files, fileop_structs, processes, consts)
+    doxygen.find_all_device_names(xml_files, processes)
+    return fileop_structs, commands
+
+
+def main(args):
+    setup_logging()
+    files = int(args["--files"] or 400)
+    processes = int(args["--processes"] or 8)
+    options = api.RecoveryOptions(source=".", processes=processes)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = list()
+        for i in range(files):
+            xml_files.append(os.path.join(directory, f"compound_{i}.xml"))
+            shutil.copy(COMPOUND, xml_files[-1])
+        xml_files = tuple(xml_files)
+
+        with timed(timings, "sequential"):
+            expected = sequential(xml_files, processes)
+        with timed(timings, "stages"):
+            values, stage_timings = stages.run(
+                entry.recovery_stages(options), {"xml_files": xml_files}, processes
+            )
+        assert (values["fileop_structs"], values["commands"]) == expected
+
+    report(f"{files} compounds, {processes} processes", timings)
+    print("")
+    print("\n".join(stages.report(stage_timings)))
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,95 @@
+"""
+Compares the supervised pool with a plain pool on many small compounds (the overhead of
+a pipe per worker and deadlines), then runs the supervised pool with one compound that
+hangs to show the run takes about the timeout longer rather than forever
+
+Usage:
+    bench_supervisor.py [--files <n>] [--processes <n>] [--timeout <seconds>]
+
+Options:
+    --files=<n>             Number of compounds (default: 2000)
+    --processes=<n>         Worker processes (default: 8)
+    --timeout=<seconds>     Deadline of each compound (default: 5)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.doxygen import find_structs, xml_archive
+from skid.utils import admission, logs, supervisor
+
+COMPOUND = """<?xml version="1.0"?>
+<doxygen><compounddef><sectiondef>
+<memberdef kind="variable" id="fops_{0}" static="yes">
+<type>const struct file_operations</type>
+<name>fops_{0}</name>
+<initializer>= {{ .owner = THIS_MODULE,
+    .unlocked_ioctl = <ref refid="ioctl_{0}">ioctl_{0}</ref>, }}</initializer>
+<location file="/drivers/char/driver_{0}.c" line="10"/>
+</memberdef>
+</sectiondef></compounddef></doxygen>
+"""
+
+HANGING = "hanging.xml"
+
+
+def write_compounds(directory: str, files: int) -> List[str]:
+    locations = list()
+    for i in range(files):
+        location = os.path.join(directory, f"compound_{i}.xml")
+        with open(location, "w") as xml_f:
+            xml_f.write(COMPOUND.format(i))
+        locations.append(location)
+    return locations
+
+
+def find_structs_or_hang(xml_file: str):
+    """ Stands in for lxml spinning on a pathological compound """
+    if xml_file.endswith(HANGING):
+        time.sleep(3600)
+    return find_structs.find_fileop_structs_in_file(xml_file)
+
+
+def parse(pool, xml_files) -> int:
+    sizes = xml_archive.sizes(xml_files)
+    return sum(1 for _ in admission.imap(pool, find_structs_or_hang, xml_files, sizes))
+
+
+def main(args):
+    setup_logging()
+    files = int(args["--files"] or 2000)
+    processes = int(args["--processes"] or 8)
+    timeout = float(args["--timeout"] or 5)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = write_compounds(directory, files)
+        hanging = xml_files[: files // 2] + [os.path.join(directory, HANGING)]
+        hanging += xml_files[files // 2 :]
+
+        with timed(timings, "logs.pool"):
+            with logs.pool(processes) as pool:
+                parse(pool, xml_files)
+        with timed(timings, "supervisor.pool"):
+            with supervisor.pool(processes, timeout) as pool:
+                parse(pool, xml_files)
+        with timed(timings, f"supervisor.pool, 1 hangs ({timeout:.0f}s)"):
+            with supervisor.pool(processes, timeout) as pool:
+                parse(pool, hanging)
+
+    report(f"Parsing {files} compounds with {processes} processes", timings)
+    print("")
+    for entry in supervisor.quarantined():
+        print(f"quarantined {os.path.basename(entry.task)}: {entry.reason}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
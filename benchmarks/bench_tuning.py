@@ -0,0 +1,67 @@
+"""
+Times the fingerprint and scan pools over a tree of copies of the example driver with
+their default settings against the profile that skid.py tune calibrated on a sample of
+the same tree (see skid.interface_recovery.calibration)
+
+Usage:
+    bench_tuning.py [--files <n>] [--sample <n>]
+
+Options:
+    --files=<n>             Number of source files in the tree (default: 4000)
+    --sample=<n>            Number of source files the calibration runs use (default: 200)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery import calibration, scan
+from skid.interface_recovery.doxygen import fingerprint
+from skid.utils import tuning
+
+DRIVER = "tests/resources/example_driver.c"
+
+
+def passes(source_dir, processes):
+    fingerprint.source_entries(source_dir, processes=processes)
+    return scan.find_structs.find_fileop_structs(source_dir, processes)
+
+
+def main(args):
+    setup_logging()
+    files = int(args["--files"] or 4000)
+    sample = int(args["--sample"] or calibration.SAMPLE_FILES)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(files):
+            driver_dir = os.path.join(directory, f"drivers/{i % 50}")
+            os.makedirs(driver_dir, exist_ok=True)
+            shutil.copy(DRIVER, os.path.join(driver_dir, f"driver_{i}.c"))
+
+        with timed(timings, "tune"):
+            profile = calibration.calibrate(directory, sample_size=sample)
+        with timed(timings, "default"):
+            expected = passes(directory, None)
+        tuning.apply(profile)
+        try:
+            with timed(timings, "tuned"):
+                assert passes(directory, profile.processes) == expected
+        finally:
+            tuning.apply(None)
+
+    report(f"{files} source files, tuned on {sample}", timings)
+    print("")
+    print(f"processes {profile.processes}, chunksizes {profile.chunksizes}")
+    print(f"doxygen {profile.doxygen}")
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
@@ -0,0 +1,77 @@
+"""
+Times finding the file_operations structs with each validation mode, over copies of the
+example compound where only a few still contain a file_operations struct
+
+Usage:
+    bench_validation.py [--files <n>] [--used <percent>] [--processes <n>]
+
+Options:
+    --files=<n>             Number of compounds (default: 400)
+    --used=<percent>        Compounds with a file_operations struct (default: 5)
+    --processes=<n>         Worker processes (default: 8)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import tempfile
+from typing import Dict, List
+
+from docopt import docopt
+
+from benchmarks.common import report, setup_logging, timed
+from skid.interface_recovery.doxygen import doxygen as doxygen_api
+from skid.interface_recovery.doxygen import find_structs, validation
+
+COMPOUND = "tests/resources/example_c_file.xml"
+SCHEMA = "tests/resources/example_schema.xsd"
+
+
+def write_compounds(directory: str, files: int, used: int) -> List[str]:
+    with open(COMPOUND) as xml_f:
+        xml = xml_f.read()
+    unused = xml.replace("struct file_operations", "struct other_operations")
+    locations = list()
+    for i in range(files):
+        location = os.path.join(directory, f"compound_{i}.xml")
+        with open(location, "w") as xml_f:
+            xml_f.write(xml if i * 100 < files * used else unused)
+        locations.append(location)
+    return locations
+
+
+def find(xml_files, processes) -> int:
+    return sum(len(s) for s in find_structs.iter_fileop_structs_by_file(xml_files, processes))
+
+
+def main(args):
+    setup_logging()
+    files = int(args["--files"] or 400)
+    used = int(args["--used"] or 5)
+    processes = int(args["--processes"] or 8)
+
+    timings: Dict[str, float] = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        xml_files = tuple(write_compounds(directory, files, used))
+        cache = os.path.join(directory, "validation.cache")
+
+        with timed(timings, "full"):
+            validation.configure(validation.MODE_FULL)
+            schema = doxygen_api.get_schema(SCHEMA)
+            found = find(doxygen_api.filter_xml_files_bad_schema(xml_files, schema), processes)
+        for name, mode in (
+            ("lazy, cold cache", validation.MODE_LAZY),
+            ("lazy, warm cache", validation.MODE_LAZY),
+            ("structural", validation.MODE_STRUCTURAL),
+        ):
+            with timed(timings, name):
+                validation.configure(mode, SCHEMA, cache)
+                assert find(xml_files, processes) == found
+        validation.configure(None)
+
+    report(f"{files} compounds, {used}% with a file_operations struct", timings)
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
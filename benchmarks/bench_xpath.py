@@ -0,0 +1,86 @@
+"""
+Times selecting the file_operations memberdefs and includes of a big compound by
+walking every element in Python against the precompiled XPath queries
+
+Usage:
+    bench_xpath.py [--members <n>] [--repeat <n>]
+
+Options:
+    --members=<n>       Memberdefs in the compound (default: 5000)
+    --repeat=<n>        Times each is run (default: 20)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+from typing import Dict
+
+from docopt import docopt
+from lxml import etree  # type: ignore
+
+from benchmarks.common import report, timed
+from skid.interface_recovery.doxygen import find_structs, xml_utils, xpath
+
+MEMBERDEF = """<memberdef kind="{kind}" id="m{0}"><type>{type}</type><name>m{0}</name>
+<initializer>= {{ .unlocked_ioctl = <ref refid="ioctl_{0}">ioctl_{0}</ref>, }}</initializer>
+<location file="driver.c" line="{0}"/></memberdef>
+"""
+
+CODELINE = '<codeline lineno="{0}"><highlight class="{kind}">{text}</highlight></codeline>\n'
+
+
+def build_compound(members: int):
+    parts = ["<doxygen><compounddef><sectiondef>"]
+    for i in range(members):
+        type_str = "const struct file_operations" if i % 1000 == 0 else "int"
+        kind = "variable" if i % 3 else "function"
+        parts.append(MEMBERDEF.format(i, kind=kind, type=type_str))
+    parts.append("</sectiondef><programlisting>")
+    for i in range(members * 4):
+        if i % 500 == 0:
+            parts.append(CODELINE.format(i, kind="preprocessor", text="#include&lt;linux/fs.h&gt;"))
+        else:
+            parts.append(CODELINE.format(i, kind="normal", text=f"value_{i} = {i};"))
+    parts.append("</programlisting></compounddef></doxygen>")
+    return etree.ElementTree(etree.fromstring("".join(parts)))
+
+
+def python_fileops(root):
+    return [
+        element
+        for element in root.iter("memberdef")
+        if find_structs.is_memberdef_a_file_ops_struct(element)
+    ]
+
+
+def python_includes(root):
+    return [
+        highlight
+        for highlight in root.iter("highlight")
+        if highlight.attrib.get("class") == "preprocessor"
+        and xml_utils.INCLUDE_RE.match("".join(highlight.itertext()))
+    ]
+
+
+def main(args):
+    members = int(args["--members"] or 5000)
+    repeat = int(args["--repeat"] or 20)
+    root = build_compound(members)
+    assert python_fileops(root) == xpath.FILEOPS_MEMBERDEFS(root)
+    assert python_includes(root) == xpath.INCLUDE_HIGHLIGHTS(root)
+
+    timings: Dict[str, float] = dict()
+    for name, func in (
+        ("file_operations, python", python_fileops),
+        ("file_operations, xpath", xpath.FILEOPS_MEMBERDEFS),
+        ("includes, python", python_includes),
+        ("includes, xpath", xpath.INCLUDE_HIGHLIGHTS),
+    ):
+        with timed(timings, name):
+            for _ in range(repeat):
+                func(root)
+    report(f"Selecting from {members} memberdefs x {repeat}", timings)
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
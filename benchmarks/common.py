@@ -0,0 +1,47 @@
+"""
+Shared helpers for the benchmarks, run them from the root of the repository e.g:
+
+    python -m benchmarks.bench_frontends --source ~/linux/drivers/watchdog
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+def setup_logging(verbose=False) -> None:
+    """
+    skid expects the same root handlers that skid.py installs (file handler first and
+    stream handler second, see utils.is_verbose)
+    """
+    root = logging.getLogger("")
+    root.setLevel(logging.DEBUG)
+    file_handler = logging.FileHandler("/tmp/skid-bench.log", "w+")
+    file_handler.setLevel(logging.DEBUG)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.DEBUG if verbose else logging.WARNING)
+    root.addHandler(file_handler)
+    root.addHandler(stream_handler)
+
+
+@contextmanager
+def timed(results: Dict[str, float], name: str) -> Iterator[None]:
+    """ Records the wall clock time of the block in results[name] """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = time.perf_counter() - start
+
+
+def report(title: str, results: Dict[str, float]) -> None:
+    """ Prints the timings as a small table """
+    print("")
+    print(title)
+    print("=" * len(title))
+    for name, seconds in results.items():
+        print(f"{name:<40} {seconds:>10.3f}s")
@@ -1,21 +1,60 @@
 """
 Usage:
     skid.py --help
-    skid.py ir --source <path> [--doxyconf <conf.json> -wnv -q -d]
+    skid.py ir --source <path> [--doxyconf <conf.json> --reuse=<policy> --frontend=<name> --compile-commands=<path> --export=<dir> --probe=<device> --probe-handler=<name> --database=<path> --coordinator=<address> --memory-budget=<size> --file-timeout=<seconds> --quarantine=<path> --validation=<mode> --profile=<path> -wnv -q -d --pack --compress --transcode]
+    skid.py tune --source <path> [--doxyconf <conf.json> --profile=<path> --sample=<n> --memory-budget=<size> -wnv]
+    skid.py query <database> [--fop=<type> --function=<name> --struct=<name> --path=<glob> --command=<name> --sql=<statement> -wnv]
+    skid.py worker <address> [--processes=<n> -wnv]
 
 Arguments:
     ir          interface-recovery
+    tune        calibrate doxygen and the worker pools for this machine, see --profile
+    query       query the interfaces exported with --database
+    worker      parse XML files for a --coordinator on another machine
 
 Options (interface-recovery):
     --source -s=<path>
     --doxyconf=<path.json>
+    --pack                  Pack the doxygen XML into a single archive
+    --validation=<mode>     Validate the XML up front (full), only the files the extractors use (lazy) or only the elements they read (structural) [default: full]
+    --compress              Compress the compounds inside the packed archive
+    --transcode             Transcode the XML into a compact binary IR, later runs read it without parsing
+    --reuse=<policy>        Reuse prior doxygen results: auto, always or never [default: auto]
+    --frontend=<name>       Extract the interfaces with: doxygen, clang or scan [default: doxygen]
+    --compile-commands=<path>  compile_commands.json for the clang frontend (default: <source>/compile_commands.json)
+                            clang skips function bodies, the ioctl commands in the handlers still need doxygen
+                            clang refids are USRs that can't be joined with commands, no --export, --database or --probe
+    --export=<dir>          Export the interfaces as protocol buffers (.proto + length-delimited records)
+    --probe=<device>        Probe the device for ioctl commands that were not recovered e.g /dev/watchdog
+    --probe-handler=<name>  The ioctl handler behind the --probe device, a function name or refid e.g watchdog_ioctl
+    --database=<path>       Export the interfaces to a SQLite database
+                            The device_names table is left empty, device names aren't recovered yet
+    --coordinator=<address> Hand the XML files out to workers, listening on host:port
+    --memory-budget=<size>  Memory the XML worker pools may use e.g 8G (default: 80% of free memory)
+    --file-timeout=<seconds>  Seconds a worker may spend on an XML file before it's quarantined (default: 300)
+    --quarantine=<path>     Write the files that timed out or crashed a worker to a json report
+    --profile=<path>        Use the profile written by tune (default for tune: /tmp/skid-profile.json)
+
+Options (tune):
+    --sample=<n>            Number of source files the calibration runs use [default: 200]
+
+Options (query):
+    --fop=<type>            Only handlers of this file_operations member e.g compat_ioctl
+    --function=<name>       Only handlers that are this function e.g compat_ptr_ioctl
+    --struct=<name>         Only handlers in this file_operations struct
+    --path=<glob>           Only handlers in files matching the glob e.g 'drivers/staging/*'
+    --command=<name>        Only handlers of this ioctl command, a name or number
+    --sql=<statement>       Run a SQL statement instead e.g 'SELECT * FROM interfaces'
+
+Options (worker):
+    --processes=<n>         Number of worker processes (default: cpu count)
 
 Misc Options:
     --dont-validate -d
     --help -h
     --verbose -v
     --no-color -n
-    --write-log -w
+    --write-log -w          Write debug messages to /tmp/skid.log
     --quite -q
 """
 
@@ -29,10 +68,16 @@ import colorlog
 
 from docopt import docopt
 
-from skid.interface_recovery.entry import start_interface_recovery
+from skid.interface_recovery.entry import (
+    start_interface_recovery, start_query, start_tune, start_worker
+)
+from skid.utils import logs
 
-def setup_logger(colour=True, verbose=False, write_location="/tmp/skid.log") -> logging.Logger:
-    """ Sets up the root logger and it's formatters """
+def setup_logger(colour=True, verbose=False, write_log=False, write_location="/tmp/skid.log") -> logging.Logger:
+    """
+    Sets up the root logger and it's formatters, debug records are only created when
+    they are going to be shown (-v) or written to the log file (-w)
+    """
     if colour:
         fmt = "%(log_color)s%(levelname)-8s%(reset)s : %(white)s%(message)s"
     else:
@@ -54,8 +99,10 @@ def setup_logger(colour=True, verbose=False, write_location="/tmp/skid.log") ->
         }
     )
 
+    file_lvl = logging.DEBUG if verbose or write_log else logging.INFO
+
     logger = logging.getLogger("")
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(min(lvl, file_lvl))
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
@@ -64,7 +111,7 @@ def setup_logger(colour=True, verbose=False, write_location="/tmp/skid.log") ->
     file_handler = logging.FileHandler(write_location, 'w+')
     file_handler_formatter = logging.Formatter('%(levelname)-8s [%(filename)s:%(lineno)d] %(message)s')
     file_handler.setFormatter(file_handler_formatter)
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(file_lvl)
 
     logger.addHandler(file_handler)
     logger.addHandler(stream_handler)
@@ -148,13 +195,24 @@ def main(arguments: Dict):
     asciiarts = [print_ascii, print_ascii2]
     asciiarts[random.randint(0, len(asciiarts)-1)]()
     # print_ascii()
-    log = setup_logger(colour=not arguments["--no-color"], verbose=arguments["--verbose"])
+    log = setup_logger(
+        colour=not arguments["--no-color"],
+        verbose=arguments["--verbose"],
+        write_log=arguments["--write-log"],
+    )
 
     try:
-        if arguments["ir"]:
-            start_interface_recovery(arguments)
-        else:
-            log.critical("No command mode found!!")
+        with logs.listening():
+            if arguments["ir"]:
+                start_interface_recovery(arguments)
+            elif arguments["tune"]:
+                start_tune(arguments)
+            elif arguments["query"]:
+                start_query(arguments)
+            elif arguments["worker"]:
+                start_worker(arguments)
+            else:
+                log.critical("No command mode found!!")
     except Exception as e:
         log.exception(e)
         log.critical("An unexpected programing error occured")
@@ -0,0 +1 @@
+from skid.fuzzer import arguments, scheduler, probe, minimize, sequences, campaign
@@ -0,0 +1,464 @@
+"""
+Generates ioctl argument buffers in batches with numpy instead of one struct.pack per call
+
+Each recovered argument type is compiled once into a numpy structured dtype with the
+same offsets and size as the C layout (see ioctl.layouts), a batch is then a single
+contiguous array with one row per ioctl call:
+
+    struct watchdog_info            dtype({'names': ['options', 'firmware_version',
+        __u32 options;                             'identity'],
+        __u32 firmware_version;               'formats': ['<u4', '<u4', ('u1', (32,))],
+        __u8  identity[32];                   'offsets': [0, 4, 8], 'itemsize': 40})
+
+Every field is filled for the whole batch with one vectorised draw:
+
+    enum fields             one of the enumerators of the enum
+    flag fields             a random OR of the flags given for the field
+    length fields           the element count or byte size of a sibling array (+/- 1)
+    everything else         boundary values (0, 1, -1, INT_MAX, ...) or random bits
+
+The constants the handler checks the argument against (see doxygen.find_constraints)
+become the known values and flags of the field they're checked on, bounds and the rest
+of the constants the handler compares against go into a dictionary that is mixed into
+the random values.
+
+Unions pick one member per row, bitfields are filled as their whole storage unit.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from skid.interface_recovery.doxygen import find_constraints
+from skid.interface_recovery.ioctl import evaluator, layouts, request
+
+logger = getLogger(__name__)
+
+# How often a plain integer field is a boundary value rather than random bits
+BOUNDARY_RATE = 0.5
+
+# How often a field with known values (enum, flags, lengths) is given something else
+INVALID_RATE = 0.05
+
+# How often a value that isn't a known value is taken from the dictionary
+DICTIONARY_RATE = 0.2
+
+# The dictionary path of the values tried in every field
+ANY_FIELD = "*"
+
+_LENGTH_RE = re.compile(
+    r"(^|_)(len|length|size|sz|count|cnt|num|nr)(_|$)|^n(r|um|bytes|elems?|ents)(_|$)"
+)
+
+
+########## GENERATION ##########
+
+
+class ArgumentBatch:
+    """
+    A batch of argument buffers backed by one contiguous array, indexing returns a
+    memoryview of a single row so nothing is copied before the ioctl call
+    """
+
+    def __init__(self, array: np.ndarray):
+        assert array.flags["C_CONTIGUOUS"]
+        self.array = array
+        # Arrays of integers such as __u32[4] are 2D, every row is still one argument
+        self.raw = array.reshape(len(array), -1).view(np.uint8)
+
+    @property
+    def buffer(self) -> memoryview:
+        """ The whole batch as one writable buffer """
+        return memoryview(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, index: int) -> memoryview:
+        return memoryview(self.raw[index])
+
+
+@dataclass
+class ArgumentGenerator:
+    """
+    Fills batches of a single argument type
+
+    Args:
+        argument: The C type of the argument e.g 'struct watchdog_info' or 'int'
+        values: Known values of a field keyed by it's dotted path e.g {'info.options': [1, 2]}
+        flags: Flags of a field that are OR'd together, keyed the same way
+        dictionary: Values worth trying in a field, keyed the same way or by ANY_FIELD
+    """
+
+    argument: str
+    consts: evaluator.ConstantEvaluator
+    values: Dict[str, Sequence[int]] = field(default_factory=dict)
+    flags: Dict[str, Sequence[int]] = field(default_factory=dict)
+    dictionary: Dict[str, Sequence[int]] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        self.rng = np.random.default_rng(self.seed)
+        compiler = _Compiler(self.consts, self.values, self.flags, self.dictionary)
+        self.root = compiler.compile(self.argument)
+        self.dtype = self.root.dtype
+
+    def generate(self, count: int) -> ArgumentBatch:
+        """ Generates count argument buffers """
+        assert count > 0
+        array = np.zeros(count, dtype=self.dtype)
+        self.root.fill(array, self.rng)
+        return ArgumentBatch(array)
+
+
+def generators_for_commands(
+    commands: Sequence[request.IoctlCommand],
+    consts: evaluator.ConstantEvaluator,
+    seed=None,
+    hints: Optional[Dict[str, "Hints"]] = None,
+) -> Dict[str, ArgumentGenerator]:
+    """
+    Compiles a generator for each command that takes an argument, keyed by command name.
+    Commands with the same argument type share a generator unless there are hints for
+    them (see hints_for_commands), unknown types are skipped
+    """
+    by_type: Dict[str, Optional[ArgumentGenerator]] = dict()
+    generators = dict()
+    for command in commands:
+        if command.argument == "" or command.size == 0:
+            continue
+        if hints is not None and command.name in hints:
+            values, flags, dictionary = hints[command.name]
+            try:
+                generators[command.name] = ArgumentGenerator(
+                    command.argument, consts, values, flags, dictionary, seed
+                )
+            except evaluator.UnresolvedConstant as e:
+                logger.debug("Can't generate arguments for %s: %s", command.name, e)
+            continue
+        if command.argument not in by_type:
+            try:
+                by_type[command.argument] = ArgumentGenerator(command.argument, consts, seed=seed)
+            except evaluator.UnresolvedConstant as e:
+                logger.debug("Can't generate arguments for %s: %s", command.name, e)
+                by_type[command.argument] = None
+        generator = by_type[command.argument]
+        if generator is not None:
+            generators[command.name] = generator
+    return generators
+
+
+class Hints(NamedTuple):
+    """ The values, flags and dictionary of an ArgumentGenerator for one command """
+
+    values: Dict[str, List[int]]
+    flags: Dict[str, List[int]]
+    dictionary: Dict[str, List[int]]
+
+
+def hints_for_commands(
+    handler: find_constraints.HandlerConstraints,
+    consts: evaluator.ConstantEvaluator,
+    commands: Sequence[request.IoctlCommand],
+) -> Dict[str, Hints]:
+    """
+    Turns the constraints of a handler into hints for the generators of it's commands,
+    keyed by command name. Checks outside of the switch on cmd apply to every command:
+
+        equal       (req.magic != REQ_MAGIC)    a known value of the field
+        mask        (req.flags & ~REQ_FLAGS)    the bits are the flags of the field
+        bound       (len > MAX_LEN)             the value and either side in the dictionary
+
+    The constants of the handler are tried in every field, the ones that can't be
+    evaluated are left out
+    """
+    dictionary = set()
+    for constant in handler.dictionary:
+        value = _evaluate(consts, constant)
+        if value is not None:
+            dictionary.add(value)
+
+    hints = dict()
+    for name in dict.fromkeys(command.name for command in commands):
+        hint = Hints(dict(), dict(), {ANY_FIELD: sorted(dictionary)} if dictionary else dict())
+        for constraint in handler.constraints:
+            if constraint.command not in ("", name):
+                continue
+            value = _evaluate(consts, constraint.value)
+            if value is None:
+                continue
+            path = constraint.field
+            if constraint.kind == find_constraints.KIND_EQUAL:
+                _add(hint.values, path, [value])
+            elif constraint.kind == find_constraints.KIND_MASK:
+                value &= (1 << 64) - 1
+                _add(hint.flags, path, [1 << bit for bit in range(64) if value >> bit & 1])
+            else:
+                _add(hint.dictionary, path, [value - 1, value, value + 1])
+        hints[name] = hint
+    return hints
+
+
+def _evaluate(consts: evaluator.ConstantEvaluator, expression: str) -> Optional[int]:
+    try:
+        return consts.evaluate(expression)
+    except evaluator.UnresolvedConstant:
+        return None
+
+
+def _add(hint: Dict[str, List[int]], path: str, values: Sequence[int]):
+    known = hint.setdefault(path, list())
+    known += [value for value in values if value not in known]
+
+
+########## VALUE STRATEGIES ##########
+
+
+def boundary_values(dtype: np.dtype) -> np.ndarray:
+    """ The interesting values of an integer type, the limits and the powers of two around them """
+    info = np.iinfo(dtype)
+    bits = dtype.itemsize * 8
+    values = {0, 1, 2, -1, info.max, info.max - 1, info.min, info.min + 1}
+    for bit in (7, 8, 15, 16, 31, 32, bits - 1):
+        for value in ((1 << bit) - 1, 1 << bit, -(1 << bit), (1 << bit) + 1):
+            values.add(value)
+    return np.array(sorted(value for value in values if info.min <= value <= info.max), dtype)
+
+
+def random_values(rng: np.random.Generator, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    """ Uniformly random integers covering every bit of the type """
+    info = np.iinfo(dtype)
+    return rng.integers(info.min, info.max, size=shape, dtype=dtype, endpoint=True)
+
+
+def mix(rng: np.random.Generator, base: np.ndarray, choices: np.ndarray, rate: float) -> np.ndarray:
+    """ Replaces roughly rate of the base values with values picked from choices """
+    mask = rng.random(base.shape) < rate
+    base[mask] = rng.choice(choices, size=int(mask.sum()))
+    return base
+
+
+def flag_values(rng: np.random.Generator, flags: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """ A random subset of the flags OR'd together for every value """
+    chosen = rng.random(shape + (len(flags),)) < 0.5
+    return np.bitwise_or.reduce(np.where(chosen, flags, flags.dtype.type(0)), axis=-1)
+
+
+########## COMPILED LAYOUT ##########
+
+
+class _Node(ABC):
+    dtype: np.dtype
+
+    @abstractmethod
+    def fill(self, view: np.ndarray, rng: np.random.Generator):
+        """ Writes random values into a view of dtype """
+
+
+@dataclass
+class _Integer(_Node):
+    """
+    An integer, pointer or array of them, known holds the enum, flag or length values and
+    dictionary the values mixed into the rest
+    """
+
+    scalar: np.dtype
+    known: Optional[np.ndarray] = None
+    is_flags: bool = False
+    count: int = 0
+    dictionary: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        self.dtype = np.dtype((self.scalar, (self.count,))) if self.count else self.scalar
+        self.boundaries = boundary_values(self.scalar)
+
+    def fill(self, view: np.ndarray, rng: np.random.Generator):
+        values = random_values(rng, self.scalar, view.shape)
+        mix(rng, values, self.boundaries, BOUNDARY_RATE)
+        if self.dictionary is not None:
+            mix(rng, values, self.dictionary, DICTIONARY_RATE)
+        if self.known is not None:
+            if self.is_flags:
+                known = flag_values(rng, self.known, view.shape)
+            else:
+                known = rng.choice(self.known, size=view.shape)
+            values = np.where(rng.random(view.shape) < INVALID_RATE, values, known)
+        view[...] = values
+
+
+@dataclass
+class _Record(_Node):
+    """ A struct (every member is filled) or union (one member per row) """
+
+    kind: str
+    dtype: np.dtype
+    members: List[Tuple[str, _Node]]
+
+    def fill(self, view: np.ndarray, rng: np.random.Generator):
+        if self.kind == "struct" or len(self.members) == 0:
+            for name, node in self.members:
+                node.fill(view[name], rng)
+            return
+
+        chosen = rng.integers(len(self.members), size=view.shape)
+        for i, (name, node) in enumerate(self.members):
+            rows = chosen == i
+            member = np.zeros(view.shape, dtype=self.dtype.fields[name][0])
+            node.fill(member, rng)
+            view[name][rows] = member[rows]
+
+
+@dataclass
+class _Array(_Node):
+    """ An array of structs or unions """
+
+    element: _Node
+    dtype: np.dtype
+
+    def fill(self, view: np.ndarray, rng: np.random.Generator):
+        self.element.fill(view, rng)
+
+
+class _Compiler:
+    """ Compiles C types into _Nodes, the dtype of the root node matches the C layout """
+
+    def __init__(
+        self, consts: evaluator.ConstantEvaluator, values: Dict, flags: Dict, dictionary=None
+    ):
+        self.consts = consts
+        self.values = values
+        self.flags = flags
+        self.dictionary = dictionary or dict()
+
+    def compile(self, type_str: str, path: str = "", lengths=()) -> _Node:
+        """ lengths are the candidate values if this is a length field """
+        type_str = layouts.normalize_type(type_str)
+        dimensions = layouts.split_dimensions(type_str)
+        if len(dimensions) > 0:
+            count = 1
+            for dim in dimensions:
+                count *= self.consts.evaluate(dim)
+            return self.array(self.compile(type_str[: type_str.index("[")], path), count)
+
+        words = type_str.split()
+        if len(words) == 2 and words[0] in ("struct", "union"):
+            return self.record(self.consts.layout(words[1]), path)
+        if type_str in self.consts.table.typedefs and layouts.primitive_size(type_str) is None:
+            return self.compile(self.consts.table.typedefs[type_str], path, lengths)
+
+        size, _ = self.consts.sizeof(type_str)
+        if size not in (1, 2, 4, 8):
+            raise evaluator.UnresolvedConstant(f"Can't generate a {size} byte {type_str}")
+        kind = "i" if layouts.is_signed(type_str) else "u"
+        dtype = np.dtype(f"<{kind}{size}")
+        dictionary = self.dictionary_for(path, dtype)
+
+        if path in self.flags:
+            known = self.known(self.flags[path], dtype)
+            return _Integer(dtype, known, is_flags=True, dictionary=dictionary)
+        if path in self.values:
+            return _Integer(dtype, self.known(self.values[path], dtype), dictionary=dictionary)
+        if len(words) == 2 and words[0] == "enum" and words[1] in self.consts.table.enum_types:
+            enumerators = self.enumerator_values(self.consts.table.enum_types[words[1]])
+            if len(enumerators) > 0:
+                return _Integer(dtype, self.known(enumerators, dtype), dictionary=dictionary)
+        if len(lengths) > 0:
+            return _Integer(dtype, self.known(lengths, dtype), dictionary=dictionary)
+        return _Integer(dtype, dictionary=dictionary)
+
+    def enumerator_values(self, enumerators: Sequence[str]) -> List[int]:
+        """ The values of the enumerators, skipping the ones that can't be evaluated """
+        values = list()
+        for enumerator in enumerators:
+            try:
+                values.append(self.consts.value(enumerator))
+            except evaluator.UnresolvedConstant as e:
+                logger.debug("Skipping enumerator %s: %s", enumerator, e)
+        return values
+
+    def dictionary_for(self, path: str, dtype: np.dtype) -> Optional[np.ndarray]:
+        """ The dictionary of the field and the values tried in every field, None if empty """
+        values = list(self.dictionary.get(path, ())) + list(self.dictionary.get(ANY_FIELD, ()))
+        if len(values) == 0:
+            return None
+        return self.known(values, dtype)
+
+    def array(self, element: _Node, count: int) -> _Node:
+        if isinstance(element, _Integer):
+            count *= max(element.count, 1)
+            return _Integer(
+                element.scalar, element.known, element.is_flags, count, element.dictionary
+            )
+        return _Array(element, np.dtype((element.dtype, (count,))))
+
+    def record(self, layout: layouts.Layout, path: str) -> _Record:
+        arrays = [f for f in layout.fields if f.bits == 0 and f.count > 1]
+        names, formats, offsets, members = list(), list(), list(), list()
+        for i, member in enumerate(layout.fields):
+            if member.bits == 0 and member.count == 0:
+                # Flexible array members are not part of the struct
+                continue
+            if member.bits > 0 and i > 0 and layout.fields[i - 1].bits > 0:
+                if layout.fields[i - 1].offset == member.offset:
+                    # The rest of the bitfields in a storage unit are filled with the first one
+                    continue
+
+            name = member.name or f"_anonymous_{member.offset}"
+            member_path = f"{path}.{name}" if path else name
+            offset = member.offset
+            if member.bits > 0:
+                offset, node = self.bitfields(layout, i)
+            elif member.count > 1:
+                node = self.array(self.compile(member.type, member_path), member.count)
+            else:
+                lengths: List[int] = list()
+                if _LENGTH_RE.search(member.name):
+                    for array in arrays:
+                        lengths += [array.count - 1, array.count, array.count + 1, array.size]
+                node = self.compile(member.type, member_path, tuple(lengths))
+
+            names.append(name)
+            formats.append(node.dtype)
+            offsets.append(offset)
+            members.append((name, node))
+
+        dtype = np.dtype(
+            {"names": names, "formats": formats, "offsets": offsets, "itemsize": layout.size}
+        )
+        return _Record(layout.kind, dtype, members)
+
+    @staticmethod
+    def bitfields(layout: layouts.Layout, first: int) -> Tuple[int, _Integer]:
+        """
+        The bitfields sharing a storage unit are random bytes, only the bytes they cover
+        are filled since other members can be packed into the rest of the storage unit.
+        Returns the offset of the first byte and the node
+        """
+        unit = [
+            f
+            for f in layout.fields[first:]
+            if f.bits > 0 and f.offset == layout.fields[first].offset
+        ]
+        start = min(f.shift for f in unit) // 8
+        end = (max(f.shift + f.bits for f in unit) + 7) // 8
+        return layout.fields[first].offset + start, _Integer(np.dtype("u1"), count=end - start)
+
+    @staticmethod
+    def known(values, dtype: np.dtype) -> np.ndarray:
+        """ Known values that fit in the type, they wrap around like they would in C """
+        info = np.iinfo(dtype)
+        bits = dtype.itemsize * 8
+        wrapped = list()
+        for value in sorted(set(values)):
+            value &= (1 << bits) - 1
+            if value > info.max:
+                value -= 1 << bits
+            wrapped.append(value)
+        return np.array(wrapped, dtype)
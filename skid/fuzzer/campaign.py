@@ -0,0 +1,194 @@
+"""
+Splits the fuzzing budget of a campaign across ioctl handlers, a 10 line watchdog handler
+shouldn't get the same CPU as a 3000 line GPU dispatcher
+
+Each handler is first scored from it's body in the doxygen program listing (see
+doxygen.find_handler_bodies):
+
+    feature         what it counts
+    lines           the non blank lines of the body
+    callees         the distinct functions it calls
+    copies          copy_from_user, get_user and memdup_user calls (argument parsing)
+    commands        the case labels of the switch on cmd
+
+The score is a weighted sum of the log of each feature so a handler twice the size isn't
+worth twice the budget. The scores are the starting split, as the campaign goes on the
+split moves toward the handlers that keep producing outcomes they haven't produced
+before (a new (command, errno) pair). Every handler keeps a small share so one that
+starts slowly isn't starved.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import math
+from logging import getLogger
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np  # type: ignore
+
+from skid.interface_recovery.doxygen import find_commands, find_constraints
+
+logger = getLogger(__name__)
+
+FEATURE_WEIGHTS = {"lines": 1.0, "callees": 1.0, "copies": 2.0, "commands": 1.5}
+
+# How much of the split follows the yield of new outcomes rather than the static score
+ADAPT_RATE = 0.7
+
+# How quickly the yield of a handler follows it's latest slices
+YIELD_SMOOTHING = 0.3
+
+# Every handler gets at least this fraction of an even split
+MIN_SHARE = 0.1
+
+# The calls that copy (part of) the argument in from userspace
+USER_COPIES = (
+    "copy_from_user",
+    "__copy_from_user",
+    "get_user",
+    "__get_user",
+    "memdup_user",
+    "vmemdup_user",
+    "memdup_user_nul",
+)
+
+
+class HandlerFeatures(NamedTuple):
+    """ The static features of an ioctl handler """
+
+    lines: int
+    callees: int
+    copies: int
+    commands: int
+
+
+########## STATIC RANKING ##########
+
+
+def handler_features(body: Sequence[Tuple[int, str]]) -> HandlerFeatures:
+    """ The features of a handler given the (line number, source code) of it's body """
+    tokens = find_constraints.tokenize(body)
+    copies = sum(
+        1
+        for i, token in enumerate(tokens[:-1])
+        if token.value in USER_COPIES and tokens[i + 1].value == "("
+    )
+    return HandlerFeatures(
+        lines=sum(1 for _, text in body if text.strip() != ""),
+        callees=len(find_constraints.called_functions(tokens)),
+        copies=copies,
+        commands=len(find_commands.find_case_labels(body)),
+    )
+
+
+def score(features: HandlerFeatures) -> float:
+    """ The weighted sum of the log of each feature, always positive """
+    total = sum(
+        weight * math.log1p(getattr(features, name)) for name, weight in FEATURE_WEIGHTS.items()
+    )
+    return max(total, 1e-3)
+
+
+def rank_handlers(bodies: Dict[str, Sequence[Tuple[int, str]]]) -> List[Tuple[str, float]]:
+    """ The (refid, score) of each handler with a body, highest score first """
+    scores = [(refid, score(handler_features(body))) for refid, body in bodies.items() if body]
+    scores.sort(key=lambda ranked: ranked[1], reverse=True)
+    for refid, handler_score in scores:
+        logger.debug("%s scored %.2f", refid, handler_score)
+    return scores
+
+
+########## ADAPTIVE SPLIT ##########
+
+
+class CampaignScheduler:
+    """
+    Splits a budget (calls, seconds, ...) across targets by their static score and how
+    many new outcomes they have been producing per call
+
+    Args:
+        targets: The targets e.g the refids of the handlers
+        scores: The static score of each target, see rank_handlers
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[str],
+        scores: Sequence[float],
+        adapt_rate: float = ADAPT_RATE,
+        smoothing: float = YIELD_SMOOTHING,
+        min_share: float = MIN_SHARE,
+    ):
+        assert len(targets) > 0
+        assert len(targets) == len(scores)
+        assert all(target_score > 0 for target_score in scores)
+        assert 0 <= adapt_rate <= 1 and 0 < smoothing <= 1 and 0 <= min_share <= 1
+        self.targets = tuple(targets)
+        self.index = {target: i for i, target in enumerate(self.targets)}
+        self.prior = np.asarray(scores, dtype=np.float64) / np.sum(scores)
+        self.adapt_rate = adapt_rate
+        self.smoothing = smoothing
+        self.min_share = min_share
+
+        # Targets that haven't run yet are assumed to be as good as the best one
+        self.yields = np.full(len(self.targets), np.nan)
+        self.executions = np.zeros(len(self.targets), dtype=np.int64)
+        self.discovered = np.zeros(len(self.targets), dtype=np.int64)
+        self.seen: List[Set[Hashable]] = [set() for _ in self.targets]
+
+    def shares(self) -> np.ndarray:
+        """ The fraction of the budget each target should get next """
+        yields = self.yields.copy()
+        known = ~np.isnan(yields)
+        yields[~known] = yields[known].max() if known.any() else 0
+
+        shares = self.prior
+        if yields.sum() > 0:
+            shares = (1 - self.adapt_rate) * self.prior + self.adapt_rate * yields / yields.sum()
+        floor = self.min_share / len(self.targets)
+        shares = floor + (1 - self.min_share) * shares
+        return shares / shares.sum()
+
+    def allocate(self, budget: int) -> Dict[str, int]:
+        """ Splits budget units across the targets, rounding to the largest remainders """
+        assert budget >= 0
+        exact = self.shares() * budget
+        counts = np.floor(exact).astype(np.int64)
+        remainder = budget - int(counts.sum())
+        counts[np.argsort(counts - exact, kind="stable")[:remainder]] += 1
+        return {target: int(count) for target, count in zip(self.targets, counts)}
+
+    def record(self, target: str, outcomes: Iterable[Hashable], executions: Optional[int] = None):
+        """
+        Records the outcomes of a slice of a target e.g (command, errno) of every call,
+        executions is the number of calls made if not every call gave an outcome
+        """
+        i = self.index[target]
+        outcomes = list(outcomes)
+        executions = len(outcomes) if executions is None else executions
+        if executions == 0:
+            return
+
+        new = len(set(outcomes) - self.seen[i])
+        self.seen[i].update(outcomes)
+        rate = new / executions
+        if np.isnan(self.yields[i]):
+            self.yields[i] = rate
+        else:
+            self.yields[i] += self.smoothing * (rate - self.yields[i])
+        self.executions[i] += executions
+        self.discovered[i] += new
+
+    def summary(self) -> List[Dict]:
+        """ The executions, discovered outcomes and current share of every target """
+        shares = self.shares()
+        return [
+            {
+                "target": target,
+                "share": float(shares[i]),
+                "executions": int(self.executions[i]),
+                "discovered": int(self.discovered[i]),
+            }
+            for i, target in enumerate(self.targets)
+        ]
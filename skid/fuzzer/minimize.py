@@ -0,0 +1,243 @@
+"""
+Minimizes a crashing sequence of ioctl calls with delta debugging (ddmin), see
+Zeller and Hildebrandt "Simplifying and Isolating Failure-Inducing Input" (2002)
+
+The sequence is minimized first, then the argument of each remaining call:
+
+    1. calls       the fewest calls that still crash
+    2. fields      the fewest recovered struct fields that have to be non zero
+    3. bytes       the fewest bytes inside those fields that have to be non zero
+
+Arguments keep their size since the driver copies a fixed number of bytes, a byte that
+isn't needed is zeroed rather than removed. Each step of ddmin tries every chunk and
+every complement at once, the candidates are sent to the oracle in worker processes and
+the first one (in order) that still crashes is kept so the result doesn't depend on
+which worker finishes first.
+
+The oracle decides if a candidate still crashes, it's any picklable callable taking a
+tuple of Calls, for example SignatureOracle matches the kernel log against the original
+crash signature.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import re
+from logging import getLogger
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from skid.interface_recovery.ioctl import evaluator, layouts
+from skid.utils import logs
+
+logger = getLogger(__name__)
+
+MINIMIZE_CHUNKSIZE = 1
+
+
+class Call(NamedTuple):
+    """ A single ioctl call, fields are the (offset, size) of each recovered field """
+
+    number: int
+    argument: bytes = b""
+    fields: Tuple[Tuple[int, int], ...] = ()
+
+
+Calls = Tuple[Call, ...]
+Oracle = Callable[[Calls], bool]
+
+
+class SignatureOracle:
+    """
+    Runs the calls and checks the kernel log for the crash signature
+
+    Args:
+        runner: Executes the calls and returns the kernel log they produced, for
+            example by replaying them in a VM and collecting dmesg. Must be picklable
+        signature: Regex the log has to match e.g 'BUG: KASAN: slab-out-of-bounds in wdt_\\w+'
+    """
+
+    def __init__(self, runner: Callable[[Calls], str], signature: str):
+        self.runner = runner
+        self.signature = re.compile(signature)
+
+    def __call__(self, calls: Calls) -> bool:
+        return self.signature.search(self.runner(calls)) is not None
+
+
+########## FIELD BOUNDARIES ##########
+
+
+def field_spans(
+    layout: layouts.Layout, consts: Optional[evaluator.ConstantEvaluator] = None, base: int = 0
+) -> Tuple[Tuple[int, int], ...]:
+    """
+    The (offset, size) of each field, nested structs are split into their own fields if
+    consts is given. Bitfields sharing a storage unit are one span
+    """
+    spans: List[Tuple[int, int]] = list()
+    for field in layout.fields:
+        span = (base + field.offset, field.size)
+        if field.size == 0 or (field.bits > 0 and spans[-1:] == [span]):
+            continue
+
+        words = layouts.normalize_type(field.type).split()
+        if consts is not None and len(words) == 2 and words[0] in ("struct", "union"):
+            try:
+                nested = consts.layout(words[1])
+                for i in range(field.count):
+                    spans += field_spans(nested, consts, span[0] + i * nested.size)
+                continue
+            except evaluator.UnresolvedConstant:
+                pass
+        spans.append(span)
+
+    # Union members overlap, only the distinct spans are kept
+    return tuple(sorted(set(spans)))
+
+
+########## MINIMIZATION ##########
+
+
+def split(items: Sequence, count: int) -> List[Tuple]:
+    """ Splits the items into count chunks of (nearly) equal size """
+    chunks = list()
+    start = 0
+    for i in range(count):
+        end = start + (len(items) - start) // (count - i)
+        chunks.append(tuple(items[start:end]))
+        start = end
+    return chunks
+
+
+class Minimizer:
+    """
+    Minimizes call sequences against an oracle, the results of the oracle are cached
+    so a candidate is never run twice
+
+    Args:
+        oracle: Returns True if the calls still crash
+        processes: Number of worker processes, 1 runs the oracle in this process
+    """
+
+    def __init__(self, oracle: Oracle, processes: Optional[int] = None):
+        self.oracle = oracle
+        self.processes = processes or os.cpu_count() or 1
+        self.cache: Dict[Calls, bool] = dict()
+        self.runs = 0
+        self._pool = None
+
+    def __enter__(self) -> "Minimizer":
+        if self.processes > 1:
+            self._pool = logs.pool(self.processes)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.__exit__(*exc)
+            self._pool = None
+
+    def minimize(self, calls: Sequence[Call]) -> Calls:
+        """ Returns the minimized calls, they must crash to begin with """
+        calls = tuple(calls)
+        if self.first_crashing([calls]) is None:
+            raise ValueError("The calls don't crash, there's nothing to minimize")
+
+        calls = self.minimize_calls(calls)
+        for i in range(len(calls)):
+            calls = self.minimize_fields(calls, i)
+            calls = self.minimize_bytes(calls, i)
+        logger.info("Minimized to %s calls with %s oracle runs", len(calls), self.runs)
+        return calls
+
+    def minimize_calls(self, calls: Calls) -> Calls:
+        """ The fewest calls that still crash """
+        kept = self.ddmin(tuple(range(len(calls))), lambda kept: tuple(calls[i] for i in kept))
+        return tuple(calls[i] for i in kept)
+
+    def minimize_fields(self, calls: Calls, index: int) -> Calls:
+        """ Zeroes every field of a calls argument that isn't needed for the crash """
+        call = calls[index]
+        spans = [s for s in call.fields if s[0] + s[1] <= len(call.argument)]
+        spans = [s for s in spans if any(call.argument[s[0] : s[0] + s[1]])]
+        if len(spans) == 0:
+            return calls
+
+        def build(kept: Tuple[Tuple[int, int], ...]) -> Calls:
+            argument = bytearray(call.argument)
+            for offset, size in spans:
+                if (offset, size) not in kept:
+                    argument[offset : offset + size] = bytes(size)
+            return with_argument(calls, index, bytes(argument))
+
+        return build(self.ddmin(tuple(spans), build))
+
+    def minimize_bytes(self, calls: Calls, index: int) -> Calls:
+        """ Zeroes every byte of a calls argument that isn't needed for the crash """
+        argument = calls[index].argument
+        nonzero = tuple(i for i, byte in enumerate(argument) if byte != 0)
+        if len(nonzero) == 0:
+            return calls
+
+        def build(kept: Tuple[int, ...]) -> Calls:
+            minimized = bytearray(len(argument))
+            for i in kept:
+                minimized[i] = argument[i]
+            return with_argument(calls, index, bytes(minimized))
+
+        return build(self.ddmin(nonzero, build))
+
+    def ddmin(self, items: Tuple, build: Callable[[Tuple], Calls]) -> Tuple:
+        """
+        Returns a 1-minimal subset of items for which build(subset) still crashes,
+        build(items) must crash
+        """
+        granularity = 2
+        while len(items) >= 2:
+            chunks = split(items, granularity)
+            complements = [
+                tuple(item for j, chunk in enumerate(chunks) if j != i for item in chunk)
+                for i in range(len(chunks))
+            ]
+            candidates = chunks + (complements if granularity > 2 else [])
+            found = self.first_crashing([build(candidate) for candidate in candidates])
+
+            if found is not None and found < len(chunks):
+                items, granularity = candidates[found], 2
+            elif found is not None:
+                items, granularity = candidates[found], max(granularity - 1, 2)
+            elif granularity >= len(items):
+                break
+            else:
+                granularity = min(len(items), granularity * 2)
+
+        if len(items) == 1 and self.first_crashing([build(tuple())]) is not None:
+            return tuple()
+        return items
+
+    def first_crashing(self, candidates: List[Calls]) -> Optional[int]:
+        """ Runs the oracle on the candidates (in parallel), returns the first that crashes """
+        untested = list({c for c in candidates if c not in self.cache})
+        if len(untested) > 0:
+            self.runs += len(untested)
+            if self._pool is None:
+                results = list(map(self.oracle, untested))
+            else:
+                results = self._pool.map(self.oracle, untested, chunksize=MINIMIZE_CHUNKSIZE)
+            self.cache.update(zip(untested, results))
+
+        for i, candidate in enumerate(candidates):
+            if self.cache[candidate]:
+                return i
+        return None
+
+
+def with_argument(calls: Calls, index: int, argument: bytes) -> Calls:
+    """ The calls with the argument of one call replaced """
+    return calls[:index] + (calls[index]._replace(argument=argument),) + calls[index + 1 :]
+
+
+def minimize(calls: Sequence[Call], oracle: Oracle, processes: Optional[int] = None) -> Calls:
+    """ Minimizes the crashing calls, see Minimizer """
+    with Minimizer(oracle, processes) as minimizer:
+        return minimizer.minimize(calls)
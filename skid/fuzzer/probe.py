@@ -0,0 +1,263 @@
+"""
+Finds the ioctl commands a device handles by calling it with candidate request numbers,
+this catches the commands static recovery misses such as table dispatch or commands
+built from macros the evaluator can't fold
+
+Sweeping all 2^32 request numbers isn't practical, instead the candidates are built
+from the _IOC structure of the commands that were recovered:
+
+     31  30 29          16 15      8 7       0
+    +------+--------------+---------+---------+
+    | dir  |     size     |  type   |   nr    |
+    +------+--------------+---------+---------+
+      every  common sizes   recovered  0..255
+      dir    + recovered    types
+             sizes
+
+_IO commands never have a size so only size 0 is tried without a direction. Drivers
+return ENOTTY for commands they don't handle, anything else means the command reached
+a case of the switch. Some drivers use EINVAL instead, calibrate() checks for this by
+probing a type no recovered command uses.
+
+Only the commands of the handler(s) behind the device are used to build the candidates
+and the probed commands are only added to those handlers, see handler_refids.
+
+Every call reuses the same open device and the same preallocated buffer, the buffer
+is big enough for the largest size that fits in the _IOC size field.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from logging import getLogger
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple
+
+import numpy as np  # type: ignore
+
+from skid.interface_recovery.ioctl import request
+from skid.utils import utils
+
+logger = getLogger(__name__)
+
+# Returned by some subsystems before it's converted to ENOTTY
+ENOIOCTLCMD = 515
+
+UNKNOWN_ERRNOS = (errno.ENOTTY, ENOIOCTLCMD)
+
+COMMON_SIZES = (1, 2, 4, 8, 12, 16, 24, 32, 40, 48, 64, 128, 256, 512, 1024, 4096)
+
+BUFFER_SIZE = 1 << request.IOC_SIZEBITS
+
+# Number of calls between progress bar updates
+PROBE_CHUNKSIZE = 4096
+
+CALIBRATION_CALLS = 64
+
+
+########## DEVICES ##########
+
+
+class Device(ABC):
+    """ Something that can be ioctl'd, returns the result or -errno like the kernel does """
+
+    @abstractmethod
+    def ioctl(self, number: int, address: int) -> int:
+        """ Calls the ioctl command with the argument at address """
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "Device":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class FileDevice(Device):
+    """ A device file opened once and called through libc """
+
+    def __init__(self, path: str, flags: int = os.O_RDWR | os.O_NONBLOCK):
+        self.path = path
+        self.fd = os.open(path, flags)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._ioctl = libc.ioctl
+        self._ioctl.argtypes = (ctypes.c_int, ctypes.c_ulong, ctypes.c_void_p)
+        self._ioctl.restype = ctypes.c_int
+
+    def ioctl(self, number: int, address: int) -> int:
+        result = self._ioctl(self.fd, number, address)
+        if result < 0:
+            return -ctypes.get_errno()
+        return result
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+########## CANDIDATES ##########
+
+
+def candidates(
+    types: Iterable[int],
+    sizes: Iterable[int] = COMMON_SIZES,
+    nrs: Iterable[int] = range(1 << request.IOC_NRBITS),
+) -> np.ndarray:
+    """ Every request number with one of the types, sizes and nrs (sorted, uint32) """
+    types = np.array(sorted(set(types)), dtype=np.uint32)
+    nrs = np.array(sorted(set(nrs)), dtype=np.uint32)
+    sizes = np.array(sorted({s for s in sizes if 0 < s < 1 << request.IOC_SIZEBITS}), np.uint32)
+    directions = np.array(
+        [request.IOC_WRITE, request.IOC_READ, request.IOC_READ | request.IOC_WRITE], np.uint32
+    )
+
+    base = (types[:, None] << request.IOC_TYPESHIFT | nrs[None, :]).ravel()
+    sized = (
+        directions[:, None, None] << request.IOC_DIRSHIFT
+        | sizes[None, :, None] << request.IOC_SIZESHIFT
+        | base[None, None, :]
+    ).ravel()
+    return np.unique(np.concatenate([base, sized]))
+
+
+def candidate_types(commands: Iterable[request.IoctlCommand]) -> Set[int]:
+    """ The ioctl types (magic numbers) of the recovered commands """
+    return {command.type for command in commands}
+
+
+def candidate_sizes(commands: Iterable[request.IoctlCommand]) -> Set[int]:
+    """ The common sizes and the sizes of the recovered commands arguments """
+    return set(COMMON_SIZES) | {command.size for command in commands if command.size > 0}
+
+
+########## PROBING ##########
+
+
+class Prober:
+    """
+    Probes a single device
+
+    Args:
+        device: An open device, it is not closed by the prober
+        unknown_errnos: The errnos that mean a command isn't handled
+    """
+
+    def __init__(self, device: Device, unknown_errnos: Sequence[int] = UNKNOWN_ERRNOS):
+        self.device = device
+        self.unknown_errnos = set(unknown_errnos)
+        self.buffer = ctypes.create_string_buffer(BUFFER_SIZE)
+        self.address = ctypes.addressof(self.buffer)
+        self.calls = 0
+
+    def calibrate(self, known_types: Iterable[int]) -> Set[int]:
+        """
+        Probes a type that none of the recovered commands use, if every call fails with
+        the same errno that errno is what this driver returns for unknown commands
+        """
+        unused = next(t for t in range(0xFF, -1, -1) if t not in set(known_types))
+        numbers = candidates([unused], nrs=range(CALIBRATION_CALLS // 4), sizes=(4,))
+        outcomes = Counter(self.call(int(number)) for number in numbers)
+        if len(outcomes) == 1:
+            (outcome,) = outcomes
+            if outcome < 0 and -outcome not in self.unknown_errnos:
+                name = errno.errorcode.get(-outcome, str(-outcome))
+                logger.warning("The device returns %s for unknown commands", name)
+                self.unknown_errnos.add(-outcome)
+        return self.unknown_errnos
+
+    def call(self, number: int) -> int:
+        """ A single call with the preallocated buffer """
+        self.calls += 1
+        return self.device.ioctl(number, self.address)
+
+    def probe(self, numbers: Sequence[int]) -> Dict[int, int]:
+        """ Returns the outcome (0 or errno) of every handled number """
+        handled: Dict[int, int] = dict()
+        if len(numbers) == 0:
+            return handled
+
+        ioctl = self.device.ioctl
+        address = self.address
+        unknown = self.unknown_errnos
+        numbers = np.asarray(numbers, dtype=np.uint64).tolist()
+        chunks = range(0, len(numbers), PROBE_CHUNKSIZE)
+
+        bar_tit = utils.format_alive_bar_title("Probing ioctl commands")
+        with utils.progress_bar(len(chunks), title=bar_tit) as bar:
+            for start in chunks:
+                for number in numbers[start : start + PROBE_CHUNKSIZE]:
+                    result = ioctl(number, address)
+                    if result >= 0:
+                        handled[number] = 0
+                    elif -result not in unknown:
+                        handled[number] = -result
+                bar()
+        self.calls += len(numbers)
+        return handled
+
+
+def probe_device(
+    path: str, commands: Sequence[request.IoctlCommand], device: Optional[Device] = None
+) -> Tuple[request.IoctlCommand, ...]:
+    """
+    Probes the device for commands with the same types as the recovered ones, returns
+    the handled commands that were not already recovered
+    """
+    types = candidate_types(commands)
+    if len(types) == 0:
+        logger.warning("No recovered ioctl commands to probe %s with", path)
+        return tuple()
+
+    numbers = candidates(types, candidate_sizes(commands))
+    with device or FileDevice(path) as opened:
+        prober = Prober(opened)
+        prober.calibrate(types)
+        handled = prober.probe(numbers)
+
+    known = {command.number for command in commands}
+    found = to_commands(number for number in handled if number not in known)
+    logger.info("Probed %s commands, %s handled and %s new", len(numbers), len(handled), len(found))
+    return found
+
+
+########## RESULTS ##########
+
+
+def to_commands(numbers: Iterable[int]) -> Tuple[request.IoctlCommand, ...]:
+    """ Decodes probed numbers, they are named after the number since the name is unknown """
+    return tuple(request.decode(f"0x{number:08X}", number) for number in sorted(numbers))
+
+
+def handler_refids(fileop_structs: Iterable[Dict], handler: str) -> Tuple[str, ...]:
+    """ The refids of the ioctl handlers that are the handler, by function name or refid """
+    refids = list()
+    for fops in fileop_structs:
+        if handler in (fops["function"], fops["refid"]) and fops["refid"] not in refids:
+            refids.append(fops["refid"])
+    return tuple(refids)
+
+
+def merge_probed(
+    commands: Dict[str, Tuple[request.IoctlCommand, ...]],
+    probed: Iterable[request.IoctlCommand],
+    refids: Iterable[str],
+) -> Dict[str, Tuple[request.IoctlCommand, ...]]:
+    """
+    Adds the probed commands to the recovered ones (keyed by handler refid), they only
+    go to the handlers of the probed device (refids), the other handlers are unchanged
+    """
+    merged = {refid: list(handler_commands) for refid, handler_commands in commands.items()}
+    probed = list(probed)
+    for refid in refids:
+        handler_commands = merged.setdefault(refid, list())
+        known = {command.number for command in handler_commands}
+        handler_commands.extend(command for command in probed if command.number not in known)
+    return {refid: tuple(handler_commands) for refid, handler_commands in merged.items()}
@@ -0,0 +1,154 @@
+"""
+Decides which ioctl command (and argument shape) to execute next using nothing but the
+errno each call returns
+
+Every (command, shape) pair is an arm of a multi-armed bandit, each arm keeps a
+histogram of the outcomes it has reached:
+
+                 success  EPERM  ENOENT  ...  EFAULT  ...  EINVAL  ...  ENOTTY  ...
+    GETSUPPORT      812      0       0           20           0            0
+    SETTIMEOUT        3      0       0            0         977            0
+    0x5799            0      0       0            0           0         1000
+
+An outcome is worth more the deeper into the driver it shows the call got, success and
+EFAULT mean the arguments were accepted and used, and the rarer it has been so far.
+Arms are picked with Thompson sampling on those rewards so commands that only ever
+return ENOTTY or EINVAL quickly stop receiving budget but are never starved outright.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import errno
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np  # type: ignore
+
+SUCCESS = 0
+
+# Outcomes are 0 for success or the errno, anything bigger shares the last bucket
+MAX_ERRNO = max(errno.errorcode) + 1
+OTHER = MAX_ERRNO
+
+# How much an outcome is worth regardless of how often it happens
+DEPTH_REWARDS = {SUCCESS: 0.3, errno.EFAULT: 0.3, errno.EINVAL: 0.05, errno.ENOTTY: 0.0}
+DEFAULT_DEPTH_REWARD = 0.2
+
+# Posterior samples drawn per batch, each winner gets an equal share of the batch
+THOMPSON_ROUNDS = 32
+
+# Old results are slowly forgotten since rewards shrink as outcomes become common
+DECAY = 0.999
+
+
+class Arm(NamedTuple):
+    """ A command and the kind of argument it is called with """
+
+    command: str
+    shape: str = "default"
+
+
+def outcome(result: int, error: int = 0) -> int:
+    """ The outcome of a call, given the return value and errno (or -errno like the kernel) """
+    if result >= 0:
+        return SUCCESS
+    return min(error or -result, OTHER)
+
+
+class ErrnoScheduler:
+    """
+    Thompson sampling over arms, the Beta posterior of each arm is updated with the
+    reward of every outcome it produced
+
+    Args:
+        arms: The arms to schedule
+        depth_rewards: Overrides DEPTH_REWARDS
+    """
+
+    def __init__(
+        self,
+        arms: Sequence[Arm],
+        depth_rewards: Optional[Dict[int, float]] = None,
+        decay: float = DECAY,
+        seed: Optional[int] = None,
+    ):
+        assert len(arms) > 0
+        assert 0 < decay <= 1
+        self.arms = tuple(arms)
+        self.decay = decay
+        self.rng = np.random.default_rng(seed)
+
+        self.histograms = np.zeros((len(self.arms), MAX_ERRNO + 1), dtype=np.uint32)
+        self.totals = np.zeros(MAX_ERRNO + 1, dtype=np.uint64)
+        self.alpha = np.ones(len(self.arms))
+        self.beta = np.ones(len(self.arms))
+
+        self.depth = np.full(MAX_ERRNO + 1, DEFAULT_DEPTH_REWARD)
+        for code, reward in {**DEPTH_REWARDS, **(depth_rewards or dict())}.items():
+            self.depth[code] = reward
+
+    ########## SCHEDULING ##########
+
+    def choose(self, count: int) -> np.ndarray:
+        """ Returns the indices of the next count arms to execute """
+        assert count > 0
+        rounds = min(count, THOMPSON_ROUNDS)
+        samples = self.rng.beta(self.alpha, self.beta, size=(rounds, len(self.arms)))
+        return np.resize(samples.argmax(axis=1), count)
+
+    def record(self, arms: np.ndarray, outcomes: np.ndarray):
+        """ Records the outcome of executing each of the arms """
+        arms = np.asarray(arms, dtype=np.intp)
+        outcomes = np.minimum(np.asarray(outcomes, dtype=np.intp), OTHER)
+        assert arms.shape == outcomes.shape
+
+        rewards = self.rewards(outcomes)
+        np.add.at(self.histograms, (arms, outcomes), 1)
+        np.add.at(self.totals, outcomes, 1)
+
+        self.alpha *= self.decay
+        self.beta *= self.decay
+        np.add.at(self.alpha, arms, rewards)
+        np.add.at(self.beta, arms, 1 - rewards)
+
+    def rewards(self, outcomes: np.ndarray) -> np.ndarray:
+        """ The reward of each outcome, the depth reward plus a bonus that shrinks as it's seen """
+        novelty = 1 / np.sqrt(1 + self.totals[outcomes].astype(np.float64))
+        return np.clip(self.depth[outcomes] + (1 - self.depth[outcomes]) * novelty, 0, 1)
+
+    ########## RESULTS ##########
+
+    def executions(self) -> np.ndarray:
+        """ The number of times each arm was executed """
+        return self.histograms.sum(axis=1)
+
+    def outcomes(self, arm: int) -> Dict[str, int]:
+        """ The histogram of an arm keyed by errno name e.g {'SUCCESS': 10, 'EINVAL': 2} """
+        return {
+            outcome_name(code): int(count)
+            for code, count in enumerate(self.histograms[arm])
+            if count > 0
+        }
+
+    def summary(self) -> List[Dict]:
+        """ The outcomes of every arm that was executed, most executed first """
+        executions = self.executions()
+        return [
+            {
+                "command": self.arms[i].command,
+                "shape": self.arms[i].shape,
+                "executions": int(executions[i]),
+                "outcomes": self.outcomes(i),
+            }
+            for i in np.argsort(-executions, kind="stable")
+            if executions[i] > 0
+        ]
+
+
+def outcome_name(code: int) -> str:
+    """ A readable name for an outcome e.g 'SUCCESS' or 'EINVAL' """
+    if code == SUCCESS:
+        return "SUCCESS"
+    if code == OTHER:
+        return "OTHER"
+    return errno.errorcode.get(code, str(code))
@@ -0,0 +1,604 @@
+"""
+Generates stateful sequences of ioctl calls, many commands only get past their first
+checks once another command has set something up:
+
+    case FOO_ALLOC:                             case FOO_SUBMIT:
+        priv->buf = kzalloc(size, GFP_KERNEL);      if (!priv->buf)
+        ...                                             return -EINVAL;
+
+Each sequence is a single open of the device, the commands another command depends on
+(setup) are called before it (operational):
+
+    open -> setup commands -> operational commands -> close
+
+The dependencies come from two places:
+
+    static      a case of the handler writes state, a global or something reached
+                through a pointer such as priv->buf, that another case checks or reads
+    runtime     a command gets through (success or EFAULT) more often when another
+                command succeeded earlier in the same open
+
+The commands that succeeded in a sequence are the state it reached, the deepest of these
+are cached per device so later runs start from them rather than rediscovering them.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import ctypes
+import errno
+import json
+import os
+from collections import Counter, defaultdict
+from logging import getLogger
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import numpy as np  # type: ignore
+
+from skid.fuzzer import arguments, minimize, probe, scheduler
+from skid.interface_recovery.doxygen import find_commands
+from skid.interface_recovery.ioctl import request
+from skid.interface_recovery.scan import lexer
+
+logger = getLogger(__name__)
+
+STATIC_CHECKS = "checks"
+STATIC_READS = "reads"
+RUNTIME = "runtime"
+
+# How likely a prerequisite is to be called before the command that depends on it
+DEPENDENCY_WEIGHTS = {STATIC_CHECKS: 0.9, STATIC_READS: 0.5, RUNTIME: 1.0}
+
+# Outcomes that mean a call got past the checks of the handler
+PASSED = (scheduler.SUCCESS, errno.EFAULT)
+
+# A runtime dependency needs this many calls with and without the prerequisite and has
+# to raise how often the command gets through by at least MIN_LIFT
+MIN_TRIALS = 20
+MIN_LIFT = 0.3
+
+MAX_LENGTH = 8
+
+# How often a sequence starts from a cached state and how many states are kept
+REUSE_PROBABILITY = 0.5
+MAX_CACHED = 64
+
+# After each operational command, how often the sequence ends
+STOP_PROBABILITY = 0.3
+
+SEQUENCE_CACHE_DIRECTORY = "/tmp/skid-sequences"
+SEQUENCE_CACHE_VERSION = 1
+
+_ASSIGNMENTS = frozenset(("=", "+=", "-=", "*=", "/=", "%=", "&=", "|=", "^=", "<<=", ">>="))
+_INCREMENTS = frozenset(("++", "--"))
+_CONDITIONS = frozenset(("if", "while", "switch"))
+_KEYWORDS = frozenset(
+    (
+        "auto break case char const continue default do double else enum extern float for "
+        "goto if inline int long register restrict return short signed sizeof static struct "
+        "switch typedef union unsigned void volatile while bool true false NULL __user "
+        "typeof __typeof__ fallthrough"
+    ).split()
+)
+_NOT_TYPES = _KEYWORDS - frozenset(
+    "char const double enum float int long short signed static struct union unsigned void "
+    "volatile bool".split()
+)
+
+
+class Dependency(NamedTuple):
+    """ before has to be called for after to get through, state is what links them """
+
+    before: str
+    after: str
+    kind: str
+    state: str = ""
+
+
+class Access(NamedTuple):
+    """ The state a case of the handler writes, checks (in a condition) and reads """
+
+    writes: FrozenSet[str] = frozenset()
+    checks: FrozenSet[str] = frozenset()
+    reads: FrozenSet[str] = frozenset()
+
+    def merge(self, other: "Access") -> "Access":
+        return Access(
+            self.writes | other.writes, self.checks | other.checks, self.reads | other.reads
+        )
+
+
+########## STATIC DEPENDENCIES ##########
+
+
+def static_dependencies(body: Sequence[Tuple[int, str]]) -> List[Dependency]:
+    """ The dependencies between the cases of a handler, given it's body, see case_accesses """
+    accesses = case_accesses(body)
+    dependencies = list()
+    for after, access in accesses.items():
+        for before, setup in accesses.items():
+            if before == after:
+                continue
+            for state in sorted(setup.writes & access.checks):
+                dependencies.append(Dependency(before, after, STATIC_CHECKS, state))
+            for state in sorted(setup.writes & (access.reads - access.checks)):
+                dependencies.append(Dependency(before, after, STATIC_READS, state))
+    return dependencies
+
+
+def case_accesses(body: Sequence[Tuple[int, str]]) -> Dict[str, Access]:
+    """
+    The state each case of the handler accesses keyed by the case label. Cases that share
+    a body (case A: case B:) share the access, fallthrough into the next case isn't followed
+    """
+    tokens = list(lexer.tokenize("\n".join(text for _, text in body)))
+    cases = list(find_commands.iter_cases(tokens))
+    starts = [start for start, _, _ in cases]
+    starts += [
+        i
+        for i, token in enumerate(tokens[:-1])
+        if token.value == "default" and tokens[i + 1].value == ":"
+    ]
+    starts.sort()
+    local_vars = local_names(tokens)
+
+    accesses: Dict[str, Access] = dict()
+    labels: List[str] = list()
+    for start, label, colon in cases:
+        values = [token.value for token in label]
+        if len(values) > 0 and "..." not in values:
+            labels.append(" ".join(values))
+        end = next((s for s in starts if s > colon), len(tokens))
+        if end == colon + 1 and end < len(tokens) and tokens[end].value == "case":
+            continue
+
+        access = state_accesses(tokens[colon + 1 : end], local_vars)
+        for text in labels:
+            accesses[text] = accesses.get(text, Access()).merge(access)
+        labels = list()
+    return accesses
+
+
+def local_names(tokens: List[lexer.Token]) -> Set[str]:
+    """
+    The parameters of the function and the variables it declares, a declaration is a type
+    followed by a name at the start of a statement:
+
+        int new_options, *p = argp;       ->      new_options, p
+    """
+    names: Set[str] = set()
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.value == "{":
+            break
+        if depth == 1 and token.value in (",", ")") and tokens[i - 1].kind == lexer.IDENT:
+            names.add(tokens[i - 1].value)
+        depth += {"(": 1, ")": -1}.get(token.value, 0)
+
+    for i, token in enumerate(tokens):
+        statement = i > 0 and (
+            tokens[i - 1].value in (";", "{", "}")
+            or tokens[i - 1].value == "(" and i > 1 and tokens[i - 2].value == "for"
+        )
+        if not statement or token.kind != lexer.IDENT or token.value in _NOT_TYPES:
+            continue
+
+        # The type is every identifier (and '*') up to the last one before = ; , [
+        j = i
+        while j < len(tokens) and (tokens[j].kind == lexer.IDENT or tokens[j].value == "*"):
+            j += 1
+        if j - i < 2 or j >= len(tokens) or tokens[j - 1].kind != lexer.IDENT:
+            continue
+        if tokens[j].value not in ("=", ";", ",", "["):
+            continue
+        names.add(tokens[j - 1].value)
+
+        # Everything else declared by the statement follows a ',' outside of brackets
+        depth = 0
+        for k in range(j, len(tokens)):
+            if tokens[k].value in ("(", "[", "{"):
+                depth += 1
+            elif tokens[k].value in (")", "]", "}"):
+                depth -= 1
+            elif tokens[k].value == ";" and depth <= 0:
+                break
+            elif tokens[k].value == "," and depth == 0:
+                name = k + 1
+                while name < len(tokens) and tokens[name].value == "*":
+                    name += 1
+                if name < len(tokens) and tokens[name].kind == lexer.IDENT:
+                    names.add(tokens[name].value)
+    return names
+
+
+def state_accesses(tokens: List[lexer.Token], local_vars: Set[str]) -> Access:
+    """ The state the tokens write, check and read, see state_name """
+    writes: Set[str] = set()
+    checks: Set[str] = set()
+    reads: Set[str] = set()
+    conditions: List[bool] = list()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        previous = tokens[i - 1].value if i > 0 else ""
+        if token.value == "(":
+            conditions.append(previous in _CONDITIONS)
+        elif token.value == ")" and len(conditions) > 0:
+            conditions.pop()
+        elif token.kind == lexer.IDENT and previous not in (".", "->"):
+            end, state = state_name(tokens, i, local_vars)
+            if state is not None:
+                following = tokens[end].value if end < len(tokens) else ""
+                address_of = previous == "&" and (
+                    i < 2 or tokens[i - 2].value == "return" or tokens[i - 2].kind == lexer.PUNCT
+                    and tokens[i - 2].value not in (")", "]")
+                )
+                if following in _ASSIGNMENTS or _INCREMENTS & {following, previous} or address_of:
+                    writes.add(state)
+                elif any(conditions):
+                    checks.add(state)
+                else:
+                    reads.add(state)
+            if end > i:
+                i = end
+                continue
+        i += 1
+    return Access(frozenset(writes), frozenset(checks), frozenset(reads))
+
+
+def state_name(
+    tokens: List[lexer.Token], start: int, local_vars: Set[str]
+) -> Tuple[int, Optional[str]]:
+    """
+    Reads the expression at start such as priv->state.mode or buffers[i] and returns
+    the index after it and the state it names: the members after a local pointer (state.mode)
+    or a global and it's members. None for locals, calls, keywords and constants
+    """
+    name = tokens[start].value
+    members: List[str] = list()
+    pointer = False
+    end = start + 1
+    while end < len(tokens):
+        value = tokens[end].value
+        if value in (".", "->") and end + 1 < len(tokens) and tokens[end + 1].kind == lexer.IDENT:
+            pointer = pointer or (len(members) == 0 and value == "->")
+            members.append(tokens[end + 1].value)
+            end += 2
+        elif value == "[":
+            depth = 0
+            while end < len(tokens):
+                depth += {"[": 1, "]": -1}.get(tokens[end].value, 0)
+                end += 1
+                if depth == 0:
+                    break
+        else:
+            break
+
+    previous = tokens[start - 1].value if start > 0 else ""
+    if (
+        name in _KEYWORDS
+        or name.upper() == name
+        or previous in ("struct", "union", "enum", "goto")
+        or (end < len(tokens) and tokens[end].value == "(")
+    ):
+        return end, None
+    if name in local_vars:
+        return end, ".".join(members) if pointer else None
+    return end, ".".join([name] + members)
+
+
+########## RUNTIME DEPENDENCIES ##########
+
+
+class DependencyLearner:
+    """
+    Counts how often each command gets through with and without each other command
+    having succeeded earlier in the same open of the device
+
+    Later calls have more chances to follow the real prerequisite, so any command that
+    tends to come early looks like a prerequisite too. To explain these away every
+    command is also counted only over the calls where it's strongest prerequisite so far
+    succeeded first, a second prerequisite has to make a difference there as well
+
+    Args:
+        commands: The names of the commands
+    """
+
+    def __init__(self, commands: Sequence[str]):
+        self.commands = tuple(commands)
+        self.index = {command: i for i, command in enumerate(self.commands)}
+        # [without/with the prerequisite, prerequisite, command]
+        shape = (2, len(self.commands), len(self.commands))
+        self.trials = np.zeros(shape, dtype=np.uint32)
+        self.passed = np.zeros(shape, dtype=np.uint32)
+        # The same given the strongest prerequisite of the command succeeded
+        self.strongest = np.full(len(self.commands), -1, dtype=np.intp)
+        self.given_trials = np.zeros(shape, dtype=np.uint32)
+        self.given_passed = np.zeros(shape, dtype=np.uint32)
+
+    def observe(self, sequence: Sequence[str], outcomes: Sequence[int]):
+        """ Records the outcome of each call of an executed sequence """
+        assert len(sequence) == len(outcomes)
+        succeeded = np.zeros(len(self.commands), dtype=np.intp)
+        everything = np.arange(len(self.commands))
+        for command, code in zip(sequence, outcomes):
+            j = self.index.get(command)
+            if j is None:
+                continue
+            got_through = code in PASSED
+            self.trials[succeeded, everything, j] += 1
+            self.passed[succeeded, everything, j] += got_through
+            strongest = self.strongest[j]
+            if strongest >= 0 and succeeded[strongest]:
+                self.given_trials[succeeded, everything, j] += 1
+                self.given_passed[succeeded, everything, j] += got_through
+            if code == scheduler.SUCCESS:
+                succeeded[j] = 1
+
+    def dependencies(self, min_trials=MIN_TRIALS, min_lift=MIN_LIFT) -> List[Dependency]:
+        """
+        The dependencies the outcomes so far support. This also picks the strongest
+        prerequisite of each command, so it should be called every so often while learning
+        """
+        lifts = lift(self.trials, self.passed, min_trials)
+        strongest = np.where(lifts.max(axis=0) >= min_lift, lifts.argmax(axis=0), -1)
+        changed = strongest != self.strongest
+        self.given_trials[:, :, changed] = 0
+        self.given_passed[:, :, changed] = 0
+        self.strongest = strongest
+
+        given = lift(self.given_trials, self.given_passed, min_trials) >= min_lift
+        is_strongest = np.arange(len(self.commands))[:, None] == strongest[None, :]
+        before, after = np.nonzero((lifts >= min_lift) & (is_strongest | given))
+        return [
+            Dependency(self.commands[b], self.commands[a], RUNTIME)
+            for b, a in zip(before.tolist(), after.tolist())
+        ]
+
+
+def lift(trials: np.ndarray, passed: np.ndarray, min_trials: int) -> np.ndarray:
+    """
+    How much more often each command (column) gets through with each prerequisite (row)
+    than without it, -inf without min_trials calls either way or on the diagonal
+    """
+    rates = passed / np.maximum(trials, 1)
+    lifts = rates[1] - rates[0]
+    lifts[(trials < min_trials).any(axis=0)] = -np.inf
+    np.fill_diagonal(lifts, -np.inf)
+    return lifts
+
+
+########## GENERATION ##########
+
+
+class SequenceGenerator:
+    """
+    Generates sequences of command names, each is meant for a single open of the device
+
+    Args:
+        commands: The names of the commands the handler accepts
+        dependencies: Static or runtime dependencies between the commands
+        cached: States to start from, the commands that succeeded in earlier sequences
+        max_length: The most calls in a sequence
+    """
+
+    def __init__(
+        self,
+        commands: Sequence[str],
+        dependencies: Iterable[Dependency] = (),
+        cached: Iterable[Tuple[str, ...]] = (),
+        max_length: int = MAX_LENGTH,
+        seed: Optional[int] = None,
+    ):
+        assert len(commands) > 0
+        assert max_length > 0
+        self.commands = tuple(commands)
+        self.max_length = max_length
+        self.rng = np.random.default_rng(seed)
+        self.cached = [tuple(state) for state in cached if len(state) > 0]
+        # The weight of each prerequisite keyed by the command that depends on it
+        self.prerequisites: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.add_dependencies(dependencies)
+
+    def add_dependencies(self, dependencies: Iterable[Dependency]):
+        """ Adds dependencies, the strongest kind wins if there's more than one """
+        known = set(self.commands)
+        for dependency in dependencies:
+            if dependency.before == dependency.after:
+                continue
+            if dependency.before not in known or dependency.after not in known:
+                continue
+            weights = self.prerequisites[dependency.after]
+            weight = DEPENDENCY_WEIGHTS[dependency.kind]
+            weights[dependency.before] = max(weights.get(dependency.before, 0.0), weight)
+
+    def setup_commands(self) -> Tuple[str, ...]:
+        """ The commands another command depends on """
+        setup = {before for weights in self.prerequisites.values() for before in weights}
+        return tuple(command for command in self.commands if command in setup)
+
+    def operational_commands(self) -> Tuple[str, ...]:
+        """ The commands no other command depends on """
+        setup = set(self.setup_commands())
+        return tuple(command for command in self.commands if command not in setup)
+
+    def setup(self, command: str, done: Iterable[str] = ()) -> List[str]:
+        """
+        The prerequisites of the command, and theirs, in the order they should be called.
+        Each is included with the probability of it's weight, those already done are skipped
+        """
+        order: List[str] = list()
+        seen = set(done) | {command}
+        pending = [(command, iter(self.prerequisites.get(command, dict()).items()))]
+        while len(pending) > 0:
+            name, remaining = pending[-1]
+            for before, weight in remaining:
+                if before not in seen and self.rng.random() < weight:
+                    seen.add(before)
+                    pending.append((before, iter(self.prerequisites.get(before, dict()).items())))
+                    break
+            else:
+                pending.pop()
+                if name != command:
+                    order.append(name)
+        return order
+
+    def generate(self) -> Tuple[str, ...]:
+        """ A sequence of commands, the setup of each command comes before it """
+        calls: List[str] = list()
+        if len(self.cached) > 0 and self.rng.random() < REUSE_PROBABILITY:
+            depths = np.array([len(state) for state in self.cached], dtype=np.float64)
+            calls.extend(self.cached[self.rng.choice(len(self.cached), p=depths / depths.sum())])
+
+        operational = self.operational_commands() or self.commands
+        while len(calls) < self.max_length:
+            target = operational[self.rng.integers(len(operational))]
+            chain = self.setup(target, calls) + [target]
+            if len(calls) > 0 and len(calls) + len(chain) > self.max_length:
+                break
+            calls.extend(chain)
+            if self.rng.random() < STOP_PROBABILITY:
+                break
+        return tuple(calls[: self.max_length])
+
+    def generate_batch(self, count: int) -> List[Tuple[str, ...]]:
+        """ Generates count sequences """
+        assert count > 0
+        return [self.generate() for _ in range(count)]
+
+
+########## EXECUTION ##########
+
+
+def to_calls(
+    sequence: Sequence[str],
+    commands: Dict[str, request.IoctlCommand],
+    generators: Dict[str, arguments.ArgumentGenerator],
+) -> minimize.Calls:
+    """
+    The ioctl calls of a sequence, the arguments of each command are generated in one
+    batch. Commands without a generator are called with a zeroed argument of their size
+    """
+    counts = Counter(sequence)
+    batches = {
+        name: iter(generators[name].generate(count))
+        for name, count in counts.items()
+        if name in generators
+    }
+    calls = list()
+    for name in sequence:
+        command = commands[name]
+        if name in batches:
+            argument = bytes(next(batches[name]))
+        else:
+            argument = bytes(command.size)
+        calls.append(minimize.Call(command.number, argument))
+    return tuple(calls)
+
+
+def run_sequence(open_device: Callable[[], probe.Device], calls: minimize.Calls) -> List[int]:
+    """ Opens the device, makes the calls, closes it and returns the outcome of each call """
+    outcomes = list()
+    with open_device() as device:
+        for call in calls:
+            buffer = ctypes.create_string_buffer(call.argument, max(len(call.argument), 1))
+            outcomes.append(scheduler.outcome(device.ioctl(call.number, ctypes.addressof(buffer))))
+    return outcomes
+
+
+def reached(sequence: Sequence[str], outcomes: Sequence[int]) -> Tuple[str, ...]:
+    """ The state a sequence reached, the commands that succeeded in the order they were called """
+    assert len(sequence) == len(outcomes)
+    return tuple(name for name, code in zip(sequence, outcomes) if code == scheduler.SUCCESS)
+
+
+########## CACHE ##########
+
+
+def cache_location(device: str, directory=SEQUENCE_CACHE_DIRECTORY) -> str:
+    """ Where the sequences of a device are cached e.g /dev/watchdog0 -> dev_watchdog0.json """
+    return os.path.join(directory, device.strip("/").replace("/", "_") + ".json")
+
+
+class SequenceCache:
+    """
+    The deepest states and the runtime dependencies found for a single device, they are
+    ignored if the commands of the device changed since they were saved
+
+    Args:
+        device: The path of the device
+        commands: The names of the commands the handler accepts
+        location: The cache file, defaults to cache_location(device)
+    """
+
+    def __init__(self, device: str, commands: Sequence[str], location: Optional[str] = None):
+        self.device = device
+        self.commands = sorted(set(commands))
+        self.location = location or cache_location(device)
+        # The number of times each state was reached
+        self.states: Dict[Tuple[str, ...], int] = dict()
+        self.dependencies: List[Dependency] = list()
+        self.load()
+
+    def load(self):
+        """ Loads the cache if it exists and is for the same commands """
+        try:
+            with open(self.location, "r") as cache_f:
+                cached = json.load(cache_f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if (
+            cached.get("version") != SEQUENCE_CACHE_VERSION
+            or cached.get("device") != self.device
+            or cached.get("commands") != self.commands
+        ):
+            logger.info("Ignoring the stale sequence cache %s", self.location)
+            return
+
+        self.states = {tuple(state["calls"]): state["reached"] for state in cached["states"]}
+        self.dependencies = [Dependency(*dependency) for dependency in cached["dependencies"]]
+
+    def save(self):
+        """ Writes the cache, replacing the old one in a single step """
+        os.makedirs(os.path.dirname(self.location) or ".", exist_ok=True)
+        cached = {
+            "version": SEQUENCE_CACHE_VERSION,
+            "device": self.device,
+            "commands": self.commands,
+            "states": [
+                {"calls": list(state), "reached": count} for state, count in self.states.items()
+            ],
+            "dependencies": [list(dependency) for dependency in self.dependencies],
+        }
+        logger.debug("Writing %s sequences to: %s", len(self.states), self.location)
+        temp_loc = self.location + ".tmp"
+        with open(temp_loc, "w") as cache_f:
+            json.dump(cached, cache_f)
+        os.replace(temp_loc, self.location)
+
+    def add(self, sequence: Sequence[str], outcomes: Sequence[int]) -> bool:
+        """ Records the state an executed sequence reached, True if it's a new one """
+        state = reached(sequence, outcomes)
+        if len(state) == 0:
+            return False
+        new = state not in self.states
+        self.states[state] = self.states.get(state, 0) + 1
+        if len(self.states) > MAX_CACHED:
+            # The shallowest state, the least reached if there's a tie
+            del self.states[min(self.states, key=lambda s: (len(s), self.states[s]))]
+        return new and state in self.states
+
+    def deepest(self) -> List[Tuple[str, ...]]:
+        """ The cached states, deepest first """
+        return sorted(self.states, key=lambda state: (-len(state), -self.states[state]))
@@ -0,0 +1,330 @@
+"""
+Python API for interface recovery
+
+This is for embedding skid inside another pipeline, rather than returning True/False
+like the command line entry point it takes typed options and hands back iterators
+so the first results are available as soon as the first worker finishes. For example
+to stop after the first 10 ioctl handlers:
+
+    options = RecoveryOptions(source="/home/luke/linux/drivers/watchdog")
+    for fops in recover(options, limit=10):
+        print(fops["function"])
+
+Breaking out of the loop (or calling close() on the iterator) terminates the workers
+so none of the remaining files are parsed.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import itertools
+import os
+from dataclasses import dataclass, replace
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import libclang, scan
+from skid.interface_recovery.doxygen import doxygen, validation
+from skid.utils import admission, stages, supervisor, tuning
+
+logger = getLogger(__name__)
+
+FRONTEND_DOXYGEN = "doxygen"
+FRONTEND_CLANG = "clang"
+FRONTEND_SCAN = "scan"
+FRONTENDS = (FRONTEND_DOXYGEN, FRONTEND_CLANG, FRONTEND_SCAN)
+
+
+@dataclass(frozen=True)
+class RecoveryOptions:
+    """
+    Options for interface recovery
+
+    Attributes:
+        source: Location of the source code that contains the ioctl's
+        doxyconf: Location of a user defined doxygen config (json)
+        validate: Drop XML files that don't match doxygen's schema
+        validation_mode: How the XML is validated, one of doxygen.validation.MODES
+        pack: Pack the doxygen XML into a single archive
+        compress: Compress the compounds inside the packed archive
+        transcode: Transcode the XML into the compact IR the extractors read, see doxygen.ir
+        processes: Number of worker processes, defaults to the cpu count
+        reuse: How prior doxygen results are reused, one of doxygen.REUSE_POLICIES
+        frontend: What extracts the interfaces, one of FRONTENDS
+        compile_commands: Location of compile_commands.json, used by the clang frontend
+        export: Directory to export the interfaces to as protocol buffers
+        probe: Device to probe for ioctl commands that were not recovered statically
+        probe_handler: The ioctl handler (function name or refid) behind the probed device
+        database: SQLite database to export the interfaces to
+        coordinator: host:port to hand the XML files out to workers from
+        memory_budget: Bytes the XML worker pools may use, defaults to most of the free memory
+        file_timeout: Seconds a worker may spend on an XML file before it's quarantined
+        quarantine: Where to write the report of quarantined files (json)
+        profile: Location of a profile written by skid.py tune, see utils.tuning
+    """
+
+    source: str
+    doxyconf: Optional[str] = None
+    validate: bool = True
+    validation_mode: str = validation.MODE_FULL
+    pack: bool = False
+    compress: bool = False
+    transcode: bool = False
+    processes: Optional[int] = None
+    reuse: str = doxygen.REUSE_AUTO
+    frontend: str = FRONTEND_DOXYGEN
+    compile_commands: Optional[str] = None
+    export: Optional[str] = None
+    probe: Optional[str] = None
+    probe_handler: Optional[str] = None
+    database: Optional[str] = None
+    coordinator: Optional[str] = None
+    memory_budget: Optional[int] = None
+    file_timeout: Optional[float] = None
+    quarantine: Optional[str] = None
+    profile: Optional[str] = None
+
+    def __post_init__(self):
+        if self.reuse not in doxygen.REUSE_POLICIES:
+            raise ValueError(
+                f"Unknown reuse policy {self.reuse}, expected one of {doxygen.REUSE_POLICIES}"
+            )
+        if self.validation_mode not in validation.MODES:
+            raise ValueError(
+                f"Unknown validation mode {self.validation_mode}, "
+                f"expected one of {validation.MODES}"
+            )
+        if self.frontend not in FRONTENDS:
+            raise ValueError(f"Unknown frontend {self.frontend}, expected one of {FRONTENDS}")
+        if self.memory_budget is not None and self.memory_budget <= 0:
+            raise ValueError("The memory budget must be positive")
+        if self.file_timeout is not None and self.file_timeout <= 0:
+            raise ValueError("The file timeout must be positive")
+        if self.probe is not None and self.probe_handler is None:
+            raise ValueError("Probing a device needs the ioctl handler behind it (--probe-handler)")
+        if self.frontend == FRONTEND_CLANG and (
+            self.export is not None or self.database is not None or self.probe is not None
+        ):
+            raise ValueError(
+                "The clang frontend's refids can't be joined with the ioctl commands, "
+                "--export, --database and --probe need --frontend=doxygen"
+            )
+        if self.transcode and self.coordinator is not None:
+            raise ValueError("The coordinator hands out XML, it can't be used with transcode")
+
+    @property
+    def compile_commands_location(self) -> str:
+        """ compile_commands.json location, defaults to the root of the source tree """
+        if self.compile_commands is not None:
+            return self.compile_commands
+        return os.path.join(self.source, "compile_commands.json")
+
+    @classmethod
+    def from_args(cls, args: Dict[str, Any]) -> "RecoveryOptions":
+        """ Builds the options from the docopt arguments """
+        return cls(
+            source=args["--source"],
+            doxyconf=args["--doxyconf"],
+            validate=not args["--dont-validate"],
+            validation_mode=args["--validation"],
+            pack=args["--pack"],
+            compress=args["--compress"],
+            transcode=args["--transcode"],
+            reuse=args["--reuse"],
+            frontend=args["--frontend"],
+            compile_commands=args["--compile-commands"],
+            export=args["--export"],
+            probe=args["--probe"],
+            probe_handler=args["--probe-handler"],
+            database=args["--database"],
+            coordinator=args["--coordinator"],
+            memory_budget=(
+                admission.parse_size(args["--memory-budget"])
+                if args["--memory-budget"] is not None
+                else None
+            ),
+            file_timeout=(
+                float(args["--file-timeout"]) if args["--file-timeout"] is not None else None
+            ),
+            quarantine=args["--quarantine"],
+            profile=args["--profile"],
+        )
+
+
+def apply_profile(options: RecoveryOptions) -> RecoveryOptions:
+    """
+    Applies the tuned profile of the options (if it has one) and returns the options
+    with the profile's processes, unless the processes were already set
+    Raises: ValueError: If the profile can't be loaded
+    """
+    if options.profile is None:
+        return options
+    profile = tuning.load(options.profile)
+    tuning.apply(profile)
+    logger.info(
+        "Using the tuned profile %s: %s processes, chunksizes %s, doxygen %s",
+        options.profile,
+        profile.processes,
+        profile.chunksizes,
+        profile.doxygen,
+    )
+    if profile.cpu_count is not None and profile.cpu_count != os.cpu_count():
+        logger.warning(
+            "The profile was tuned on a machine with %s cpus, this one has %s",
+            profile.cpu_count,
+            os.cpu_count(),
+        )
+    if options.processes is not None:
+        return options
+    return replace(options, processes=profile.processes)
+
+
+def preparation_stages(options: RecoveryOptions) -> List[stages.Stage]:
+    """
+    The stages of prepare(), the source tree is fingerprinted while doxygen is
+    configured and the schema is loaded while the XML files are listed. The stages
+    produce xml_files, the XML files that the extractors should run over
+    Raises: DoxygenException: (when run) If doxygen could not be configured or run
+    """
+
+    def configure_doxygen() -> bool:
+        if not doxygen.configure(options.source, options.doxyconf):
+            raise doxygen.DoxygenException("Failed to configure doxygen")
+        return True
+
+    def fingerprint_source(processes: int) -> Optional[Dict]:
+        # A missing source is reported by configure_doxygen, which runs at the same time
+        if not os.path.isdir(options.source):
+            return None
+        # Saved whenever doxygen runs, so a later auto run can reuse the results
+        if options.reuse == doxygen.REUSE_ALWAYS and doxygen.has_prior_results():
+            return None
+        return doxygen.get_fingerprint(options.source, options.doxyconf, processes)
+
+    def run_doxygen(configured: bool, fingerprint: Optional[Dict]) -> str:
+        assert configured
+        if not doxygen.run(reuse=options.reuse, fingerprint=fingerprint):
+            raise doxygen.DoxygenException("Failed to run doxygen")
+        if options.pack:
+            return doxygen.pack_xml_files(compress=options.compress)
+        return doxygen.XML_LOCATION
+
+    def load_schema(xml_dir: str) -> Optional[etree.XMLSchema]:
+        if not options.validate:
+            validation.configure(None)
+            return None
+        if options.validation_mode == validation.MODE_FULL:
+            validation.configure(validation.MODE_FULL)
+            if options.pack:
+                return doxygen.get_archive_schema(xml_dir)
+            return doxygen.get_schema()
+
+        # Checked by the workers once they find something, see doxygen.validation
+        schema_loc = doxygen.SCHEMA_LOCATION
+        if options.pack:
+            schema_loc = doxygen.get_archive_schema_location(xml_dir)
+        validation.configure(
+            options.validation_mode, schema_loc, doxygen.VALIDATION_CACHE_LOCATION
+        )
+        return None
+
+    def validate_xml_files(
+        all_xml_files: Tuple[str, ...], schema: Optional[etree.XMLSchema]
+    ) -> Tuple[str, ...]:
+        if schema is None:
+            return all_xml_files
+        return doxygen.filter_xml_files_bad_schema(all_xml_files, schema)
+
+    def transcode(valid_xml_files: Tuple[str, ...], processes: int) -> Tuple[str, ...]:
+        if len(valid_xml_files) == 0:
+            return valid_xml_files
+        return doxygen.transcode_xml_files(valid_xml_files, processes)
+
+    # With transcode the validated XML files are transcoded and the IR is used instead
+    validated = "valid_xml_files" if options.transcode else "xml_files"
+    pipeline = [
+        stages.Stage("configure doxygen", configure_doxygen, outputs=("configured",)),
+        stages.Stage("fingerprint", fingerprint_source, outputs=("fingerprint",), parallel=True),
+        stages.Stage("run doxygen", run_doxygen, ("configured", "fingerprint"), ("xml_dir",)),
+        stages.Stage("load schema", load_schema, ("xml_dir",), ("schema",)),
+        stages.Stage(
+            "list xml files", doxygen.get_all_xml_files, ("xml_dir",), ("all_xml_files",)
+        ),
+        stages.Stage("validate", validate_xml_files, ("all_xml_files", "schema"), (validated,)),
+    ]
+    if options.transcode:
+        pipeline.append(
+            stages.Stage("transcode", transcode, ("valid_xml_files",), ("xml_files",), True)
+        )
+    return pipeline
+
+
+def prepare(options: RecoveryOptions) -> Tuple[str, ...]:
+    """
+    Configures and runs doxygen and then returns the XML files that the
+    extractors should run over
+    Raises: DoxygenException: If doxygen could not be configured or run
+    """
+    assert isinstance(options, RecoveryOptions)
+    admission.set_budget(options.memory_budget)
+    supervisor.set_timeout(options.file_timeout)
+
+    values, timings = stages.run(preparation_stages(options), processes=options.processes)
+    for line in stages.report(timings):
+        logger.debug(line)
+    return values["xml_files"]
+
+
+def iter_fileop_structs(
+    options: RecoveryOptions, xml_files: Optional[Tuple[str, ...]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily yields every file_operations struct entry that points to an ioctl handler.
+    With the doxygen frontend, if xml_files is not given doxygen is run first with prepare()
+    """
+    if options.frontend == FRONTEND_CLANG:
+        return libclang.find_structs.iter_fileop_structs(
+            options.compile_commands_location, options.processes
+        )
+    if options.frontend == FRONTEND_SCAN:
+        return scan.find_structs.iter_fileop_structs(options.source, options.processes)
+
+    admission.set_budget(options.memory_budget)
+    supervisor.set_timeout(options.file_timeout)
+    if xml_files is None:
+        xml_files = prepare(options)
+    if len(xml_files) == 0:
+        return iter(())
+    return doxygen.iter_fileop_structs(xml_files, options.processes)
+
+
+def recover(
+    options: RecoveryOptions,
+    limit: Optional[int] = None,
+    where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    xml_files: Optional[Tuple[str, ...]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the recovered ioctl handlers
+
+    Args:
+        options: The interface recovery options
+        limit: Stop after this many handlers have been found
+        where: Only yield handlers this predicate returns True for
+        xml_files: Skip running doxygen and use these XML files
+
+    Once the limit is reached the workers are terminated, the remaining files are
+    never parsed
+    """
+    assert limit is None or limit >= 0
+    options = apply_profile(options)
+    handlers = iter_fileop_structs(options, xml_files)
+    results = handlers if where is None else filter(where, handlers)
+    try:
+        yield from itertools.islice(results, limit)
+    finally:
+        close = getattr(handlers, "close", None)
+        if close is not None:
+            close()
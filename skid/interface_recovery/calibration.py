@@ -0,0 +1,365 @@
+"""
+Calibration runs for `skid.py tune`, finds the doxygen and worker pool settings that are
+fastest on this machine for this source tree and returns them as a tuning.Profile
+
+Running doxygen and the extractors over a whole kernel to try each setting would take
+hours, so a random sample of the .c and .h files is copied to a temporary directory and
+every calibration run is over the sample:
+
+    setting             how it's chosen
+    NUM_PROC_THREADS    doxygen is run over the sample with each candidate thread count
+    LOOKUP_CACHE_SIZE   from the symbols doxygen put in it's lookup cache for the sample,
+                        scaled up to the size of the whole tree
+    DOT_NUM_THREADS     the same as NUM_PROC_THREADS (dot only runs if HAVE_DOT is set)
+    processes           the constants pass is run over the sample XML with each candidate,
+                        capped so the workers fit in the memory budget
+    chunksizes          each pool is run with each candidate chunksize
+
+The candidates are timed REPEATS times and the best time is kept. A setting within
+TOLERANCE of the fastest is as good as it, the smallest of them is chosen as it uses
+less memory. Without doxygen the doxygen settings and the constants chunksize are left
+at their defaults and the processes are chosen with the scan pass.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from logging import getLogger
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from skid.interface_recovery import scan
+from skid.interface_recovery.doxygen import config, doxygen, find_constants, fingerprint
+from skid.utils import admission, logs, tuning
+
+logger = getLogger(__name__)
+
+SAMPLE_FILES = 200
+CHUNKSIZE_CANDIDATES = (1, 4, 16, 64)
+REPEATS = 2
+TOLERANCE = 0.05
+
+# doxygen's lookup cache holds 2 ** (16 + LOOKUP_CACHE_SIZE) symbols
+LOOKUP_CACHE_BASE = 1 << 16
+MAX_LOOKUP_CACHE_SIZE = 9
+
+_CACHE_USED_RE = re.compile(r"lookup cache used (\d+)/(\d+)")
+_CACHE_HINT_RE = re.compile(r"ideal setting for LOOKUP_CACHE_SIZE is (\d+)")
+
+
+class Measurement(NamedTuple):
+    """ The best time of a candidate setting and the peak RSS it used (0 if unknown) """
+
+    setting: int
+    seconds: float
+    peak_rss: int
+
+
+########## PROFILE ##########
+
+
+def calibrate(
+    source_dir: str,
+    user_config_location: Optional[str] = None,
+    sample_size: int = SAMPLE_FILES,
+    cpu_count: Optional[int] = None,
+) -> tuning.Profile:
+    """
+    Runs the calibration passes over a sample of the source tree and returns the profile
+    Raises: ValueError: If the source tree has no .c or .h files
+    """
+    assert sample_size > 0
+    if not os.path.isdir(source_dir):
+        raise ValueError(f"Source directory does not exist at location: {source_dir}")
+    cpu_count = cpu_count or os.cpu_count() or 1
+
+    source_files = fingerprint.list_source_files(source_dir)
+    if len(source_files) == 0:
+        raise ValueError(f"There are no .c or .h files in {source_dir}")
+    sample = sample_source(source_files, sample_size)
+    scale = len(source_files) / len(sample)
+    logger.info("Calibrating with %s of the %s source files", len(sample), len(source_files))
+
+    # The candidates are measured against the defaults, not a profile applied earlier
+    previous = tuning.get_profile()
+    tuning.apply(None)
+    try:
+        with tempfile.TemporaryDirectory(prefix="skid-tune-") as work_dir:
+            sample_dir = os.path.join(work_dir, "source")
+            copy_sample(source_dir, sample, sample_dir)
+
+            settings: Dict[str, str] = dict()
+            xml_files: Tuple[str, ...] = tuple()
+            tuned = calibrate_doxygen(sample_dir, work_dir, scale, cpu_count, user_config_location)
+            if tuned is not None:
+                settings, xml_dir = tuned
+                xml_files = doxygen.get_all_xml_files(xml_dir)
+
+            processes, chunksizes, worker_rss = calibrate_pools(sample_dir, xml_files, cpu_count)
+    finally:
+        tuning.apply(previous)
+
+    return tuning.Profile(
+        processes=processes,
+        chunksizes=chunksizes,
+        doxygen=settings,
+        cpu_count=cpu_count,
+        worker_rss=worker_rss,
+    )
+
+
+def sample_source(source_files: Sequence[str], sample_size: int, seed: int = 0) -> List[str]:
+    """ A random (but repeatable) sample of the source files, sorted """
+    if len(source_files) <= sample_size:
+        return sorted(source_files)
+    return sorted(random.Random(seed).sample(list(source_files), sample_size))
+
+
+def copy_sample(source_dir: str, sample: Sequence[str], sample_dir: str) -> None:
+    """ Copies the sampled files (relative to source_dir) keeping their directories """
+    for rel_path in sample:
+        destination = os.path.join(sample_dir, rel_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(os.path.join(source_dir, rel_path), destination)
+
+
+########## MEASUREMENTS ##########
+
+
+def process_candidates(cpu_count: int) -> Tuple[int, ...]:
+    """ The powers of two below the cpu count and the cpu count itself """
+    assert cpu_count > 0
+    candidates = [1 << i for i in range(cpu_count.bit_length()) if 1 << i < cpu_count]
+    return tuple(candidates + [cpu_count])
+
+
+def measure(
+    run: Callable[[int], Optional[int]], candidates: Sequence[int], repeats: int = REPEATS
+) -> List[Measurement]:
+    """
+    Times run(candidate) for each candidate, run may return the peak RSS it used. With a
+    single candidate there is nothing to compare so it's only run once
+    """
+    assert len(candidates) > 0
+    repeats = repeats if len(candidates) > 1 else 1
+    measurements = list()
+    for candidate in candidates:
+        seconds = list()
+        peak_rss = 0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            rss = run(candidate)
+            seconds.append(time.perf_counter() - start)
+            peak_rss = max(peak_rss, rss or 0)
+        measurements.append(Measurement(candidate, min(seconds), peak_rss))
+        logger.debug("%s took %.3fs", candidate, min(seconds))
+    return measurements
+
+
+def choose(measurements: Sequence[Measurement], tolerance: float = TOLERANCE) -> int:
+    """ The smallest setting within tolerance of the fastest """
+    assert len(measurements) > 0
+    fastest = min(measurement.seconds for measurement in measurements)
+    return min(
+        measurement.setting
+        for measurement in measurements
+        if measurement.seconds <= fastest * (1 + tolerance)
+    )
+
+
+########## DOXYGEN ##########
+
+
+def calibrate_doxygen(
+    sample_dir: str,
+    work_dir: str,
+    scale: float,
+    cpu_count: int,
+    user_config_location: Optional[str] = None,
+) -> Optional[Tuple[Dict[str, str], str]]:
+    """
+    Runs doxygen over the sample with each candidate thread count, returns the tuned
+    settings and the XML directory of the last run. None if doxygen couldn't be run
+    """
+    output_dir = os.path.join(work_dir, "doxygen")
+    outputs = list()
+
+    def run(threads: int) -> int:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        settings = {"NUM_PROC_THREADS": str(threads)}
+        peak_rss, output = run_doxygen(sample_dir, output_dir, settings, user_config_location)
+        outputs.append(output)
+        return peak_rss
+
+    try:
+        measurements = measure(run, process_candidates(cpu_count))
+    except (OSError, doxygen.DoxygenException) as e:
+        logger.warning("Could not run doxygen on the sample, keeping it's default settings")
+        logger.warning(e)
+        return None
+
+    for measurement in measurements:
+        logger.info(
+            "doxygen with %s threads took %.2fs and used %s MB",
+            measurement.setting,
+            measurement.seconds,
+            measurement.peak_rss >> 20,
+        )
+    threads = choose(measurements)
+    settings = {"NUM_PROC_THREADS": str(threads), "DOT_NUM_THREADS": str(threads)}
+    cache_size = lookup_cache_size(outputs[-1], scale)
+    if cache_size is not None:
+        settings["LOOKUP_CACHE_SIZE"] = str(cache_size)
+    return settings, os.path.join(output_dir, "xml")
+
+
+def run_doxygen(
+    sample_dir: str,
+    output_dir: str,
+    settings: Dict[str, str],
+    user_config_location: Optional[str] = None,
+) -> Tuple[int, str]:
+    """
+    Runs doxygen over the sample with the settings, returns the peak RSS of doxygen in
+    bytes and what it printed
+    Raises:
+        OSError: If doxygen isn't installed
+        DoxygenException: If doxygen returned a non zero exit code
+    """
+    config_dict = config.get(sample_dir, user_config_location)
+    config_dict.update(
+        {
+            "OUTPUT_DIRECTORY": f'"{output_dir}"',
+            "WARN_LOGFILE": os.path.join(output_dir, "doxygen.log"),
+            "QUIET": "NO",
+            **settings,
+        }
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    conf_loc = os.path.join(output_dir, "doxyconf")
+    if not config.write(config_dict, conf_loc):
+        raise doxygen.DoxygenException("Failed to write the calibration doxygen config")
+
+    with tempfile.TemporaryFile("w+") as out:
+        proc = subprocess.Popen(["doxygen", conf_loc], stdout=out, stderr=subprocess.STDOUT)
+        # wait4 gives the peak RSS of this doxygen rather than of every child so far
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = exit_code(status)
+        out.seek(0)
+        output = out.read()
+
+    if proc.returncode != 0:
+        raise doxygen.DoxygenException(f"Doxygen returned {proc.returncode} on the sample")
+    return usage.ru_maxrss * 1024, output
+
+
+def exit_code(status: int) -> int:
+    """ The exit code of a wait status like Popen.returncode, -signal if it was killed """
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return status
+
+
+def lookup_cache_size(output: str, scale: float) -> Optional[int]:
+    """
+    The LOOKUP_CACHE_SIZE for the whole tree from what doxygen printed for the sample,
+    scale is how many times bigger the tree is. None if doxygen didn't print it's cache
+    """
+    used = _CACHE_USED_RE.search(output)
+    if used is not None:
+        symbols = int(used.group(1)) * max(scale, 1)
+        size = math.ceil(math.log2(max(symbols, 1) / LOOKUP_CACHE_BASE))
+    else:
+        hint = _CACHE_HINT_RE.search(output)
+        if hint is None:
+            return None
+        size = int(hint.group(1)) + math.ceil(math.log2(max(scale, 1)))
+    return min(max(size, 0), MAX_LOOKUP_CACHE_SIZE)
+
+
+########## WORKER POOLS ##########
+
+
+def calibrate_pools(
+    sample_dir: str, xml_files: Tuple[str, ...], cpu_count: int
+) -> Tuple[int, Dict[str, int], Optional[int]]:
+    """
+    Chooses the processes with the heaviest pass and then the chunksize of each pool,
+    returns (processes, chunksizes, worker RSS)
+    """
+    def fingerprint_pass(processes: int) -> None:
+        fingerprint.source_entries(sample_dir, processes=processes)
+
+    def scan_pass(processes: int) -> None:
+        scan.find_structs.find_fileop_structs(sample_dir, processes)
+
+    def constants_pass(processes: int) -> None:
+        find_constants.find_constants(xml_files, processes)
+
+    passes: Dict[str, Callable[[int], None]] = {
+        "fingerprint": fingerprint_pass,
+        "scan": scan_pass,
+    }
+    if len(xml_files) > 0:
+        passes["constants"] = constants_pass
+    heaviest = "constants" if "constants" in passes else "scan"
+
+    measurements = measure(passes[heaviest], process_candidates(cpu_count))
+    for measurement in measurements:
+        logger.info(
+            "%s with %s processes took %.2fs", heaviest, measurement.setting, measurement.seconds
+        )
+    processes = choose(measurements)
+
+    worker_rss = worker_footprint(xml_files) if len(xml_files) > 0 else None
+    budget = admission.get_budget()
+    if worker_rss and budget is not None and processes * worker_rss > budget:
+        processes = max(1, budget // worker_rss)
+        logger.info("Using %s processes so the workers fit in the memory budget", processes)
+
+    chunksizes = dict()
+    for name, run in passes.items():
+        measurements = measure(
+            lambda chunksize, name=name, run=run: run_with_chunksize(
+                name, chunksize, run, processes
+            ),
+            CHUNKSIZE_CANDIDATES,
+        )
+        chunksizes[name] = choose(measurements)
+        logger.info("Using a chunksize of %s for %s", chunksizes[name], name)
+    return processes, chunksizes, worker_rss
+
+
+def run_with_chunksize(
+    name: str, chunksize: int, run: Callable[[int], None], processes: int
+) -> None:
+    """ Runs a pass with the pool's chunksize set to chunksize """
+    previous = tuning.get_profile()
+    tuning.apply(tuning.Profile(processes, chunksizes={name: chunksize}))
+    try:
+        run(processes)
+    finally:
+        tuning.apply(previous)
+
+
+def worker_footprint(xml_files: Tuple[str, ...]) -> int:
+    """ The largest private RSS of a worker after finding the constants in an XML file """
+    with logs.pool(1) as pool:
+        return max(pool.imap_unordered(footprint_of_file, xml_files), default=0)
+
+
+def footprint_of_file(xml_file: str) -> int:
+    """ The private RSS of this worker while the constants of the file are held """
+    table = find_constants.find_constants_in_file(xml_file)
+    rss = admission.current_rss(private=True)
+    del table
+    return rss
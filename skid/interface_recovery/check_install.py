@@ -30,11 +30,11 @@ def check_dependencies() -> bool:
 
 def log_environment_config() -> None:
     """ Log the runtime environment for bug reports """
-    logger.info(f"Machine: {platform.machine()}")
-    logger.info(f"Version: {platform.version()}")
-    logger.info(f"Platform: {platform.platform()}")
-    logger.info(f"System: {platform.system()}")
-    logger.info(f"Processor: {platform.processor()}")
+    logger.info("Machine: %s", platform.machine())
+    logger.info("Version: %s", platform.version())
+    logger.info("Platform: %s", platform.platform())
+    logger.info("System: %s", platform.system())
+    logger.info("Processor: %s", platform.processor())
 
 
 def check_doxygen() -> bool:
@@ -55,7 +55,7 @@ def check_doxygen() -> bool:
         return False
 
     sproc = proc.stdout.split(" ")
-    logger.info(f"Found Doxygen version {sproc[0]}")
+    logger.info("Found Doxygen version %s", sproc[0])
     return True
 
 
@@ -73,7 +73,7 @@ def check_clang() -> bool:
 
     try:
         clang_version = proc.stderr.splitlines()[0].split(" ")[2]
-        logger.info(f"Found Clang version {clang_version}")
+        logger.info("Found Clang version %s", clang_version)
     except IndexError:
         logger.warning("Failed to get the clang version")
 
@@ -0,0 +1 @@
+from skid.interface_recovery.distributed import protocol, worker, coordinator
@@ -0,0 +1,292 @@
+"""
+Hands batches of doxygen compounds out to workers on other machines and collects the
+file_operations structs and includes they find
+
+    skid.py ir --source <path> --coordinator=0.0.0.0:7117     (this machine)
+    skid.py worker <this machine>:7117                         (every other machine)
+
+Compounds are read here (from the XML directory or a packed archive) and sent to the
+workers compressed, so the workers don't need access to the source or doxygen output.
+Every worker connection is served by a thread, which takes the next batch whenever the
+worker has returned the last one so faster machines get more of the work.
+
+A batch that is in flight when it's worker disconnects or stops responding is put back
+on the queue, after MAX_ATTEMPTS the files in it are reported as failed rather than
+stalling the run. The run ends once every batch is done, workers are then told to exit.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import socket
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from skid.interface_recovery.distributed import protocol
+from skid.interface_recovery.doxygen import xml_archive
+from skid.utils import utils
+
+logger = getLogger(__name__)
+
+# Compounds per batch, big enough that a round trip is small next to parsing them
+BATCH_SIZE = 32
+
+# Times a batch is handed out before it's files are given up on
+MAX_ATTEMPTS = 3
+
+# Seconds a worker has to return a batch before it's considered lost
+BATCH_TIMEOUT = 600.0
+
+# Seconds between checks for new workers (and for the end of the run)
+ACCEPT_INTERVAL = 0.2
+
+
+@dataclass
+class WorkerStats:
+    """ What a single worker did, used for the throughput report """
+
+    name: str
+    batches: int = 0
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    lost: int = 0
+
+    @property
+    def files_per_second(self) -> float:
+        """ Files parsed per second of the workers own time """
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class Results:
+    """ Everything the workers found """
+
+    structs: List[Dict[str, Any]] = field(default_factory=list)
+    includes: Dict[str, List[str]] = field(default_factory=dict)
+    failed: List[str] = field(default_factory=list)
+    workers: List[WorkerStats] = field(default_factory=list)
+    retries: int = 0
+    seconds: float = 0.0
+
+    def files_including(self, header: str) -> Tuple[str, ...]:
+        """ The files that include a header, like xml_utils.filter_xml_list_by_header """
+        return tuple(sorted(f for f, headers in self.includes.items() if header in headers))
+
+    def report(self) -> List[str]:
+        """ The throughput of each worker and of the whole run """
+        columns = ("batches", "files", "MB sent", "files/s")
+        lines = [f"{'worker':<32} " + " ".join(f"{c:>8}" for c in columns) + f" {'lost':>5}"]
+        for stats in self.workers:
+            lines.append(
+                f"{stats.name:<32} {stats.batches:>8} {stats.files:>8} "
+                f"{stats.bytes / 1e6:>8.1f} {stats.files_per_second:>8.1f} {stats.lost:>5}"
+            )
+        files = sum(stats.files for stats in self.workers)
+        rate = files / self.seconds if self.seconds > 0 else 0.0
+        lines.append(
+            f"{files} files in {self.seconds:.1f}s ({rate:.1f} files/s) by "
+            f"{len(self.workers)} workers, {self.retries} batches retried, "
+            f"{len(self.failed)} files failed"
+        )
+        return lines
+
+
+@dataclass
+class _Batch:
+    id: int
+    files: Tuple[str, ...]
+    attempts: int = 0
+
+
+class Coordinator:
+    """
+    Serves batches of xml_files to workers until they have all been processed
+
+    Args:
+        xml_files: Plain XML files or archive member paths
+        address: The (host, port) to listen on, port 0 picks a free port
+    """
+
+    def __init__(
+        self,
+        xml_files: Sequence[str],
+        address: Tuple[str, int] = ("0.0.0.0", protocol.DEFAULT_PORT),
+        batch_size: int = BATCH_SIZE,
+        max_attempts: int = MAX_ATTEMPTS,
+        timeout: float = BATCH_TIMEOUT,
+    ):
+        assert batch_size > 0
+        assert max_attempts > 0
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.pending: Deque[_Batch] = deque(
+            _Batch(i, tuple(xml_files[start : start + batch_size]))
+            for i, start in enumerate(range(0, len(xml_files), batch_size))
+        )
+        self.files = len(xml_files)
+        self.remaining = len(self.pending)
+        self.results = Results()
+        self.changed = threading.Condition()
+        self.bar = lambda: None
+        self.server = socket.create_server(address)
+        self.server.settimeout(ACCEPT_INTERVAL)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """ The address workers should connect to, useful when listening on port 0 """
+        return self.server.getsockname()[:2]
+
+    def run(self) -> Results:
+        """ Blocks until every batch is done (or failed) and returns the results """
+        start = time.perf_counter()
+        threads: List[threading.Thread] = list()
+        logger.info("Waiting for workers on %s:%s", *self.address)
+
+        bar_tit = utils.format_alive_bar_title("Finding file_operations structs on workers")
+        try:
+            with utils.progress_bar(self.files, title=bar_tit) as bar:
+                self.bar = bar
+                while not self.finished():
+                    try:
+                        conn, peer = self.server.accept()
+                    except socket.timeout:
+                        continue
+                    thread = threading.Thread(target=self.serve, args=(conn, peer), daemon=True)
+                    thread.start()
+                    threads.append(thread)
+                for thread in threads:
+                    thread.join()
+        finally:
+            self.server.close()
+
+        self.results.seconds = time.perf_counter() - start
+        return self.results
+
+    def finished(self) -> bool:
+        with self.changed:
+            return self.remaining == 0
+
+    ########## WORKER CONNECTIONS ##########
+
+    def serve(self, conn: socket.socket, peer: Tuple):
+        """ Serves a single worker until there's no work left or it's lost """
+        stats = WorkerStats(f"{peer[0]}:{peer[1]}")
+        with conn:
+            try:
+                conn.settimeout(self.timeout)
+                hello, _ = protocol.recv(conn)
+                stats.name = str(hello.get("name", stats.name))
+            except (OSError, ConnectionError) as e:
+                logger.warning("Worker %s failed to say hello: %s", stats.name, e)
+                return
+            with self.changed:
+                self.results.workers.append(stats)
+            logger.info("Worker %s connected", stats.name)
+
+            while True:
+                batch = self.take()
+                if batch is None:
+                    try:
+                        protocol.send(conn, {"type": protocol.DONE})
+                    except OSError:
+                        pass
+                    return
+                try:
+                    self.process(conn, batch, stats)
+                except (OSError, ConnectionError, KeyError, TypeError) as e:
+                    logger.warning("Lost worker %s: %s", stats.name, e)
+                    stats.lost += 1
+                    self.give_back(batch)
+                    return
+
+    def process(self, conn: socket.socket, batch: _Batch, stats: WorkerStats):
+        """ Sends a batch to a worker and records the result """
+        blobs = [zlib.compress(xml_archive.read(location), 1) for location in batch.files]
+        sent = protocol.send(
+            conn, {"type": protocol.BATCH, "id": batch.id, "files": batch.files}, blobs
+        )
+        result, _ = protocol.recv(conn)
+        # Checked before anything is recorded, a bad result is retried without duplicates
+        structs, includes, failed, seconds = parse_result(result, batch.id)
+
+        with self.changed:
+            self.results.structs += structs
+            self.results.includes.update(includes)
+            self.results.failed += failed
+            stats.batches += 1
+            stats.files += len(batch.files)
+            stats.bytes += sent
+            stats.seconds += seconds
+            self.remaining -= 1
+            for _ in batch.files:
+                self.bar()
+            self.changed.notify_all()
+
+    ########## WORK QUEUE ##########
+
+    def take(self) -> Optional[_Batch]:
+        """ The next batch, waits while other workers might still give theirs back """
+        with self.changed:
+            while len(self.pending) == 0 and self.remaining > 0:
+                self.changed.wait()
+            if len(self.pending) == 0:
+                return None
+            batch = self.pending.popleft()
+            batch.attempts += 1
+            return batch
+
+    def give_back(self, batch: _Batch):
+        """ Requeues the batch of a lost worker, or fails it's files after MAX_ATTEMPTS """
+        with self.changed:
+            if batch.attempts < self.max_attempts:
+                self.results.retries += 1
+                self.pending.append(batch)
+            else:
+                logger.error(
+                    "Giving up on %s files after %s attempts", len(batch.files), batch.attempts
+                )
+                self.results.failed += batch.files
+                self.remaining -= 1
+                for _ in batch.files:
+                    self.bar()
+            self.changed.notify_all()
+
+
+def parse_result(
+    result: Dict[str, Any], batch_id: int
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]], List[str], float]:
+    """
+    The (structs, includes, failed, seconds) of a worker's result message
+    Raises: ProtocolError: If it isn't the result of the batch or a field is malformed
+    """
+    if not isinstance(result, dict):
+        raise protocol.ProtocolError(f"Expected the result of batch {batch_id}")
+    if result.get("type") != protocol.RESULT or result.get("id") != batch_id:
+        raise protocol.ProtocolError(f"Expected the result of batch {batch_id}")
+    try:
+        structs = list(result["structs"])
+        includes = dict(result["includes"])
+        failed = list(result["failed"])
+        seconds = float(result["seconds"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise protocol.ProtocolError(f"Malformed result of batch {batch_id}: {e}") from e
+    if not all(isinstance(fops, dict) for fops in structs):
+        raise protocol.ProtocolError(f"Malformed structs in the result of batch {batch_id}")
+    return structs, includes, failed, seconds
+
+
+def find_fileop_structs(
+    xml_files: Sequence[str], address: str, batch_size: int = BATCH_SIZE
+) -> Results:
+    """ Finds the file_operations structs with workers, address is host:port to listen on """
+    coordinator = Coordinator(xml_files, protocol.parse_address(address), batch_size)
+    results = coordinator.run()
+    for line in results.report():
+        logger.info(line)
+    return results
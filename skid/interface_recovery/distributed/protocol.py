@@ -0,0 +1,109 @@
+"""
+The messages the coordinator and workers send each other over TCP
+
+Every message is a JSON header followed by any number of binary blobs (the compressed
+compounds of a batch), each part is prefixed by it's length:
+
+    +-------------+-------------+--------+-------------+-------+-------------+-------+
+    | json length | blob count  |  json  | blob length | blob  | blob length | blob  | ...
+    +-------------+-------------+--------+-------------+-------+-------------+-------+
+         u32          u32                     u32                   u32
+
+    worker          coordinator
+      |    hello        |       name of the worker
+      | --------------> |
+      |    batch        |       id, member paths + a zlib compressed blob for each
+      | <-------------- |
+      |    result       |       id, structs, includes, files that failed to parse
+      | --------------> |
+      |      ...        |
+      |    done         |       no work is left, the worker exits
+      | <-------------- |
+
+A worker only ever has one batch in flight, if the connection is lost (or the result
+doesn't arrive in time) the coordinator gives the batch to another worker.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import socket
+import struct
+from typing import Any, Dict, List, Sequence, Tuple
+
+HELLO = "hello"
+BATCH = "batch"
+RESULT = "result"
+DONE = "done"
+
+DEFAULT_PORT = 7117
+
+HEADER = struct.Struct("!II")
+BLOB_LENGTH = struct.Struct("!I")
+
+# Anything bigger than this isn't a message from skid
+MAX_LENGTH = 1 << 30
+
+
+class ProtocolError(ConnectionError):
+    """ The peer sent something that isn't a valid message """
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """ Parses host:port, the port defaults to DEFAULT_PORT """
+    if ":" not in address:
+        return address, DEFAULT_PORT
+    host, port = address.rsplit(":", 1)
+    try:
+        return host.strip("[]") or "0.0.0.0", int(port)
+    except ValueError as e:
+        raise ValueError(f"Invalid address {address}, expected host:port") from e
+
+
+def send(sock: socket.socket, message: Dict[str, Any], blobs: Sequence[bytes] = ()) -> int:
+    """ Sends a message and returns the number of bytes sent """
+    header = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    parts = [HEADER.pack(len(header), len(blobs)), header]
+    for blob in blobs:
+        parts += [BLOB_LENGTH.pack(len(blob)), blob]
+    data = b"".join(parts)
+    sock.sendall(data)
+    return len(data)
+
+
+def recv(sock: socket.socket) -> Tuple[Dict[str, Any], List[bytes]]:
+    """
+    Receives a message and it's blobs
+    Raises: ConnectionError: If the connection is closed or the message is invalid
+    """
+    header_length, count = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    if header_length > MAX_LENGTH:
+        raise ProtocolError(f"Message header of {header_length} bytes")
+    try:
+        message = json.loads(recv_exactly(sock, header_length))
+    except ValueError as e:
+        raise ProtocolError("Message header is not JSON") from e
+    if not isinstance(message, dict) or "type" not in message:
+        raise ProtocolError("Message has no type")
+
+    blobs = list()
+    for _ in range(count):
+        (length,) = BLOB_LENGTH.unpack(recv_exactly(sock, BLOB_LENGTH.size))
+        if length > MAX_LENGTH:
+            raise ProtocolError(f"Blob of {length} bytes")
+        blobs.append(recv_exactly(sock, length))
+    return message, blobs
+
+
+def recv_exactly(sock: socket.socket, length: int) -> bytes:
+    """ Receives exactly length bytes """
+    data = bytearray(length)
+    view = memoryview(data)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return bytes(data)
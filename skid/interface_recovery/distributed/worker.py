@@ -0,0 +1,148 @@
+"""
+Runs the XML extractors for a coordinator, start one on each machine with:
+
+    skid.py worker <coordinator host:port> [--processes=<n>]
+
+The worker doesn't need the source tree or the doxygen output, every batch carries the
+compressed compounds. They are parsed by a local supervised process pool and only the
+results (the file_operations structs and the headers each file includes) are sent back.
+A compound that hangs or crashes it's worker is quarantined (see utils.supervisor) and
+sent back as failed, so one bad file costs the supervisor's timeout and not the
+coordinator's batch timeout and retries.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import queue
+import socket
+import time
+import zlib
+from io import BytesIO
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery.distributed import protocol
+from skid.interface_recovery.doxygen import find_structs, xml_utils
+from skid.utils import supervisor
+
+logger = getLogger(__name__)
+
+# Seconds between attempts to connect to a coordinator that isn't listening yet
+CONNECT_INTERVAL = 1.0
+CONNECT_ATTEMPTS = 30
+
+
+def run(
+    address: Tuple[str, int],
+    processes: Optional[int] = None,
+    name: Optional[str] = None,
+    connect_attempts: int = CONNECT_ATTEMPTS,
+) -> int:
+    """
+    Processes batches from the coordinator until it has no work left
+
+    Args:
+        address: The (host, port) of the coordinator
+        processes: Size of the local supervised pool
+        name: How the coordinator refers to this worker, defaults to host:pid
+
+    Returns: The number of batches processed
+    Raises: ConnectionError: If the coordinator can't be reached or goes away
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    batches = 0
+    with connect(address, connect_attempts) as sock:
+        protocol.send(sock, {"type": protocol.HELLO, "name": name})
+        logger.info("Connected to the coordinator at %s:%s as %s", *address, name)
+        with supervisor.pool(processes) as pool:
+            while True:
+                message, blobs = protocol.recv(sock)
+                if message["type"] == protocol.DONE:
+                    break
+                if message["type"] != protocol.BATCH:
+                    raise protocol.ProtocolError(f"Unexpected {message['type']} message")
+                protocol.send(sock, process_batch(message, blobs, pool))
+                batches += 1
+
+    logger.info("Processed %s batches", batches)
+    return batches
+
+
+def connect(address: Tuple[str, int], attempts: int = CONNECT_ATTEMPTS) -> socket.socket:
+    """ Connects to the coordinator, retrying while it starts up """
+    for attempt in range(attempts):
+        try:
+            return socket.create_connection(address)
+        except ConnectionRefusedError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(CONNECT_INTERVAL)
+    raise ConnectionError(f"Could not connect to {address}")
+
+
+def process_batch(message: Dict[str, Any], blobs: Sequence[bytes], pool=None) -> Dict[str, Any]:
+    """ Runs the extractors over every file of a batch and builds the result message """
+    start = time.perf_counter()
+    items = list(zip(message["files"], blobs))
+    extracted = map(extract, items) if pool is None else supervised_map(pool, items)
+
+    structs: List[Dict[str, Any]] = list()
+    includes: Dict[str, List[str]] = dict()
+    failed: List[str] = list()
+    for location, file_structs, file_includes, error in extracted:
+        if error is not None:
+            logger.error("Failed to parse %s: %s", location, error)
+            failed.append(location)
+            continue
+        structs += file_structs
+        includes[location] = file_includes
+
+    return {
+        "type": protocol.RESULT,
+        "id": message["id"],
+        "structs": structs,
+        "includes": includes,
+        "failed": failed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def supervised_map(pool: supervisor.SupervisedPool, items: List[Tuple[str, bytes]]) -> List:
+    """ Runs extract over the items in order, a quarantined file fails with the reason """
+    done: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+    for index, item in enumerate(items):
+        pool.apply_async(
+            extract,
+            (item,),
+            callback=lambda out, i=index: done.put((i, out)),
+            error_callback=lambda e, i=index: done.put((i, e)),
+        )
+
+    extracted: Dict[int, Any] = dict()
+    for _ in items:
+        index, out = done.get()
+        if isinstance(out, supervisor.Quarantined):
+            out = (items[index][0], list(), list(), out.reason)
+        elif isinstance(out, BaseException):
+            raise out
+        extracted[index] = out
+    return [extracted[index] for index in range(len(items))]
+
+
+def extract(item: Tuple[str, bytes]) -> Tuple[str, List[Dict], List[str], Optional[str]]:
+    """ The structs and includes of a single compressed compound, or the parse error """
+    location, blob = item
+    try:
+        root = etree.parse(BytesIO(zlib.decompress(blob)))
+    except (etree.LxmlError, zlib.error) as e:
+        return location, list(), list(), str(e)
+    return (
+        location,
+        find_structs.find_fileop_structs_in_root(root),
+        xml_utils.find_includes(root),
+        None,
+    )
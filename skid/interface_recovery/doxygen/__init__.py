@@ -4,9 +4,18 @@ Author: Luke Goddard
 Date: 2020
 """
 
+from skid.interface_recovery.doxygen import xml_archive
+from skid.interface_recovery.doxygen import xpath
 from skid.interface_recovery.doxygen import xml_utils
+from skid.interface_recovery.doxygen import validation
 from skid.interface_recovery.doxygen import find_device_name
 from skid.interface_recovery.doxygen import find_structs
 from skid.interface_recovery.doxygen import config
+from skid.interface_recovery.doxygen import fingerprint
+from skid.interface_recovery.doxygen import find_constants
+from skid.interface_recovery.doxygen import find_commands
+from skid.interface_recovery.doxygen import find_constraints
+from skid.interface_recovery.doxygen import find_directions
+from skid.interface_recovery.doxygen import ir
 
 
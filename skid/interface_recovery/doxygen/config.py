@@ -12,6 +12,8 @@ from logging import getLogger
 from pathlib import Path
 from typing import Dict, Tuple
 
+from skid.utils import tuning
+
 logger = getLogger(__name__)
 
 OUTPUT_DIRECTORY = "/tmp/skid-doxygen"
@@ -43,7 +45,7 @@ def get(source_dir: str, user_config_location: str) -> Dict:
     if not os.path.exists(source_dir):
         raise FileNotFoundError("Fuzzing source code does not exist")
 
-    logger.info(f"Source code location exists: {source_dir}")
+    logger.info("Source code location exists: %s", source_dir)
     if (
         user_config_location is not None
         and os.path.exists(user_config_location)
@@ -52,11 +54,12 @@ def get(source_dir: str, user_config_location: str) -> Dict:
         user = get_users_override_config(user_config_location)
         logger.info("Setting doxygen user supplied configurations")
         for key, value in user.items():
-            logger.debug(f"{key} -> {value}")
+            logger.debug("%s -> %s", key, value)
     elif user_config_location is not None:
         raise FileNotFoundError(f"Failed to find the config at {user_config_location}")
 
-    return {**default, **user}
+    # A tuned profile (skid.py tune) is applied over the defaults but not over the user's
+    return {**default, **tuning.doxygen_settings(), **user}
 
 
 def get_default_config(source_dir: str) -> Dict:
@@ -294,18 +297,18 @@ def write(config: Dict, write_location: str) -> bool:
     """
     assert isinstance(config, dict)
 
-    logger.info(f"Writing doxygen configuration file to: {write_location}")
+    logger.info("Writing doxygen configuration file to: %s", write_location)
 
     # Check we can write to that location
     dirname = os.path.dirname(write_location)
     if not os.path.exists(dirname):
-        logger.debug(f"Creating directory {dirname}")
+        logger.debug("Creating directory %s", dirname)
         try:
             Path(dirname).mkdir(parents=True)
         except OSError as e:
-            logger.critical(f"Failed to create the directory: {dirname}")
+            logger.critical("Failed to create the directory: %s", dirname)
             logger.critical(
-                f"Failed to write the configuration file to: {write_location}"
+                "Failed to write the configuration file to: %s", write_location
             )
             logger.critical(e)
             return False
@@ -318,7 +321,7 @@ def write(config: Dict, write_location: str) -> bool:
             _ = [logger.debug(x.strip()) for x in str_conf]  # type: ignore
     except OSError as e:
         logger.critical(
-            f"Failed to write the doxygen configuration file to: {write_location}"
+            "Failed to write the doxygen configuration file to: %s", write_location
         )
         logger.critical(e)
         return False
@@ -7,6 +7,11 @@ Attributes:
     DOXYCONF_LOCATION: (str) Location to write the confiuration file to
     XML_LOCATION: (str) Location of the folder that contains the XML files
     SCHEMA_LOCATION: (str) Location of the XML schema produced by doxygen
+    ARCHIVE_LOCATION: (str) Location of the packed XML archive
+    VALIDATION_CACHE_LOCATION: (str) Location of the cached schema validation verdicts
+    IR_LOCATION: (str) Location of the XML transcoded into the compact IR
+    CONSTRAINTS_CACHE_LOCATION: (str) Location of the cached handler constraints
+    REUSE_POLICIES: (Tuple[str, ...]) How prior doxygen results are reused
 """
 
 import logging
@@ -16,17 +21,25 @@ import subprocess
 import time
 
 from pathlib import Path
-from typing import Tuple, Dict, Any
+from typing import Any, Dict, Iterator, Optional, Tuple
 
-from alive_progress import alive_bar # type: ignore
 from lxml import etree
 
-from skid.interface_recovery import doxygen
+from skid.interface_recovery import doxygen, ioctl
 from skid.utils import utils
 
 XML_LOCATION = os.path.join(doxygen.config.OUTPUT_DIRECTORY, "xml")
 SCHEMA_LOCATION = os.path.join(XML_LOCATION, "compound.xsd")
 DOXYCONF_LOCATION = "/tmp/skid-doxyconf"
+ARCHIVE_LOCATION = os.path.join(doxygen.config.OUTPUT_DIRECTORY, "xml.skidpack")
+VALIDATION_CACHE_LOCATION = os.path.join(doxygen.config.OUTPUT_DIRECTORY, "validation.cache")
+IR_LOCATION = os.path.join(doxygen.config.OUTPUT_DIRECTORY, "xml.skidir")
+CONSTRAINTS_CACHE_LOCATION = os.path.join(doxygen.config.OUTPUT_DIRECTORY, "constraints.cache")
+
+REUSE_AUTO = "auto"
+REUSE_ALWAYS = "always"
+REUSE_NEVER = "never"
+REUSE_POLICIES = (REUSE_AUTO, REUSE_ALWAYS, REUSE_NEVER)
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +57,7 @@ def configure(fuzz_source_location: str, user_config_location: str, conf_loc=DOX
     """
     if not os.path.exists(fuzz_source_location):
         logger.critical(
-            f"Source directory does not exist at location: {fuzz_source_location}"
+            "Source directory does not exist at location: %s", fuzz_source_location
         )
         return False
 
@@ -57,14 +70,29 @@ def configure(fuzz_source_location: str, user_config_location: str, conf_loc=DOX
         return False
 
 
-def run() -> bool:
+def get_fingerprint(fuzz_source_location: str, user_config_location: str, processes=None) -> Dict:
+    """
+    Fingerprints the merged doxygen configuration and the source tree, this is
+    compared against the fingerprint stored with prior doxygen results
+    """
+    config_dict = doxygen.config.get(fuzz_source_location, user_config_location)
+    bar_tit = utils.format_alive_bar_title("Fingerprinting source code")
+    with utils.progress_bar(title=bar_tit):
+        return doxygen.fingerprint.compute(fuzz_source_location, config_dict, processes=processes)
+
+
+def run(reuse=REUSE_AUTO, fingerprint: Optional[Dict] = None) -> bool:
     """
     Runs doxygen against the source code. If doxygen returns a non zero
     exit code then this function will return False, else it will return True
+
+    Args:
+        reuse: One of REUSE_POLICIES, see overwrite_prior_doxygen
+        fingerprint: Fingerprint from get_fingerprint, stored with the results
     """
     assert os.path.exists(DOXYCONF_LOCATION)
 
-    if not overwrite_prior_doxygen():
+    if not overwrite_prior_doxygen(reuse, fingerprint):
         logger.info("Using previous doxygen results")
         return True
 
@@ -87,65 +115,106 @@ def run() -> bool:
         bar_tit = utils.format_alive_bar_title(
             "Indexing source code, this might take a while"
         )
-        with alive_bar(title=bar_tit):
+        with utils.progress_bar(title=bar_tit):
             while proc.poll() is None:
                 time.sleep(0.1)
 
     if proc.returncode != 0:
         logger.critical("Doxygen returned a non zero error code")
-        logger.info(f"Try run again with -v enabled or read {doxygen.config.WARN_LOGFILE}")
+        logger.info("Try run again with -v enabled or read %s", doxygen.config.WARN_LOGFILE)
         return False
 
+    if fingerprint is not None:
+        doxygen.fingerprint.save(fingerprint)
+
     logger.debug("Doxygen has finished indexing source code")
     return True
 
 
-def overwrite_prior_doxygen() -> bool:
+def has_prior_results() -> bool:
+    """ Returns True if a previous run left results in the output directory """
+    if not os.path.exists(doxygen.config.OUTPUT_DIRECTORY):
+        return False
+    return len(os.listdir(doxygen.config.OUTPUT_DIRECTORY)) > 0
+
+
+def overwrite_prior_doxygen(reuse=REUSE_AUTO, fingerprint: Optional[Dict] = None) -> bool:
     """
-    running doxygen is expensive on a large code base so this function give us the option
-    of reusing the prior results or to disgard them
+    running doxygen is expensive on a large code base so this function decides if the
+    prior results are reused or disgarded. Returns True if doxygen needs to be re-run
+
+    Args:
+        reuse: REUSE_ALWAYS reuses any prior results, REUSE_NEVER always re-runs doxygen
+               and REUSE_AUTO reuses them only if the stored fingerprint matches
+        fingerprint: Fingerprint of the current config and source tree
     """
-    if not os.path.exists(doxygen.config.OUTPUT_DIRECTORY):
-        return True
+    assert reuse in REUSE_POLICIES
 
-    if len(os.listdir(doxygen.config.OUTPUT_DIRECTORY)) == 0:
+    if not has_prior_results():
         return True
 
-    logger.critical(f"Previous doxygen results found: {doxygen.config.OUTPUT_DIRECTORY}")
+    logger.info("Previous doxygen results found: %s", doxygen.config.OUTPUT_DIRECTORY)
+
+    if reuse == REUSE_ALWAYS:
+        return False
 
-    while True:
-        answer = ask_for_overwrite()
-        if answer in ["", None] or answer[0].lower() == "n":
+    if reuse == REUSE_AUTO:
+        if fingerprint is not None and doxygen.fingerprint.matches(fingerprint):
+            logger.info("Source code and doxygen config are unchanged")
             return False
-        if answer[0].lower() == "y":
+        logger.info("Source code or doxygen config changed since the previous results")
 
-            # Delete old results
-            try:
-                path = Path(doxygen.config.OUTPUT_DIRECTORY)
-                shutil.rmtree(path)
-                path.mkdir(parents=True)
-            except OSError as e:
-                logger.warning(f"Failed to delete old results at: {path}")
-                logger.exception(e)
-                raise e
+    # Delete old results
+    path = Path(doxygen.config.OUTPUT_DIRECTORY)
+    try:
+        shutil.rmtree(path)
+        path.mkdir(parents=True)
+    except OSError as e:
+        logger.warning("Failed to delete old results at: %s", path)
+        logger.exception(e)
+        raise e
+
+    return True
 
-            return True
 
-def ask_for_overwrite() -> str:
-    """ Just seperating this so I can mock it out of the tests """
-    return input("         : Do you want to overwrite it (y/N): ")
+def pack_xml_files(xml_dir=XML_LOCATION, archive_loc=ARCHIVE_LOCATION, compress=False) -> str:
+    """
+    Packs all of the XML files produced by doxygen into a single archive so later
+    stages don't pay the per-file metadata cost
+    """
+    bar_tit = utils.format_alive_bar_title("Packing XML files into a single archive")
+    with utils.progress_bar(title=bar_tit):
+        return doxygen.xml_archive.pack(xml_dir, archive_loc, compress=compress)
 
 
+def get_archive_schema(
+    archive_loc=ARCHIVE_LOCATION, schema_name=os.path.basename(SCHEMA_LOCATION)
+) -> etree.XMLSchema:
+    """ Loads and returns the schema produced by doxygen from a packed archive """
+    return get_schema(get_archive_schema_location(archive_loc, schema_name))
+
+
+def get_archive_schema_location(
+    archive_loc=ARCHIVE_LOCATION, schema_name=os.path.basename(SCHEMA_LOCATION)
+) -> str:
+    """ The member path of the schema inside of a packed archive """
+    return doxygen.xml_archive.member_path(archive_loc, schema_name)
+
 
 def get_schema(schema=SCHEMA_LOCATION) -> etree.XMLSchema:
     """ Loads and returns the schema produced by doxygen """
-    assert os.path.exists(schema)
+    assert doxygen.xml_archive.exists(schema)
     return doxygen.xml_utils.get_schema(schema)
 
 
 def get_all_xml_files(xml_dir=XML_LOCATION) -> Tuple[str, ...]:
-    """ Returns a tuple of all XML files produced by doxygen """
+    """
+    Returns a tuple of all XML files produced by doxygen. If xml_dir is a packed
+    archive then the member paths of the compounds inside of it are returned
+    """
     assert os.path.exists(xml_dir)
+    if doxygen.xml_archive.is_archive(xml_dir):
+        return doxygen.xml_archive.list_members(xml_dir)
     return tuple(
         [
             os.path.join(xml_dir, f)
@@ -165,32 +234,162 @@ def filter_xml_files_bad_schema(
     assert isinstance(schema, etree.XMLSchema)
     valid_files = []
     bin_tit = utils.format_alive_bar_title("Validating file schemas")
-    with alive_bar(len(xml_files_locs), title=bin_tit) as bar:
+    with utils.progress_bar(len(xml_files_locs), title=bin_tit) as bar:
         for loc in xml_files_locs:
-            assert os.path.exists(loc)
+            assert doxygen.xml_archive.exists(loc)
             try:
                 if doxygen.xml_utils.validate_schema(loc, schema):
                     valid_files.append(loc)
                 else:
-                    logger.warning(f"Schema validation for file {loc} failed")
+                    logger.warning("Schema validation for file %s failed", loc)
             except doxygen.xml_utils.DoxygenMalformedXML as e:
                 logger.error(e)
             bar()
     return tuple(valid_files)
 
 
-def find_fileop_structs(xml_files: Tuple[str, ...]):
+def transcode_xml_files(
+    xml_files: Tuple[str, ...], processes=None, ir_loc=IR_LOCATION
+) -> Tuple[str, ...]:
+    """
+    Transcodes the XML files into the compact IR (see doxygen.ir) and returns the
+    locations of the transcoded compounds, the extractors accept them as XML files
+    """
+    assert isinstance(xml_files, tuple)
+    bar_tit = utils.format_alive_bar_title("Transcoding XML files")
+    with utils.progress_bar(len(xml_files), title=bar_tit) as bar:
+        return doxygen.ir.transcode(xml_files, ir_loc, processes, bar=bar)
+
+
+def find_fileop_structs(xml_files: Tuple[str, ...], processes=None):
     """
     Wrapper function to find the file_operations structs
     for ioctl
     """
     assert isinstance(xml_files, tuple)
-    return doxygen.find_structs.find_fileop_structs(xml_files)
+    return doxygen.find_structs.find_fileop_structs(xml_files, processes)
+
+
+def iter_fileop_structs(xml_files: Tuple[str, ...], processes=None) -> Iterator[Dict[str, Any]]:
+    """
+    Wrapper function to lazily find the file_operations structs
+    for ioctl
+    """
+    assert isinstance(xml_files, tuple)
+    return doxygen.find_structs.iter_fileop_structs(xml_files, processes)
+
+
+def get_constant_evaluator(
+    xml_files: Tuple[str, ...], processes=None
+) -> "ioctl.evaluator.ConstantEvaluator":
+    """ Collects the #defines, enums, typedefs and structs from the XML to evaluate with """
+    assert isinstance(xml_files, tuple)
+    table = doxygen.find_constants.find_constants(xml_files, processes)
+    return ioctl.evaluator.ConstantEvaluator(table)
+
+
+def resolve_ioctl_commands(
+    xml_files: Tuple[str, ...],
+    fileop_structs: Tuple[Dict[str, Any], ...],
+    processes=None,
+    consts: Optional["ioctl.evaluator.ConstantEvaluator"] = None,
+) -> Dict[str, Tuple["ioctl.request.IoctlCommand", ...]]:
+    """
+    Evaluates the case labels of every ioctl handler to their request numbers, the
+    result is keyed by the refid of the handler. Labels that can't be folded to a
+    constant are left out. consts is created from the xml files if not given
+    """
+    assert isinstance(xml_files, tuple)
+    evaluator = consts or get_constant_evaluator(xml_files, processes)
+    labels = doxygen.find_commands.find_commands(xml_files, fileop_structs, processes)
+
+    resolved = dict()
+    total = 0
+    for refid, names in labels.items():
+        commands = evaluator.commands(names)
+        resolved[refid] = tuple(commands[name] for name in names if name in commands)
+        total += len(names)
+        for command in resolved[refid]:
+            logger.debug(
+                "%s = %#010x (%s, %s bytes)",
+                command.name,
+                command.number,
+                command.direction,
+                command.size,
+            )
+
+    found = sum(len(commands) for commands in resolved.values())
+    logger.info("Resolved %s of %s ioctl commands", found, total)
+    return resolved
+
+
+def find_handler_bodies(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...], processes=None
+) -> Dict[str, Tuple[Tuple[int, str], ...]]:
+    """
+    Wrapper function to read the body of every ioctl handler, the (line number, source
+    code) of each line keyed by the refid of the handler
+    """
+    assert isinstance(xml_files, tuple)
+    return doxygen.find_commands.find_handler_bodies(xml_files, fileop_structs, processes)
 
 
-def find_all_device_names(xml_files: Tuple[str, ...]):
+def find_handler_constraints(
+    xml_files: Tuple[str, ...],
+    fileop_structs: Tuple[Dict[str, Any], ...],
+    processes=None,
+    cache_loc: Optional[str] = CONSTRAINTS_CACHE_LOCATION,
+) -> Dict[str, "doxygen.find_constraints.HandlerConstraints"]:
+    """
+    Wrapper function to find the checks every ioctl handler makes on it's argument and
+    the constants it compares against, keyed by the refid of the handler. Handlers whose
+    bodies haven't changed are read from the cache at cache_loc (None to not cache them)
+    """
+    assert isinstance(xml_files, tuple)
+    doxygen.find_constraints.configure(cache_loc)
+    return doxygen.find_constraints.find_constraints(xml_files, fileop_structs, processes)
+
+
+def infer_argument_directions(
+    xml_files: Tuple[str, ...],
+    fileop_structs: Tuple[Dict[str, Any], ...],
+    processes=None,
+    consts: Optional["ioctl.evaluator.ConstantEvaluator"] = None,
+    commands: Optional[Dict[str, Tuple["ioctl.request.IoctlCommand", ...]]] = None,
+) -> Dict[str, Tuple["ioctl.request.IoctlCommand", ...]]:
+    """
+    Resolves the ioctl commands of every handler (unless given as commands) with the
+    direction and size of each reconciled with how the handler copies it's argument,
+    keyed by the refid of the handler
+    """
+    assert isinstance(xml_files, tuple)
+    evaluator = consts or get_constant_evaluator(xml_files, processes)
+    if commands is None:
+        commands = resolve_ioctl_commands(xml_files, fileop_structs, processes, evaluator)
+    accesses = doxygen.find_directions.find_directions(xml_files, fileop_structs, processes)
+
+    reconciled = dict()
+    disagree = 0
+    for refid, handler_commands in commands.items():
+        by_command = {access.command: access for access in accesses.get(refid, ())}
+        reconciled[refid] = tuple()
+        for command in handler_commands:
+            merged, agrees = doxygen.find_directions.reconcile(
+                command, by_command.get(command.name, by_command.get("")), evaluator
+            )
+            reconciled[refid] += (merged,)
+            disagree += not agrees
+
+    total = sum(len(handler_commands) for handler_commands in commands.values())
+    logger.info("Handlers disagree with _IOC_DIR/_IOC_SIZE for %s of %s commands", disagree, total)
+    return reconciled
+
+
+def find_all_device_names(xml_files: Tuple[str, ...], processes=None):
     """
     Wrapper function to find all device names that is found in the xml files /dev/*
     """
-    pruned_xml_files = doxygen.find_device_name.xml_list_must_include(xml_files, doxygen.find_device_name.INCLUDE_FILE)
+    pruned_xml_files = doxygen.find_device_name.xml_list_must_include(
+        xml_files, doxygen.find_device_name.INCLUDE_FILE, processes
+    )
     return doxygen.find_device_name.find_all(pruned_xml_files)
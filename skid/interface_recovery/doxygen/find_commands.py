@@ -0,0 +1,272 @@
+"""
+Finds the ioctl commands an ioctl handler accepts, these are the case labels in it's body
+
+    static long fop_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+    {
+        switch (cmd) {
+        case WDIOC_GETSUPPORT:
+            ...
+
+The body is read from the programlisting of the file compound between the bodystart
+and bodyend of the handlers memberdef. The labels are unevaluated, see ioctl.evaluator
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+from collections import defaultdict
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+from skid.interface_recovery.scan import lexer
+from skid.utils import admission, supervisor, utils
+
+logger = getLogger(__name__)
+
+
+########## ALL HANDLERS ##########
+
+
+def compound_id(refid: str) -> str:
+    """
+    Given a member refid such as example__driver_8c_1a243d17718e8710d65139b4ac93320c5a
+    returns the compound it belongs to: example__driver_8c
+    """
+    return refid.rsplit("_1", 1)[0]
+
+
+def index_xml_files(xml_files: Tuple[str, ...]) -> Dict[str, str]:
+    """ Maps each compound id to it's xml file, this works for archive members too """
+    index = dict()
+    for xml_file in xml_files:
+        name = xml_file.split(doxygen.xml_archive.MEMBER_SEPARATOR)[-1]
+        index[os.path.splitext(os.path.basename(name))[0]] = xml_file
+    return index
+
+
+def handlers_by_file(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...]
+) -> Dict[str, List[str]]:
+    """ The refids of the ioctl handlers grouped by the xml file they are defined in """
+    index = index_xml_files(xml_files)
+    by_file: Dict[str, List[str]] = defaultdict(list)
+    for fops in fileop_structs:
+        xml_file = index.get(compound_id(fops["refid"]))
+        if fops["refid"] == "" or xml_file is None:
+            logger.debug("No XML for the ioctl handler %s", fops['function'])
+            continue
+        if fops["refid"] not in by_file[xml_file]:
+            by_file[xml_file].append(fops["refid"])
+    return by_file
+
+
+def find_commands(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...], processes=None
+) -> Dict[str, Tuple[str, ...]]:
+    """ Returns the case labels of every ioctl handler keyed by the handlers refid """
+    return map_handlers(
+        xml_files, fileop_structs, find_commands_in_file, "Finding ioctl commands", processes
+    )
+
+
+def find_handler_bodies(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...], processes=None
+) -> Dict[str, Tuple[Tuple[int, str], ...]]:
+    """ Returns the (line number, source code) of every ioctl handlers body keyed by it's refid """
+    return map_handlers(
+        xml_files, fileop_structs, find_bodies_in_file, "Reading ioctl handlers", processes
+    )
+
+
+def map_handlers(
+    xml_files: Tuple[str, ...],
+    fileop_structs: Tuple[Dict[str, Any], ...],
+    func: Callable[[Tuple[str, List[str]]], Dict[str, Any]],
+    title: str,
+    processes=None,
+) -> Dict[str, Any]:
+    """
+    Calls func with (xml file, refids) for every file that defines an ioctl handler, in
+    worker processes, and merges the results keyed by refid
+    """
+    by_file = handlers_by_file(xml_files, fileop_structs)
+    found: Dict[str, Any] = dict()
+    if len(by_file) == 0:
+        return found
+
+    bar_tit = utils.format_alive_bar_title(title)
+    sizes = doxygen.xml_archive.sizes(list(by_file))
+    with utils.progress_bar(len(by_file), title=bar_tit) as bar:
+        with supervisor.pool(processes) as pool:
+            for file_found in admission.imap(pool, func, by_file.items(), sizes, bar=bar):
+                bar()
+                found.update(file_found)
+    return found
+
+
+########## SINGLE XML FILE ##########
+
+
+def find_commands_in_file(args: Tuple[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+    """ Returns the case labels of each of the handlers (by refid) in the xml file """
+    assert len(args) == 2
+    xml_file, refids = args
+    try:
+        source = FunctionSource(xml_file)
+    except (etree.LxmlError, doxygen.ir.IRError) as e:
+        logger.error("%s: %s", xml_file, e)
+        return dict()
+
+    commands = {refid: find_case_labels(source.body(refid)) for refid in refids}
+    if any(len(labels) > 0 for labels in commands.values()) and not source.trusted():
+        return dict()
+    return commands
+
+
+def find_bodies_in_file(args: Tuple[str, List[str]]) -> Dict[str, Tuple[Tuple[int, str], ...]]:
+    """ Returns the body of each of the handlers (by refid) in the xml file """
+    assert len(args) == 2
+    xml_file, refids = args
+    try:
+        source = FunctionSource(xml_file)
+    except (etree.LxmlError, doxygen.ir.IRError) as e:
+        logger.error("%s: %s", xml_file, e)
+        return dict()
+
+    bodies = {refid: tuple(source.body(refid)) for refid in refids}
+    if any(len(body) > 0 for body in bodies.values()) and not source.trusted():
+        return dict()
+    return bodies
+
+
+class FunctionSource:
+    """
+    Reads the bodies of the functions in an xml file, or a compound transcoded by
+    doxygen.ir. trusted() is only worth calling once something was found in them, see
+    doxygen.validation
+    Raises: etree.LxmlError, doxygen.ir.IRError: If the file can't be read
+    """
+
+    def __init__(self, xml_file: str):
+        self.xml_file = xml_file
+        self.compound = None
+        self.root = None
+        if doxygen.ir.is_ir(xml_file):
+            self.compound = doxygen.ir.load(xml_file)
+        else:
+            self.root = doxygen.xml_utils.get_root(xml_file)
+        self._functions: Optional[Dict[str, Tuple[int, int]]] = None
+
+    def trusted(self) -> bool:
+        if self.compound is not None:
+            return self.compound.trusted
+        return doxygen.validation.trusted(self.xml_file, self.root)
+
+    def body(self, refid: str) -> List[Tuple[int, str]]:
+        """ The (line number, source code) of each line in the body of the function """
+        if self.compound is not None:
+            return get_ir_function_body(self.compound, refid)
+        return get_function_body(self.root, refid)
+
+    def body_by_name(self, name: str) -> List[Tuple[int, str]]:
+        """ Like body for the function defined in the file with this name """
+        if self._functions is None:
+            self._functions = self.function_lines()
+        if name not in self._functions:
+            return list()
+        return self.lines_between(*self._functions[name])
+
+    def function_lines(self) -> Dict[str, Tuple[int, int]]:
+        """ The bodystart and bodyend of each function with a body keyed by it's name """
+        functions = dict()
+        if self.compound is not None:
+            for member in self.compound.members(("function",)):
+                if 0 <= member.bodystart <= member.bodyend:
+                    name = self.compound.string(member.name)
+                    functions.setdefault(name, (member.bodystart, member.bodyend))
+            return functions
+
+        for memberdef in doxygen.xpath.FUNCTION_MEMBERDEFS(self.root):
+            location = memberdef.find("location")
+            if location is None:
+                continue
+            start = int(location.attrib.get("bodystart", "-1"))
+            end = int(location.attrib.get("bodyend", "-1"))
+            if 0 <= start <= end:
+                functions.setdefault(memberdef.findtext("name"), (start, end))
+        return functions
+
+    def lines_between(self, start: int, end: int) -> List[Tuple[int, str]]:
+        if self.compound is not None:
+            return self.compound.codelines_between(start, end)
+        return [
+            (int(codeline.attrib["lineno"]), doxygen.find_constants.codeline_text(codeline))
+            for codeline in doxygen.xpath.CODELINES_BETWEEN(self.root, start=start, end=end)
+        ]
+
+
+def get_ir_function_body(compound: "doxygen.ir.Compound", refid: str) -> List[Tuple[int, str]]:
+    """ Like get_function_body for a compound transcoded by doxygen.ir """
+    member = compound.member_by_id(refid)
+    if member is None or not 0 <= member.bodystart <= member.bodyend:
+        return list()
+    return compound.codelines_between(member.bodystart, member.bodyend)
+
+
+def get_function_body(root, refid: str) -> List[Tuple[int, str]]:
+    """ Returns the (line number, source code) of each line in the functions body """
+    location = None
+    for memberdef in doxygen.xpath.MEMBERDEF_BY_ID(root, id=refid):
+        location = memberdef.find("location")
+        break
+    if location is None or "bodystart" not in location.attrib:
+        return list()
+
+    start = int(location.attrib["bodystart"])
+    end = int(location.attrib.get("bodyend", "-1"))
+    if end < start:
+        return list()
+
+    return [
+        (int(codeline.attrib["lineno"]), doxygen.find_constants.codeline_text(codeline))
+        for codeline in doxygen.xpath.CODELINES_BETWEEN(root, start=start, end=end)
+    ]
+
+
+def find_case_labels(body: Sequence[Tuple[int, str]]) -> Tuple[str, ...]:
+    """ Returns each unique case label expression in the order they appear """
+    tokens = list(lexer.tokenize("\n".join(text for _, text in body)))
+    labels: List[str] = list()
+    for _, label, _ in iter_cases(tokens):
+        # GNU case ranges such as 'case 1 ... 5:' are skipped
+        values = [token.value for token in label]
+        text = " ".join(values)
+        if len(values) > 0 and "..." not in values and text not in labels:
+            labels.append(text)
+    return tuple(labels)
+
+
+def iter_cases(tokens: List[lexer.Token]) -> Iterator[Tuple[int, List[lexer.Token], int]]:
+    """ Yields the index of each 'case', the tokens of it's label and the index of the ':' """
+    for i, token in enumerate(tokens):
+        if token.value != "case":
+            continue
+
+        # The label ends at the ':' that isn't part of a '?:'
+        label = list()
+        ternaries = 0
+        end = len(tokens)
+        for j in range(i + 1, len(tokens)):
+            if tokens[j].value == "?":
+                ternaries += 1
+            elif tokens[j].value == ":":
+                if ternaries == 0:
+                    end = j
+                    break
+                ternaries -= 1
+            label.append(tokens[j])
+        yield i, label, end
@@ -0,0 +1,304 @@
+"""
+Finds the #defines, enums, typedefs and structs that ioctl request numbers are built from
+and collects them into an ioctl.evaluator.ConstantTable
+
+Since doxygen is run with ENABLE_PREPROCESSING=NO it does not always emit define
+memberdefs, so the #define lines are also read out of the programlisting:
+
+    <codeline lineno="41">
+        <highlight class="preprocessor">#define<sp/>WDT_ENABLE<sp/>0x9C</highlight>
+    </codeline>
+
+A struct is it's own compound, each member is a variable memberdef:
+
+    <compounddef id="structwatchdog__info" kind="struct">
+        <compoundname>watchdog_info</compoundname>
+        <memberdef kind="variable">
+            <type>__u8</type><name>identity</name><argsstring>[32]</argsstring>
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import re
+from collections import defaultdict
+from logging import getLogger
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+from skid.interface_recovery.ioctl import evaluator, layouts
+from skid.utils import admission, supervisor, tuning, utils
+
+logger = getLogger(__name__)
+
+CONSTANTS_CHUNKSIZE = 8
+RECORD_KINDS = ("struct", "union")
+
+_DEFINE_RE = re.compile(r"^\s*#\s*define\s+([A-Za-z_]\w*)(\(([^)]*)\))?\s*(.*)$", re.S)
+
+
+########## ALL XML FILES ##########
+
+
+def find_constants(xml_files: Tuple[str, ...], processes=None) -> evaluator.ConstantTable:
+    """
+    Itterates through all xml files and collects every constant definition, when a name
+    is defined more than once the definition from the first xml file (sorted) is kept
+    """
+    assert isinstance(xml_files, tuple)
+    table = evaluator.ConstantTable()
+    if len(xml_files) == 0:
+        return table
+
+    bar_tit = utils.format_alive_bar_title("Finding #defines, enums and structs")
+    xml_files = tuple(sorted(xml_files))
+    sizes = doxygen.xml_archive.sizes(xml_files)
+    with utils.progress_bar(len(xml_files), title=bar_tit) as bar:
+        with supervisor.pool(processes) as pool:
+            # Kept in order so the same definition always wins
+            for file_table in admission.imap(
+                pool,
+                find_constants_in_file,
+                xml_files,
+                sizes,
+                ordered=True,
+                chunksize=tuning.get_chunksize("constants", CONSTANTS_CHUNKSIZE),
+                bar=bar,
+            ):
+                bar()
+                table.merge(file_table)
+
+    logger.info(
+        "Found %s macros, %s enumerators, %s structs and %s typedefs",
+        len(table.macros),
+        len(table.enums),
+        len(table.records),
+        len(table.typedefs),
+    )
+    return table
+
+
+########## SINGLE XML FILE ##########
+
+
+def find_constants_in_file(xml_file: str) -> evaluator.ConstantTable:
+    """ Collects the constant definitions in a single xml file """
+    if doxygen.ir.is_ir(xml_file):
+        return find_constants_in_ir(xml_file)
+    table = evaluator.ConstantTable()
+    try:
+        root = doxygen.xml_utils.get_root(xml_file)
+    except etree.LxmlError as e:
+        logger.error(e)
+        return table
+
+    for compound in doxygen.xpath.RECORD_COMPOUNDS(root):
+        name, record = parse_record_compound(compound)
+        table.records.setdefault(name, record)
+
+    for element in doxygen.xpath.CONSTANT_MEMBERDEFS(root):
+        kind = element.attrib.get("kind")
+        if kind == "define":
+            macro = parse_define_memberdef(element)
+            table.macros.setdefault(macro.name, macro)
+        elif kind == "enum":
+            enumerators = parse_enum_memberdef(element)
+            for name, value in enumerators.items():
+                table.enums.setdefault(name, value)
+            table.enum_types.setdefault(element_text(element.find("name")), tuple(enumerators))
+        elif kind == "typedef":
+            name, type_str = parse_typedef_memberdef(element)
+            table.typedefs.setdefault(name, type_str)
+
+    for macro in iter_programlisting_defines(root):
+        table.macros.setdefault(macro.name, macro)
+    return table
+
+
+def find_constants_in_ir(ir_file: str) -> evaluator.ConstantTable:
+    """ Like find_constants_in_file for a compound transcoded by doxygen.ir """
+    table = evaluator.ConstantTable()
+    try:
+        compound = doxygen.ir.load(ir_file)
+    except doxygen.ir.IRError as e:
+        logger.error("%s: %s", ir_file, e)
+        return table
+
+    compounds = compound.compounds()
+    fields: Dict[int, List[layouts.Member]] = defaultdict(list)
+    for member in compound.members(("variable",)):
+        if compounds[member.compound][0] in RECORD_KINDS:
+            bits = None if member.bitfield == doxygen.ir.NONE else compound.text(member.bitfield)
+            fields[member.compound].append(
+                record_member(
+                    compound.text(member.name),
+                    compound.text(member.type),
+                    compound.text(member.argsstring),
+                    bits,
+                )
+            )
+    for index, (kind, name) in enumerate(compounds):
+        if kind in RECORD_KINDS:
+            table.records.setdefault(name, evaluator.Record(kind, tuple(fields[index])))
+
+    for member in compound.members(("define", "enum", "typedef")):
+        kind = compound.string(member.kind)
+        name = compound.text(member.name)
+        if kind == "define":
+            macro = evaluator.Macro(
+                name, compound.params(member), compound.text(member.initializer)
+            )
+            table.macros.setdefault(macro.name, macro)
+        elif kind == "enum":
+            enumerators = enum_values(compound.enumvalues(member))
+            for enumerator, value in enumerators.items():
+                table.enums.setdefault(enumerator, value)
+            table.enum_types.setdefault(name, tuple(enumerators))
+        else:
+            typedef = typedef_type(
+                compound.text(member.type), compound.text(member.argsstring)
+            )
+            table.typedefs.setdefault(name, typedef)
+
+    for macro in iter_defines(text for _, text in compound.codelines()):
+        table.macros.setdefault(macro.name, macro)
+    return table
+
+
+def parse_define_memberdef(element: etree.Element) -> evaluator.Macro:  # type: ignore
+    """ Converts a define memberdef into a Macro, params is None for object like macros """
+    params = None
+    if element.find("param") is not None:
+        params = tuple(element_text(defname) for defname in element.iter("defname"))
+    initializer = element.find("initializer")
+    body = element_text(initializer) if initializer is not None else ""
+    return evaluator.Macro(element_text(element.find("name")), params, body)
+
+
+def parse_enum_memberdef(element: etree.Element) -> Dict[str, evaluator.EnumValue]:  # type: ignore
+    """ Returns the value of every enumerator, implicit values count up from the last one """
+    enumvalues = list()
+    for enumvalue in element.iter("enumvalue"):
+        initializer = enumvalue.find("initializer")
+        enumvalues.append(
+            (
+                element_text(enumvalue.find("name")),
+                element_text(initializer) if initializer is not None else None,
+            )
+        )
+    return enum_values(enumvalues)
+
+
+def enum_values(
+    enumvalues: List[Tuple[str, Optional[str]]]
+) -> Dict[str, evaluator.EnumValue]:
+    """ The value of each (name, initializer) enumerator, initializer is None if it has none """
+    values = dict()
+    expression, offset = "0", 0
+    for name, initializer in enumvalues:
+        if initializer is not None:
+            expression, offset = initializer.lstrip("= \t"), 0
+        values[name] = evaluator.EnumValue(expression, offset)
+        offset += 1
+    return values
+
+
+def parse_typedef_memberdef(element: etree.Element) -> Tuple[str, str]:  # type: ignore
+    """ Returns (name, type), function pointer typedefs are just pointers """
+    type_str = typedef_type(
+        element_text(element.find("type")), element_text(element.find("argsstring"))
+    )
+    return element_text(element.find("name")), type_str
+
+
+def typedef_type(type_str: str, argsstring: str) -> str:
+    """ The type a typedef names, function pointer typedefs are just pointers """
+    if "(" in argsstring:
+        return "void *"
+    if "[" in argsstring:
+        return type_str + argsstring
+    return type_str
+
+
+def parse_record_compound(compound: etree.Element) -> Tuple[str, evaluator.Record]:  # type: ignore
+    """ Returns the name and members (in declaration order) of a struct or union compound """
+    members = list()
+    for element in doxygen.xpath.RECORD_MEMBERS(compound):
+        bitfield = element.find("bitfield")
+        members.append(
+            record_member(
+                element_text(element.find("name")),
+                element_text(element.find("type")),
+                element_text(element.find("argsstring")),
+                element_text(bitfield) if bitfield is not None else None,
+            )
+        )
+    name = element_text(compound.find("compoundname"))
+    return name, evaluator.Record(compound.attrib["kind"], tuple(members))
+
+
+def record_member(
+    name: str, type_str: str, argsstring: str, bits: Optional[str]
+) -> layouts.Member:
+    """ A member of a struct or union, function pointers are just pointers """
+    if "(" in argsstring:
+        type_str, argsstring = "void *", ""
+    return layouts.Member(
+        name=name, type=type_str, dimensions=layouts.split_dimensions(argsstring), bits=bits
+    )
+
+
+def iter_programlisting_defines(root) -> Iterator[evaluator.Macro]:
+    """ Yields every #define in the programlisting, continuation lines are joined """
+    return iter_defines(codeline_text(codeline) for codeline in root.iter("codeline"))
+
+
+def iter_defines(lines: Iterable[str]) -> Iterator[evaluator.Macro]:
+    """ Yields every #define in the lines of source code, continuation lines are joined """
+    pending = ""
+    for text in lines:
+        if pending == "" and not text.lstrip().startswith("#"):
+            continue
+
+        pending += text
+        if pending.rstrip().endswith("\\"):
+            pending = pending.rstrip()[:-1] + " "
+            continue
+
+        macro = parse_define(pending)
+        pending = ""
+        if macro is not None:
+            yield macro
+
+
+def parse_define(line: str) -> Optional[evaluator.Macro]:
+    """
+    Given a line such as '#define WDT_ENABLE 0x9C' or '#define ADD(a, b) ((a) + (b))'
+    returns the Macro, None is returned for any other directive
+    """
+    match = _DEFINE_RE.match(line)
+    if match is None:
+        return None
+    # The params only count if the bracket comes straight after the name, '#define A (1)' is 1
+    name, has_params, params, body = match.groups()
+    body = re.sub(r"/\*.*?\*/|//.*$", " ", body, flags=re.S).strip()
+    if has_params is None:
+        return evaluator.Macro(name, None, body)
+    return evaluator.Macro(name, tuple(p.strip() for p in params.split(",") if p.strip()), body)
+
+
+def codeline_text(node) -> str:
+    """ The source code of a codeline, <sp/> elements are spaces """
+    text = " " if node.tag == "sp" else (node.text or "")
+    for child in node:
+        text += codeline_text(child) + (child.tail or "")
+    return text
+
+
+def element_text(node) -> str:
+    """ All of the text inside an element (including <ref>'s) with whitespace collapsed """
+    if node is None:
+        return ""
+    return " ".join("".join(node.itertext()).split())
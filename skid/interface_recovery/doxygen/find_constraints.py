@@ -0,0 +1,582 @@
+"""
+Finds the checks ioctl handlers make on their argument, so the argument generator (see
+fuzzer.arguments) can pass them rather than bouncing off them with EINVAL
+
+    case WDIOC_SETTIMEOUT:                              command           field  check
+        if (get_user(new_timeout, p))                   WDIOC_SETTIMEOUT  ''     < 1
+            return -EFAULT;                             WDIOC_SETTIMEOUT  ''     > 3600
+        if (new_timeout < 1 || new_timeout > 3600)
+            return -EINVAL;
+    case FOO_SUBMIT:
+        if (copy_from_user(&req, argp, sizeof(req)))
+            return -EFAULT;                             FOO_SUBMIT        magic  != REQ_MAGIC
+        if (req.magic != REQ_MAGIC)                     FOO_SUBMIT        flags  &~ REQ_FLAGS
+            return -EINVAL;
+        if (req.flags & ~REQ_FLAGS)
+            return -EINVAL;
+
+A check is attributed to the field of the argument it reads by following what
+copy_from_user, get_user and memdup_user copy out of the argument, and to the command
+whose case (of the switch on cmd) it's in. Comparisons, bounds, flag masks and switches
+on a field are found. The functions the handler calls that are defined in the same file
+are searched too, their checks can't be attributed so the constants they compare against
+only go into the dictionary of the handler.
+
+Constants are kept as they are written and evaluated when the generator is built. The
+extraction runs in the workers that read the handlers, the result is cached by a hash
+of the handler and callee bodies so unchanged handlers aren't analysed again. The cache
+is a text file of "<hash> <json>" lines appended to like validation's verdicts.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+from logging import getLogger
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+from skid.interface_recovery.scan import lexer
+
+logger = getLogger(__name__)
+
+KIND_BOUND = "bound"
+KIND_EQUAL = "equal"
+KIND_MASK = "mask"
+
+# How deep the calls of a handler are followed and the most functions searched
+CALLEE_DEPTH = 2
+MAX_CALLEES = 32
+
+# Part of the cache key, bump it when the extraction changes
+CONSTRAINTS_VERSION = 1
+
+# Each comparison and the one it becomes when the operands are swapped
+_COMPARISONS = {"<": ">", ">": "<", "<=": ">=", ">=": "<=", "==": "==", "!=": "!="}
+_COPIES = ("copy_from_user", "__copy_from_user", "get_user", "__get_user")
+_DUPLICATES = ("memdup_user", "vmemdup_user", "memdup_user_nul")
+_STRING_COMPARES = ("strcmp", "strncmp", "strcasecmp", "strncasecmp", "memcmp")
+_NOT_CALLS = frozenset(("if", "while", "for", "switch", "return", "sizeof"))
+_CONSTANT_PUNCT = frozenset(("(", ")", "+", "-", "*", "/", "%", "<<", ">>", "|", "&", "^", "~"))
+# What can come before the left operand of a comparison, so the field is all of it
+_OPERAND_STARTS = frozenset(("(", "&&", "||", ",", "=", "?", ":", "return", ";", "{", "}"))
+# What ends the constant on the right, anything that binds less tightly
+_COMPARISON_ENDS = frozenset((",", ";", "&&", "||", "?", ":", "=", "{", "}", "&", "|", "^"))
+_MASK_ENDS = frozenset((",", ";", "&&", "||", "?", ":", "=", "{", "}", "|", "^"))
+
+_cache_location: Optional[str] = None
+_cached: Dict[str, "HandlerConstraints"] = dict()
+
+
+class Constraint(NamedTuple):
+    """
+    A check on the argument of a command ('' if it's outside of the switch on cmd).
+    field is the dotted path of the member it reads ('' for the whole argument) and
+    value the constant expression it's checked against
+    """
+
+    command: str
+    field: str
+    kind: str
+    operator: str
+    value: str
+
+
+class HandlerConstraints(NamedTuple):
+    """ The constants a handler and it's callees check against and the checks on the argument """
+
+    dictionary: Tuple[str, ...] = ()
+    constraints: Tuple[Constraint, ...] = ()
+
+
+########## CACHE ##########
+
+
+def configure(cache_location: Optional[str]) -> None:
+    """ Sets where the constraints are cached, None to not cache them """
+    global _cache_location  # pylint: disable=global-statement
+    _cache_location = cache_location
+    _cached.clear()
+    if cache_location is not None:
+        _cached.update(load_cache(cache_location))
+        logger.debug("Loaded %s cached handler constraints", len(_cached))
+
+
+def load_cache(location: str) -> Dict[str, HandlerConstraints]:
+    """ Reads the cached constraints, a missing or damaged cache is just a smaller one """
+    cached = dict()
+    try:
+        with open(location) as cache_f:
+            for line in cache_f:
+                key, _, found = line.partition(" ")
+                try:
+                    dictionary, constraints = json.loads(found)
+                    cached[key] = HandlerConstraints(
+                        tuple(dictionary), tuple(Constraint(*c) for c in constraints)
+                    )
+                except (ValueError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return cached
+
+
+def record(location: str, key: str, found: HandlerConstraints) -> None:
+    """ Appends the constraints of a handler to the cache """
+    line = json.dumps([list(found.dictionary), [list(c) for c in found.constraints]])
+    try:
+        with open(location, "a") as cache_f:
+            cache_f.write(f"{key} {line}\n")
+    except OSError as e:
+        logger.debug("Could not cache the constraints for %s: %s", key, e)
+
+
+def body_hash(body: Sequence[Tuple[int, str]], callees: Sequence[Tuple[str, List]]) -> str:
+    """ The cache key of a handler, the line numbers are left out so moving it is free """
+    texts = [str(CONSTRAINTS_VERSION), "\n".join(text for _, text in body)]
+    for name, callee in callees:
+        texts += [name, "\n".join(text for _, text in callee)]
+    return doxygen.validation.content_hash("\0".join(texts).encode("utf-8"))
+
+
+########## ALL HANDLERS ##########
+
+
+def find_constraints(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...], processes=None
+) -> Dict[str, HandlerConstraints]:
+    """ Returns the constraints of every ioctl handler keyed by the handlers refid """
+    return doxygen.find_commands.map_handlers(
+        xml_files,
+        fileop_structs,
+        find_constraints_in_file,
+        "Finding argument constraints",
+        processes,
+    )
+
+
+########## SINGLE XML FILE ##########
+
+
+def find_constraints_in_file(args: Tuple[str, List[str]]) -> Dict[str, HandlerConstraints]:
+    """ Returns the constraints of each of the handlers (by refid) in the xml file """
+    assert len(args) == 2
+    xml_file, refids = args
+    try:
+        source = doxygen.find_commands.FunctionSource(xml_file)
+    except (etree.LxmlError, doxygen.ir.IRError) as e:
+        logger.error("%s: %s", xml_file, e)
+        return dict()
+
+    found = dict()
+    for refid in refids:
+        body = source.body(refid)
+        if len(body) == 0:
+            continue
+        callees = read_callees(source, body)
+        key = body_hash(body, callees)
+        if key not in _cached:
+            _cached[key] = extract(body, callees)
+            if _cache_location is not None:
+                record(_cache_location, key, _cached[key])
+        found[refid] = _cached[key]
+
+    if len(found) > 0 and not source.trusted():
+        return dict()
+    return found
+
+
+def read_callees(
+    source: "doxygen.find_commands.FunctionSource", body: Sequence[Tuple[int, str]]
+) -> List[Tuple[str, List[Tuple[int, str]]]]:
+    """ The (name, body) of the functions defined in the file the handler calls, breadth first """
+    callees: List[Tuple[str, List[Tuple[int, str]]]] = list()
+    seen: Set[str] = set()
+    frontier = [body]
+    for _ in range(CALLEE_DEPTH):
+        calls = [name for lines in frontier for name in called_functions(tokenize(lines))]
+        frontier = list()
+        for name in calls:
+            if name in seen or len(callees) >= MAX_CALLEES:
+                continue
+            seen.add(name)
+            callee = source.body_by_name(name)
+            if len(callee) > 0:
+                callees.append((name, callee))
+                frontier.append(callee)
+    return callees
+
+
+########## EXTRACTION ##########
+
+
+def tokenize(body: Sequence[Tuple[int, str]]) -> List[lexer.Token]:
+    return list(lexer.tokenize("\n".join(text for _, text in body)))
+
+
+def extract(
+    body: Sequence[Tuple[int, str]], callees: Sequence[Tuple[str, List[Tuple[int, str]]]] = ()
+) -> HandlerConstraints:
+    """ The constraints of a handler given it's body and the (name, body) of it's callees """
+    tokens = tokenize(body)
+    params = parameters(tokens)
+    cmd = params[-2] if len(params) >= 2 else None
+    arg = params[-1] if len(params) >= 1 else None
+
+    constraints, dictionary = checks(
+        tokens, argument_fields(tokens, arg), command_labels(tokens, cmd), {cmd}
+    )
+    for _, callee in callees:
+        callee_tokens = tokenize(callee)
+        dictionary += checks(callee_tokens, dict(), [()] * len(callee_tokens), set())[1]
+    return HandlerConstraints(unique(dictionary), unique(constraints))
+
+
+def parameters(tokens: List[lexer.Token]) -> List[str]:
+    """ The names of the parameters of the function, in order """
+    names = list()
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.value == "{":
+            break
+        if depth == 1 and token.value in (",", ")") and tokens[i - 1].kind == lexer.IDENT:
+            names.append(tokens[i - 1].value)
+        depth += {"(": 1, ")": -1}.get(token.value, 0)
+    return names
+
+
+def called_functions(tokens: List[lexer.Token]) -> List[str]:
+    """ The functions called by name in the body, macros (upper case) are left out """
+    called = list()
+    body = next((i for i, token in enumerate(tokens) if token.value == "{"), len(tokens))
+    for i, token in enumerate(tokens[:-1]):
+        if i < body or token.kind != lexer.IDENT or tokens[i + 1].value != "(":
+            continue
+        if token.value in _NOT_CALLS or token.value.upper() == token.value:
+            continue
+        if i > 0 and tokens[i - 1].value in (".", "->"):
+            continue
+        if token.value not in called:
+            called.append(token.value)
+    return called
+
+
+def argument_fields(tokens: List[lexer.Token], arg: Optional[str]) -> Dict[str, str]:
+    """
+    The variables holding (part of) the argument, mapped to the field they hold:
+
+        void __user *argp = (void __user *)arg;         argp points to the argument
+        get_user(timeout, &uarg->timeout)               timeout     -> 'timeout'
+        copy_from_user(&req, argp, sizeof(req))         req         -> ''
+        buf = memdup_user(argp, size)                   buf         -> ''
+    """
+    fields: Dict[str, str] = dict()
+    if arg is None:
+        return fields
+    fields[arg] = ""
+    pointers = argument_pointers(tokens, arg)
+    for i, token in enumerate(tokens):
+        if token.kind != lexer.IDENT:
+            continue
+        following = tokens[i + 1].value if i + 1 < len(tokens) else ""
+        if following == "=":
+            rhs = assigned(tokens, i)
+            calls = [j for j in range(len(rhs) - 1) if rhs[j + 1].value == "("]
+            duplicate = next((j for j in calls if rhs[j].value in _DUPLICATES), None)
+            if duplicate is not None:
+                source, _ = call_arguments(rhs, duplicate + 1)
+                path = pointer_path(source[0], pointers) if len(source) > 0 else None
+                if path is not None:
+                    fields[token.value] = path
+        elif token.value in _COPIES and following == "(":
+            args, _ = call_arguments(tokens, i + 1)
+            if len(args) < 2:
+                continue
+            path = pointer_path(args[1], pointers)
+            destination = [t for t in args[0] if t.value != "&"]
+            if path is not None and len(destination) == 1 and destination[0].kind == lexer.IDENT:
+                fields[destination[0].value] = path
+    return fields
+
+
+def argument_pointers(tokens: List[lexer.Token], arg: str) -> Set[str]:
+    """ arg and the variables assigned it, or a cast of it, such as argp = (void __user *)arg """
+    pointers = {arg}
+    for i, token in enumerate(tokens[:-1]):
+        if token.kind == lexer.IDENT and tokens[i + 1].value == "=":
+            rhs = assigned(tokens, i)
+            if all(t.value not in _NOT_CALLS for t in rhs) and pointer_path(rhs, pointers) == "":
+                pointers.add(token.value)
+    return pointers
+
+
+def assigned(tokens: List[lexer.Token], i: int) -> List[lexer.Token]:
+    """ The tokens assigned to the variable at i, up to the end of the statement """
+    end = next((j for j in range(i + 2, len(tokens)) if tokens[j].value == ";"), i + 2)
+    return tokens[i + 2 : end]
+
+
+def pointer_path(tokens: List[lexer.Token], pointers: Set[str]) -> Optional[str]:
+    """
+    The field of the argument an expression points to such as &uarg->info.timeout, ''
+    for the argument itself and None if it doesn't point into the argument. Calls other
+    than casts don't count
+    """
+    for i, token in enumerate(tokens):
+        if token.kind == lexer.IDENT and token.value in pointers:
+            if i > 0 and tokens[i - 1].value in (".", "->"):
+                continue
+            members = list()
+            j = i + 1
+            while j + 1 < len(tokens) and tokens[j].value in (".", "->"):
+                members.append(tokens[j + 1].value)
+                j += 2
+            return ".".join(members)
+        if token.kind == lexer.IDENT and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            return None
+    return None
+
+
+def call_arguments(tokens: List[lexer.Token], start: int) -> Tuple[List[List[lexer.Token]], int]:
+    """ The tokens of each argument of the call whose '(' is at start and the index of it's ')' """
+    args: List[List[lexer.Token]] = [[]]
+    depth = 0
+    for i in range(start, len(tokens)):
+        value = tokens[i].value
+        if value in ("(", "[", "{"):
+            depth += 1
+            if depth == 1:
+                continue
+        elif value in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return [arg for arg in args if len(arg) > 0], i
+        elif value == "," and depth == 1:
+            args.append(list())
+            continue
+        args[-1].append(tokens[i])
+    return [arg for arg in args if len(arg) > 0], len(tokens)
+
+
+def switch_cases(tokens: List[lexer.Token], start: int) -> Tuple[List[Tuple[int, int, str]], int]:
+    """
+    The (index, index of the ':', label) of each case of the switch at start, the label of
+    default is ''. Also returns the index of the closing brace, cases of nested switches
+    are left out
+    """
+    _, close = call_arguments(tokens, start + 1)
+    cases: List[Tuple[int, int, str]] = list()
+    if close + 1 >= len(tokens) or tokens[close + 1].value != "{":
+        return cases, close
+    depth = 0
+    j = close + 1
+    while j < len(tokens):
+        value = tokens[j].value
+        if value == "{":
+            depth += 1
+        elif value == "}":
+            depth -= 1
+            if depth == 0:
+                return cases, j
+        elif depth == 1 and value == "case":
+            _, label, colon = next(doxygen.find_commands.iter_cases(tokens[j:]))
+            cases.append((j, j + colon, " ".join(token.value for token in label)))
+            j += colon
+        elif depth == 1 and value == "default" and j + 1 < len(tokens):
+            if tokens[j + 1].value == ":":
+                cases.append((j, j + 1, ""))
+        j += 1
+    return cases, len(tokens)
+
+
+def command_labels(tokens: List[lexer.Token], cmd: Optional[str]) -> List[Tuple[str, ...]]:
+    """
+    The labels of the cases (of a switch on cmd) each token is in, () outside of one. A
+    case that falls through into the next one is in both
+    """
+    labels: List[Tuple[str, ...]] = [()] * len(tokens)
+    if cmd is None:
+        return labels
+    for i in range(len(tokens) - 3):
+        if tokens[i].value != "switch" or tokens[i + 1].value != "(":
+            continue
+        if tokens[i + 2].value != cmd or tokens[i + 3].value != ")":
+            continue
+
+        cases, end = switch_cases(tokens, i)
+        group: List[str] = list()
+        carried: List[str] = list()
+        for k, (_, colon, label) in enumerate(cases):
+            if label != "":
+                group.append(label)
+            following = cases[k + 1][0] if k + 1 < len(cases) else end
+            if following == colon + 1:
+                # case A: case B: share a body
+                continue
+            for j in range(colon + 1, following):
+                labels[j] = tuple(carried + group)
+            carried = carried + group if falls_through(tokens, colon + 1, following) else []
+            group = list()
+    return labels
+
+
+def falls_through(tokens: List[lexer.Token], start: int, end: int) -> bool:
+    """ False if the last statement of the case body between start and end leaves the switch """
+    last = end - 1
+    while last >= start and tokens[last].value == "}":
+        last -= 1
+    if last < start or tokens[last].value != ";":
+        return True
+    first = last - 1
+    while first >= start and tokens[first].value not in (";", "{", "}"):
+        first -= 1
+    first += 1
+    # Labels of a nested switch and else are part of the statement
+    while first < last and tokens[first].value in ("else", "case", "default"):
+        if tokens[first].value == "else":
+            first += 1
+        else:
+            first = next((j for j in range(first, last) if tokens[j].value == ":"), last) + 1
+    return tokens[first].value not in ("return", "break", "goto", "continue")
+
+
+def checks(
+    tokens: List[lexer.Token],
+    fields: Dict[str, str],
+    labels: List[Tuple[str, ...]],
+    ignore: Set[Optional[str]],
+) -> Tuple[List[Constraint], List[str]]:
+    """
+    The constraints on the argument fields and the constants every comparison, mask and
+    switch compares against. Comparisons of the variables in ignore (cmd) are left out
+    """
+    constraints: List[Constraint] = list()
+    dictionary: List[str] = list()
+
+    def found(i: int, chain: List[lexer.Token], kind: str, operator: str, value: str):
+        if chain[0].value in ignore:
+            return
+        dictionary.append(value)
+        path = field_path(chain, fields)
+        if path is not None:
+            for command in labels[i] or ("",):
+                constraints.append(Constraint(command, path, kind, operator, value))
+
+    for i, token in enumerate(tokens):
+        value = token.value
+        if value in _COMPARISONS or (value == "&" and is_binary(tokens, i)):
+            ends = _MASK_ENDS if value == "&" else _COMPARISON_ENDS
+            start = chain_start(tokens, i)
+            end = operand_end(tokens, i + 1, ends)
+            right = tokens[i + 1 : end]
+            if start is not None and is_constant(right):
+                chain, constant, operator = tokens[start:i], right, value
+            elif (
+                i > 0
+                and is_constant(tokens[i - 1 : i])
+                and (i < 2 or tokens[i - 2].value in _OPERAND_STARTS)
+                and is_chain(right)
+            ):
+                chain, constant = right, tokens[i - 1 : i]
+                operator = _COMPARISONS.get(value, value)
+            else:
+                continue
+
+            if operator == "&" and constant[0].value == "~":
+                operator, constant = "&~", constant[1:]
+            kind = KIND_BOUND
+            if value == "&":
+                kind = KIND_MASK
+            elif value in ("==", "!="):
+                kind = KIND_EQUAL
+            found(i, chain, kind, operator, " ".join(t.value for t in constant))
+        elif value == "switch" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            subject, close = call_arguments(tokens, i + 1)
+            if len(subject) != 1 or not is_chain(subject[0]):
+                continue
+            for _, _, label in switch_cases(tokens, i)[0]:
+                if label != "" and is_constant(list(lexer.tokenize(label))):
+                    found(close, subject[0], KIND_EQUAL, "==", label)
+        elif value in _STRING_COMPARES and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            args, _ = call_arguments(tokens, i + 1)
+            for arg in args:
+                dictionary += [t.value for t in arg if t.kind == lexer.STRING]
+    return constraints, dictionary
+
+
+def field_path(chain: List[lexer.Token], fields: Dict[str, str]) -> Optional[str]:
+    """ The field of the argument a chain such as req.info.flags reads, None if it's not one """
+    if chain[0].value not in fields:
+        return None
+    members = [fields[chain[0].value]] + [token.value for token in chain[2::2]]
+    return ".".join(member for member in members if member != "")
+
+
+def chain_start(tokens: List[lexer.Token], end: int) -> Optional[int]:
+    """ Where the chain such as req->info.flags before end starts, None if it's not an operand """
+    start = end - 1
+    if start < 0 or tokens[start].kind != lexer.IDENT:
+        return None
+    while start >= 2 and tokens[start - 1].value in (".", "->"):
+        if tokens[start - 2].kind != lexer.IDENT:
+            return None
+        start -= 2
+    if start > 0 and tokens[start - 1].value not in _OPERAND_STARTS:
+        return None
+    return start
+
+
+def is_chain(tokens: List[lexer.Token]) -> bool:
+    """ True for a variable and it's members such as req->info.flags """
+    if len(tokens) % 2 == 0 or any(t.kind != lexer.IDENT for t in tokens[::2]):
+        return False
+    return all(t.value in (".", "->") for t in tokens[1::2])
+
+
+def is_binary(tokens: List[lexer.Token], i: int) -> bool:
+    """ True if the operator at i has a left operand """
+    return i > 0 and (
+        tokens[i - 1].kind in (lexer.IDENT, lexer.NUMBER, lexer.CHAR)
+        or tokens[i - 1].value in (")", "]")
+    )
+
+
+def operand_end(tokens: List[lexer.Token], start: int, ends: frozenset) -> int:
+    """ The index after the operand that starts at start """
+    depth = 0
+    for i in range(start, len(tokens)):
+        value = tokens[i].value
+        if value in ("(", "["):
+            depth += 1
+        elif value in (")", "]"):
+            if depth == 0:
+                return i
+            depth -= 1
+        elif depth == 0 and (value in ends or value in _COMPARISONS):
+            return i
+    return len(tokens)
+
+
+def is_constant(tokens: List[lexer.Token]) -> bool:
+    """ True if the tokens are a constant expression: numbers, macros and sizeof """
+    if len(tokens) == 0:
+        return False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.value == "sizeof" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            _, i = call_arguments(tokens, i + 1)
+        elif token.kind == lexer.IDENT:
+            if token.value.upper() != token.value:
+                return False
+        elif token.kind not in (lexer.NUMBER, lexer.CHAR) and token.value not in _CONSTANT_PUNCT:
+            return False
+        i += 1
+    return True
+
+
+def unique(items: List) -> Tuple:
+    """ The items without duplicates, in the order they first appear """
+    return tuple(dict.fromkeys(items))
@@ -26,23 +26,22 @@ Author: Luke Goddard
 Date: 2020
 """
 
-import os
 import logging
 
 from typing import Tuple
-from multiprocessing import Pool
 
 from lxml import etree 
-from alive_progress import alive_bar # type: ignore
 
-from skid.utils import utils
+from skid.utils import admission, supervisor, utils
 from skid.interface_recovery import doxygen
 
 logger = logging.getLogger(__name__)
 
 INCLUDE_FILE = "linux/fs.h"
 
-def xml_list_must_include(xml_files: Tuple[str, ...], header: str) -> Tuple[str, ...]:
+def xml_list_must_include(
+    xml_files: Tuple[str, ...], header: str, processes=None
+) -> Tuple[str, ...]:
     """
     Given a list of xml_file locations this function will return a new tuple
     of xml_file locations that all include the header file `header`
@@ -50,9 +49,11 @@ def xml_list_must_include(xml_files: Tuple[str, ...], header: str) -> Tuple[str,
     keep_files = list()
 
     title = utils.format_alive_bar_title(f"Finding source files that include '{header}'")
-    with alive_bar(len(xml_files), title=title) as bar:
-        with Pool(processes=os.cpu_count()) as pool:
-            for res, xml_file in pool.imap_unordered(xml_file_includes, [(xml_file, header) for xml_file in xml_files]):
+    sizes = doxygen.xml_archive.sizes(xml_files)
+    with utils.progress_bar(len(xml_files), title=title) as bar:
+        with supervisor.pool(processes) as pool:
+            items = [(xml_file, header) for xml_file in xml_files]
+            for res, xml_file in admission.imap(pool, xml_file_includes, items, sizes, bar=bar):
                 bar()
                 if res:
                     keep_files.append(xml_file)
@@ -61,6 +62,8 @@ def xml_list_must_include(xml_files: Tuple[str, ...], header: str) -> Tuple[str,
 def xml_file_includes(args: Tuple[str, str]) -> Tuple[bool, str]:
     assert len(args) == 2
     xml_file, header = args
+    if doxygen.ir.is_ir(xml_file):
+        return (doxygen.xml_utils.ir_has_header(xml_file, header), xml_file)
     try:
         root = doxygen.xml_utils.get_root(xml_file)
     except etree.LxmlError as e:
@@ -77,7 +80,7 @@ def xml_file_includes(args: Tuple[str, str]) -> Tuple[bool, str]:
                 continue
 
             if header in doxygen.find_structs.stringify_children(highlight):
-                logger.debug(f"The following file include {header}: {xml_file}")
+                logger.debug("The following file include %s: %s", header, xml_file)
 
             return (True, xml_file)
 
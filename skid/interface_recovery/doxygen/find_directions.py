@@ -0,0 +1,381 @@
+"""
+Infers which way each ioctl command copies it's argument, and how many bytes, from the
+calls the handler makes on the argument pointer:
+
+    case FOO_GET:                                   command  direction  bytes
+        if (copy_to_user(argp, &info, sizeof(info)))    FOO_GET  read       sizeof(struct foo_info)
+            return -EFAULT;
+        return 0;
+    case FOO_SET:                                   FOO_SET  write      sizeof(int)
+        return get_user(val, p);
+
+The directions are named like _IOC_DIR, userspace reads what copy_to_user and put_user
+write and writes what copy_from_user, get_user and memdup_user read. Aliases and casts
+of arg are followed (argp = (void __user *)arg), as are functions defined in the same
+file that are passed the pointer. sizeof(variable) is rewritten to sizeof(it's declared
+type) so the sizes can be evaluated with the constants of the tree.
+
+reconcile() compares the result with the _IOC_DIR and _IOC_SIZE of the request number,
+the union of the directions and the larger of the sizes is what the fuzzer allocates.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+from logging import getLogger
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+from skid.interface_recovery.ioctl import evaluator, request
+from skid.interface_recovery.scan import lexer
+
+logger = getLogger(__name__)
+
+# (direction, index of the user pointer, index of the size or None) of each user access
+USER_ACCESSES = {
+    "copy_from_user": (request.IOC_WRITE, 1, 2),
+    "__copy_from_user": (request.IOC_WRITE, 1, 2),
+    "memdup_user": (request.IOC_WRITE, 0, 1),
+    "vmemdup_user": (request.IOC_WRITE, 0, 1),
+    "memdup_user_nul": (request.IOC_WRITE, 0, 1),
+    "get_user": (request.IOC_WRITE, 1, None),
+    "__get_user": (request.IOC_WRITE, 1, None),
+    "copy_to_user": (request.IOC_READ, 0, 2),
+    "__copy_to_user": (request.IOC_READ, 0, 2),
+    "put_user": (request.IOC_READ, 1, None),
+    "__put_user": (request.IOC_READ, 1, None),
+    "clear_user": (request.IOC_READ, 0, 1),
+}
+
+_QUALIFIERS = frozenset(("const", "volatile", "static", "register", "__user", "__iomem"))
+_NOT_TYPES = frozenset(("return", "case", "goto", "else", "sizeof", "default", "do"))
+_DECLARATION_STARTS = frozenset(("(", ",", ";", "{", "}"))
+
+
+class Site(NamedTuple):
+    """ A copy to or from the argument, size is an expression or None if it's not known """
+
+    direction: int
+    size: Optional[str]
+
+
+class ArgumentAccess(NamedTuple):
+    """
+    How a command accesses it's argument, direction is named like request.DIRECTIONS and
+    copied_in/copied_out are the size of each copy from/to userspace
+    """
+
+    command: str
+    direction: str
+    copied_in: Tuple[str, ...] = ()
+    copied_out: Tuple[str, ...] = ()
+
+
+########## ALL HANDLERS ##########
+
+
+def find_directions(
+    xml_files: Tuple[str, ...], fileop_structs: Tuple[Dict[str, Any], ...], processes=None
+) -> Dict[str, Tuple[ArgumentAccess, ...]]:
+    """ Returns the argument access of every command of every ioctl handler keyed by refid """
+    return doxygen.find_commands.map_handlers(
+        xml_files,
+        fileop_structs,
+        find_directions_in_file,
+        "Inferring argument directions",
+        processes,
+    )
+
+
+def reconcile(
+    command: request.IoctlCommand,
+    access: Optional[ArgumentAccess],
+    consts: evaluator.ConstantEvaluator,
+) -> Tuple[request.IoctlCommand, bool]:
+    """
+    Merges what the handler does with the argument into the command, the direction is
+    the union of both and the size the largest. A handler that copies exactly sizeof a
+    type gives the argument type if the command has none. Also returns if the handler
+    agrees with _IOC_DIR and _IOC_SIZE (sizes that can't be evaluated are ignored)
+    """
+    if access is None:
+        return command, True
+
+    ioc_direction = direction_bits(command.direction)
+    body_direction = direction_bits(access.direction)
+    sizes = dict()
+    for expression in access.copied_in + access.copied_out:
+        try:
+            sizes[expression] = consts.evaluate(expression)
+        except evaluator.UnresolvedConstant:
+            continue
+
+    size = max([command.size] + list(sizes.values()))
+    argument = command.argument
+    if argument == "" and len(sizes) == 1:
+        expression = next(iter(sizes))
+        if expression.startswith("sizeof(") and expression.endswith(")"):
+            argument = expression[len("sizeof(") : -1]
+
+    agrees = ioc_direction == body_direction and all(s == command.size for s in sizes.values())
+    if not agrees:
+        logger.debug(
+            "%s: _IOC says %s %s bytes, the handler %s %s",
+            command.name,
+            command.direction,
+            command.size,
+            access.direction,
+            sorted(set(sizes.values())),
+        )
+    direction = request.DIRECTIONS[ioc_direction | body_direction]
+    return command._replace(direction=direction, size=size, argument=argument), agrees
+
+
+def direction_bits(direction: str) -> int:
+    """ The _IOC_DIR bits of a direction named like request.DIRECTIONS """
+    return next(bits for bits, name in request.DIRECTIONS.items() if name == direction)
+
+
+########## SINGLE XML FILE ##########
+
+
+def find_directions_in_file(args: Tuple[str, List[str]]) -> Dict[str, Tuple[ArgumentAccess, ...]]:
+    """ Returns the argument accesses of each of the handlers (by refid) in the xml file """
+    assert len(args) == 2
+    xml_file, refids = args
+    try:
+        source = doxygen.find_commands.FunctionSource(xml_file)
+    except (etree.LxmlError, doxygen.ir.IRError) as e:
+        logger.error("%s: %s", xml_file, e)
+        return dict()
+
+    found = {refid: extract(source.body(refid), source.body_by_name) for refid in refids}
+    if any(len(accesses) > 0 for accesses in found.values()) and not source.trusted():
+        return dict()
+    return found
+
+
+########## EXTRACTION ##########
+
+
+def extract(
+    body: Sequence[Tuple[int, str]],
+    callee_body: Callable[[str], Sequence[Tuple[int, str]]] = lambda _: (),
+) -> Tuple[ArgumentAccess, ...]:
+    """
+    The argument access of each command of a handler given it's body, callee_body
+    returns the body of a function defined in the same file (empty if it's not). The
+    command is '' if the handler doesn't switch on cmd
+    """
+    if len(body) == 0:
+        return ()
+    tokens = doxygen.find_constraints.tokenize(body)
+    params = doxygen.find_constraints.parameters(tokens)
+    if len(params) < 2:
+        return ()
+    labels = doxygen.find_constraints.command_labels(tokens, params[-2])
+    name = next(tokens[i - 1].value for i, token in enumerate(tokens) if token.value == "(")
+    sites = function_sites(tokens, params[-1], callee_body, 0, {name})
+
+    commands = list(dict.fromkeys(label for token_labels in labels for label in token_labels))
+    by_command: Dict[str, List[Site]] = {command: list() for command in commands or [""]}
+    for i, site in sites:
+        for command in labels[i] or by_command:
+            by_command[command].append(site)
+
+    accesses = list()
+    for command, command_sites in by_command.items():
+        direction = 0
+        for site in command_sites:
+            direction |= site.direction
+        accesses.append(
+            ArgumentAccess(
+                command,
+                request.DIRECTIONS[direction],
+                _sizes(command_sites, request.IOC_WRITE),
+                _sizes(command_sites, request.IOC_READ),
+            )
+        )
+    return tuple(accesses)
+
+
+def _sizes(sites: List[Site], direction: int) -> Tuple[str, ...]:
+    return tuple(
+        dict.fromkeys(s.size for s in sites if s.direction == direction and s.size is not None)
+    )
+
+
+def function_sites(
+    tokens: List[lexer.Token],
+    pointer: str,
+    callee_body: Callable[[str], Sequence[Tuple[int, str]]],
+    depth: int,
+    visited: Set[str],
+) -> List[Tuple[int, Site]]:
+    """
+    The (token index, site) of each access of the argument in a function, pointer is
+    the parameter holding the argument. The sites of a callee are at the index of the
+    call, copies of a single field such as get_user(x, &uarg->len) have no size
+    """
+    pointers = doxygen.find_constraints.argument_pointers(tokens, pointer)
+    types = declared_types(tokens)
+    body_start = next((i for i, token in enumerate(tokens) if token.value == "{"), len(tokens))
+
+    sites: List[Tuple[int, Site]] = list()
+    for i in range(body_start, len(tokens) - 1):
+        name = tokens[i].value
+        if tokens[i].kind != lexer.IDENT or tokens[i + 1].value != "(":
+            continue
+        if i > 0 and tokens[i - 1].value in (".", "->"):
+            continue
+        args, _ = doxygen.find_constraints.call_arguments(tokens, i + 1)
+
+        if name in USER_ACCESSES:
+            direction, index, size_index = USER_ACCESSES[name]
+            if index >= len(args):
+                continue
+            path = doxygen.find_constraints.pointer_path(args[index], pointers)
+            if path is None:
+                continue
+            if path != "":
+                # A copy of a single field, it's size isn't the size of the argument
+                size = None
+            elif size_index is not None:
+                size = size_expression(args[size_index], types) if size_index < len(args) else None
+            else:
+                size = element_size(args[0], args[index], types)
+            sites.append((i, Site(direction, size)))
+        elif depth < doxygen.find_constraints.CALLEE_DEPTH and name not in visited:
+            passed = [
+                k
+                for k, arg in enumerate(args)
+                if doxygen.find_constraints.pointer_path(arg, pointers) == ""
+            ]
+            if len(passed) == 0:
+                continue
+            callee = callee_body(name)
+            if len(callee) == 0:
+                continue
+            callee_tokens = doxygen.find_constraints.tokenize(callee)
+            callee_params = doxygen.find_constraints.parameters(callee_tokens)
+            for k in passed:
+                if k < len(callee_params):
+                    for _, site in function_sites(
+                        callee_tokens, callee_params[k], callee_body, depth + 1, visited | {name}
+                    ):
+                        sites.append((i, site))
+    return sites
+
+
+########## TYPES AND SIZES ##########
+
+
+def declared_types(tokens: List[lexer.Token]) -> Dict[str, str]:
+    """
+    The type of each variable and parameter declared in a function, arrays keep their
+    dimensions e.g {'req': 'struct foo_req', 'p': 'int *', 'buf': 'char [16]'}
+    """
+    types = dict()
+    for i, token in enumerate(tokens[:-1]):
+        if token.kind != lexer.IDENT or tokens[i + 1].value not in (";", "=", ",", "[", ")"):
+            continue
+        start = i - 1
+        while start >= 0 and (tokens[start].kind == lexer.IDENT or tokens[start].value == "*"):
+            start -= 1
+        if start >= 0 and tokens[start].value not in _DECLARATION_STARTS:
+            continue
+        words = [t.value for t in tokens[start + 1 : i] if t.value not in _QUALIFIERS]
+        if all(word == "*" for word in words) or _NOT_TYPES & set(words):
+            continue
+        if words[-1] in ("struct", "union", "enum"):
+            # The tag of a type such as sizeof(struct foo)
+            continue
+
+        type_str = " ".join(words).replace(" *", "*").replace("*", " *")
+        if tokens[i + 1].value == "[":
+            dims = ""
+            j = i + 1
+            while j < len(tokens) and tokens[j].value == "[":
+                close = lexer.find_matching(tokens, j)
+                dims += "[" + " ".join(t.value for t in tokens[j + 1 : close]) + "]"
+                j = close + 1
+            type_str = f"{type_str} {dims}"
+        types.setdefault(token.value, type_str.strip())
+    return types
+
+
+def size_expression(tokens: List[lexer.Token], types: Dict[str, str]) -> str:
+    """
+    The size argument with sizeof(variable) and sizeof(*pointer) given as types, the
+    operand of a sizeof without brackets (sizeof info) is treated the same
+    """
+    parts = list()
+    i = 0
+    while i < len(tokens):
+        if tokens[i].value == "sizeof" and i + 1 < len(tokens):
+            if tokens[i + 1].value == "(":
+                end = lexer.find_matching(tokens, i + 1)
+                inner = tokens[i + 2 : end]
+            else:
+                end = unary_operand_end(tokens, i + 1)
+                inner = tokens[i + 1 : end + 1]
+            type_str = expression_type(inner, types)
+            if type_str is None:
+                type_str = " ".join(t.value for t in inner)
+            parts.append(f"sizeof({type_str})")
+            i = end + 1
+            continue
+        parts.append(tokens[i].value)
+        i += 1
+    return " ".join(parts)
+
+
+def unary_operand_end(tokens: List[lexer.Token], start: int) -> int:
+    """ The index of the last token of a unary expression such as *info, info.len or buf[0] """
+    i = start
+    while i < len(tokens) - 1 and tokens[i].value in ("*", "&"):
+        i += 1
+    while i + 2 < len(tokens) and tokens[i + 1].value in (".", "->", "["):
+        if tokens[i + 1].value == "[":
+            i = lexer.find_matching(tokens, i + 1)
+        else:
+            i += 2
+    return i
+
+
+def element_size(
+    value: List[lexer.Token], pointer: List[lexer.Token], types: Dict[str, str]
+) -> Optional[str]:
+    """ The size get_user and put_user copy, the size of *pointer or else of the value """
+    pointee = pointer_type(pointer, types)
+    if pointee is None or pointee == "void":
+        pointee = expression_type(value, types)
+    return None if pointee is None else f"sizeof({pointee})"
+
+
+def pointer_type(tokens: List[lexer.Token], types: Dict[str, str]) -> Optional[str]:
+    """ The type pointed to by a pointer variable or a cast such as (int __user *)arg """
+    if len(tokens) > 0 and tokens[0].value == "(":
+        close = lexer.find_matching(tokens, 0)
+        words = [t.value for t in tokens[1:close] if t.value not in _QUALIFIERS]
+        if len(words) > 1 and words[-1] == "*":
+            return " ".join(words[:-1]).replace(" *", "*").replace("*", " *")
+        return None
+    type_str = expression_type(tokens, types)
+    if type_str is None or not type_str.endswith("*"):
+        return None
+    return type_str[:-1].strip()
+
+
+def expression_type(tokens: List[lexer.Token], types: Dict[str, str]) -> Optional[str]:
+    """ The type of a variable, *pointer or &variable, None for anything else """
+    values = [t.value for t in tokens]
+    if len(values) == 1 and values[0] in types:
+        return types[values[0]]
+    if len(values) == 2 and values[0] == "*" and values[1] in types:
+        return pointer_type(tokens[1:], types)
+    if len(values) == 2 and values[0] == "&" and values[1] in types:
+        return f"{types[values[1]]} *"
+    return None
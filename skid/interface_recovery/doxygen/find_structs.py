@@ -28,16 +28,15 @@ Date: 2020
 """
 
 import json
+import logging
 import os
 from logging import getLogger
-from multiprocessing import Pool
-from typing import Dict, List, Tuple, Any
+from typing import Any, Dict, Iterator, List, Tuple
 
-from alive_progress import alive_bar  # type: ignore
 from lxml import etree
 
 from skid.interface_recovery import doxygen
-from skid.utils import utils
+from skid.utils import admission, supervisor, utils
 
 logger = getLogger(__name__)
 
@@ -47,7 +46,7 @@ POSSIBLE_IOCTL_NAMES = {".unlocked_ioctl", ".compat_ioctl"}
 ########## LIST OF XML ##########
 
 
-def find_fileop_structs(xml_files: Tuple[str, ...]) -> Tuple[Dict[str, str], ...]:
+def find_fileop_structs(xml_files: Tuple[str, ...], processes=None) -> Tuple[Dict[str, str], ...]:
     """
     Itterates through all xml files and returns all file_operations
     structs that contain ioctl
@@ -59,43 +58,101 @@ def find_fileop_structs(xml_files: Tuple[str, ...]) -> Tuple[Dict[str, str], ...
     bar_tit = utils.format_alive_bar_title("Finding file_operations structs")
 
     # Multiprocessed loading bar
-    with Pool(processes=os.cpu_count()) as pool:
-        with alive_bar(len(xml_files), title=bar_tit) as bar:
+    with utils.progress_bar(len(xml_files), title=bar_tit) as bar:
+        for structs in iter_fileop_structs_by_file(xml_files, processes, bar=bar):
+            bar()
+            struct_elements += structs
 
-            for structs in pool.imap_unordered(
-                find_fileop_structs_in_file, xml_files
-            ):  # type: List[Dict[str, str]]
-                bar()
-                struct_elements += structs
-
-        logger.debug(
-            f"Found {len(struct_elements)} ioctl file_operations handler function pointers"
-        )
+    logger.debug(
+        "Found %s ioctl file_operations handler function pointers", len(struct_elements)
+    )
 
     log_results(struct_elements)
     return tuple(struct_elements)  # type: ignore
 
 
+def iter_fileop_structs(xml_files: Tuple[str, ...], processes=None) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily yields the file_operations structs that contain ioctl as soon as the
+    worker parsing them has finished. Closing the iterator early terminates the
+    workers so none of the remaining files are parsed
+    """
+    for structs in iter_fileop_structs_by_file(xml_files, processes):
+        yield from structs
+
+
+def iter_fileop_structs_by_file(
+    xml_files: Tuple[str, ...], processes=None, bar=None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields the structs found in each xml file in the order the workers finish them,
+    files are only parsed while there is memory for them (see utils.admission) and a
+    file that hangs or crashes it's worker is quarantined (see utils.supervisor)
+    """
+    assert len(xml_files) > 0
+    assert isinstance(xml_files[0], str)
+
+    sizes = doxygen.xml_archive.sizes(xml_files)
+    # Leaving the with block (including through GeneratorExit) terminates the pool
+    with supervisor.pool(processes) as pool:
+        yield from admission.imap(pool, find_fileop_structs_in_file, xml_files, sizes, bar=bar)
+
+
 ########## SINGLE XML FILE ##########
 
 
 def find_fileop_structs_in_file(xml_file: str) -> List[Dict[str, str]]:
     """ Loop's through all member definitions in the XML looking for relevant structs """
+    if doxygen.ir.is_ir(xml_file):
+        return find_fileop_structs_in_ir(xml_file)
     try:
-        logger.debug(f"Finding structs in {xml_file}")
+        logger.debug("Finding structs in %s", xml_file)
         root = doxygen.xml_utils.get_root(xml_file)
     except etree.LxmlError as e:
         logger.error(e)
         return list()
+    structs = find_fileop_structs_in_root(root)
+    if len(structs) > 0 and not doxygen.validation.trusted(xml_file, root):
+        return list()
+    return structs
 
+
+def find_fileop_structs_in_root(root: etree.ElementTree) -> List[Dict[str, str]]:  # type: ignore
+    """ Finds the relevant structs in an already parsed XML file, see xpath.FILEOPS_MEMBERDEFS """
     return [
         subelement
-        for element in root.iter("memberdef")
-        if is_memberdef_a_file_ops_struct(element)
+        for element in doxygen.xpath.FILEOPS_MEMBERDEFS(root)
         for subelement in parse_ioctl_file_operations(element)
     ]
 
 
+def find_fileop_structs_in_ir(ir_file: str) -> List[Dict[str, str]]:
+    """ Like find_fileop_structs_in_file for a compound transcoded by doxygen.ir """
+    try:
+        compound = doxygen.ir.load(ir_file)
+    except doxygen.ir.IRError as e:
+        logger.error("%s: %s", ir_file, e)
+        return list()
+
+    structs = list()
+    for member in compound.members(("variable",)):
+        # The same test as xpath.FILEOPS_MEMBERDEFS
+        if member.initializer == doxygen.ir.NONE:
+            continue
+        if "file_operations" not in compound.lead(member, doxygen.ir.FIELD_TYPE):
+            continue
+        structs += parse_ioctl_lines(
+            compound.markup(member, doxygen.ir.FIELD_INITIALIZER),
+            compound.string(member.name),
+            compound.string(member.file),
+            member.line,
+        )
+    if len(structs) > 0 and not compound.trusted:
+        logger.warning("Skipping %s, it failed validation when it was transcoded", ir_file)
+        return list()
+    return structs
+
+
 ########## SINGLE XML ELEMENT ##########
 
 
@@ -133,8 +190,20 @@ def parse_ioctl_file_operations(struct_xml: etree.Element):  # type: ignore
         List of dictionaries parsed by the convert_line_to_dict
         function
     """
+    text = parse_member_definitions(struct_xml)
+    if not any(name in text for name in POSSIBLE_IOCTL_NAMES):
+        return list()
+    file_path, line_number = get_memberdef_location(struct_xml)
+    struct_name = struct_xml.find("name").text  # type: ignore
+    return parse_ioctl_lines(text, struct_name, file_path, line_number)
+
+
+def parse_ioctl_lines(
+    text: str, struct_name: str, file_path: str, line_number: int
+) -> List[Dict[str, Any]]:
+    """ The parsed ioctl lines of a structs initializer, see parse_ioctl_file_operations """
     ioctl_ops = list()
-    for line in parse_member_definitions(struct_xml).splitlines():
+    for line in text.splitlines():
 
         # check to see if struct contains ioctl
         struct_words = set(line.split())
@@ -142,10 +211,7 @@ def parse_ioctl_file_operations(struct_xml: etree.Element):  # type: ignore
             continue
 
         # log findings
-        file_path, line_number = get_memberdef_location(struct_xml)
-        logger.debug(f"Found fops struct: {file_path}:{line_number}")
-
-        struct_name = struct_xml.find("name").text  # type: ignore
+        logger.debug("Found fops struct: %s:%s", file_path, line_number)
         ioctl_ops.append(convert_line_to_dict(line, struct_name, file_path, line_number))
 
     return ioctl_ops
@@ -277,4 +343,6 @@ def log_results(struct_elements: List[Dict]):
     if len(struct_elements) == 0:
         logger.critical("No file_operations structs could be found in the source code")
         return
-    logger.debug(json.dumps(struct_elements, indent=4))
+    # Dumping every struct is expensive, only do it if the output is going to be kept
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s", json.dumps(struct_elements, indent=4))
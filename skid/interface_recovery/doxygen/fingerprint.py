@@ -0,0 +1,145 @@
+"""
+Fingerprints the doxygen configuration and the source tree so prior doxygen results can
+be reused without asking the user, doxygen only needs to be re-run when either differ.
+
+The source fingerprint is built from the mtime, size and content hash of every source
+file. The per file entries are stored next to the doxygen output, a file whose mtime and
+size have not changed is not hashed again so checking an unchanged tree is cheap.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import hashlib
+import json
+import os
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from skid.interface_recovery import doxygen
+from skid.utils import logs, tuning
+
+logger = getLogger(__name__)
+
+FINGERPRINT_FILENAME = ".skid-fingerprint.json"
+SOURCE_EXTENSIONS = (".c", ".h")
+HASH_CHUNKSIZE = 64
+READ_BLOCKSIZE = 1 << 20
+
+# {relative path: (mtime_ns, size, content hash)}
+FileEntry = Tuple[int, int, str]
+FileEntries = Dict[str, FileEntry]
+
+
+def config_fingerprint(config: Dict) -> str:
+    """ Hashes the merged doxygen configuration produced by config.get """
+    assert isinstance(config, dict)
+    serialised = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+
+def list_source_files(source_dir: str) -> List[str]:
+    """ Returns the sorted paths (relative to source_dir) of every file doxygen indexes """
+    assert os.path.isdir(source_dir)
+    files = []
+    for dirpath, _, filenames in os.walk(source_dir):
+        for filename in filenames:
+            if filename.endswith(SOURCE_EXTENSIONS):
+                files.append(os.path.relpath(os.path.join(dirpath, filename), source_dir))
+    return sorted(files)
+
+
+def hash_file(path: str) -> str:
+    """ Returns the blake2b hash of the file's content """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as src_f:
+        for block in iter(lambda: src_f.read(READ_BLOCKSIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stat_and_hash(args: Tuple[str, str, Optional[FileEntry]]) -> Tuple[str, FileEntry]:
+    """
+    Worker function, returns the file entry for a single source file. The previous
+    entry's hash is reused if the mtime and size match
+
+    Param:
+        args[0]: source directory
+        args[1]: file path relative to the source directory
+        args[2]: previous entry for this file or None
+    """
+    assert len(args) == 3
+    source_dir, rel_path, previous = args
+    path = os.path.join(source_dir, rel_path)
+    stat = os.stat(path)
+    if previous is not None and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+        return rel_path, previous
+    return rel_path, (stat.st_mtime_ns, stat.st_size, hash_file(path))
+
+
+def source_entries(
+    source_dir: str, previous: Optional[FileEntries] = None, processes=None
+) -> FileEntries:
+    """ Stats and hashes every source file in parallel """
+    previous = previous or dict()
+    work = [(source_dir, f, previous.get(f)) for f in list_source_files(source_dir)]
+    if len(work) == 0:
+        return dict()
+
+    chunksize = tuning.get_chunksize("fingerprint", HASH_CHUNKSIZE)
+    with logs.pool(processes) as pool:
+        return dict(pool.imap_unordered(stat_and_hash, work, chunksize=chunksize))
+
+
+def source_fingerprint(entries: FileEntries) -> str:
+    """ Combines the file entries into a single hash, only paths and content are used """
+    digest = hashlib.sha256()
+    for rel_path in sorted(entries):
+        digest.update(f"{rel_path}\0{entries[rel_path][2]}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compute(source_dir: str, config: Dict, output_dir=None, processes=None) -> Dict:
+    """
+    Computes the fingerprint of the doxygen config and source tree, the file entries
+    stored in output_dir (defaults to the doxygen output) from the previous run are
+    used to skip re-hashing
+    """
+    previous = load(output_dir)
+    entries = source_entries(
+        source_dir, previous["files"] if previous is not None else None, processes
+    )
+    return {
+        "config": config_fingerprint(config),
+        "source": source_fingerprint(entries),
+        "files": entries,
+    }
+
+
+def matches(fingerprint: Dict, output_dir=None) -> bool:
+    """ Returns True if the fingerprint matches the one stored with the doxygen output """
+    stored = load(output_dir)
+    if stored is None:
+        return False
+    return all(stored.get(key) == fingerprint[key] for key in ("config", "source"))
+
+
+def load(output_dir=None) -> Optional[Dict]:
+    """ Loads the fingerprint stored next to the doxygen output, None if there isn't one """
+    location = os.path.join(output_dir or doxygen.config.OUTPUT_DIRECTORY, FINGERPRINT_FILENAME)
+    try:
+        with open(location, "r") as fingerprint_f:
+            fingerprint = json.load(fingerprint_f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    fingerprint["files"] = {k: tuple(v) for k, v in fingerprint.get("files", dict()).items()}
+    return fingerprint
+
+
+def save(fingerprint: Dict, output_dir=None) -> None:
+    """ Stores the fingerprint next to the doxygen output """
+    location = os.path.join(output_dir or doxygen.config.OUTPUT_DIRECTORY, FINGERPRINT_FILENAME)
+    logger.debug("Writing doxygen fingerprint to: %s", location)
+    with open(location, "w") as fingerprint_f:
+        json.dump(fingerprint, fingerprint_f)
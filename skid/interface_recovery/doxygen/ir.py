@@ -0,0 +1,515 @@
+"""
+A compact binary intermediate representation (IR) of doxygen's XML
+
+The extractors only ever read a small part of a compound: the kind, type, name,
+initializer and location of it's memberdefs, the defines and enums, the struct members,
+the source lines and the includes. The XML around them (descriptions, whitespace,
+highlight markup, attributes repeated on every element) is most of it's size and
+parsing it is most of the time spent in the extractors. transcode() parses every
+compound once and keeps only that part, the next runs read the IR straight out of an
+mmap without parsing anything.
+
+The transcoded compounds are members of an xml_archive (with FLAG_IR set) named after the
+XML they came from, so the member paths can be used anywhere an XML location can:
+
+    /tmp/skid-doxygen/xml.skidir::example__driver_8c.xml
+
+Each compound is a header, a string table and tables of fixed width little endian records
+that refer to the strings by their index:
+
+    +--------+---------------+---------+-----------+---------+------+-------+----------+
+    | header | string offset | strings | compounds | members | refs | ...   | includes |
+    +--------+---------------+---------+-----------+---------+------+-------+----------+
+
+The header holds the magic, the version, the flags and the number of records in each
+table. Every string is stored once, a missing element is the string NONE. A file
+transcoded with the validation mode it was checked with is reused by the next transcode()
+while it's stamp (size and mtime, or the hash of an archive member) is unchanged.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import os
+import struct
+from logging import getLogger
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+from skid.utils import admission, supervisor
+
+logger = getLogger(__name__)
+
+IR_MAGIC = b"SKIR"
+IR_VERSION = 1
+STAMPS_NAME = "stamps.json"
+NONE = 0xFFFFFFFF
+FLAG_TRUSTED = 0x1
+
+FIELD_TYPE = 0
+FIELD_INITIALIZER = 1
+
+# magic, version, flags and the number of strings, compounds, members, refs, enumvalues,
+# params, codelines and includes
+HEADER = struct.Struct("<4sHH8I")
+# kind, compoundname
+COMPOUND = struct.Struct("<2I")
+# See Member
+MEMBER = struct.Struct("<9I3i4I")
+# member, field, start, end, refid. Where a <ref> is in the text of the members type or
+# initializer
+REF = struct.Struct("<5I")
+# name, initializer
+ENUMVALUE = struct.Struct("<2I")
+# defname
+PARAM = struct.Struct("<I")
+# lineno (-1 if missing), text, 1 if in the programlisting of the compound (xpath.CODELINES)
+CODELINE = struct.Struct("<iII")
+# text, 1 if it's an #include directive (xpath.INCLUDE_DIRECTIVES)
+INCLUDE = struct.Struct("<2I")
+
+
+class IRError(Exception):
+    """ The IR is corrupt or was written by another version """
+
+
+class Member(NamedTuple):
+    """
+    A memberdef, the strings are indexes for Compound.string and the numbers are -1
+    when they are missing
+
+    Attributes:
+        index: The position of the memberdef in the compound
+        compound: Index of the compounddef the memberdef is in
+        params: Number of defnames, NONE if the define has no <param>
+    """
+
+    index: int
+    compound: int
+    kind: int
+    id: int
+    name: int
+    type: int
+    initializer: int
+    argsstring: int
+    bitfield: int
+    file: int
+    line: int
+    bodystart: int
+    bodyend: int
+    first_param: int
+    params: int
+    first_enumvalue: int
+    enumvalues: int
+
+
+########## READING ##########
+
+
+def is_ir(location: str) -> bool:
+    """ True if the location is a compound inside of an IR archive """
+    if not doxygen.xml_archive.is_member_path(location):
+        return False
+    archive_loc, _ = doxygen.xml_archive.split_member_path(location)
+    try:
+        return bool(doxygen.xml_archive.get_flags(archive_loc) & doxygen.xml_archive.FLAG_IR)
+    except (OSError, doxygen.xml_archive.ArchiveError):
+        return False
+
+
+def load(location: str) -> "Compound":
+    """
+    The transcoded compound at an IR member path, it's read from the archive's mmap
+    Raises: IRError: If the compound is corrupt
+    """
+    return Compound(doxygen.xml_archive.view(location))
+
+
+class Compound:
+    """ Reads the tables of a transcoded compound, strings are only decoded when asked for """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        try:
+            magic, version, self.flags, *counts = HEADER.unpack_from(self.data)
+            if magic != IR_MAGIC or version != IR_VERSION:
+                raise IRError(f"Not IR or an unsupported version ({magic}, {version})")
+            strings = counts[0]
+            offset = HEADER.size
+            self._offsets = struct.unpack_from(f"<{strings + 1}I", self.data, offset)
+        except struct.error as e:
+            raise IRError("The IR is truncated") from e
+
+        offset += 4 * (strings + 1)
+        self._strings_at = offset
+        offset += _align(self._offsets[-1])
+        self._tables: Dict[struct.Struct, Tuple[int, int]] = dict()
+        for record, count in zip(
+            (COMPOUND, MEMBER, REF, ENUMVALUE, PARAM, CODELINE, INCLUDE), counts[1:]
+        ):
+            self._tables[record] = (offset, offset + record.size * count)
+            offset += record.size * count
+        if offset > len(self.data):
+            raise IRError("The IR is truncated")
+
+        self._strings: Dict[int, Optional[str]] = {NONE: None}
+        self._refs: Optional[Dict[Tuple[int, int], List[Tuple[int, int, str]]]] = None
+
+    @property
+    def trusted(self) -> bool:
+        """ What the extractors find can be used, see validation.trusted """
+        return bool(self.flags & FLAG_TRUSTED)
+
+    def string(self, index: int) -> Optional[str]:
+        """ The string at index, None for NONE """
+        if index not in self._strings:
+            start = self._strings_at + self._offsets[index]
+            end = self._strings_at + self._offsets[index + 1]
+            self._strings[index] = str(self.data[start:end], "utf-8")
+        return self._strings[index]
+
+    def text(self, index: int) -> str:
+        """ The string at index with whitespace collapsed, like find_constants.element_text """
+        return " ".join((self.string(index) or "").split())
+
+    def _records(self, record: struct.Struct) -> Iterator[Tuple]:
+        start, end = self._tables[record]
+        return record.iter_unpack(self.data[start:end])
+
+    def compounds(self) -> List[Tuple[str, str]]:
+        """ The (kind, compoundname) of each compounddef """
+        return [(self.string(kind), self.text(name)) for kind, name in self._records(COMPOUND)]
+
+    def members(self, kinds: Optional[Sequence[str]] = None) -> Iterator[Member]:
+        """ The memberdefs in document order, only those of kinds if it's given """
+        for index, record in enumerate(self._records(MEMBER)):
+            if kinds is None or self.string(record[1]) in kinds:
+                yield Member(index, *record)
+
+    def member_by_id(self, refid: str) -> Optional[Member]:
+        for member in self.members():
+            if self.string(member.id) == refid:
+                return member
+        return None
+
+    def refs(self, member: Member, field: int) -> List[Tuple[int, int, str]]:
+        """ The (start, end, refid) of each <ref> in the type or initializer of member """
+        if self._refs is None:
+            self._refs = dict()
+            for index, ref_field, start, end, refid in self._records(REF):
+                self._refs.setdefault((index, ref_field), list()).append(
+                    (start, end, self.string(refid))
+                )
+        return self._refs.get((member.index, field), list())
+
+    def lead(self, member: Member, field: int) -> str:
+        """ The text of a type or initializer before it's first <ref> """
+        text = self.string(member.type if field == FIELD_TYPE else member.initializer) or ""
+        refs = self.refs(member, field)
+        return text[: refs[0][0]] if len(refs) > 0 else text
+
+    def markup(self, member: Member, field: int) -> str:
+        """
+        The type or initializer with it's refs as they are in the XML, like
+        find_structs.stringify_children without the attributes other than the refid
+        """
+        text = self.string(member.type if field == FIELD_TYPE else member.initializer) or ""
+        parts = list()
+        last = 0
+        for start, end, refid in self.refs(member, field):
+            parts += [text[last:start], f'<ref refid="{refid}">', text[start:end], "</ref>"]
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def enumvalues(self, member: Member) -> List[Tuple[str, Optional[str]]]:
+        """ The (name, initializer) of each enumerator, the initializer is None if missing """
+        start, _ = self._tables[ENUMVALUE]
+        start += ENUMVALUE.size * member.first_enumvalue
+        end = start + ENUMVALUE.size * member.enumvalues
+        return [
+            (self.text(name), None if initializer == NONE else self.text(initializer))
+            for name, initializer in ENUMVALUE.iter_unpack(self.data[start:end])
+        ]
+
+    def params(self, member: Member) -> Optional[Tuple[str, ...]]:
+        """ The defnames of a function like define, None for object like ones """
+        if member.params == NONE:
+            return None
+        start, _ = self._tables[PARAM]
+        start += PARAM.size * member.first_param
+        end = start + PARAM.size * member.params
+        return tuple(self.text(name) for (name,) in PARAM.iter_unpack(self.data[start:end]))
+
+    def codelines(self, listing_only=False) -> Iterator[Tuple[int, str]]:
+        """ The (lineno, text) of each codeline, listing_only skips code in descriptions """
+        for lineno, text, listing in self._records(CODELINE):
+            if listing or not listing_only:
+                yield lineno, self.string(text)
+
+    def codelines_between(self, start: int, end: int) -> List[Tuple[int, str]]:
+        """ Like xpath.CODELINES_BETWEEN """
+        return [
+            (lineno, self.string(text))
+            for lineno, text, listing in self._records(CODELINE)
+            if listing and start <= lineno <= end
+        ]
+
+    def includes(self) -> List[Tuple[str, bool]]:
+        """ The (text, is a directive) of each preprocessor highlight that mentions include """
+        return [(self.string(text), bool(directive)) for text, directive in self._records(INCLUDE)]
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+########## WRITING ##########
+
+
+class _Builder:
+    """ Collects the records of a compound while it's transcoded """
+
+    def __init__(self):
+        self.strings: Dict[str, int] = dict()
+        self.compounds: List[Tuple] = list()
+        self.members: List[Tuple] = list()
+        self.refs: List[Tuple] = list()
+        self.enumvalues: List[Tuple] = list()
+        self.params: List[Tuple] = list()
+        self.codelines: List[Tuple] = list()
+        self.includes: List[Tuple] = list()
+
+    def string(self, text: Optional[str]) -> int:
+        if text is None:
+            return NONE
+        return self.strings.setdefault(text, len(self.strings))
+
+    def text_with_refs(self, member: int, field: int, node) -> int:
+        """ Adds the text of an element and where the <ref>'s are in it """
+        if node is None:
+            return NONE
+        text = node.text or ""
+        for child in node:
+            child_text = "".join(child.itertext())
+            if child.tag == "ref":
+                refid = self.string(child.attrib.get("refid", ""))
+                self.refs.append((member, field, len(text), len(text) + len(child_text), refid))
+            text += child_text + (child.tail or "")
+        return self.string(text)
+
+    def pack(self, flags: int) -> bytes:
+        encoded = [text.encode("utf-8") for text in self.strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        strings = b"".join(encoded)
+        parts = [
+            HEADER.pack(
+                IR_MAGIC,
+                IR_VERSION,
+                flags,
+                len(encoded),
+                len(self.compounds),
+                len(self.members),
+                len(self.refs),
+                len(self.enumvalues),
+                len(self.params),
+                len(self.codelines),
+                len(self.includes),
+            ),
+            struct.pack(f"<{len(offsets)}I", *offsets),
+            strings,
+            bytes(_align(len(strings)) - len(strings)),
+        ]
+        for record, records in (
+            (COMPOUND, self.compounds),
+            (MEMBER, self.members),
+            (REF, self.refs),
+            (ENUMVALUE, self.enumvalues),
+            (PARAM, self.params),
+            (CODELINE, self.codelines),
+            (INCLUDE, self.includes),
+        ):
+            parts += [record.pack(*values) for values in records]
+        return b"".join(parts)
+
+
+def transcode_root(root, trusted=True) -> bytes:
+    """
+    Transcodes a parsed compound
+    Raises: ValueError: If a line number isn't a number
+    """
+    text = doxygen.find_constants.element_text
+    builder = _Builder()
+    for compound_index, compound in enumerate(doxygen.xpath.COMPOUNDDEFS(root)):
+        kind = builder.string(compound.attrib.get("kind"))
+        builder.compounds.append((kind, builder.string(text(compound.find("compoundname")))))
+        for element in doxygen.xpath.COMPOUND_MEMBERDEFS(compound):
+            builder.members.append(_member(builder, compound_index, element))
+
+    document = root.getroot()
+    for codeline in root.iter("codeline"):
+        parent = codeline.getparent()
+        listing = (
+            parent.tag == "programlisting"
+            and parent.getparent().tag == "compounddef"
+            and parent.getparent().getparent() is document
+        )
+        builder.codelines.append(
+            (
+                int(codeline.attrib.get("lineno", "-1")),
+                builder.string(doxygen.find_constants.codeline_text(codeline)),
+                int(listing),
+            )
+        )
+
+    for highlight in doxygen.xpath.INCLUDE_HIGHLIGHTS(root):
+        lead = highlight.text or ""
+        directive = "include" in lead and "#" in lead
+        builder.includes.append((builder.string("".join(highlight.itertext())), int(directive)))
+
+    return builder.pack(FLAG_TRUSTED if trusted else 0)
+
+
+def _member(builder: _Builder, compound: int, element) -> Tuple:
+    text = doxygen.find_constants.element_text
+    index = len(builder.members)
+    kind = element.attrib.get("kind")
+
+    bitfield = element.find("bitfield")
+    location = element.find("location")
+    attrib = location.attrib if location is not None else dict()
+
+    first_param, params = len(builder.params), NONE
+    if kind == "define" and element.find("param") is not None:
+        names = [builder.string(text(defname)) for defname in element.iter("defname")]
+        builder.params += [(name,) for name in names]
+        params = len(names)
+
+    first_enumvalue, enumvalues = len(builder.enumvalues), 0
+    if kind == "enum":
+        for enumvalue in element.iter("enumvalue"):
+            initializer = enumvalue.find("initializer")
+            builder.enumvalues.append(
+                (
+                    builder.string(text(enumvalue.find("name"))),
+                    builder.string(text(initializer)) if initializer is not None else NONE,
+                )
+            )
+            enumvalues += 1
+
+    return (
+        compound,
+        builder.string(kind),
+        builder.string(element.attrib.get("id")),
+        builder.string(text(element.find("name"))),
+        builder.text_with_refs(index, FIELD_TYPE, element.find("type")),
+        builder.text_with_refs(index, FIELD_INITIALIZER, element.find("initializer")),
+        builder.string(text(element.find("argsstring"))),
+        builder.string(text(bitfield)) if bitfield is not None else NONE,
+        builder.string(attrib.get("file")),
+        int(attrib.get("line", "-1")),
+        int(attrib.get("bodystart", "-1")),
+        int(attrib.get("bodyend", "-1")),
+        first_param,
+        params,
+        first_enumvalue,
+        enumvalues,
+    )
+
+
+def transcode_file(xml_file: str) -> Tuple[str, Optional[bytes]]:
+    """ The IR of an XML file, None if it couldn't be parsed """
+    try:
+        root = doxygen.xml_utils.get_root(xml_file)
+        return xml_file, transcode_root(root, doxygen.validation.trusted(xml_file, root))
+    except (etree.LxmlError, ValueError) as e:
+        logger.error("Failed to transcode %s: %s", xml_file, e)
+        return xml_file, None
+
+
+def member_name(xml_file: str) -> str:
+    """ The name of the IR of an XML file (or archive member) e.g example__driver_8c.xml """
+    return os.path.basename(xml_file.split(doxygen.xml_archive.MEMBER_SEPARATOR)[-1])
+
+
+def stamp(xml_file: str) -> str:
+    """ Changes when the XML does, archive members are hashed since the archive is repacked """
+    if doxygen.xml_archive.is_member_path(xml_file):
+        data = doxygen.xml_archive.view(xml_file)
+        return f"{len(data)}:{doxygen.validation.content_hash(data)}"
+    stat = os.stat(xml_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_stamps(ir_loc: str) -> Dict[str, str]:
+    """ The stamps of the compounds in an IR archive that can be reused, empty if none can """
+    location = doxygen.xml_archive.member_path(ir_loc, STAMPS_NAME)
+    if not is_ir(location) or not doxygen.xml_archive.exists(location):
+        return dict()
+    try:
+        stamps = json.loads(doxygen.xml_archive.read(location))
+    except ValueError:
+        return dict()
+    if stamps.get("version") != IR_VERSION:
+        return dict()
+    if stamps.get("validation") != doxygen.validation.get_mode():
+        return dict()
+    return stamps.get("stamps", dict())
+
+
+def transcode(
+    xml_files: Tuple[str, ...], ir_loc: str, processes=None, bar=None
+) -> Tuple[str, ...]:
+    """
+    Transcodes the XML files into an IR archive at ir_loc, compounds that are unchanged
+    since the last transcode are copied from the old archive rather than parsed again
+
+    Returns: The IR member paths, files that couldn't be parsed are left out
+    """
+    previous = load_stamps(ir_loc)
+    stamps = {member_name(xml_file): stamp(xml_file) for xml_file in xml_files}
+    todo = [
+        xml_file
+        for xml_file in xml_files
+        if previous.get(member_name(xml_file)) != stamps[member_name(xml_file)]
+    ]
+    reused = set(stamps) - {member_name(xml_file) for xml_file in todo}
+    if bar is not None:
+        for _ in reused:
+            bar()
+
+    blobs: Dict[str, bytes] = dict()
+    if len(todo) > 0:
+        sizes = doxygen.xml_archive.sizes(todo)
+        with supervisor.pool(processes) as pool:
+            for xml_file, blob in admission.imap(pool, transcode_file, todo, sizes, bar=bar):
+                if bar is not None:
+                    bar()
+                if blob is not None:
+                    blobs[member_name(xml_file)] = blob
+    logger.info("Transcoded %s XML files, reused %s", len(blobs), len(reused))
+
+    names = sorted(reused | set(blobs))
+    # The old archive stays mapped while the new one replaces it
+    old = {
+        name: doxygen.xml_archive.view(doxygen.xml_archive.member_path(ir_loc, name))
+        for name in reused
+    }
+    kept = {
+        "version": IR_VERSION,
+        "validation": doxygen.validation.get_mode(),
+        "stamps": {name: stamps[name] for name in names},
+    }
+
+    def members() -> Iterator[Tuple[str, bytes]]:
+        for name in names:
+            yield name, blobs[name] if name in blobs else bytes(old[name])
+        yield STAMPS_NAME, json.dumps(kept).encode("utf-8")
+
+    doxygen.xml_archive.write(ir_loc, members(), doxygen.xml_archive.FLAG_IR)
+    return tuple(doxygen.xml_archive.member_path(ir_loc, name) for name in names)
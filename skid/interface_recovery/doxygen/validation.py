@@ -0,0 +1,134 @@
+"""
+Checks the XML a worker has already parsed before an extractor trusts what it found
+
+Validating every compound against doxygen's schema up front (MODE_FULL, see
+doxygen.filter_xml_files_bad_schema) parses every file twice, even though most of
+them contain nothing the extractors use. The other modes check a file in the worker
+that parsed it, and only once an extractor has found something in it:
+
+    MODE_LAZY:          The tree is validated against the schema, the verdict is cached
+                        by the content hash of the file so the next run (after doxygen
+                        regenerated the XML) only validates the compounds that changed
+    MODE_STRUCTURAL:    Only the elements and attributes the extractors read are checked
+                        (see xpath.MALFORMED), no schema is needed
+
+The cache is a text file of "<schema hash>:<content hash> <0|1>" lines. Workers load it
+when the pool forks them and append the verdicts they reach, a single short write to a
+file opened for appending is not interleaved with the writes of other workers.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import hashlib
+from logging import getLogger
+from typing import Dict, Optional
+
+from lxml import etree  # type: ignore
+
+from skid.interface_recovery import doxygen
+
+logger = getLogger(__name__)
+
+MODE_FULL = "full"
+MODE_LAZY = "lazy"
+MODE_STRUCTURAL = "structural"
+MODES = (MODE_FULL, MODE_LAZY, MODE_STRUCTURAL)
+
+_mode: Optional[str] = None
+_schema_location: Optional[str] = None
+_schema: Optional[etree.XMLSchema] = None
+_schema_digest = ""
+_cache_location: Optional[str] = None
+_verdicts: Dict[str, bool] = dict()
+
+
+def configure(
+    mode: Optional[str],
+    schema_location: Optional[str] = None,
+    cache_location: Optional[str] = None,
+) -> None:
+    """
+    Sets how trusted() checks files, None (or MODE_FULL, where the files were already
+    validated) trusts every file. MODE_LAZY needs the schema_location and caches the
+    verdicts in cache_location when it's given
+    """
+    # pylint: disable=global-statement
+    global _mode, _schema_location, _schema, _schema_digest, _cache_location
+    assert mode is None or mode in MODES
+    assert mode != MODE_LAZY or schema_location is not None
+    _mode, _schema_location, _schema = mode, schema_location, None
+    _cache_location = cache_location
+    _verdicts.clear()
+    _schema_digest = ""
+
+    if mode != MODE_LAZY:
+        return
+    # Loaded here so a broken schema is reported before any work, forked workers share it
+    _schema = doxygen.xml_utils.get_schema(schema_location)
+    _schema_digest = content_hash(doxygen.xml_archive.read(schema_location))
+    if cache_location is not None:
+        _verdicts.update(load_cache(cache_location))
+        logger.debug("Loaded %s cached validation verdicts", len(_verdicts))
+
+
+def get_mode() -> Optional[str]:
+    return _mode
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def trusted(xml_file: str, root: etree.ElementTree) -> bool:  # type: ignore
+    """ True if what the extractors found in the parsed xml_file can be used """
+    if _mode is None or _mode == MODE_FULL:
+        return True
+    if _mode == MODE_STRUCTURAL:
+        valid = not doxygen.xpath.MALFORMED(root)
+    else:
+        valid = validate(doxygen.xml_archive.read(xml_file), root)
+    if not valid:
+        logger.warning("Skipping %s, it failed %s validation", xml_file, _mode)
+    return valid
+
+
+def validate(data: bytes, root: etree.ElementTree) -> bool:  # type: ignore
+    """ Validates the tree parsed from data against the schema, using the cached verdict """
+    global _schema  # pylint: disable=global-statement
+    key = f"{_schema_digest}:{content_hash(data)}"
+    if key in _verdicts:
+        return _verdicts[key]
+
+    if _schema is None:
+        _schema = doxygen.xml_utils.get_schema(_schema_location)
+    verdict = bool(_schema.validate(root))
+    if not verdict:
+        logger.debug(_schema.error_log)
+    _verdicts[key] = verdict
+    if _cache_location is not None:
+        record(_cache_location, key, verdict)
+    return verdict
+
+
+def load_cache(location: str) -> Dict[str, bool]:
+    """ Reads the cached verdicts, a missing or damaged cache is just a smaller one """
+    verdicts = dict()
+    try:
+        with open(location) as cache_f:
+            for line in cache_f:
+                fields = line.split()
+                if len(fields) == 2 and fields[1] in ("0", "1"):
+                    verdicts[fields[0]] = fields[1] == "1"
+    except OSError:
+        pass
+    return verdicts
+
+
+def record(location: str, key: str, verdict: bool) -> None:
+    """ Appends a verdict to the cache, losing one only costs validating the file again """
+    try:
+        with open(location, "a") as cache_f:
+            cache_f.write(f"{key} {int(verdict)}\n")
+    except OSError as e:
+        logger.debug("Could not cache the verdict for %s: %s", key, e)
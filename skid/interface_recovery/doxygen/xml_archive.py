@@ -0,0 +1,276 @@
+"""
+Packs the XML files produced by doxygen into a single archive
+
+Doxygen writes tens of thousands of small files, on network filesystems and overlayfs the
+cost of listing, opening and closing every one of them dominates. This module concatenates
+every compound into one file with an offset/length index so that each worker only has to
+mmap the archive once and can then slice the compounds out of it.
+
+Archive layout:
+
+    +--------+---------+-------+--------------+--------------+------------------+-------+
+    | magic  | version | flags | index offset | index length | compounds ...    | index |
+    +--------+---------+-------+--------------+--------------+------------------+-------+
+
+The index is a JSON object of {name: [offset, length, raw_length]}. When the archive is
+compressed every compound is compressed on it's own so it can be read without touching
+the rest of the archive. The same container holds the compounds transcoded by doxygen.ir,
+those archives have FLAG_IR set.
+
+Compounds inside an archive are refered to with a member path such as:
+
+    /tmp/skid-doxygen/xml.skidpack::example__driver_8c.xml
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from logging import getLogger
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+ARCHIVE_MAGIC = b"SKIDPACK"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<8sIIQQ")
+MEMBER_SEPARATOR = "::"
+FLAG_COMPRESSED = 0x1
+FLAG_IR = 0x2
+PACKED_EXTENSIONS = (".xml", ".xsd")
+
+# Opened archives are cached per process: {archive location: (mmap, index, flags)}
+_OPEN_ARCHIVES = dict()  # type: Dict[str, Tuple[mmap.mmap, Dict[str, Tuple[int, int, int]], int]]
+
+
+class ArchiveError(Exception):
+    """ Raised when an archive is corrupt or a member could not be found """
+
+
+########## WRITING ##########
+
+
+def pack(xml_dir: str, archive_loc: str, compress=False) -> str:
+    """
+    Concatenates every XML/XSD file in `xml_dir` into a single archive
+
+    Args:
+        xml_dir: Directory that contains the doxygen XML output
+        archive_loc: Location to write the archive to
+        compress: If True each compound is zlib compressed
+
+    Returns: The location of the archive
+    """
+    assert os.path.isdir(xml_dir)
+    assert isinstance(archive_loc, str)
+
+    names = sorted(f for f in os.listdir(xml_dir) if f.endswith(PACKED_EXTENSIONS))
+    logger.info("Packing %s doxygen XML files into: %s", len(names), archive_loc)
+
+    def members() -> Iterator[Tuple[str, bytes]]:
+        for name in names:
+            with open(os.path.join(xml_dir, name), "rb") as xml_f:
+                yield name, xml_f.read()
+
+    return write(archive_loc, members(), FLAG_COMPRESSED if compress else 0)
+
+
+def write(archive_loc: str, members: Iterable[Tuple[str, bytes]], flags=0) -> str:
+    """
+    Writes the (name, bytes) members into an archive, with FLAG_COMPRESSED each
+    member is compressed
+    Returns: The location of the archive
+    """
+    index = dict()
+
+    # Written to a temporary file first so a half written archive is never picked up
+    tmp_loc = archive_loc + ".tmp"
+    with open(tmp_loc, "wb") as archive:
+        archive.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, flags, 0, 0))
+
+        for name, raw in members:
+            data = zlib.compress(raw, 1) if flags & FLAG_COMPRESSED else raw
+            index[name] = (archive.tell(), len(data), len(raw))
+            archive.write(data)
+
+        index_bytes = json.dumps(index).encode("utf-8")
+        index_offset = archive.tell()
+        archive.write(index_bytes)
+
+        archive.seek(0)
+        archive.write(
+            ARCHIVE_HEADER.pack(
+                ARCHIVE_MAGIC, ARCHIVE_VERSION, flags, index_offset, len(index_bytes)
+            )
+        )
+
+    os.replace(tmp_loc, archive_loc)
+    _close(archive_loc)
+    return archive_loc
+
+
+########## READING ##########
+
+
+def is_archive(location: str) -> bool:
+    """ Returns True if the location is a file starting with the archive magic """
+    if not isinstance(location, str) or not os.path.isfile(location):
+        return False
+    with open(location, "rb") as archive:
+        return archive.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def is_member_path(location: str) -> bool:
+    """ Returns True if the location points inside an archive """
+    return isinstance(location, str) and MEMBER_SEPARATOR in location
+
+
+def member_path(archive_loc: str, name: str) -> str:
+    """ Builds the path used to refer to the compound `name` inside an archive """
+    return f"{archive_loc}{MEMBER_SEPARATOR}{name}"
+
+
+def split_member_path(location: str) -> Tuple[str, str]:
+    """ Splits a member path into the archive location and the compound name """
+    assert is_member_path(location)
+    archive_loc, name = location.rsplit(MEMBER_SEPARATOR, 1)
+    return archive_loc, name
+
+
+def list_members(archive_loc: str) -> Tuple[str, ...]:
+    """ Returns the member paths of all compounds in the archive (index.xml excluded) """
+    _, index, _ = _open(archive_loc)
+    return tuple(
+        member_path(archive_loc, name)
+        for name in index
+        if name.endswith(".xml") and name != "index.xml"
+    )
+
+
+def exists(location: str) -> bool:
+    """ Like os.path.exists but also understands member paths """
+    if not is_member_path(location):
+        return location is not None and os.path.exists(location)
+
+    # Answered from the cached index, the archive is only opened the first time
+    archive_loc, name = split_member_path(location)
+    try:
+        _, index, _ = _open(archive_loc)
+    except (OSError, ValueError, ArchiveError):
+        return False
+    return name in index
+
+
+def read(location: str) -> bytes:
+    """
+    Reads the bytes of a plain file or of a compound inside an archive, compounds
+    are sliced out of the archive's mmap
+    Raises: ArchiveError: If the member is missing from the archive
+    """
+    if not is_member_path(location):
+        with open(location, "rb") as xml_f:
+            return xml_f.read()
+
+    archive_loc, name = split_member_path(location)
+    mapped, index, flags = _open(archive_loc)
+    try:
+        offset, length, _ = index[name]
+    except KeyError as e:
+        raise ArchiveError(f"{name} is not in the archive {archive_loc}") from e
+
+    data = mapped[offset : offset + length]
+    if flags & FLAG_COMPRESSED:
+        return zlib.decompress(data)
+    return data
+
+
+def view(location: str) -> memoryview:
+    """
+    The bytes of a member of an uncompressed archive without copying them out of the
+    archive's mmap, anything else is read
+    """
+    if not is_member_path(location):
+        return memoryview(read(location))
+    archive_loc, name = split_member_path(location)
+    mapped, index, flags = _open(archive_loc)
+    if flags & FLAG_COMPRESSED or name not in index:
+        return memoryview(read(location))
+    offset, length, _ = index[name]
+    return memoryview(mapped)[offset : offset + length]
+
+
+def get_flags(archive_loc: str) -> int:
+    """ The flags the archive was written with e.g FLAG_COMPRESSED """
+    return _open(archive_loc)[2]
+
+
+def size(location: str) -> int:
+    """ Returns the uncompressed size in bytes of a plain file or archive member """
+    if not is_member_path(location):
+        return os.path.getsize(location)
+    archive_loc, name = split_member_path(location)
+    _, index, _ = _open(archive_loc)
+    return index[name][2]
+
+
+def sizes(locations: Sequence[str]) -> List[int]:
+    """ The sizes of many files, 0 for those that are missing so whatever parses them fails """
+    found = list()
+    for location in locations:
+        try:
+            found.append(size(location))
+        except (OSError, KeyError, ArchiveError):
+            found.append(0)
+    return found
+
+
+def _open(archive_loc: str) -> Tuple[mmap.mmap, Dict[str, Tuple[int, int, int]], int]:
+    """
+    Maps the archive into memory and loads it's index, this is only done once
+    per process
+    Raises: ArchiveError: If the file is not a valid archive
+    """
+    if archive_loc in _OPEN_ARCHIVES:
+        return _OPEN_ARCHIVES[archive_loc]
+
+    with open(archive_loc, "rb") as archive:
+        mapped = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, flags, index_offset, index_length = ARCHIVE_HEADER.unpack_from(mapped)
+    except struct.error as e:
+        mapped.close()
+        raise ArchiveError(f"Archive is truncated: {archive_loc}") from e
+
+    if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+        mapped.close()
+        raise ArchiveError(f"Not a skid archive or unsupported version: {archive_loc}")
+
+    try:
+        index = {
+            name: tuple(entry)
+            for name, entry in json.loads(
+                mapped[index_offset : index_offset + index_length].decode("utf-8")
+            ).items()
+        }
+    except (ValueError, AttributeError, TypeError) as e:
+        mapped.close()
+        raise ArchiveError(f"Archive index is corrupt: {archive_loc}") from e
+    _OPEN_ARCHIVES[archive_loc] = (mapped, index, flags)  # type: ignore
+    return _OPEN_ARCHIVES[archive_loc]  # type: ignore
+
+
+def _close(archive_loc: str) -> None:
+    """ Unmaps the cached archive (if it was opened) so it's opened again on next use """
+    opened = _OPEN_ARCHIVES.pop(archive_loc, None)
+    if opened is None:
+        return
+    try:
+        opened[0].close()
+    except BufferError:
+        # A view() of a member is still alive, the mmap is closed once it's released
+        pass
@@ -8,33 +8,49 @@ Date: 2020
 import os
 from io import BytesIO
 from logging import getLogger
-from multiprocessing import Pool
-from typing import Tuple
+import re
+from typing import List, Tuple
 
-from alive_progress import alive_bar  # type: ignore
 from lxml import etree  # type: ignore
 from skid.interface_recovery import doxygen
-from skid.utils import utils
+from skid.utils import admission, supervisor, utils
 
 logger = getLogger(__name__)
 
+INCLUDE_RE = re.compile(r"#\s*include\s*[<\"]([^>\"]+)[>\"]")
+
 
 class DoxygenMalformedXML(etree.LxmlError):
     """ Doxygen does not always generate XML files matching it's schema """
 
 
+class ArchiveResolver(etree.Resolver):
+    """ Resolves schema imports such as xml.xsd from inside of a packed archive """
+
+    def __init__(self, archive_loc: str):
+        super().__init__()
+        self.archive_loc = archive_loc
+
+    def resolve(self, system_url, public_id, context):  # pylint: disable=unused-argument
+        """ Looks for the imported file next to the schema inside the archive """
+        location = doxygen.xml_archive.member_path(self.archive_loc, os.path.basename(system_url))
+        if not doxygen.xml_archive.exists(location):
+            return None
+        return self.resolve_string(doxygen.xml_archive.read(location), context)
+
+
 ##################### OPENING XML FILES #####################
 
 
 def get_root(xml_loc: str):
     """
-    Get's the root node of the XML
+    Get's the root node of the XML, xml_loc can either be a file or a compound
+    inside of a packed archive
     Raises: DoxygenMalformedXML: If the XML could not be parsed
     """
     assert xml_loc is not None
-    assert os.path.exists(xml_loc)
-    with open(xml_loc, "rb") as xml_f:
-        return etree.parse(BytesIO(xml_f.read()))
+    assert doxygen.xml_archive.exists(xml_loc)
+    return etree.parse(BytesIO(doxygen.xml_archive.read(xml_loc)))
 
 
 ##################### SHCMEA #####################
@@ -48,23 +64,22 @@ def validate_schema(xml_loc: str, schema: etree.XMLSchema):
     """
     assert xml_loc is not None
     assert schema is not None
-    assert os.path.exists(xml_loc)
+    assert doxygen.xml_archive.exists(xml_loc)
 
-    with open(xml_loc, "rb") as xml_f:
-        xml_bytes = BytesIO(xml_f.read())
+    xml_bytes = BytesIO(doxygen.xml_archive.read(xml_loc))
 
     try:
         xml = etree.parse(xml_bytes)
     except etree.XMLSyntaxError as e:
         logger.error(e)
-        logger.warning(f"Failed to parse: {xml_loc}")
+        logger.warning("Failed to parse: %s", xml_loc)
         logger.warning("Skipping this XML file")
         raise DoxygenMalformedXML(xml_loc) from e
 
-    logger.debug(f"Validating {xml_loc}")
+    logger.debug("Validating %s", xml_loc)
 
     if schema and not schema.validate(xml):  # type: ignore
-        logger.warning(f"Validating schema failed for: {xml_loc}")
+        logger.warning("Validating schema failed for: %s", xml_loc)
         logger.warning(schema.error_log)  # type: ignore
         logger.warning("Skipping this XML file")
         return False
@@ -73,11 +88,17 @@ def validate_schema(xml_loc: str, schema: etree.XMLSchema):
 
 
 def get_schema(xml_loc: str):
-    """ Loads the schema produced by doxygen from disk """
+    """ Loads the schema produced by doxygen from disk or from a packed archive """
     assert xml_loc is not None
-    assert os.path.exists(xml_loc)
+    assert doxygen.xml_archive.exists(xml_loc)
     try:
-        schema_root = etree.parse(xml_loc)
+        if doxygen.xml_archive.is_member_path(xml_loc):
+            archive_loc, _ = doxygen.xml_archive.split_member_path(xml_loc)
+            parser = etree.XMLParser()
+            parser.resolvers.add(ArchiveResolver(archive_loc))
+            schema_root = etree.parse(BytesIO(doxygen.xml_archive.read(xml_loc)), parser)
+        else:
+            schema_root = etree.parse(xml_loc)
     except (etree.XMLSchemaError, etree.XMLSyntaxError) as e:
         logger.warning("Doxygen failed to make an XML schema :(")
         logger.warning("Do you have space left on your device?")
@@ -99,10 +120,15 @@ def filter_xml_list_by_header(
     msg = f"Finding source files that include '{header}'"
     title = utils.format_alive_bar_title(msg)
 
-    with alive_bar(len(xml_files), title=title) as bar:
-        with Pool(processes=os.cpu_count()) as pool:
-            for res, xml_file in pool.imap_unordered(
-                xml_file_has_header, [(xml_file, header) for xml_file in xml_files]
+    sizes = doxygen.xml_archive.sizes(xml_files)
+    with utils.progress_bar(len(xml_files), title=title) as bar:
+        with supervisor.pool() as pool:
+            for res, xml_file in admission.imap(
+                pool,
+                xml_file_has_header,
+                [(xml_file, header) for xml_file in xml_files],
+                sizes,
+                bar=bar,
             ):
                 bar()
                 if res:
@@ -124,23 +150,41 @@ def xml_file_has_header(args: Tuple[str, str]) -> Tuple[bool, str]:
     """
     assert len(args) == 2
     xml_file, header = args
+    if doxygen.ir.is_ir(xml_file):
+        return (ir_has_header(xml_file, header), xml_file)
     try:
         root = doxygen.xml_utils.get_root(xml_file)
     except etree.LxmlError as e:
         logger.error(e)
         return (False, xml_file)
 
-    for element in root.iter("codeline"):
-        for highlight in element.iter("highlight"):
-            txt = highlight.text
-            if not (txt is not None and "include" in txt and "#" in txt):
-                continue
+    for highlight in doxygen.xpath.INCLUDE_DIRECTIVES(root):
+        if header in doxygen.find_structs.stringify_children(highlight):
+            logger.debug("The following file include %s: %s", header, xml_file)
+            return (True, xml_file)
 
-            if highlight.attrib["class"] != "preprocessor":
-                continue
+    return (False, xml_file)
 
-            if header in doxygen.find_structs.stringify_children(highlight):
-                logger.debug(f"The following file include {header}: {xml_file}")
-                return (True, xml_file)
 
-    return (False, xml_file)
+def ir_has_header(ir_file: str, header: str) -> bool:
+    """ Like xml_file_has_header for a compound transcoded by doxygen.ir """
+    try:
+        compound = doxygen.ir.load(ir_file)
+    except doxygen.ir.IRError as e:
+        logger.error("%s: %s", ir_file, e)
+        return False
+    for text, directive in compound.includes():
+        if directive and header in text:
+            logger.debug("The following file include %s: %s", header, ir_file)
+            return True
+    return False
+
+
+def find_includes(root: etree.ElementTree) -> List[str]:  # type: ignore
+    """ The headers an already parsed XML file includes e.g ['linux/fs.h', 'wdt.h'] """
+    includes = list()
+    for highlight in doxygen.xpath.INCLUDE_HIGHLIGHTS(root):
+        match = INCLUDE_RE.match("".join(highlight.itertext()))
+        if match is not None:
+            includes.append(match.group(1))
+    return includes
@@ -0,0 +1,76 @@
+"""
+Precompiled XPath queries over doxygen's XML
+
+Walking every memberdef (or highlight) of a compound in Python is most of the time
+spent in the extractors, a kernel compound has thousands of them and only a handful
+matter. These queries are compiled once when the module is imported (so once per
+worker) and evaluated inside libxml2, only the elements they select become Python
+objects. Each takes the root (or an element) and returns a list of elements:
+
+    for memberdef in xpath.FILEOPS_MEMBERDEFS(root):
+        ...
+
+Queries with $variables take them as keyword arguments, MEMBERDEF_BY_ID(root, id=refid)
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+from lxml import etree  # type: ignore
+
+# Where doxygen puts the members and the source listing of a compound, the queries are
+# anchored to them rather than searching the whole document (// or descendant) which
+# would also walk every codeline of the programlisting
+MEMBERDEFS = "/doxygen/compounddef/sectiondef/descendant::memberdef"
+CODELINES = "/doxygen/compounddef/programlisting/codeline"
+
+# Variables whose every <type> starts with text that mentions file_operations and that
+# have an initializer, the same test as find_structs.is_memberdef_a_file_ops_struct. The
+# contains() on the whole type is only there to reject most members cheaply
+FILEOPS_MEMBERDEFS = etree.XPath(
+    MEMBERDEFS + '[@kind="variable"][contains(type, "file_operations")][initializer]'
+    '[not(.//type[not(node()[1][self::text()][contains(., "file_operations")])])]'
+)
+
+# Preprocessor highlights whose leading text is an #include
+INCLUDE_DIRECTIVES = etree.XPath(
+    CODELINES + '/highlight[@class="preprocessor"]'
+    '[node()[1][self::text()][contains(., "include") and contains(., "#")]]'
+)
+
+# Any preprocessor highlight that mentions include, find_includes runs INCLUDE_RE on them
+INCLUDE_HIGHLIGHTS = etree.XPath(
+    CODELINES + '/highlight[@class="preprocessor"][contains(., "include")]'
+)
+
+# The memberdefs find_constants turns into macros, enums and typedefs (document order)
+CONSTANT_MEMBERDEFS = etree.XPath(
+    MEMBERDEFS + '[@kind="define" or @kind="enum" or @kind="typedef"]'
+)
+
+# Every compound and the memberdefs of one, in document order (see ir.transcode_root)
+COMPOUNDDEFS = etree.XPath("/doxygen/compounddef")
+COMPOUND_MEMBERDEFS = etree.XPath("sectiondef/descendant::memberdef")
+
+# Struct and union compounds and the members (variables) of one
+RECORD_COMPOUNDS = etree.XPath('/doxygen/compounddef[@kind="struct" or @kind="union"]')
+RECORD_MEMBERS = etree.XPath('sectiondef/descendant::memberdef[@kind="variable"]')
+
+# True if an element or attribute the extractors read is missing (or isn't a number),
+# the structural check of validation.MODE_STRUCTURAL
+MALFORMED = etree.XPath(
+    "boolean("
+    + MEMBERDEFS
+    + "[not(name) or not(location/@file) or not(number(location/@line) >= 0)]"
+    + " | "
+    + CODELINES
+    + "[not(number(@lineno) >= 0)]"
+    + " | /doxygen/compounddef[not(compoundname)])"
+)
+
+# A function (or any member) by it's refid and the codelines between two line numbers
+MEMBERDEF_BY_ID = etree.XPath(MEMBERDEFS + "[@id=$id]")
+CODELINES_BETWEEN = etree.XPath(CODELINES + "[@lineno >= $start and @lineno <= $end]")
+
+# The functions of a file compound, find_constraints follows the calls a handler makes
+FUNCTION_MEMBERDEFS = etree.XPath(MEMBERDEFS + '[@kind="function"]')
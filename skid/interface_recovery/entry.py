@@ -38,10 +38,19 @@ Author: Luke Goddard
 Date: 2020
 """
 
-from typing import Dict, Any
+import sqlite3
+from typing import Dict, Any, List, Optional, Tuple
 from logging import getLogger
 
-from skid.interface_recovery.doxygen import doxygen
+from skid.fuzzer import probe
+from skid.interface_recovery import api
+from skid.interface_recovery import calibration
+from skid.interface_recovery import distributed
+from skid.interface_recovery import export
+from skid.interface_recovery import ioctl
+from skid.interface_recovery import libclang
+from skid.interface_recovery.doxygen import doxygen, find_device_name, find_structs
+from skid.utils import admission, stages, supervisor, tuning
 
 logger = getLogger(__name__)
 
@@ -52,28 +61,238 @@ def start_interface_recovery(args: Dict[str, Any]) -> bool:
     logger.info("Starting Interface Recovery Mode")
     logger.info("================================")
 
-    source_location = args["--source"]
-    user_config_location = args["--doxyconf"]
-
-    if not doxygen.configure(source_location, user_config_location):
-        logger.critical("Failed to configure doxygen")
+    try:
+        options = api.RecoveryOptions.from_args(args)
+        if options.frontend != api.FRONTEND_DOXYGEN:
+            return start_frontend(options)
+        options = api.apply_profile(options)
+        admission.set_budget(options.memory_budget)
+        supervisor.set_timeout(options.file_timeout)
+        pipeline = api.preparation_stages(options) + recovery_stages(options)
+        _, timings = stages.run(pipeline, processes=options.processes)
+    except (ValueError, doxygen.DoxygenException) as e:
+        logger.critical(e)
         return False
 
-    if not doxygen.run():
+    for line in stages.report(timings):
+        logger.info(line)
+    report_quarantine(options)
+
+    # device_register_functions = doxygen.find_device_register_functions(
+    # ioctl_handers = doxygen.find_ioctl_handers(fileop_structs)
+
+    return True
+
+
+def recovery_stages(options: api.RecoveryOptions) -> List[stages.Stage]:
+    """
+    The stages that run over the xml_files from api.preparation_stages. The structs,
+    constants and device names are found at the same time, the commands once both the
+    structs and constants are known
+    """
+
+    def find_fileop_structs(xml_files: Tuple[str, ...], processes: Optional[int] = None):
+        if options.coordinator is not None:
+            results = distributed.coordinator.find_fileop_structs(xml_files, options.coordinator)
+            return tuple(results.structs), results
+        return doxygen.find_fileop_structs(xml_files, processes), None
+
+    def find_constants(xml_files: Tuple[str, ...], processes: int):
+        return doxygen.get_constant_evaluator(xml_files, processes)
+
+    def find_device_names(xml_files: Tuple[str, ...], processes: int):
+        doxygen.find_all_device_names(xml_files, processes)
+
+    def find_coordinated_device_names(coordinated):
+        find_device_name.find_all(coordinated.files_including(find_device_name.INCLUDE_FILE))
+
+    def resolve_commands(xml_files, fileop_structs, consts, processes: int):
+        return doxygen.resolve_ioctl_commands(xml_files, fileop_structs, processes, consts)
+
+    def probe_device(fileop_structs, resolved_commands):
+        return probe_commands(
+            options.probe, options.probe_handler, fileop_structs, resolved_commands
+        )
+
+    def export_protobuf(fileop_structs, commands, consts):
+        export.protobuf.export(fileop_structs, options.export, commands, consts)
+
+    def export_sqlite(fileop_structs, commands):
+        export.sqlite.export(fileop_structs, options.database, commands)
+
+    local = options.coordinator is None
+    resolved = "commands" if options.probe is None else "resolved_commands"
+    pipeline = [
+        stages.Stage(
+            "find fileop structs",
+            find_fileop_structs,
+            ("xml_files",),
+            ("fileop_structs", "coordinated"),
+            parallel=local,
+        ),
+        stages.Stage("find constants", find_constants, ("xml_files",), ("consts",), True),
+        stages.Stage(
+            "resolve commands",
+            resolve_commands,
+            ("xml_files", "fileop_structs", "consts"),
+            (resolved,),
+            parallel=True,
+        ),
+    ]
+    if local:
+        pipeline.append(
+            stages.Stage("find device names", find_device_names, ("xml_files",), (), True)
+        )
+    else:
+        pipeline.append(
+            stages.Stage("find device names", find_coordinated_device_names, ("coordinated",))
+        )
+    if options.probe is not None:
+        pipeline.append(
+            stages.Stage(
+                "probe device",
+                probe_device,
+                ("fileop_structs", "resolved_commands"),
+                ("commands",),
+            )
+        )
+    if options.export is not None:
+        pipeline.append(
+            stages.Stage(
+                "export protobuf", export_protobuf, ("fileop_structs", "commands", "consts")
+            )
+        )
+    if options.database is not None:
+        pipeline.append(
+            stages.Stage("export sqlite", export_sqlite, ("fileop_structs", "commands"))
+        )
+    return pipeline
+
+
+def report_quarantine(options: api.RecoveryOptions):
+    """ Logs the files the workers gave up on and writes them to the --quarantine report """
+    supervisor.log_report()
+    if options.quarantine is None:
+        return
+    try:
+        supervisor.write_report(options.quarantine)
+        logger.info("Wrote the quarantine report to %s", options.quarantine)
+    except OSError as e:
+        logger.error("Could not write the quarantine report: %s", e)
+
+
+def probe_commands(
+    device: str,
+    handler: str,
+    fileop_structs: Tuple[Dict[str, Any], ...],
+    commands: Dict[str, Tuple[ioctl.request.IoctlCommand, ...]],
+):
+    """
+    Adds the commands the device handles that static recovery missed, the device is
+    only probed with (and the results only added to) the commands of it's handler
+    """
+    refids = probe.handler_refids(fileop_structs, handler)
+    if len(refids) == 0:
+        logger.error("The ioctl handler %s of %s was not recovered", handler, device)
+        return commands
+    recovered = [command for refid in refids for command in commands.get(refid, ())]
+    try:
+        probed = probe.probe_device(device, recovered)
+    except OSError as e:
+        logger.error("Could not probe %s: %s", device, e)
+        return commands
+    return probe.merge_probed(commands, probed, refids)
+
+
+def start_frontend(options: api.RecoveryOptions) -> bool:
+    """ Recovers the interfaces with a frontend other than doxygen """
+    logger.info("Using the %s frontend", options.frontend)
+    try:
+        struct_elements = list(api.recover(options))
+        if options.export is not None:
+            export.protobuf.export(struct_elements, options.export)
+        if options.database is not None:
+            export.sqlite.export(struct_elements, options.database)
+    except (OSError, ValueError, sqlite3.Error, libclang.find_structs.LibclangException) as e:
+        logger.critical(e)
         return False
 
-    xml_files = doxygen.get_all_xml_files()
+    logger.info("Found %s ioctl file_operations handler function pointers", len(struct_elements))
+    find_structs.log_results(struct_elements)
+    return True
 
-    if not args["--dont-validate"]:
-        schema = doxygen.get_schema()
-        xml_files = doxygen.filter_xml_files_bad_schema(xml_files, schema)
 
-    doxygen.find_fileop_structs(xml_files)
-    doxygen.find_all_device_names(xml_files)
+def start_query(args: Dict[str, Any]) -> bool:
+    """ Starts the query mode, prints the interfaces in an exported database """
+    database = args["<database>"]
+    try:
+        if args["--sql"] is not None:
+            columns, rows = export.sqlite.execute(database, args["--sql"])
+            print("\t".join(columns))
+            for row in rows:
+                print("\t".join(str(value) for value in row))
+            return True
+
+        interfaces = export.sqlite.query(
+            database,
+            fop_type=args["--fop"],
+            function=args["--function"],
+            struct_name=args["--struct"],
+            path=args["--path"],
+            command=args["--command"],
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.critical(e)
+        return False
+
+    for interface in interfaces:
+        print(
+            f"{interface['file_path']}:{interface['struct_line_number']} "
+            f"{interface['struct_name']}.{interface['fop_type']} = {interface['function']}"
+        )
+        for command in interface["commands"]:
+            print(
+                f"    {command['name']} {command['number']:#010x} "
+                f"{command['direction']} {command['size']} {command['argument']}".rstrip()
+            )
+    logger.info("%s matching interfaces", len(interfaces))
+    return True
 
-    # device_register_functions = doxygen.find_device_register_functions(
-    # ioctl_handers = doxygen.find_ioctl_handers(fileop_structs)
 
+def start_worker(args: Dict[str, Any]) -> bool:
+    """ Starts the worker mode, processes batches for a coordinator until it's done """
+    try:
+        address = distributed.protocol.parse_address(args["<address>"])
+        processes = int(args["--processes"]) if args["--processes"] is not None else None
+        distributed.worker.run(address, processes)
+    except (ValueError, ConnectionError, OSError) as e:
+        logger.critical(e)
+        return False
     return True
 
 
+def start_tune(args: Dict[str, Any]) -> bool:
+    """ Starts the tune mode, calibrates doxygen and the worker pools and writes the profile """
+    location = args["--profile"] or tuning.PROFILE_LOCATION
+    try:
+        admission.set_budget(
+            admission.parse_size(args["--memory-budget"])
+            if args["--memory-budget"] is not None
+            else None
+        )
+        profile = calibration.calibrate(
+            args["--source"], args["--doxyconf"], sample_size=int(args["--sample"])
+        )
+        tuning.save(profile, location)
+    except (ValueError, OSError) as e:
+        logger.critical(e)
+        return False
+
+    logger.info(
+        "Tuned %s processes, chunksizes %s and doxygen %s",
+        profile.processes,
+        profile.chunksizes,
+        profile.doxygen,
+    )
+    logger.info("Wrote the profile to %s, use it with skid.py ir --profile=%s", location, location)
+    return True
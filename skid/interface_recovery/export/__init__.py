@@ -0,0 +1 @@
+from skid.interface_recovery.export import protowire, protobuf, sqlite
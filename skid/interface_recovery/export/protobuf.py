@@ -0,0 +1,423 @@
+"""
+Exports the recovered ioctl interfaces as protocol buffers for libprotobuf-mutator
+
+The export directory contains:
+
+    skid.proto          The schema of the records in interfaces.pb
+    interfaces.pb       Length-delimited skid.Interface records
+    <interface>.proto   A description of the arguments of each ioctl handler
+
+Records are written (and flushed) one at a time as they are recovered, so exports of
+any size use constant memory and a fuzzer can start reading before the export has
+finished. Encoding is done by export.protowire, the protobuf runtime isn't needed.
+
+An interface .proto has a message per argument struct and a Call message with a
+oneof over the commands:
+
+    message WatchdogInfo {
+      uint32 options = 1;  // offset 0, 4 bytes
+      ...
+    }
+    message Call {
+      oneof command {
+        WdiocGetsupportCommand wdioc_getsupport = 1;  // 0x80285700 read, 40 bytes
+      }
+    }
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import re
+from logging import getLogger
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from skid.interface_recovery.export import protowire
+from skid.interface_recovery.ioctl import evaluator, layouts, request
+
+logger = getLogger(__name__)
+
+SCHEMA_FILENAME = "skid.proto"
+RECORDS_FILENAME = "interfaces.pb"
+
+DIRECTION_NUMBERS = {"none": 0, "write": 1, "read": 2, "read|write": 3}
+
+SCHEMA_PROTO = """\
+// Generated by skid, the records in interfaces.pb are length-delimited Interface messages
+syntax = "proto3";
+
+package skid;
+
+enum Direction {
+  NONE = 0;
+  WRITE = 1;
+  READ = 2;
+  READ_WRITE = 3;
+}
+
+message IoctlCommand {
+  string name = 1;
+  uint32 number = 2;
+  Direction direction = 3;
+  uint32 size = 4;
+  string argument = 5;
+}
+
+message Interface {
+  string function = 1;
+  string refid = 2;
+  string struct_name = 3;
+  uint32 struct_line_number = 4;
+  string file_path = 5;
+  string fop_type = 6;
+  repeated IoctlCommand commands = 7;
+  string proto_file = 8;
+}
+"""
+
+# Byte sized arrays are bytes rather than repeated fields
+BYTE_TYPES = {
+    "char",
+    "signed char",
+    "unsigned char",
+    "u8",
+    "s8",
+    "__u8",
+    "__s8",
+    "uint8_t",
+    "int8_t",
+}
+
+
+########## RECORDS ##########
+
+
+def encode_command(command: request.IoctlCommand) -> bytes:
+    """ Encodes an IoctlCommand message """
+    return b"".join(
+        (
+            protowire.string_field(1, command.name),
+            protowire.varint_field(2, command.number),
+            protowire.varint_field(3, DIRECTION_NUMBERS[command.direction]),
+            protowire.varint_field(4, command.size),
+            protowire.string_field(5, command.argument),
+        )
+    )
+
+
+def encode_interface(
+    record: Dict[str, Any], commands: Tuple[request.IoctlCommand, ...], proto_file: str = ""
+) -> bytes:
+    """ Encodes an Interface message from a file_operations record and it's commands """
+    fields = [
+        protowire.string_field(1, record["function"]),
+        protowire.string_field(2, record["refid"]),
+        protowire.string_field(3, record["struct_name"]),
+        protowire.varint_field(4, record["struct_line_number"]),
+        protowire.string_field(5, record["file_path"]),
+        protowire.string_field(6, record["fop_type"]),
+    ]
+    fields += [protowire.message_field(7, encode_command(command)) for command in commands]
+    fields.append(protowire.string_field(8, proto_file))
+    return b"".join(fields)
+
+
+def decode_interface(data: bytes) -> Dict[str, Any]:
+    """ Decodes an Interface message back into a record with a list of command dicts """
+    names = {
+        1: "function",
+        2: "refid",
+        3: "struct_name",
+        5: "file_path",
+        6: "fop_type",
+        8: "proto_file",
+    }
+    record: Dict[str, Any] = {name: "" for name in names.values()}
+    record["struct_line_number"] = 0
+    record["commands"] = list()
+    for number, _, value in protowire.iter_fields(data):
+        if number in names:
+            record[names[number]] = value.decode("utf-8")  # type: ignore
+        elif number == 4:
+            record["struct_line_number"] = value
+        elif number == 7:
+            record["commands"].append(decode_command(value))  # type: ignore
+    return record
+
+
+def decode_command(data: bytes) -> Dict[str, Any]:
+    """ Decodes an IoctlCommand message """
+    directions = {number: name for name, number in DIRECTION_NUMBERS.items()}
+    command: Dict[str, Any] = {
+        "name": "",
+        "number": 0,
+        "direction": "none",
+        "size": 0,
+        "argument": "",
+    }
+    for number, _, value in protowire.iter_fields(data):
+        if number == 1:
+            command["name"] = value.decode("utf-8")  # type: ignore
+        elif number == 2:
+            command["number"] = value
+        elif number == 3:
+            command["direction"] = directions[value]  # type: ignore
+        elif number == 4:
+            command["size"] = value
+        elif number == 5:
+            command["argument"] = value.decode("utf-8")  # type: ignore
+    return command
+
+
+def iter_interfaces(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """ Reads the records back out of interfaces.pb as they are written """
+    for message in protowire.iter_delimited(stream):
+        yield decode_interface(message)
+
+
+########## EXPORT ##########
+
+
+def export(
+    records: Iterable[Dict[str, Any]],
+    export_dir: str,
+    commands: Optional[Dict[str, Tuple[request.IoctlCommand, ...]]] = None,
+    consts: Optional[evaluator.ConstantEvaluator] = None,
+) -> int:
+    """
+    Streams the records into export_dir/interfaces.pb and writes a .proto for each interface
+
+    Args:
+        records: file_operations records, this can be a lazy iterator such as api.recover()
+        commands: The resolved ioctl commands of each handler keyed by refid
+        consts: Used to lay out the argument structs, without it they are bytes
+
+    Returns: The number of records written
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    commands = commands or dict()
+    with open(os.path.join(export_dir, SCHEMA_FILENAME), "w") as schema_f:
+        schema_f.write(SCHEMA_PROTO)
+
+    # Only the handlers are remembered, never the records
+    proto_files: Dict[Tuple[str, str, str], str] = dict()
+    taken: set = set()
+    written = 0
+    with open(os.path.join(export_dir, RECORDS_FILENAME), "wb") as records_f:
+        for record in records:
+            handler_commands = commands.get(record["refid"], tuple()) if record["refid"] else ()
+            handler = (record["file_path"], record["struct_name"], record["function"])
+            if handler not in proto_files:
+                proto_files[handler] = write_interface_proto(
+                    export_dir, record, handler_commands, consts, taken
+                )
+                taken.add(proto_files[handler])
+
+            message = encode_interface(record, handler_commands, proto_files[handler])
+            protowire.write_delimited(records_f, message)
+            # Flushed every record so readers never wait for a buffer to fill
+            records_f.flush()
+            written += 1
+
+    logger.info("Exported %s interfaces to %s", written, export_dir)
+    return written
+
+
+def write_interface_proto(
+    export_dir: str,
+    record: Dict[str, Any],
+    commands: Tuple[request.IoctlCommand, ...],
+    consts: Optional[evaluator.ConstantEvaluator],
+    taken: set,
+) -> str:
+    """ Writes the .proto of a single interface and returns it's filename """
+    stem = identifier(
+        f"{os.path.splitext(os.path.basename(record['file_path']))[0]}_"
+        f"{record['struct_name']}_{record['function']}"
+    ).lower()
+    filename = f"{stem}.proto"
+    suffix = 1
+    while filename in taken:
+        suffix += 1
+        filename = f"{stem}_{suffix}.proto"
+
+    with open(os.path.join(export_dir, filename), "w") as proto_f:
+        proto_f.write(generate_interface_proto(record, commands, consts, package=filename[:-6]))
+    return filename
+
+
+def generate_interface_proto(
+    record: Dict[str, Any],
+    commands: Tuple[request.IoctlCommand, ...],
+    consts: Optional[evaluator.ConstantEvaluator] = None,
+    package: str = "",
+) -> str:
+    """ Generates the .proto text describing the commands and arguments of an ioctl handler """
+    generator = _ProtoGenerator(consts)
+    call_fields = list()
+    command_messages = list()
+    for i, command in enumerate(commands, start=1):
+        message_name = camel_case(command.name) + "Command"
+        field_name = identifier(command.name).lower()
+        call_fields.append(
+            f"    {message_name} {field_name} = {i};  "
+            f"// {command.number:#010x} {command.direction}, {command.size} bytes"
+        )
+        command_messages.append(generator.command_message(message_name, command))
+
+    lines = [
+        f"// Generated by skid from {record['file_path']}:{record['struct_line_number']}",
+        f"// {record['struct_name']}.{record['fop_type']} = {record['function']}",
+        'syntax = "proto3";',
+        "",
+        f"package skid.{package or identifier(record['function']).lower()};",
+        "",
+    ]
+    for message in generator.messages + command_messages:
+        lines += message + [""]
+
+    lines.append("message Call {")
+    if len(call_fields) > 0:
+        lines += ["  oneof command {"] + call_fields + ["  }"]
+    lines += ["}", ""]
+    return "\n".join(lines)
+
+
+class _ProtoGenerator:
+    """ Generates a message for each struct reachable from the command arguments """
+
+    def __init__(self, consts: Optional[evaluator.ConstantEvaluator]):
+        self.consts = consts
+        self.messages: List[List[str]] = list()
+        self.generated: Dict[str, str] = dict()
+
+    def command_message(self, message_name: str, command: request.IoctlCommand) -> List[str]:
+        """ The message for a command is the argument as field 1, _IO commands have none """
+        if command.argument == "" or command.direction == "none":
+            return [f"message {message_name} {{", "}"]
+        declaration, c_type = self.field("arg", command.argument, (), 1, in_oneof=False)
+        return [f"message {message_name} {{", f"  {declaration}  // {c_type}", "}"]
+
+    def field(
+        self, name: str, type_str: str, dimensions: Tuple[str, ...], number: int, in_oneof: bool
+    ) -> Tuple[str, str]:
+        """ Returns the field declaration for a C member and the C type it came from """
+        type_str = layouts.normalize_type(type_str)
+        type_dims = layouts.split_dimensions(type_str)
+        if len(type_dims) > 0:
+            dimensions = type_dims + dimensions
+            type_str = type_str[: type_str.index("[")].strip()
+        c_type = type_str + "".join(f"[{dim}]" for dim in dimensions)
+
+        proto_type = self.proto_type(type_str)
+        name = identifier(name).lower()
+        if len(dimensions) > 0 and (type_str in BYTE_TYPES or proto_type == "bytes" or in_oneof):
+            # repeated fields aren't allowed in a oneof
+            return f"bytes {name} = {number};", c_type
+        repeated = "repeated " if len(dimensions) > 0 else ""
+        return f"{repeated}{proto_type} {name} = {number};", c_type
+
+    def proto_type(self, type_str: str) -> str:
+        """ Maps a C type to a protobuf type, unknown types are bytes """
+        if layouts.is_pointer(type_str):
+            return "uint64"
+        if type_str in ("_Bool", "bool"):
+            return "bool"
+
+        words = type_str.split()
+        if len(words) == 2 and words[0] in ("struct", "union"):
+            return self.record_message(words[1])
+
+        size = layouts.primitive_size(type_str)
+        if size is None and self.consts is not None:
+            resolved = self.consts.table.typedefs.get(type_str)
+            if resolved is not None and resolved.split()[0] in ("struct", "union"):
+                return self.proto_type(layouts.normalize_type(resolved))
+            try:
+                size = self.consts.sizeof(type_str)[0]
+            except evaluator.UnresolvedConstant:
+                size = None
+        if size is None or size > 8:
+            return "bytes"
+
+        signed = layouts.is_signed(type_str)
+        if size > 4:
+            return "int64" if signed else "uint64"
+        return "int32" if signed else "uint32"
+
+    def record_message(self, struct_name: str) -> str:
+        """ Generates (once) the message for a struct or union and returns it's name """
+        if struct_name in self.generated:
+            return self.generated[struct_name]
+
+        message_name = camel_case(struct_name)
+        self.generated[struct_name] = message_name
+        if self.consts is None or struct_name not in self.consts.table.records:
+            self.messages.append(
+                [
+                    f"// struct {struct_name} was not recovered",
+                    f"message {message_name} {{",
+                    "  bytes raw = 1;",
+                    "}",
+                ]
+            )
+            return message_name
+
+        record = self.consts.table.records[struct_name]
+        try:
+            layout = self.consts.layout(struct_name)
+            header = f"// {record.kind} {struct_name}, {layout.size} bytes"
+            # Unnamed bitfields are padding, the rest line up with the members one to one
+            laid_out = [f for f in layout.fields if f.name != "" or f.bits == 0]
+        except evaluator.UnresolvedConstant:
+            header, laid_out = f"// {record.kind} {struct_name}", list()
+
+        in_oneof = record.kind == "union"
+        indent = "    " if in_oneof else "  "
+        members = [m for m in record.members if m.name != "" or m.bits is None]
+        names = unique_names([member.name for member in members])
+        body = list()
+        for number, (member, name) in enumerate(zip(members, names), start=1):
+            declaration, c_type = self.field(name, member.type, member.dimensions, number, in_oneof)
+            comment = c_type
+            if number <= len(laid_out):
+                field = laid_out[number - 1]
+                comment += f", offset {field.offset}, {field.size} bytes"
+            body.append(f"{indent}{declaration}  // {comment}")
+
+        lines = [header, f"message {message_name} {{"]
+        if in_oneof and len(body) > 0:
+            lines += ["  oneof value {"] + body + ["  }"]
+        else:
+            lines += body
+        lines.append("}")
+        self.messages.append(lines)
+        return message_name
+
+
+def identifier(name: str) -> str:
+    """ Replaces anything that can't be in a protobuf identifier with _ """
+    name = re.sub(r"\W+", "_", name).strip("_")
+    if name == "" or name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def unique_names(names: List[str]) -> List[str]:
+    """ Names the unnamed members (anonymous structs and unions) anon1, anon2... """
+    taken = {identifier(name).lower() for name in names}
+    unique, anonymous = list(), 0
+    for name in names:
+        if name == "":
+            while name == "" or name in taken:
+                anonymous += 1
+                name = f"anon{anonymous}"
+            taken.add(name)
+        unique.append(name)
+    return unique
+
+
+def camel_case(name: str) -> str:
+    """ WDIOC_GETSUPPORT -> WdiocGetsupport, watchdog_info -> WatchdogInfo """
+    return "".join(part.capitalize() for part in identifier(name).split("_") if part) or "Unnamed"
@@ -0,0 +1,175 @@
+"""
+A minimal protocol buffers wire format encoder and decoder, so exporting does not need
+the protobuf runtime. See https://developers.google.com/protocol-buffers/docs/encoding
+
+Every message is a sequence of fields, each field is a varint key (field number << 3 |
+wire type) followed by the value:
+
+    varint  (0): int32, int64, uint32, uint64, sint32 (zigzag), bool, enum
+    i64     (1): fixed64, double
+    len     (2): string, bytes, embedded messages, packed repeated fields
+    i32     (5): fixed32, float
+
+A stream of messages is length-delimited, each message is prefixed with it's length as
+a varint. This is the same framing as writeDelimitedTo / parseDelimitedFrom in the
+official libraries.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import struct
+from typing import BinaryIO, Iterator, Tuple, Union
+
+WIRE_VARINT = 0
+WIRE_I64 = 1
+WIRE_LEN = 2
+WIRE_I32 = 5
+
+_I64 = struct.Struct("<Q")
+_I32 = struct.Struct("<I")
+
+# Single byte varints are by far the most common, build them once
+_SMALL_VARINTS = tuple(bytes((i,)) for i in range(0x80))
+
+
+class WireFormatError(Exception):
+    """ Raised when decoding bytes that are not valid protobuf wire format """
+
+
+########## ENCODING ##########
+
+
+def encode_varint(value: int) -> bytes:
+    """ Encodes an integer as a varint, negative numbers are 10 bytes like int64 """
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    if value < 0:
+        value &= 0xFFFFFFFFFFFFFFFF
+
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def zigzag(value: int) -> int:
+    """ Maps signed integers to unsigned so small negatives stay small (sint32/sint64) """
+    return (value << 1) ^ (value >> 63)
+
+
+def key(field_number: int, wire_type: int) -> bytes:
+    """ The key that comes before every field """
+    assert field_number > 0
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def varint_field(field_number: int, value: Union[int, bool]) -> bytes:
+    """ An int32/int64/uint32/uint64/bool/enum field, proto3 leaves out zero values """
+    if value == 0:
+        return b""
+    return key(field_number, WIRE_VARINT) + encode_varint(int(value))
+
+
+def bytes_field(field_number: int, value: bytes) -> bytes:
+    """ A bytes or embedded message field, proto3 leaves out empty values """
+    if len(value) == 0:
+        return b""
+    return key(field_number, WIRE_LEN) + encode_varint(len(value)) + value
+
+
+def string_field(field_number: int, value: str) -> bytes:
+    """ A string field, strings are always utf-8 """
+    return bytes_field(field_number, value.encode("utf-8"))
+
+
+def message_field(field_number: int, message: bytes) -> bytes:
+    """ An embedded message, unlike bytes_field an empty message is still written """
+    return key(field_number, WIRE_LEN) + encode_varint(len(message)) + message
+
+
+def write_delimited(stream: BinaryIO, message: bytes) -> int:
+    """ Writes the message prefixed with it's length, returns the number of bytes written """
+    prefix = encode_varint(len(message))
+    stream.write(prefix)
+    stream.write(message)
+    return len(prefix) + len(message)
+
+
+########## DECODING ##########
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """ Decodes the varint at pos, returns (value, position after the varint) """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise WireFormatError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise WireFormatError("Varint is too long")
+
+
+def iter_fields(data: bytes) -> Iterator[Tuple[int, int, Union[int, bytes]]]:
+    """ Yields (field number, wire type, value) for each field in a message """
+    pos = 0
+    while pos < len(data):
+        field_key, pos = decode_varint(data, pos)
+        field_number, wire_type = field_key >> 3, field_key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, pos = decode_varint(data, pos)
+            yield field_number, wire_type, value
+        elif wire_type == WIRE_LEN:
+            length, pos = decode_varint(data, pos)
+            if pos + length > len(data):
+                raise WireFormatError("Truncated length delimited field")
+            yield field_number, wire_type, data[pos : pos + length]
+            pos += length
+        elif wire_type == WIRE_I64:
+            if pos + 8 > len(data):
+                raise WireFormatError("Truncated fixed64 field")
+            yield field_number, wire_type, _I64.unpack_from(data, pos)[0]
+            pos += 8
+        elif wire_type == WIRE_I32:
+            if pos + 4 > len(data):
+                raise WireFormatError("Truncated fixed32 field")
+            yield field_number, wire_type, _I32.unpack_from(data, pos)[0]
+            pos += 4
+        else:
+            raise WireFormatError(f"Unsupported wire type {wire_type}")
+
+
+def read_varint(stream: BinaryIO) -> Union[int, None]:
+    """ Reads a varint from a stream, None is returned at the end of the stream """
+    result = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if len(byte) == 0:
+            if shift == 0:
+                return None
+            raise WireFormatError("Truncated varint")
+        result |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return result
+        shift += 7
+
+
+def iter_delimited(stream: BinaryIO) -> Iterator[bytes]:
+    """ Yields each message of a length-delimited stream as soon as it can be read """
+    while True:
+        length = read_varint(stream)
+        if length is None:
+            return
+        message = stream.read(length)
+        if len(message) != length:
+            raise WireFormatError("Truncated message")
+        yield message
@@ -0,0 +1,304 @@
+"""
+Exports the recovered ioctl interfaces into a SQLite database so they can be queried
+without running interface recovery again
+
+    files           path, directory
+    fops_structs    name, line, file_id
+    functions       name, refid
+    handlers        struct_id, fop_type, function_id     (a .ioctl = function entry)
+    commands        function_id, name, number, direction, size, argument
+    device_names    file_id, name
+
+The interfaces view joins handlers back to their struct, function and file, e.g every
+driver whose compat_ioctl is compat_ptr_ioctl:
+
+    SELECT file_path, struct_name FROM interfaces
+    WHERE fop_type = 'compat_ioctl' AND function = 'compat_ptr_ioctl'
+
+Ids are assigned here rather than looked up with a SELECT per row, the rows are then
+inserted with executemany one batch (and one transaction) at a time. The indexes are
+created after the rows are inserted since building them once is much faster than
+updating them for every row.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import sqlite3
+from logging import getLogger
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from skid.interface_recovery.ioctl import request
+
+logger = getLogger(__name__)
+
+# Records inserted per transaction
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    directory TEXT NOT NULL
+);
+CREATE TABLE fops_structs (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    name TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE TABLE functions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    refid TEXT NOT NULL
+);
+CREATE TABLE handlers (
+    id INTEGER PRIMARY KEY,
+    struct_id INTEGER NOT NULL REFERENCES fops_structs(id),
+    fop_type TEXT NOT NULL,
+    function_id INTEGER NOT NULL REFERENCES functions(id)
+);
+CREATE TABLE commands (
+    id INTEGER PRIMARY KEY,
+    function_id INTEGER NOT NULL REFERENCES functions(id),
+    name TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    argument TEXT NOT NULL
+);
+CREATE TABLE device_names (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    name TEXT NOT NULL
+);
+CREATE VIEW interfaces AS
+    SELECT
+        handlers.id AS handler_id,
+        files.path AS file_path,
+        files.directory AS directory,
+        fops_structs.name AS struct_name,
+        fops_structs.line AS struct_line_number,
+        handlers.fop_type AS fop_type,
+        functions.name AS function,
+        functions.refid AS refid,
+        functions.id AS function_id
+    FROM handlers
+    JOIN fops_structs ON fops_structs.id = handlers.struct_id
+    JOIN files ON files.id = fops_structs.file_id
+    JOIN functions ON functions.id = handlers.function_id;
+"""
+
+# GLOB (unlike LIKE) is case sensitive so the path prefix queries can use the indexes
+INDEXES = """
+CREATE INDEX files_directory ON files(directory);
+CREATE INDEX fops_structs_file ON fops_structs(file_id);
+CREATE INDEX fops_structs_name ON fops_structs(name);
+CREATE UNIQUE INDEX functions_name_refid ON functions(name, refid);
+CREATE INDEX handlers_struct ON handlers(struct_id);
+CREATE INDEX handlers_function ON handlers(function_id);
+CREATE INDEX handlers_fop_type_function ON handlers(fop_type, function_id);
+CREATE INDEX commands_function ON commands(function_id);
+CREATE INDEX commands_name ON commands(name);
+CREATE INDEX commands_number ON commands(number);
+CREATE INDEX device_names_file ON device_names(file_id);
+CREATE INDEX device_names_name ON device_names(name);
+"""
+
+# The columns rows are inserted into, in order
+COLUMNS = {
+    "files": ("id", "path", "directory"),
+    "fops_structs": ("id", "file_id", "name", "line"),
+    "functions": ("id", "name", "refid"),
+    "handlers": ("id", "struct_id", "fop_type", "function_id"),
+    "commands": ("function_id", "name", "number", "direction", "size", "argument"),
+    "device_names": ("file_id", "name"),
+}
+
+
+class _Rows:
+    """ The rows waiting to be inserted and the ids that were given out """
+
+    def __init__(self):
+        self.files: Dict[str, int] = dict()
+        self.structs: Dict[Tuple[int, str, int], int] = dict()
+        self.functions: Dict[Tuple[str, str], int] = dict()
+        self.handlers = 0
+        self.pending: Dict[str, List[Tuple]] = {table: list() for table in COLUMNS}
+
+    def file(self, path: str) -> int:
+        if path not in self.files:
+            self.files[path] = len(self.files) + 1
+            self.pending["files"].append((self.files[path], path, os.path.dirname(path)))
+        return self.files[path]
+
+    def struct(self, file_id: int, name: str, line: int) -> int:
+        key = (file_id, name, line)
+        if key not in self.structs:
+            self.structs[key] = len(self.structs) + 1
+            self.pending["fops_structs"].append((self.structs[key],) + key)
+        return self.structs[key]
+
+    def function(self, name: str, refid: str, commands: Sequence[request.IoctlCommand]) -> int:
+        """ Commands belong to the function, they are only added the first time it's seen """
+        key = (name, refid)
+        if key not in self.functions:
+            function_id = self.functions[key] = len(self.functions) + 1
+            self.pending["functions"].append((function_id, name, refid))
+            self.pending["commands"] += [
+                (function_id, c.name, c.number, c.direction, c.size, c.argument)
+                for c in commands
+            ]
+        return self.functions[key]
+
+    def handler(self, struct_id: int, fop_type: str, function_id: int):
+        self.handlers += 1
+        self.pending["handlers"].append((self.handlers, struct_id, fop_type, function_id))
+
+    def insert(self, connection: sqlite3.Connection):
+        """ Inserts the pending rows in a single transaction """
+        with connection:
+            for table, rows in self.pending.items():
+                if len(rows) > 0:
+                    columns = ", ".join(COLUMNS[table])
+                    placeholders = ", ".join("?" * len(COLUMNS[table]))
+                    connection.executemany(
+                        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows
+                    )
+                    rows.clear()
+
+
+def connect(database: str) -> sqlite3.Connection:
+    """ Opens an exported database, rows can be indexed by column name """
+    if not os.path.isfile(database):
+        raise FileNotFoundError(f"No such database: {database}")
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def export(
+    records: Iterable[Dict[str, Any]],
+    database: str,
+    commands: Optional[Dict[str, Tuple[request.IoctlCommand, ...]]] = None,
+    device_names: Optional[Dict[str, Iterable[str]]] = None,
+) -> int:
+    """
+    Writes the records into a new SQLite database, an existing database is replaced
+
+    Args:
+        records: file_operations records, this can be a lazy iterator such as api.recover()
+        commands: The resolved ioctl commands of each handler keyed by refid
+        device_names: The /dev names each file registers keyed by file path
+
+    Returns: The number of handlers written
+    """
+    commands = commands or dict()
+    if os.path.exists(database):
+        os.remove(database)
+
+    connection = sqlite3.connect(database)
+    try:
+        # Nothing needs to survive a crash half way through, the export is redone instead
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+
+        rows = _Rows()
+        for record in records:
+            file_id = rows.file(record["file_path"])
+            struct_id = rows.struct(file_id, record["struct_name"], record["struct_line_number"])
+            handler_commands = commands.get(record["refid"], ()) if record["refid"] else ()
+            function_id = rows.function(record["function"], record["refid"], handler_commands)
+            rows.handler(struct_id, record["fop_type"], function_id)
+            if rows.handlers % BATCH_SIZE == 0:
+                rows.insert(connection)
+
+        for path, names in (device_names or dict()).items():
+            file_id = rows.file(path)
+            rows.pending["device_names"] += [(file_id, name) for name in names]
+        rows.insert(connection)
+
+        with connection:
+            connection.executescript(INDEXES)
+            connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+    logger.info("Exported %s interfaces to %s", rows.handlers, database)
+    return rows.handlers
+
+
+########## QUERIES ##########
+
+
+def query(
+    database: str,
+    fop_type: Optional[str] = None,
+    function: Optional[str] = None,
+    struct_name: Optional[str] = None,
+    path: Optional[str] = None,
+    command: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Returns the interfaces matching every filter that is given, each with it's commands
+
+    Args:
+        path: A glob over the file path e.g 'drivers/staging/*'
+        command: The name or number (e.g '0x80285700') of a command the handler handles
+    """
+    clauses, parameters = list(), list()
+    equal = {"fop_type": fop_type, "function": function, "struct_name": struct_name}
+    for column, value in equal.items():
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            parameters.append(value)
+    if path is not None:
+        clauses.append("file_path GLOB ?")
+        parameters.append(path)
+    if command is not None:
+        clauses.append(
+            "function_id IN (SELECT function_id FROM commands WHERE name = ? OR number = ?)"
+        )
+        parameters += [command, parse_number(command)]
+
+    statement = "SELECT * FROM interfaces"
+    if len(clauses) > 0:
+        statement += " WHERE " + " AND ".join(clauses)
+    statement += " ORDER BY file_path, struct_line_number, fop_type"
+
+    connection = connect(database)
+    try:
+        interfaces = [dict(row) for row in connection.execute(statement, parameters)]
+        for interface in interfaces:
+            interface["commands"] = [
+                dict(row)
+                for row in connection.execute(
+                    "SELECT name, number, direction, size, argument FROM commands"
+                    " WHERE function_id = ? ORDER BY number",
+                    (interface["function_id"],),
+                )
+            ]
+    finally:
+        connection.close()
+    return interfaces
+
+
+def execute(database: str, statement: str) -> Tuple[Tuple[str, ...], List[Tuple]]:
+    """ Runs a statement against the database, returns the column names and the rows """
+    connection = connect(database)
+    try:
+        cursor = connection.execute(statement)
+        columns = tuple(column[0] for column in cursor.description or ())
+        return columns, [tuple(row) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def parse_number(text: str) -> Optional[int]:
+    """ The command number if the text is one, e.g '0x5705' or '22277' """
+    try:
+        return int(text, 0)
+    except ValueError:
+        return None
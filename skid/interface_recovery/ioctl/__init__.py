@@ -0,0 +1 @@
+from skid.interface_recovery.ioctl import request, layouts, evaluator
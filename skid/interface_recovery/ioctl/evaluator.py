@@ -0,0 +1,567 @@
+"""
+A constant folding evaluator for the C expressions that ioctl request numbers are made of
+
+Doxygen is run without the preprocessor so a case label such as `WDIOC_GETSUPPORT` is
+never expanded. Given the #defines, enums, typedefs and structs recovered from the XML
+this evaluates
+
+    #define WATCHDOG_IOCTL_BASE 'W'
+    #define WDIOC_GETSUPPORT    _IOR(WATCHDOG_IOCTL_BASE, 0, struct watchdog_info)
+
+to 0x80285700, a read of 40 bytes. _IO, _IOR, _IOW, _IOWR and _IOC are builtin (see
+ioctl.request), every other macro is expanded from it's definition. Every value, macro
+call and struct layout is memoized on the evaluator (failures included) so evaluating
+every command in the kernel only folds each constant once.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import re
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from skid.interface_recovery.ioctl import layouts, request
+from skid.interface_recovery.scan import lexer
+
+logger = getLogger(__name__)
+
+IOCTL_MACROS = {
+    "_IO": request.IOC_NONE,
+    "_IOR": request.IOC_READ,
+    "_IOW": request.IOC_WRITE,
+    "_IOWR": request.IOC_READ | request.IOC_WRITE,
+    "_IOR_BAD": request.IOC_READ,
+    "_IOW_BAD": request.IOC_WRITE,
+    "_IOWR_BAD": request.IOC_READ | request.IOC_WRITE,
+}
+
+TYPE_KEYWORDS = {
+    "struct",
+    "union",
+    "enum",
+    "const",
+    "volatile",
+    "signed",
+    "unsigned",
+    "char",
+    "short",
+    "int",
+    "long",
+    "float",
+    "double",
+    "void",
+    "_Bool",
+}
+
+_BINARY_PRECEDENCE = {
+    "||": 1,
+    "&&": 2,
+    "|": 3,
+    "^": 4,
+    "&": 5,
+    "==": 6,
+    "!=": 6,
+    "<": 7,
+    ">": 7,
+    "<=": 7,
+    ">=": 7,
+    "<<": 8,
+    ">>": 8,
+    "+": 9,
+    "-": 9,
+    "*": 10,
+    "/": 10,
+    "%": 10,
+}
+
+
+class UnresolvedConstant(Exception):
+    """ Raised when an expression refers to something that can't be folded to a constant """
+
+
+class Macro(NamedTuple):
+    """ A #define, params is None for object like macros """
+
+    name: str
+    params: Optional[Tuple[str, ...]]
+    body: str
+
+
+class EnumValue(NamedTuple):
+    """ An enumerator is the last explicit initializer plus how many enumerators since """
+
+    expression: str
+    offset: int
+
+
+class Record(NamedTuple):
+    """ The declared members of a struct or union """
+
+    kind: str
+    members: Tuple[layouts.Member, ...]
+
+
+@dataclass
+class ConstantTable:
+    """ Everything the evaluator can look up by name """
+
+    macros: Dict[str, Macro] = field(default_factory=dict)
+    enums: Dict[str, EnumValue] = field(default_factory=dict)
+    records: Dict[str, Record] = field(default_factory=dict)
+    typedefs: Dict[str, str] = field(default_factory=dict)
+    # enum name -> the names of it's enumerators
+    enum_types: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+    def merge(self, other: "ConstantTable"):
+        """ Adds the definitions of another table, the first definition of a name wins """
+        for mine, theirs in (
+            (self.macros, other.macros),
+            (self.enums, other.enums),
+            (self.records, other.records),
+            (self.typedefs, other.typedefs),
+            (self.enum_types, other.enum_types),
+        ):
+            for name, value in theirs.items():
+                mine.setdefault(name, value)
+
+    def __len__(self) -> int:
+        return len(self.macros) + len(self.enums) + len(self.records) + len(self.typedefs)
+
+
+class ConstantEvaluator:
+    """ Folds C constant expressions using the definitions in a ConstantTable """
+
+    def __init__(self, table: ConstantTable):
+        assert isinstance(table, ConstantTable)
+        self.table = table
+        self._values: Dict[str, int] = dict()
+        self._calls: Dict[str, int] = dict()
+        self._sizes: Dict[str, Tuple[int, int]] = dict()
+        self._layouts: Dict[str, layouts.Layout] = dict()
+        self._commands: Dict[str, request.IoctlCommand] = dict()
+        self._failed: Dict[str, str] = dict()
+        self._in_progress: set = set()
+
+    ########## PUBLIC ##########
+
+    def evaluate(self, expression: str) -> int:
+        """
+        Evaluates a constant C expression
+        Raises: UnresolvedConstant: If the expression can't be folded
+        """
+        return self.evaluate_tokens(lexer.tokenize_expression(expression))
+
+    def evaluate_tokens(self, tokens: List[lexer.Token]) -> int:
+        """ Evaluates an already tokenized expression """
+        if len(tokens) == 0:
+            raise UnresolvedConstant("Empty expression")
+        parser = _Parser(tokens, self)
+        value = parser.parse_expression()
+        if not parser.at_end():
+            raise UnresolvedConstant(f"Unexpected token {parser.peek().value}")
+        return value
+
+    def value(self, name: str) -> int:
+        """ Returns the value of an object like macro or enumerator """
+        return self._memoized(name, self._values, self._compute_value)
+
+    def layout(self, name: str) -> layouts.Layout:
+        """ Returns the layout of the struct or union with this name """
+        return self._memoized(f"struct {name}", self._layouts, lambda _: self._compute_layout(name))
+
+    def sizeof(self, type_str: str) -> Tuple[int, int]:
+        """ Returns the (size, align) of a C type name """
+        type_str = layouts.normalize_type(type_str)
+        dimensions = layouts.split_dimensions(type_str)
+        if len(dimensions) > 0:
+            size, align = self.sizeof(type_str[: type_str.index("[")])
+            for dim in dimensions:
+                size *= self.evaluate(dim)
+            return size, align
+
+        size = layouts.primitive_size(type_str)
+        if size is not None:
+            return size, size
+        if type_str == "long double":
+            return 16, 16
+
+        words = type_str.split()
+        if len(words) == 2 and words[0] in ("struct", "union"):
+            layout = self.layout(words[1])
+            return layout.size, layout.align
+        if type_str in self.table.typedefs:
+            return self._memoized_sizeof_typedef(type_str)
+        raise UnresolvedConstant(f"Unknown type {type_str}")
+
+    def command(self, name: str) -> request.IoctlCommand:
+        """
+        Resolves an ioctl command name (or any constant expression) to it's request number
+        Raises: UnresolvedConstant: If the command can't be folded
+        """
+
+        def compute(expression: str) -> request.IoctlCommand:
+            return request.decode(expression, self.evaluate(expression), self.argument(expression))
+
+        return self._memoized(f"command {name}", self._commands, lambda _: compute(name))
+
+    def argument(self, name: str) -> str:
+        """
+        Returns the argument type of an _IOR/_IOW/_IOWR command such as 'struct watchdog_info'
+        by following the macros until the ioctl macro is found, "" if there isn't one
+        """
+        tokens = lexer.tokenize_expression(name)
+        for _ in range(len(self.table.macros) + 1):
+            wrapped = len(tokens) > 2 and tokens[0].value == "("
+            if wrapped and lexer.find_matching(tokens, 0) == len(tokens) - 1:
+                tokens = tokens[1:-1]
+            elif len(tokens) > 1 and tokens[0].value in IOCTL_MACROS and tokens[1].value == "(":
+                parser = _Parser(tokens, self)
+                parser.pos = 1
+                args = parser.parse_arguments()
+                return self.type_name(args[2]) if len(args) == 3 else ""
+            elif len(tokens) == 1 and tokens[0].value in self.table.macros:
+                macro = self.table.macros[tokens[0].value]
+                if macro.params is not None:
+                    return ""
+                tokens = lexer.tokenize_expression(macro.body)
+            else:
+                return ""
+        return ""
+
+    def type_name(self, tokens: List[lexer.Token]) -> str:
+        """ Joins the tokens of a type, a macro that names a type is expanded """
+        if len(tokens) == 1 and not self.is_type(tokens):
+            macro = self.table.macros.get(tokens[0].value)
+            if macro is not None and macro.params is None:
+                return self.type_name(lexer.tokenize_expression(macro.body))
+        return re.sub(r" ?([\[\]]) ?", r"\1", " ".join(token.value for token in tokens))
+
+    def commands(self, names: Iterable[str]) -> Dict[str, request.IoctlCommand]:
+        """ Resolves every command that can be resolved, the rest are logged and skipped """
+        resolved = dict()
+        for name in names:
+            try:
+                resolved[name] = self.command(name)
+            except UnresolvedConstant as e:
+                logger.debug("Could not resolve ioctl command %s: %s", name, e)
+        return resolved
+
+    ########## MEMOIZATION ##########
+
+    def _memoized(self, key: str, cache: Dict, compute):
+        if key in cache:
+            return cache[key]
+        if key in self._failed:
+            raise UnresolvedConstant(self._failed[key])
+        if key in self._in_progress:
+            raise UnresolvedConstant(f"{key} is defined in terms of itself")
+
+        self._in_progress.add(key)
+        try:
+            cache[key] = compute(key)
+        except (UnresolvedConstant, ValueError, RecursionError) as e:
+            self._failed[key] = str(e)
+            raise UnresolvedConstant(self._failed[key]) from None
+        finally:
+            self._in_progress.discard(key)
+        return cache[key]
+
+    def _memoized_sizeof_typedef(self, name: str) -> Tuple[int, int]:
+        return self._memoized(
+            f"typedef {name}", self._sizes, lambda _: self.sizeof(self.table.typedefs[name])
+        )
+
+    ########## COMPUTATION ##########
+
+    def _compute_value(self, name: str) -> int:
+        if name in request.BUILTIN_CONSTANTS:
+            return request.BUILTIN_CONSTANTS[name]
+
+        macro = self.table.macros.get(name)
+        if macro is not None:
+            if macro.params is not None:
+                raise UnresolvedConstant(f"{name} is a function like macro")
+            return self.evaluate(macro.body)
+
+        enum = self.table.enums.get(name)
+        if enum is not None:
+            return self.evaluate(enum.expression) + enum.offset
+
+        raise UnresolvedConstant(f"{name} is not defined")
+
+    def _compute_layout(self, name: str) -> layouts.Layout:
+        record = self.table.records.get(name)
+        if record is None:
+            raise UnresolvedConstant(f"struct {name} is not defined")
+        return layouts.compute_layout(name, record.kind, record.members, self.sizeof, self.evaluate)
+
+    def call(self, name: str, args: List[List[lexer.Token]]) -> int:
+        """ Expands a function like macro with the given (unevaluated) arguments """
+        if name in IOCTL_MACROS:
+            return self._ioctl_macro(name, args)
+        if name == "_IOC":
+            if len(args) != 4:
+                raise UnresolvedConstant("_IOC takes 4 arguments")
+            values = [self.evaluate_tokens(arg) for arg in args]
+            return request.ioc(*values)
+
+        if name == "_IOC_TYPECHECK":
+            if len(args) != 1:
+                raise UnresolvedConstant("_IOC_TYPECHECK takes 1 argument")
+            return self.sizeof_tokens(args[0])
+
+        macro = self.table.macros.get(name)
+        if macro is None or macro.params is None:
+            raise UnresolvedConstant(f"{name} is not a function like macro")
+
+        key = f"{name}({', '.join(' '.join(t.value for t in arg) for arg in args)})"
+        return self._memoized(key, self._calls, lambda _: self._expand(macro, args))
+
+    def _expand(self, macro: Macro, args: List[List[lexer.Token]]) -> int:
+        params = macro.params or ()
+        variadic = len(params) > 0 and params[-1] in ("...", "__VA_ARGS__")
+        if len(args) != len(params) and not (variadic and len(args) >= len(params) - 1):
+            raise UnresolvedConstant(f"{macro.name} takes {len(params)} arguments")
+
+        bindings = dict(zip(params, args))
+        if variadic:
+            rest = args[len(params) - 1 :]
+            joined: List[lexer.Token] = list()
+            for i, arg in enumerate(rest):
+                joined += ([lexer.Token(lexer.PUNCT, ",", 0)] if i > 0 else []) + arg
+            bindings["__VA_ARGS__"] = joined
+
+        expanded: List[lexer.Token] = list()
+        for token in lexer.tokenize_expression(macro.body):
+            if token.value == "#":
+                raise UnresolvedConstant(f"{macro.name} uses stringification")
+            if token.kind == lexer.IDENT and token.value in bindings:
+                expanded += [lexer.Token(lexer.PUNCT, "(", 0)]
+                expanded += bindings[token.value]
+                expanded += [lexer.Token(lexer.PUNCT, ")", 0)]
+            else:
+                expanded.append(token)
+
+        if any(token.value == "##" for token in expanded):
+            raise UnresolvedConstant(f"{macro.name} uses token pasting")
+        return self.evaluate_tokens(expanded)
+
+    def _ioctl_macro(self, name: str, args: List[List[lexer.Token]]) -> int:
+        direction = IOCTL_MACROS[name]
+        expected = 2 if name == "_IO" else 3
+        if len(args) != expected:
+            raise UnresolvedConstant(f"{name} takes {expected} arguments")
+
+        type_ = self.evaluate_tokens(args[0])
+        nr = self.evaluate_tokens(args[1])
+        size = self.sizeof_tokens(args[2]) if expected == 3 else 0
+        return request.ioc(direction, type_, nr, size)
+
+    def sizeof_tokens(self, tokens: List[lexer.Token]) -> int:
+        """ The size of a type given as tokens, a macro that names a type is expanded first """
+        if self.is_type(tokens):
+            return self.sizeof(" ".join(t.value for t in tokens))[0]
+
+        if len(tokens) == 1 and tokens[0].kind == lexer.IDENT:
+            macro = self.table.macros.get(tokens[0].value)
+            if macro is not None and macro.params is None:
+                return self.sizeof_tokens(lexer.tokenize_expression(macro.body))
+        raise UnresolvedConstant(f"Can't take the size of {' '.join(t.value for t in tokens)}")
+
+    def is_type(self, tokens: List[lexer.Token]) -> bool:
+        """ Determines if the tokens are a type name rather than an expression """
+        if len(tokens) == 0 or tokens[0].kind != lexer.IDENT:
+            return False
+        first = tokens[0].value
+        if not (
+            first in TYPE_KEYWORDS
+            or first in layouts.PRIMITIVE_SIZES
+            or first in layouts.QUALIFIERS
+            or first in self.table.typedefs
+        ):
+            return False
+        return all(t.kind in (lexer.IDENT, lexer.NUMBER) or t.value in "*[]" for t in tokens)
+
+
+class _Parser:
+    """ Precedence climbing parser that evaluates as it goes """
+
+    def __init__(self, tokens: List[lexer.Token], evaluator: ConstantEvaluator):
+        self.tokens = tokens
+        self.evaluator = evaluator
+        self.pos = 0
+
+    def at_end(self) -> bool:
+        return self.pos >= len(self.tokens)
+
+    def peek(self) -> lexer.Token:
+        if self.at_end():
+            raise UnresolvedConstant("Unexpected end of expression")
+        return self.tokens[self.pos]
+
+    def next(self) -> lexer.Token:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value: str):
+        token = self.next()
+        if token.value != value:
+            raise UnresolvedConstant(f"Expected {value} but found {token.value}")
+
+    def parse_expression(self) -> int:
+        # The comma operator, the value is the last expression
+        value = self.parse_ternary()
+        while not self.at_end() and self.peek().value == ",":
+            self.next()
+            value = self.parse_ternary()
+        return value
+
+    def parse_ternary(self) -> int:
+        condition = self.parse_binary(1)
+        if self.at_end() or self.peek().value != "?":
+            return condition
+        self.next()
+        if_true = self.parse_expression()
+        self.expect(":")
+        if_false = self.parse_ternary()
+        return if_true if condition else if_false
+
+    def parse_binary(self, min_precedence: int) -> int:
+        left = self.parse_unary()
+        while not self.at_end():
+            operator = self.peek().value
+            precedence = _BINARY_PRECEDENCE.get(operator)
+            if precedence is None or precedence < min_precedence:
+                break
+            self.next()
+            right = self.parse_binary(precedence + 1)
+            left = apply_binary(operator, left, right)
+        return left
+
+    def parse_unary(self) -> int:
+        token = self.peek()
+        if token.value in ("-", "+", "~", "!"):
+            self.next()
+            value = self.parse_unary()
+            return {"-": -value, "+": value, "~": ~value, "!": int(not value)}[token.value]
+
+        if token.value == "(":
+            close = lexer.find_matching(self.tokens, self.pos)
+            inner = self.tokens[self.pos + 1 : close]
+            if self.evaluator.is_type(inner):
+                # A cast, the value is kept as is and truncated at the end
+                self.pos = close + 1
+                return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self) -> int:
+        token = self.next()
+        if token.value == "(":
+            value = self.parse_expression()
+            self.expect(")")
+            return value
+        if token.kind == lexer.NUMBER:
+            return parse_number(token.value)
+        if token.kind == lexer.CHAR:
+            return parse_char(token.value)
+        if token.kind != lexer.IDENT:
+            raise UnresolvedConstant(f"Unexpected token {token.value}")
+
+        if token.value == "sizeof":
+            return self.parse_sizeof()
+        if not self.at_end() and self.peek().value == "(":
+            return self.evaluator.call(token.value, self.parse_arguments())
+        return self.evaluator.value(token.value)
+
+    def parse_sizeof(self) -> int:
+        if self.at_end() or self.peek().value != "(":
+            raise UnresolvedConstant("sizeof of an expression is not supported")
+        close = lexer.find_matching(self.tokens, self.pos)
+        inner = self.tokens[self.pos + 1 : close]
+        self.pos = close + 1
+        return self.evaluator.sizeof_tokens(inner)
+
+    def parse_arguments(self) -> List[List[lexer.Token]]:
+        """ Splits the tokens of a macro call into it's arguments without evaluating them """
+        open_paren = self.pos
+        close = lexer.find_matching(self.tokens, open_paren)
+        self.pos = close + 1
+
+        args: List[List[lexer.Token]] = [[]]
+        i = open_paren + 1
+        while i < close:
+            token = self.tokens[i]
+            if token.value in ("(", "{", "["):
+                end = lexer.find_matching(self.tokens, i)
+                args[-1] += self.tokens[i : end + 1]
+                i = end + 1
+                continue
+            if token.value == ",":
+                args.append([])
+            else:
+                args[-1].append(token)
+            i += 1
+        return [] if args == [[]] else args
+
+
+def apply_binary(operator: str, left: int, right: int) -> int:
+    """ Applies a C binary operator, division truncates toward zero like C """
+    if operator in ("/", "%"):
+        if right == 0:
+            raise UnresolvedConstant("Division by zero")
+        quotient = abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)
+        return quotient if operator == "/" else left - quotient * right
+    if operator in ("<<", ">>") and right < 0:
+        raise UnresolvedConstant("Negative shift")
+
+    return {
+        "||": lambda: int(bool(left) or bool(right)),
+        "&&": lambda: int(bool(left) and bool(right)),
+        "|": lambda: left | right,
+        "^": lambda: left ^ right,
+        "&": lambda: left & right,
+        "==": lambda: int(left == right),
+        "!=": lambda: int(left != right),
+        "<": lambda: int(left < right),
+        ">": lambda: int(left > right),
+        "<=": lambda: int(left <= right),
+        ">=": lambda: int(left >= right),
+        "<<": lambda: left << right,
+        ">>": lambda: left >> right,
+        "+": lambda: left + right,
+        "-": lambda: left - right,
+        "*": lambda: left * right,
+    }[operator]()
+
+
+def parse_number(text: str) -> int:
+    """ Parses a C integer literal such as 0x1fUL, 017 or 0b101 """
+    digits = text.rstrip("uUlL")
+    try:
+        if digits[:2] in ("0x", "0X"):
+            return int(digits[2:], 16)
+        if digits[:2] in ("0b", "0B"):
+            return int(digits[2:], 2)
+        if len(digits) > 1 and digits[0] == "0":
+            return int(digits[1:], 8)
+        return int(digits, 10)
+    except ValueError:
+        raise UnresolvedConstant(f"{text} is not an integer constant") from None
+
+
+def parse_char(text: str) -> int:
+    """ Parses a C character literal such as 'W' or '\\n' """
+    body = text[text.index("'") + 1 : -1]
+    if len(body) == 1:
+        return ord(body)
+    escapes = {"n": 10, "t": 9, "r": 13, "0": 0, "\\": 92, "'": 39, '"': 34, "a": 7, "b": 8}
+    if len(body) == 2 and body[0] == "\\" and body[1] in escapes:
+        return escapes[body[1]]
+    if body.startswith("\\x"):
+        return int(body[2:], 16)
+    if body.startswith("\\") and body[1:].isdigit():
+        return int(body[1:], 8)
+    raise UnresolvedConstant(f"Unsupported character constant {text}")
@@ -0,0 +1,239 @@
+"""
+Computes the memory layout of C structs and unions from their members, this follows
+the x86_64 (LP64) System V ABI which is what the kernel uses on x86_64 and arm64
+
+    struct watchdog_info {
+        __u32 options;          offset 0,  size 4
+        __u32 firmware_version; offset 4,  size 4
+        __u8  identity[32];     offset 8,  size 32
+    };                          size 40, align 4
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+POINTER_SIZE = 8
+
+# Alignment is the same as the size for every type here
+PRIMITIVE_SIZES = {
+    "char": 1,
+    "signed char": 1,
+    "unsigned char": 1,
+    "_Bool": 1,
+    "bool": 1,
+    "short": 2,
+    "short int": 2,
+    "signed short": 2,
+    "unsigned short": 2,
+    "unsigned short int": 2,
+    "int": 4,
+    "signed": 4,
+    "signed int": 4,
+    "unsigned": 4,
+    "unsigned int": 4,
+    "long": 8,
+    "long int": 8,
+    "signed long": 8,
+    "unsigned long": 8,
+    "unsigned long int": 8,
+    "long long": 8,
+    "long long int": 8,
+    "signed long long": 8,
+    "unsigned long long": 8,
+    "unsigned long long int": 8,
+    "float": 4,
+    "double": 8,
+    "u8": 1,
+    "s8": 1,
+    "__u8": 1,
+    "__s8": 1,
+    "uint8_t": 1,
+    "int8_t": 1,
+    "u16": 2,
+    "s16": 2,
+    "__u16": 2,
+    "__s16": 2,
+    "__le16": 2,
+    "__be16": 2,
+    "uint16_t": 2,
+    "int16_t": 2,
+    "u32": 4,
+    "s32": 4,
+    "__u32": 4,
+    "__s32": 4,
+    "__le32": 4,
+    "__be32": 4,
+    "uint32_t": 4,
+    "int32_t": 4,
+    "u64": 8,
+    "s64": 8,
+    "__u64": 8,
+    "__s64": 8,
+    "__le64": 8,
+    "__be64": 8,
+    "uint64_t": 8,
+    "int64_t": 8,
+    "__aligned_u64": 8,
+    "size_t": 8,
+    "ssize_t": 8,
+    "loff_t": 8,
+    "off_t": 8,
+    "pid_t": 4,
+    "uid_t": 4,
+    "gid_t": 4,
+    "dev_t": 4,
+    "umode_t": 2,
+    "__kernel_size_t": 8,
+    "__kernel_ssize_t": 8,
+    "__kernel_long_t": 8,
+    "__kernel_ulong_t": 8,
+    "__kernel_off_t": 8,
+    "__kernel_loff_t": 8,
+    "__kernel_pid_t": 4,
+    "__kernel_uid32_t": 4,
+    "__kernel_gid32_t": 4,
+    "__kernel_time64_t": 8,
+    "uintptr_t": 8,
+    "intptr_t": 8,
+}
+
+UNSIGNED_PREFIXES = ("unsigned", "u", "__u", "__le", "__be", "size_t", "__kernel_u")
+
+QUALIFIERS = {"const", "volatile", "__user", "__iomem", "__kernel", "restrict", "__restrict"}
+
+_ARRAY_RE = re.compile(r"\[([^\]]*)\]")
+
+
+@dataclass(frozen=True)
+class Member:
+    """ A struct member as declared, array dimensions and bits are unevaluated C expressions """
+
+    name: str
+    type: str
+    dimensions: Tuple[str, ...] = ()
+    bits: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    A laid out struct member, offset and size are in bytes, count is the array length.
+    A bitfield's offset is it's storage unit, it starts shift bits into the unit
+    """
+
+    name: str
+    type: str
+    offset: int
+    size: int
+    count: int = 1
+    bits: int = 0
+    shift: int = 0
+
+
+@dataclass(frozen=True)
+class Layout:
+    """ The layout of a whole struct or union """
+
+    name: str
+    kind: str
+    size: int
+    align: int
+    fields: Tuple[Field, ...]
+
+
+def normalize_type(type_str: str) -> str:
+    """ Drops qualifiers and extra whitespace e.g 'const  struct foo __user *' -> 'struct foo *' """
+    spaced = type_str.replace("*", " * ")
+    words = [word for word in spaced.split() if word not in QUALIFIERS]
+    return " ".join(words).replace(" *", "*").replace("* ", "*").replace("*", " *").strip()
+
+
+def split_dimensions(declarator: str) -> Tuple[str, ...]:
+    """ Given an argsstring such as '[2][WDT_LEN]' returns ('2', 'WDT_LEN') """
+    return tuple(dim.strip() for dim in _ARRAY_RE.findall(declarator))
+
+
+def is_pointer(type_str: str) -> bool:
+    """ Pointers and function pointers are all POINTER_SIZE """
+    return type_str.endswith("*") or "(" in type_str
+
+
+def is_signed(type_str: str) -> bool:
+    """ Signedness of an integer type, char is signed like it is on x86 """
+    type_str = normalize_type(type_str)
+    if is_pointer(type_str) or type_str in ("_Bool", "bool"):
+        return False
+    return not type_str.startswith(UNSIGNED_PREFIXES)
+
+
+def primitive_size(type_str: str) -> Optional[int]:
+    """ Returns the size of a builtin or fixed width type, None if it isn't one """
+    type_str = normalize_type(type_str)
+    if is_pointer(type_str):
+        return POINTER_SIZE
+    if type_str.startswith("enum "):
+        return 4
+    return PRIMITIVE_SIZES.get(type_str)
+
+
+def align_up(value: int, align: int) -> int:
+    """ Rounds the value up to a multiple of align """
+    return (value + align - 1) // align * align
+
+
+def compute_layout(
+    name: str,
+    kind: str,
+    members: Tuple[Member, ...],
+    sizeof: Callable[[str], Tuple[int, int]],
+    evaluate: Callable[[str], int],
+) -> Layout:
+    """
+    Lays the members out one after another, or on top of each other for a union
+
+    Args:
+        sizeof: Returns (size, align) of a type name
+        evaluate: Evaluates a constant C expression such as an array dimension
+    """
+    assert kind in ("struct", "union")
+    fields: List[Field] = list()
+    bit_offset = 0
+    size_bits = 0
+    struct_align = 1
+
+    for member in members:
+        size, align = sizeof(member.type)
+        count = 1
+        for dim in member.dimensions:
+            # A flexible array member is 0 elements long
+            count *= evaluate(dim) if dim != "" else 0
+
+        if member.bits is not None:
+            bits = evaluate(member.bits)
+            unit = size * 8
+            if kind == "union":
+                bit_offset = 0
+            elif bits == 0 or bit_offset // unit != (bit_offset + bits - 1) // unit:
+                # Bitfields don't straddle a storage unit, width 0 closes the unit
+                bit_offset = align_up(bit_offset, unit)
+            if bits > 0:
+                offset = bit_offset // unit * size
+                shift = bit_offset - offset * 8
+                fields.append(Field(member.name, member.type, offset, size, 1, bits, shift))
+            bit_offset += bits
+        else:
+            if kind == "union":
+                bit_offset = 0
+            bit_offset = align_up(bit_offset, align * 8)
+            fields.append(Field(member.name, member.type, bit_offset // 8, size * count, count))
+            bit_offset += size * count * 8
+
+        struct_align = max(struct_align, align)
+        size_bits = max(size_bits, bit_offset)
+
+    total = align_up(align_up(size_bits, 8) // 8, struct_align)
+    return Layout(name, kind, total, struct_align, tuple(fields))
@@ -0,0 +1,104 @@
+"""
+Encodes and decodes ioctl request numbers the same way as the kernel's
+include/uapi/asm-generic/ioctl.h
+
+     31 30 29                 16 15            8 7             0
+    +-----+---------------------+---------------+---------------+
+    | dir |        size         |     type      |      nr       |
+    +-----+---------------------+---------------+---------------+
+
+The generic layout is used by x86, arm and most other architectures. powerpc, mips,
+sparc and alpha use a 13 bit size and a 3 bit direction which is not modelled here.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+from typing import NamedTuple
+
+IOC_NRBITS = 8
+IOC_TYPEBITS = 8
+IOC_SIZEBITS = 14
+IOC_DIRBITS = 2
+
+IOC_NRSHIFT = 0
+IOC_TYPESHIFT = IOC_NRSHIFT + IOC_NRBITS
+IOC_SIZESHIFT = IOC_TYPESHIFT + IOC_TYPEBITS
+IOC_DIRSHIFT = IOC_SIZESHIFT + IOC_SIZEBITS
+
+IOC_NONE = 0
+IOC_WRITE = 1
+IOC_READ = 2
+
+DIRECTIONS = {
+    IOC_NONE: "none",
+    IOC_WRITE: "write",
+    IOC_READ: "read",
+    IOC_READ | IOC_WRITE: "read|write",
+}
+
+# The constants a header would get from <asm-generic/ioctl.h>
+BUILTIN_CONSTANTS = {
+    "_IOC_NRBITS": IOC_NRBITS,
+    "_IOC_TYPEBITS": IOC_TYPEBITS,
+    "_IOC_SIZEBITS": IOC_SIZEBITS,
+    "_IOC_DIRBITS": IOC_DIRBITS,
+    "_IOC_NRSHIFT": IOC_NRSHIFT,
+    "_IOC_TYPESHIFT": IOC_TYPESHIFT,
+    "_IOC_SIZESHIFT": IOC_SIZESHIFT,
+    "_IOC_DIRSHIFT": IOC_DIRSHIFT,
+    "_IOC_NONE": IOC_NONE,
+    "_IOC_WRITE": IOC_WRITE,
+    "_IOC_READ": IOC_READ,
+}
+
+
+class IoctlCommand(NamedTuple):
+    """
+    A resolved ioctl request number, size is the size of the argument in bytes and
+    argument is it's C type such as 'struct watchdog_info' ("" if it's not known)
+    """
+
+    name: str
+    number: int
+    direction: str
+    type: int
+    nr: int
+    size: int
+    argument: str = ""
+
+
+def ioc(direction: int, type_: int, nr: int, size: int) -> int:
+    """
+    Builds the request number like _IOC(dir, type, nr, size)
+    Raises: ValueError: If a field does not fit, the kernel refuses to compile these
+    """
+    for value, bits, field in (
+        (direction, IOC_DIRBITS, "direction"),
+        (type_, IOC_TYPEBITS, "type"),
+        (nr, IOC_NRBITS, "nr"),
+        (size, IOC_SIZEBITS, "size"),
+    ):
+        if not 0 <= value < (1 << bits):
+            raise ValueError(f"ioctl {field} {value} does not fit in {bits} bits")
+
+    return (
+        (direction << IOC_DIRSHIFT)
+        | (type_ << IOC_TYPESHIFT)
+        | (nr << IOC_NRSHIFT)
+        | (size << IOC_SIZESHIFT)
+    )
+
+
+def decode(name: str, number: int, argument="") -> IoctlCommand:
+    """ Splits a 32 bit request number back into it's fields """
+    number &= 0xFFFFFFFF
+    return IoctlCommand(
+        name=name,
+        number=number,
+        direction=DIRECTIONS[(number >> IOC_DIRSHIFT) & ((1 << IOC_DIRBITS) - 1)],
+        type=(number >> IOC_TYPESHIFT) & ((1 << IOC_TYPEBITS) - 1),
+        nr=(number >> IOC_NRSHIFT) & ((1 << IOC_NRBITS) - 1),
+        size=(number >> IOC_SIZESHIFT) & ((1 << IOC_SIZEBITS) - 1),
+        argument=argument,
+    )
@@ -0,0 +1,8 @@
+"""
+libclang frontend, an alternative to doxygen for source trees that can be built
+Author: Luke Goddard
+Date: 2020
+"""
+
+from skid.interface_recovery.libclang import compile_commands
+from skid.interface_recovery.libclang import find_structs
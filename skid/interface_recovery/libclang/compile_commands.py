@@ -0,0 +1,107 @@
+"""
+Loads a compile_commands.json compilation database, for the kernel this can be generated
+with `scripts/clang-tools/gen_compile_commands.py` after a build
+
+    [
+        {
+            "directory": "/home/luke/linux",
+            "command": "gcc -Wp,-MMD,... -nostdinc -I./include -D__KERNEL__ -c -o drivers/watchdog/alim7101_wdt.o drivers/watchdog/alim7101_wdt.c",
+            "file": "drivers/watchdog/alim7101_wdt.c"
+        },
+    ]
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import os
+import shlex
+from dataclasses import dataclass
+from logging import getLogger
+from typing import List, Tuple
+
+logger = getLogger(__name__)
+
+# Arguments that only gcc understands, libclang would complain about every one of them
+GCC_ONLY_FLAGS = (
+    "-fconserve-stack",
+    "-fno-var-tracking-assignments",
+    "-fmerge-constants",
+    "-fno-allow-store-data-races",
+    "-mindirect-branch=",
+    "-mrecord-mcount",
+    "-mabi=lp64",
+    "-Wno-maybe-uninitialized",
+    "-Wno-alloc-size-larger-than",
+    "-Wp,",
+)
+
+# Arguments that take the next argument as their value and are not needed for parsing
+DROP_WITH_VALUE = {"-o", "-MF", "-MT", "-MQ"}
+DROP_FLAGS = {"-c", "-MD", "-MMD", "-MP"}
+
+
+@dataclass(frozen=True)
+class CompileCommand:
+    """ A single translation unit from the compilation database """
+
+    directory: str
+    file: str
+    arguments: Tuple[str, ...]
+
+    @property
+    def path(self) -> str:
+        """ Absolute path to the source file """
+        return os.path.normpath(os.path.join(self.directory, self.file))
+
+
+def load(location: str) -> Tuple[CompileCommand, ...]:
+    """
+    Loads the C translation units from a compile_commands.json
+    Raises:
+        FileNotFoundError: If the database does not exist
+        JSONDecodeError: If the database is not valid json
+    """
+    assert isinstance(location, str)
+    if not os.path.exists(location):
+        raise FileNotFoundError(f"compile_commands.json does not exist at: {location}")
+
+    with open(location, "r") as db_f:
+        entries = json.load(db_f)
+
+    commands = [
+        parse_entry(entry) for entry in entries if entry.get("file", "").endswith(".c")
+    ]
+    logger.info("Found %s C translation units in %s", len(commands), location)
+    return tuple(commands)
+
+
+def parse_entry(entry: dict) -> CompileCommand:
+    """ Converts a single compilation database entry into a CompileCommand """
+    if "arguments" in entry:
+        argv = list(entry["arguments"])
+    else:
+        argv = shlex.split(entry["command"])
+    directory = entry["directory"]
+    return CompileCommand(directory, entry["file"], tuple(clean_arguments(argv, entry["file"])))
+
+
+def clean_arguments(argv: List[str], source_file: str) -> List[str]:
+    """
+    Drops the compiler, the source file, output arguments and gcc only flags so
+    only the arguments libclang needs for preprocessing are left
+    """
+    cleaned = list()
+    skip_next = False
+    for arg in argv[1:]:
+        if skip_next:
+            skip_next = False
+            continue
+        if arg in DROP_WITH_VALUE:
+            skip_next = True
+            continue
+        if arg in DROP_FLAGS or arg == source_file or arg.startswith(GCC_ONLY_FLAGS):
+            continue
+        cleaned.append(arg)
+    return cleaned
@@ -0,0 +1,217 @@
+"""
+Finds file_operations structs with libclang instead of doxygen
+
+Each translation unit from compile_commands.json is parsed with the arguments it is built
+with, so unlike the doxygen frontend the C preprocessor is run properly and macros such as
+`.unlocked_ioctl = MY_IOCTL` are resolved. The designated initializers show up in the AST as:
+
+    VAR_DECL wdt_fops (const struct file_operations)
+      INIT_LIST_EXPR
+        UNEXPOSED_EXPR
+          MEMBER_REF unlocked_ioctl
+          UNEXPOSED_EXPR
+            DECL_REF_EXPR fop_ioctl
+
+The records have the same keys as doxygen.find_structs.convert_line_to_dict but they are
+not interchangeable: the refid is the clang USR of the handler if it is declared in the
+driver itself and "" otherwise. It never matches a doxygen refid, so these records can't be
+joined with anything keyed by refid (the resolved commands, the sqlite commands table or
+--probe-handler), api.RecoveryOptions rejects those outputs with --frontend=clang.
+
+Function bodies are skipped while parsing, so only the handlers are found. The ioctl
+commands are read from the handler bodies, which still needs the doxygen XML.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+from logging import getLogger
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from skid.interface_recovery import libclang
+from skid.utils import logs, utils
+
+try:
+    from clang import cindex  # type: ignore
+except ImportError:
+    cindex = None
+
+logger = getLogger(__name__)
+
+POSSIBLE_IOCTL_NAMES = {"unlocked_ioctl", "compat_ioctl"}
+
+# Each worker process creates it's own libclang index
+_INDEX = None
+
+
+class LibclangException(Exception):
+    """ Raised when libclang is not available or fails to parse a translation unit """
+
+
+def is_available() -> bool:
+    """ Returns True if the clang python bindings and libclang can be loaded """
+    if cindex is None:
+        return False
+    try:
+        cindex.conf.lib  # pylint: disable=pointless-statement
+    except cindex.LibclangError:
+        return False
+    return True
+
+
+########## COMPILATION DATABASE ##########
+
+
+def find_fileop_structs(compile_commands_loc: str, processes=None) -> Tuple[Dict[str, Any], ...]:
+    """
+    Parses every translation unit in the compilation database and returns all
+    file_operations structs that contain ioctl
+    """
+    commands = libclang.compile_commands.load(compile_commands_loc)
+    struct_elements = []
+    bar_tit = utils.format_alive_bar_title("Finding file_operations structs with libclang")
+    with utils.progress_bar(len(commands), title=bar_tit) as bar:
+        for structs in iter_fileop_structs_by_unit(commands, processes):
+            bar()
+            struct_elements += structs
+
+    logger.debug("Found %s ioctl file_operations handler function pointers", len(struct_elements))
+    return tuple(struct_elements)
+
+
+def iter_fileop_structs(compile_commands_loc: str, processes=None) -> Iterator[Dict[str, Any]]:
+    """ Lazily yields the file_operations structs as each translation unit is parsed """
+    commands = libclang.compile_commands.load(compile_commands_loc)
+    for structs in iter_fileop_structs_by_unit(commands, processes):
+        yield from structs
+
+
+def iter_fileop_structs_by_unit(
+    commands: Tuple["libclang.compile_commands.CompileCommand", ...], processes=None
+) -> Iterator[List[Dict[str, Any]]]:
+    """ Parses the translation units in parallel and yields the structs found in each """
+    if not is_available():
+        raise LibclangException("The clang python bindings or libclang could not be loaded")
+    if len(commands) == 0:
+        return
+
+    with logs.pool(processes) as pool:
+        yield from pool.imap_unordered(find_fileop_structs_in_unit, commands)
+
+
+########## SINGLE TRANSLATION UNIT ##########
+
+
+def parse(command: "libclang.compile_commands.CompileCommand", skip_bodies=True):
+    """
+    Parses a translation unit. Function bodies are skipped by default since the
+    file_operations initializers don't need them
+    """
+    global _INDEX  # pylint: disable=global-statement
+    if _INDEX is None:
+        _INDEX = cindex.Index.create()
+
+    options = cindex.TranslationUnit.PARSE_INCOMPLETE
+    if skip_bodies:
+        options |= cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+
+    cwd = os.getcwd()
+    try:
+        # relative include paths in the compilation database are relative to it's directory
+        os.chdir(command.directory)
+        return _INDEX.parse(command.path, args=list(command.arguments), options=options)
+    finally:
+        os.chdir(cwd)
+
+
+def find_fileop_structs_in_unit(
+    command: "libclang.compile_commands.CompileCommand",
+) -> List[Dict[str, Any]]:
+    """ Loop's through the top level declarations looking for file_operations structs """
+    logger.debug("Parsing translation unit %s", command.path)
+    try:
+        unit = parse(command)
+    except cindex.TranslationUnitLoadError as e:
+        logger.error("libclang failed to parse %s: %s", command.path, e)
+        return list()
+
+    return [
+        record
+        for cursor in unit.cursor.get_children()
+        if is_file_ops_struct(cursor, unit)
+        for record in parse_ioctl_file_operations(cursor, unit)
+    ]
+
+
+def is_file_ops_struct(cursor, unit) -> bool:
+    """ Determines if the top level cursor is a file_operations variable defined in the unit """
+    if cursor.kind != cindex.CursorKind.VAR_DECL or "file_operations" not in cursor.type.spelling:
+        return False
+    if cursor.location.file is None or cursor.location.file.name != unit.spelling:
+        return False
+    return get_init_list(cursor) is not None
+
+
+def get_init_list(cursor) -> Optional[Any]:
+    """ Returns the INIT_LIST_EXPR of a variable or None """
+    for child in cursor.get_children():
+        if child.kind == cindex.CursorKind.INIT_LIST_EXPR:
+            return child
+    return None
+
+
+def parse_ioctl_file_operations(cursor, unit) -> List[Dict[str, Any]]:
+    """ Returns a record for each ioctl member in the designated initializer """
+    records = list()
+    for fop_type, value in iter_designated_initializers(get_init_list(cursor)):
+        if fop_type not in POSSIBLE_IOCTL_NAMES:
+            continue
+
+        decl_ref = find_decl_ref(value)
+        if decl_ref is None:
+            continue
+
+        logger.debug("Found fops struct: %s:%s", unit.spelling, cursor.location.line)
+        records.append(convert_to_dict(decl_ref, cursor, unit, fop_type))
+    return records
+
+
+def iter_designated_initializers(init_list) -> Iterator[Tuple[str, Any]]:
+    """ Yields (member name, value cursor) for each `.member = value` in the initializer """
+    for init in init_list.get_children():
+        children = list(init.get_children())
+        if len(children) == 2 and children[0].kind == cindex.CursorKind.MEMBER_REF:
+            yield children[0].spelling, children[1]
+
+
+def find_decl_ref(cursor) -> Optional[Any]:
+    """ Finds the function that the initializer value refers to through any casts """
+    if cursor.kind == cindex.CursorKind.DECL_REF_EXPR:
+        return cursor
+    for child in cursor.get_children():
+        found = find_decl_ref(child)
+        if found is not None:
+            return found
+    return None
+
+
+def convert_to_dict(decl_ref, struct_cursor, unit, fop_type: str) -> Dict[str, Any]:
+    """ Formats the same record as doxygen.find_structs.convert_line_to_dict """
+    referenced = decl_ref.referenced
+    refid = ""
+    if (
+        referenced is not None
+        and referenced.location.file is not None
+        and referenced.location.file.name == unit.spelling
+    ):
+        refid = referenced.get_usr()
+
+    return {
+        "function": decl_ref.spelling,
+        "refid": refid,
+        "struct_name": struct_cursor.spelling,
+        "struct_line_number": struct_cursor.location.line,
+        "file_path": os.path.relpath(unit.spelling),
+        "fop_type": fop_type,
+    }
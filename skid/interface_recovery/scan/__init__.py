@@ -0,0 +1,9 @@
+"""
+Quick triage frontend, finds ioctl file_operations directly in the C sources without
+running doxygen
+Author: Luke Goddard
+Date: 2020
+"""
+
+from skid.interface_recovery.scan import lexer
+from skid.interface_recovery.scan import find_structs
@@ -0,0 +1,206 @@
+"""
+Quick triage scanner, finds file_operations structs with ioctl directly in the C sources
+
+This is much less accurate than doxygen or libclang, nothing is preprocessed so a struct
+hidden behind a macro is missed, but it can list the ioctl-bearing drivers of a fresh tree
+in about a minute. It looks for designated initializers such as:
+
+    static const struct file_operations wdt_fops = {
+        .owner          = THIS_MODULE,
+        .unlocked_ioctl = fop_ioctl,
+        .compat_ioctl   = compat_ptr_ioctl,
+    };
+
+and produces the same records as doxygen.find_structs.convert_line_to_dict, the refid is
+always "" since there is no doxygen XML to refer to.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+from logging import getLogger
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from skid.interface_recovery.scan import lexer
+from skid.utils import logs, tuning, utils
+
+logger = getLogger(__name__)
+
+POSSIBLE_IOCTL_NAMES = {"unlocked_ioctl", "compat_ioctl"}
+QUALIFIERS = {"const", "volatile", "static", "extern"}
+SCAN_CHUNKSIZE = 16
+
+# Files that don't contain this are not tokenized at all
+NEEDLE = b"file_operations"
+
+
+########## SOURCE TREE ##########
+
+
+def list_c_files(source_dir: str) -> Tuple[str, ...]:
+    """ Returns every .c file under the source directory """
+    assert os.path.isdir(source_dir)
+    return tuple(
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(source_dir)
+        for filename in sorted(filenames)
+        if filename.endswith(".c")
+    )
+
+
+def find_fileop_structs(source_dir: str, processes=None) -> Tuple[Dict[str, Any], ...]:
+    """
+    Scans every .c file in the source tree and returns all file_operations
+    structs that contain ioctl
+    """
+    c_files = list_c_files(source_dir)
+    struct_elements = []
+    bar_tit = utils.format_alive_bar_title("Scanning C sources for file_operations structs")
+    with utils.progress_bar(len(c_files), title=bar_tit) as bar:
+        for structs in iter_fileop_structs_by_file(c_files, processes):
+            bar()
+            struct_elements += structs
+
+    logger.debug("Found %s ioctl file_operations handler function pointers", len(struct_elements))
+    return tuple(struct_elements)
+
+
+def iter_fileop_structs(source_dir: str, processes=None) -> Iterator[Dict[str, Any]]:
+    """ Lazily yields the file_operations structs as each file is scanned """
+    for structs in iter_fileop_structs_by_file(list_c_files(source_dir), processes):
+        yield from structs
+
+
+def iter_fileop_structs_by_file(
+    c_files: Tuple[str, ...], processes=None
+) -> Iterator[List[Dict[str, Any]]]:
+    """ Scans the files in parallel and yields the structs found in each """
+    if len(c_files) == 0:
+        return
+
+    with logs.pool(processes) as pool:
+        chunksize = tuning.get_chunksize("scan", SCAN_CHUNKSIZE)
+        yield from pool.imap_unordered(find_fileop_structs_in_file, c_files, chunksize=chunksize)
+
+
+########## SINGLE C FILE ##########
+
+
+def find_fileop_structs_in_file(c_file: str) -> List[Dict[str, Any]]:
+    """ Tokenizes a C file and returns a record for every ioctl member of a fops struct """
+    try:
+        with open(c_file, "rb") as c_f:
+            source = c_f.read()
+    except OSError as e:
+        logger.error(e)
+        return list()
+
+    if NEEDLE not in source:
+        return list()
+
+    logger.debug("Scanning %s", c_file)
+    tokens = list(lexer.tokenize(source.decode("utf-8", errors="replace")))
+    return find_fileop_structs_in_tokens(tokens, c_file)
+
+
+def find_fileop_structs_in_tokens(tokens: List[lexer.Token], c_file: str) -> List[Dict[str, Any]]:
+    """ Finds every `struct file_operations <name> = {...}` in the tokens """
+    records = list()
+    for i, token in enumerate(tokens):
+        if token.value != "file_operations" or i == 0 or tokens[i - 1].value != "struct":
+            continue
+
+        found = find_initializer(tokens, i + 1)
+        if found is None:
+            continue
+
+        name_token, open_brace = found
+        close_brace = lexer.find_matching(tokens, open_brace)
+        for fop_type, value in iter_designated_initializers(tokens[open_brace + 1 : close_brace]):
+            if fop_type not in POSSIBLE_IOCTL_NAMES:
+                continue
+            function = parse_function_name(value)
+            if function == "":
+                continue
+            logger.debug("Found fops struct: %s:%s", c_file, name_token.line)
+            records.append(convert_to_dict(function, name_token, c_file, fop_type))
+    return records
+
+
+def find_initializer(tokens: List[lexer.Token], start: int) -> Optional[Tuple[lexer.Token, int]]:
+    """
+    Starting just after `struct file_operations` returns the variable name token and
+    the index of the opening brace of it's initializer. None is returned for pointers,
+    arrays, declarations and function parameters
+    """
+    idents = list()
+    i = start
+    while i < len(tokens):
+        token = tokens[i]
+        if token.kind == lexer.IDENT:
+            if i + 1 < len(tokens) and tokens[i + 1].value == "(":
+                # attribute macros such as __attribute__((unused)) or __section(".x")
+                i = lexer.find_matching(tokens, i + 1)
+            elif token.value not in QUALIFIERS:
+                idents.append(token)
+        elif token.value == "=" and len(idents) > 0:
+            if i + 1 >= len(tokens) or tokens[i + 1].value != "{":
+                return None
+            # __maybe_unused, __read_mostly, ... are skipped unless it's the only name
+            names = [t for t in idents if not t.value.startswith("__")] or idents
+            return names[0], i + 1
+        else:
+            # '*', '[', ';', ',', ')' and anything else means this is not a definition
+            return None
+        i += 1
+    return None
+
+
+def iter_designated_initializers(
+    tokens: List[lexer.Token],
+) -> Iterator[Tuple[str, List[lexer.Token]]]:
+    """ Yields (member name, value tokens) for each `.member = value` in the initializer """
+    i = 0
+    while i < len(tokens):
+        # Find the end of this entry, commas inside brackets don't count
+        end = i
+        while end < len(tokens) and tokens[end].value != ",":
+            if tokens[end].value in ("(", "{", "["):
+                end = lexer.find_matching(tokens, end)
+            end += 1
+
+        entry = tokens[i:end]
+        if (
+            len(entry) >= 4
+            and entry[0].value == "."
+            and entry[1].kind == lexer.IDENT
+            and entry[2].value == "="
+        ):
+            yield entry[1].value, entry[3:]
+        i = end + 1
+
+
+def parse_function_name(value: List[lexer.Token]) -> str:
+    """
+    Given the tokens of the value such as `fop_ioctl` or `(void *)fop_ioctl` returns
+    the function name, the last identifier is used. On error "" is returned
+    """
+    for token in reversed(value):
+        if token.kind == lexer.IDENT:
+            return token.value
+    return ""
+
+
+def convert_to_dict(
+    function: str, name_token: lexer.Token, c_file: str, fop_type: str
+) -> Dict[str, Any]:
+    """ Formats the same record as doxygen.find_structs.convert_line_to_dict """
+    return {
+        "function": function,
+        "refid": "",
+        "struct_name": name_token.value,
+        "struct_line_number": name_token.line,
+        "file_path": os.path.relpath(c_file),
+        "fop_type": fop_type,
+    }
@@ -0,0 +1,121 @@
+"""
+A lightweight C lexer
+
+This does not preprocess anything, comments are dropped and preprocessor directives are
+either dropped or kept as a single token. Macros are just identifiers so code such as
+
+    static const struct file_operations wdt_fops = {
+    #ifdef CONFIG_COMPAT
+        .compat_ioctl = compat_ptr_ioctl,
+    #endif
+    };
+
+lexes to the tokens of both branches, which is what the quick triage scanner wants. Anything
+the lexer does not understand becomes an OTHER token instead of raising an exception.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import re
+from typing import Iterator, List, NamedTuple, Tuple
+
+IDENT = "IDENT"
+NUMBER = "NUMBER"
+STRING = "STRING"
+CHAR = "CHAR"
+PUNCT = "PUNCT"
+DIRECTIVE = "DIRECTIVE"
+OTHER = "OTHER"
+
+_TOKEN_SPEC = (
+    ("DIRECTIVE", r"^[ \t]*\#(?:\\\n|/\*.*?\*/|[^\n])*"),
+    ("COMMENT", r"/\*.*?(?:\*/|\Z)|//(?:\\\n|[^\n])*"),
+    ("STRING", r'(?:u8|[uUL])?"(?:\\.|\\\n|[^"\\\n])*"'),
+    ("CHAR", r"(?:[uUL])?'(?:\\.|[^'\\\n])*'"),
+    ("NUMBER", r"\.?\d(?:[eEpP][+-]|[\w.])*"),
+    ("IDENT", r"[A-Za-z_$][\w$]*"),
+    (
+        "PUNCT",
+        r"<<=|>>=|\.\.\.|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||##|[-+*/%&|^]="
+        r"|[{}\[\]();,.<>=!~?:*/%+\-&|^\#]",
+    ),
+    ("NEWLINE", r"\n"),
+    ("SKIP", r"[ \t\r\f\v]+|\\\n"),
+    ("OTHER", r"."),
+)
+_TOKEN_RE = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in _TOKEN_SPEC), re.M | re.S
+)
+_MULTILINE_KINDS = {"DIRECTIVE", "COMMENT", "STRING", "SKIP"}
+
+
+class Token(NamedTuple):
+    """ A single C token, line is 1-indexed """
+
+    kind: str
+    value: str
+    line: int
+
+
+def tokenize(text: str, keep_directives=False) -> Iterator[Token]:
+    """
+    Yields the tokens of the C source code, comments and whitespace are dropped.
+    Preprocessor directives are only yielded (as a single DIRECTIVE token) if
+    keep_directives is True
+    """
+    assert isinstance(text, str)
+    line = 1
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "NEWLINE":
+            line += 1
+            continue
+
+        if kind in ("IDENT", "NUMBER", "STRING", "CHAR", "PUNCT", "OTHER"):
+            yield Token(kind, value, line)
+        elif kind == "DIRECTIVE" and keep_directives:
+            yield Token(kind, value.strip(), line)
+
+        if kind in _MULTILINE_KINDS:
+            line += value.count("\n")
+
+
+def tokenize_expression(text: str) -> List[Token]:
+    """ Tokenizes a single C expression such as a macro body """
+    return list(tokenize(text))
+
+
+def split_directive(token: Token) -> Tuple[str, str]:
+    """
+    Splits a DIRECTIVE token into it's name and the rest of the line with line
+    continuations and comments removed e.g '#define A 1 /* one */' -> ('define', 'A 1')
+    """
+    assert token.kind == DIRECTIVE
+    body = re.sub(r"/\*.*?\*/|//.*$", " ", token.value.replace("\\\n", " "), flags=re.S | re.M)
+    parts = body.strip()[1:].split(None, 1)
+    if len(parts) == 0:
+        return "", ""
+    return parts[0], parts[1].strip() if len(parts) > 1 else ""
+
+
+def find_matching(tokens: List[Token], start: int) -> int:
+    """
+    Given the index of an opening bracket returns the index of the closing bracket,
+    if the brackets are unbalanced the index of the last token is returned
+    """
+    opening = tokens[start].value
+    closing = {"(": ")", "{": "}", "[": "]"}[opening]
+    depth = 0
+    for i in range(start, len(tokens)):
+        value = tokens[i].value
+        if tokens[i].kind != PUNCT:
+            continue
+        if value == opening:
+            depth += 1
+        elif value == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
@@ -0,0 +1,331 @@
+"""
+Admission control for pools that parse XML files, files are only handed to the workers
+while the projected memory use stays under a budget
+
+lxml trees are many times bigger than the XML they came from, so a pool that parses a
+batch of 200 MB compounds on every core at once can use more memory than the machine
+has. Each file's footprint is estimated from it's size:
+
+    footprint = expansion ratio * size + FILE_OVERHEAD
+
+and a file is only submitted while
+
+    RSS of this process + sum(private RSS of each worker)
+                        + sum(footprint of files in flight) <= budget
+
+The expansion ratio starts at DEFAULT_EXPANSION and is then learnt from the files that
+were parsed. Workers measure the peak RSS of each call (with getrusage, which is exact
+whenever a call sets a new high-water mark) and report it back with their current RSS.
+A file that doesn't fit on it's own is still parsed once nothing else is in flight.
+With a supervisor.pool() an item that is quarantined yields nothing.
+
+glibc keeps the memory of a freed tree in the worker, so after a few big files every
+worker would hold hundreds of MB while idle. Workers call malloc_trim after each call
+to give it back.
+
+Pools running at the same time (stages, see utils.stages) share the budget, the
+projection of each includes the workers and files in flight of the others.
+
+The budget defaults to BUDGET_FRACTION of the available memory and can be set with
+set_budget() (skid.py ir --memory-budget=8G).
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import re
+import resource
+import threading
+from collections import deque
+from logging import getLogger
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from skid.utils import supervisor
+
+logger = getLogger(__name__)
+
+# Tree size / file size before anything has been measured, doxygen's XML is mostly
+# small elements which lxml expands around 15-20x
+DEFAULT_EXPANSION = 20.0
+
+# Memory used for a file regardless of it's size (the result, parser state, ...)
+FILE_OVERHEAD = 1 << 20
+
+# Files smaller than this say more about FILE_OVERHEAD than the expansion ratio
+MIN_SAMPLE_SIZE = 256 << 10
+
+# Measurements needed before the observed expansion ratio replaces the default
+MIN_SAMPLES = 4
+
+# The expansion ratio used is this quantile of the measured ones
+EXPANSION_QUANTILE = 0.9
+
+# Share of the available memory used when no budget is set
+BUDGET_FRACTION = 0.8
+
+# Files queued per worker, more makes the projection less accurate
+QUEUED_PER_WORKER = 2
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+_budget: Optional[int] = None
+
+# Worker RSS + estimates of files in flight of every imap running in this process
+_reserved: Dict[int, int] = dict()
+_reserved_lock = threading.Lock()
+
+
+########## BUDGET ##########
+
+
+def parse_size(size: str) -> int:
+    """ Parses a size such as '8G', '512M' or '1048576' into bytes """
+    match = _SIZE_RE.match(size)
+    if match is None:
+        raise ValueError(f"Invalid size {size}, expected a number with an optional K, M, G or T")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def set_budget(budget: Optional[int]) -> None:
+    """ Sets the memory budget of every admitted pool in bytes, None uses the default """
+    global _budget  # pylint: disable=global-statement
+    assert budget is None or budget > 0
+    _budget = budget
+
+
+def get_budget() -> Optional[int]:
+    """ The memory budget in bytes, None if it's unknown and wasn't set """
+    if _budget is not None:
+        return _budget
+    available = available_memory()
+    return int(available * BUDGET_FRACTION) if available is not None else None
+
+
+def available_memory() -> Optional[int]:
+    """ MemAvailable from /proc/meminfo in bytes, None if it can't be read """
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss(private: bool = False) -> int:
+    """
+    The resident set size of this process in bytes, 0 if it can't be read. Forked
+    workers share pages with the parent, private leaves the shared pages out
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            fields = statm.read().split()
+        pages = int(fields[1]) - (int(fields[2]) if private else 0)
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def release_memory() -> None:
+    """ Returns the free memory at the top of the heap to the OS, only on glibc """
+    try:
+        ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+
+def peak_rss() -> int:
+    """ The highest resident set size this process has had in bytes """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+########## ESTIMATES ##########
+
+
+class FootprintEstimator:
+    """ Estimates the memory used to parse a file from it's size and earlier files """
+
+    def __init__(self, default_expansion: float = DEFAULT_EXPANSION):
+        self.default_expansion = default_expansion
+        self.ratios: List[float] = list()
+
+    @property
+    def expansion(self) -> float:
+        """ The expansion ratio estimates are made with """
+        if len(self.ratios) < MIN_SAMPLES:
+            return self.default_expansion
+        ratios = sorted(self.ratios)
+        return ratios[min(int(len(ratios) * EXPANSION_QUANTILE), len(ratios) - 1)]
+
+    def estimate(self, size: int) -> int:
+        return int(self.expansion * size) + FILE_OVERHEAD
+
+    def observe(self, size: int, footprint: int):
+        """ Records the measured footprint of a file, unmeasured (0) footprints are ignored """
+        if size >= MIN_SAMPLE_SIZE and footprint > 0:
+            self.ratios.append(max(footprint - FILE_OVERHEAD, 0) / size)
+
+
+class _Measured:
+    """ Calls func on a chunk of items in a worker and measures the memory it used """
+
+    def __init__(self, func: Callable):
+        self.func = func
+
+    def __call__(self, chunk: Sequence[Any]) -> Tuple[List[Any], int, int, int]:
+        """ Returns the results, the pid, the RSS after the call and the peak footprint """
+        before, peak_before = current_rss(), peak_rss()
+        result = [self.func(item) for item in chunk]
+        peak_after = peak_rss()
+        # Only exact when the call set a new high-water mark, otherwise it's unknown
+        footprint = peak_after - before if peak_after > peak_before else 0
+        release_memory()
+        return result, os.getpid(), current_rss(private=True), footprint
+
+
+########## ADMITTED MAP ##########
+
+
+def imap(
+    pool,
+    func: Callable,
+    items: Iterable[Any],
+    sizes: Sequence[int],
+    ordered: bool = False,
+    chunksize: int = 1,
+    budget: Optional[int] = None,
+    estimator: Optional[FootprintEstimator] = None,
+    bar=None,
+) -> Iterator[Any]:
+    """
+    Like pool.imap_unordered (or pool.imap if ordered) but only submits an item while
+    the projected memory use stays under the budget
+
+    Args:
+        pool: A logs.pool() or supervisor.pool()
+        items: The arguments of func, sizes are the sizes of the files they parse
+        chunksize: Items sent to a worker at once, like the chunksize of pool.imap. A
+                   supervisor.pool() gives a chunk a timeout per item and runs the items
+                   of a quarantined chunk again one at a time
+        budget: Defaults to get_budget(), without a budget nothing is held back
+        bar: The alive_bar of the caller, the memory headroom is shown as it's text
+    """
+    items = list(items)
+    assert len(items) == len(sizes)
+    assert chunksize > 0
+    chunks = [items[i : i + chunksize] for i in range(0, len(items), chunksize)]
+    chunk_sizes = [sum(sizes[i : i + chunksize]) for i in range(0, len(items), chunksize)]
+    budget = budget or get_budget()
+    estimator = estimator or FootprintEstimator()
+    measured = _Measured(func)
+    supervised = isinstance(pool, supervisor.SupervisedPool)
+    done: "queue.Queue[Tuple[Any, bool, Any]]" = queue.Queue()
+    max_in_flight = max(pool.processes, 1) * QUEUED_PER_WORKER
+
+    # A chunk is keyed by it's index, the items of a quarantined one by (index, item)
+    in_flight: Dict[Any, int] = dict()
+    worker_rss: Dict[int, int] = dict()
+    finished: Dict[int, Any] = dict()
+    retries: Deque[Tuple[Tuple[int, int], List[Any], int]] = deque()
+    parts: Dict[int, List[Optional[List[Any]]]] = dict()
+    next_chunk, next_result = 0, 0
+    headroom = None
+
+    parent_rss = current_rss()
+    token = object()
+
+    def projected() -> int:
+        with _reserved_lock:
+            _reserved[id(token)] = sum(worker_rss.values()) + sum(in_flight.values())
+            return parent_rss + sum(_reserved.values())
+
+    try:
+        while next_result < len(chunks):
+            while len(in_flight) < max_in_flight:
+                if len(retries) > 0:
+                    key, chunk, size = retries[0]
+                elif next_chunk < len(chunks):
+                    key, chunk, size = next_chunk, chunks[next_chunk], chunk_sizes[next_chunk]
+                else:
+                    break
+                estimate = estimator.estimate(size)
+                fits = budget is None or projected() + estimate <= budget
+                if not fits and len(in_flight) > 0:
+                    break
+                in_flight[key] = estimate
+                pool.apply_async(
+                    measured,
+                    (chunk,),
+                    callback=lambda out, k=key: done.put((k, True, out)),
+                    error_callback=lambda e, k=key: done.put((k, False, e)),
+                    **({"weight": len(chunk)} if supervised else dict()),
+                )
+                if len(retries) > 0:
+                    retries.popleft()
+                else:
+                    next_chunk += 1
+
+            key, ok, out = done.get()
+            del in_flight[key]
+            if not ok and not isinstance(out, supervisor.Quarantined):
+                raise out
+            if ok:
+                result, pid, rss, footprint = out
+                worker_rss[pid] = rss
+                if isinstance(key, tuple):
+                    estimator.observe(sizes[key[0] * chunksize + key[1]], footprint)
+                else:
+                    estimator.observe(chunk_sizes[key], footprint)
+            else:
+                # A SupervisedPool gave up on the chunk and replaced it's worker
+                result = list()
+                worker_rss.pop(out.pid, None)
+
+            if isinstance(key, tuple):
+                index, item = key
+                parts[index][item] = result
+                if any(part is None for part in parts[index]):
+                    continue
+                result = [value for part in parts.pop(index) for value in part]
+            elif not ok and len(chunks[key]) > 1:
+                # Only the item that hung or crashed should be quarantined, not the chunk
+                supervisor.forgive(out)
+                index = key
+                parts[index] = [None] * len(chunks[index])
+                for item, value in enumerate(chunks[index]):
+                    size = sizes[index * chunksize + item]
+                    retries.append(((index, item), [value], size))
+                continue
+            else:
+                index = key
+
+            if budget is not None:
+                headroom = (budget - projected()) >> 20
+                if bar is not None:
+                    bar.text(f"memory headroom {headroom} MB")
+
+            if not ordered:
+                next_result += 1
+                yield from result
+                continue
+            finished[index] = result
+            while next_result in finished:
+                yield from finished.pop(next_result)
+                next_result += 1
+
+        if headroom is not None:
+            logger.debug(
+                "Parsed with an expansion ratio of %.1f, %s MB of the %s MB budget left",
+                estimator.expansion,
+                headroom,
+                budget >> 20,
+            )
+    finally:
+        with _reserved_lock:
+            _reserved.pop(id(token), None)
@@ -0,0 +1,124 @@
+"""
+Sends the log records of worker processes to the handlers setup_logger installs in the
+parent process
+
+Pool workers don't share the parents handlers, with fork they write to copies of them
+(so the log file is written to from many processes at once) and with spawn they have
+none at all. While listening() is active the workers of pool() replace their handlers
+with a QueueHandler and a QueueListener in the parent passes each record on:
+
+    worker --QueueHandler--> multiprocessing.Queue --QueueListener--> parent handlers
+
+Workers only create records at levels a parent handler will keep, so a disabled
+logger.debug("...", arg) in a worker costs a level check and nothing else.
+
+Workers share a lock for writing to the queue, a worker killed while it holds the lock
+leaves the others (and the listener) waiting forever. So pool() is closed and joined
+at the end of a with block rather than terminated, every worker exits normally and
+flushes what it has queued. It's only terminated when the block raises, the listener
+is then abandoned instead of waiting for records that may never arrive.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.pool
+import os
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
+
+_queue: Optional[multiprocessing.Queue] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_listener() -> None:
+    """ Starts passing the records of pool() workers to the root loggers handlers """
+    global _queue, _listener  # pylint: disable=global-statement
+    if _listener is not None:
+        return
+
+    _queue = multiprocessing.Queue(-1)
+    _listener = logging.handlers.QueueListener(
+        _queue, *logging.getLogger("").handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_listener(flush: bool = True) -> None:
+    """
+    Stops the listener once every record that was sent has been handled, without flush
+    the listener thread (a daemon) is left to stop with the process
+    """
+    global _queue, _listener  # pylint: disable=global-statement
+    if _listener is None:
+        return
+
+    if flush:
+        _listener.stop()
+        _queue.close()
+    else:
+        _queue.cancel_join_thread()
+    _queue, _listener = None, None
+
+
+@contextmanager
+def listening() -> Iterator[None]:
+    """ Forwards the records of pool() workers for the duration of the block """
+    start_listener()
+    try:
+        yield
+    except BaseException:
+        stop_listener(flush=False)
+        raise
+    stop_listener()
+
+
+def handled_level() -> int:
+    """ The lowest level a record can have and still be kept by one of the root handlers """
+    root = logging.getLogger("")
+    if len(root.handlers) == 0:
+        return root.getEffectiveLevel()
+    return max(root.getEffectiveLevel(), min(handler.level for handler in root.handlers))
+
+
+class JoiningPool(multiprocessing.pool.Pool):
+    """ A Pool that waits for it's workers to exit at the end of a with block """
+
+    @property
+    def processes(self) -> int:
+        """ The number of worker processes """
+        return self._processes
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+            self.join()
+        else:
+            self.terminate()
+
+
+def pool(processes: Optional[int] = None) -> JoiningPool:
+    """ A multiprocessing Pool whose workers log through the listener when it is running """
+    initializer, initargs = worker_initializer()
+    return JoiningPool(
+        processes=processes or os.cpu_count(), initializer=initializer, initargs=initargs
+    )
+
+
+def worker_initializer() -> Tuple[Optional[Callable], Tuple]:
+    """ The initializer (and it's args) a worker process needs to log through the listener """
+    if _queue is None:
+        return None, ()
+    return init_worker, (_queue, handled_level())
+
+
+def init_worker(queue: multiprocessing.Queue, level: int) -> None:
+    """ Pool initializer, replaces the workers root handlers with a QueueHandler """
+    root = logging.getLogger("")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level)
@@ -0,0 +1,195 @@
+"""
+Runs a pipeline of stages as soon as their inputs are ready, stages that don't depend
+on each other run at the same time
+
+Each stage names the values it takes (as keyword arguments) and the values it returns:
+
+    stages.run(
+        [
+            Stage("list", get_all_xml_files, inputs=("xml_dir",), outputs=("xml_files",)),
+            Stage("fops", find_fileop_structs, ("xml_files",), ("fops",), parallel=True),
+            Stage("consts", get_constants, ("xml_files",), ("consts",), parallel=True),
+            Stage("commands", resolve, ("fops", "consts"), ("commands",), parallel=True),
+        ],
+        {"xml_dir": "/tmp/skid-doxygen/xml"},
+    )
+
+Here fops and consts both start once list is done and commands once both have. Every
+stage runs in a thread of this process, a parallel stage is also given processes= (the
+size of the pools it starts) out of a budget shared by every stage running at the
+same time, so two stages with a pool each use half the cpus each rather than twice
+the cpus. A stage that is ready while the budget is used up waits for a share.
+
+If a stage raises no new stages are started, the ones running are waited for and the
+first exception is raised again.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A step of a pipeline
+
+    Attributes:
+        name: Used in the timings and errors
+        func: Called with each of the inputs as a keyword argument
+        inputs: Names of the values the stage needs
+        outputs: Names of the values it returns, with more than one it returns a tuple
+        parallel: The stage starts a pool, func is also given processes=
+    """
+
+    name: str
+    func: Callable[..., Any]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    parallel: bool = False
+
+
+@dataclass(frozen=True)
+class Timing:
+    """ When a stage ran (seconds since the pipeline started) and it's share of the budget """
+
+    name: str
+    start: float
+    seconds: float
+    processes: int
+
+    @property
+    def end(self) -> float:
+        return self.start + self.seconds
+
+
+class StageError(Exception):
+    """ The stages can't be run, an input nothing produces or an output produced twice """
+
+
+def check(stages: Sequence[Stage], values: Sequence[str] = ()) -> None:
+    """
+    Raises: StageError: If a stage needs a value no stage (before or after it) produces,
+            a value is produced twice or the stages depend on each other in a cycle
+    """
+    produced = set(values)
+    for stage in stages:
+        for output in stage.outputs:
+            if output in produced:
+                raise StageError(f"{output} is produced more than once ({stage.name})")
+            produced.add(output)
+
+    available = set(values)
+    remaining = list(stages)
+    while len(remaining) > 0:
+        ready = [stage for stage in remaining if available.issuperset(stage.inputs)]
+        if len(ready) == 0:
+            stage = remaining[0]
+            missing = sorted(set(stage.inputs) - available)
+            if set(missing) <= produced:
+                raise StageError(f"{stage.name} is part of a cycle through {missing}")
+            raise StageError(f"Nothing produces {missing} for {stage.name}")
+        for stage in ready:
+            available.update(stage.outputs)
+            remaining.remove(stage)
+
+
+def run(
+    stages: Sequence[Stage],
+    values: Optional[Dict[str, Any]] = None,
+    processes: Optional[int] = None,
+) -> Tuple[Dict[str, Any], List[Timing]]:
+    """
+    Runs every stage once it's inputs are ready
+
+    Args:
+        values: The inputs no stage produces
+        processes: The budget parallel stages share, defaults to the cpu count
+
+    Returns: Every value (given and produced) and the timing of each stage in the
+             order they finished
+    Raises: StageError: See check(), anything a stage raises is raised again
+    """
+    values = dict(values or dict())
+    check(stages, tuple(values))
+    budget = processes or os.cpu_count() or 1
+    assert budget > 0
+
+    start = time.perf_counter()
+    finished: "queue.Queue[Tuple[Stage, int, float, bool, Any]]" = queue.Queue()
+    pending = list(stages)
+    running: Dict[str, int] = dict()
+    timings: List[Timing] = list()
+    error: Optional[BaseException] = None
+
+    def call(stage: Stage, kwargs: Dict[str, Any], share: int):
+        began = time.perf_counter()
+        try:
+            result = stage.func(**kwargs)
+            finished.put((stage, share, began, True, result))
+        except BaseException as e:  # pylint: disable=broad-except
+            finished.put((stage, share, began, False, e))
+
+    while True:
+        if error is None:
+            ready = [stage for stage in pending if all(i in values for i in stage.inputs)]
+            parallel = sum(1 for stage in ready if stage.parallel)
+            free = budget - sum(running.values())
+            for stage in ready:
+                kwargs = {name: values[name] for name in stage.inputs}
+                share = 0
+                if stage.parallel:
+                    if free <= 0 and len(running) > 0:
+                        continue
+                    # What's left is split evenly between the parallel stages still to start
+                    share = max(-(-free // parallel), 1)
+                    kwargs["processes"] = share
+                    free -= share
+                    parallel -= 1
+                pending.remove(stage)
+                running[stage.name] = share
+                logger.debug("Starting stage %s", stage.name)
+                threading.Thread(target=call, args=(stage, kwargs, share), daemon=True).start()
+
+        if len(running) == 0:
+            break
+        stage, share, began, ok, result = finished.get()
+        del running[stage.name]
+        timings.append(Timing(stage.name, began - start, time.perf_counter() - began, share))
+        if not ok:
+            logger.debug("Stage %s raised %r", stage.name, result)
+            error = error or result
+            continue
+        if len(stage.outputs) == 1:
+            values[stage.outputs[0]] = result
+        elif len(stage.outputs) > 1:
+            values.update(zip(stage.outputs, result))
+
+    if error is not None:
+        raise error
+    return values, timings
+
+
+def report(timings: Sequence[Timing]) -> List[str]:
+    """ The timings as a table with a bar of when each stage ran """
+    total = max((timing.end for timing in timings), default=0.0)
+    width = 40
+    lines = [f"{'stage':<32} {'start':>8} {'seconds':>8} {'procs':>5}"]
+    for timing in sorted(timings, key=lambda timing: timing.start):
+        first = int(timing.start / total * width) if total > 0 else 0
+        last = max(int(timing.end / total * width) if total > 0 else 0, first + 1)
+        bar = " " * first + "#" * (last - first)
+        lines.append(
+            f"{timing.name:<32} {timing.start:>8.2f} {timing.seconds:>8.2f} "
+            f"{timing.processes or '':>5} |{bar:<{width}}|"
+        )
+    return lines
@@ -0,0 +1,391 @@
+"""
+A process pool that survives workers which hang or crash
+
+lxml can spin forever (or segfault) on a pathological compound. A multiprocessing Pool
+then either waits for that worker forever or loses it's task without telling anyone,
+and a run over the whole kernel is lost with no record of the file that caused it.
+
+SupervisedPool has the same apply_async as a Pool (so admission.imap works with both)
+but every task has a deadline:
+
+    supervisor thread --pipe--> worker 1    busy with compound_a.xml for 2s
+                      --pipe--> worker 2    busy with compound_b.xml for 301s -> killed
+                      --pipe--> worker 3    exited with SIGSEGV               -> replaced
+
+A worker that is still busy when the deadline passes is killed and one that exits on
+it's own is noticed through it's sentinel. Either way a new worker takes it's place,
+the task fails with Quarantined and it's recorded in the quarantine report so the run
+carries on and the slowest file costs at most the timeout. A task given a chunk of files
+has weight times the timeout, admission.imap then runs a quarantined chunk's files again
+one at a time and forgive()s the chunk so only the bad file is reported.
+
+Each worker has it's own pipe, there is no lock shared between the workers that a
+killed one could be holding (like the one on a multiprocessing.Queue). The exception
+is the logging queue, see logs.py, which a worker only holds while logging.
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from skid.utils import logs
+
+logger = getLogger(__name__)
+
+# Seconds a task may run before it's worker is killed
+DEFAULT_TIMEOUT = 300.0
+
+_timeout: float = DEFAULT_TIMEOUT
+_quarantine: List["QuarantinedTask"] = list()
+_quarantine_lock = threading.Lock()
+
+
+class Quarantined(Exception):
+    """ A task that timed out or crashed it's worker, passed to the error_callback """
+
+    def __init__(
+        self, reason: str, args: Tuple, pid: int, entry: Optional["QuarantinedTask"] = None
+    ):
+        super().__init__(reason)
+        self.reason = reason
+        self.task_args = args
+        self.pid = pid
+        self.entry = entry
+
+
+@dataclass(frozen=True)
+class QuarantinedTask:
+    """ An entry in the quarantine report """
+
+    task: str
+    reason: str
+    seconds: float
+
+
+########## TIMEOUT AND REPORT ##########
+
+
+def set_timeout(timeout: Optional[float]) -> None:
+    """ Sets the deadline of every task in seconds, None uses DEFAULT_TIMEOUT """
+    global _timeout  # pylint: disable=global-statement
+    assert timeout is None or timeout > 0
+    _timeout = timeout if timeout is not None else DEFAULT_TIMEOUT
+
+
+def get_timeout() -> float:
+    return _timeout
+
+
+def quarantined() -> Tuple[QuarantinedTask, ...]:
+    """ Every task quarantined since the report was last cleared """
+    with _quarantine_lock:
+        return tuple(_quarantine)
+
+
+def forgive(error: Quarantined) -> None:
+    """ Drops the report entry of a quarantined task that is being run again in pieces """
+    with _quarantine_lock:
+        _quarantine[:] = [entry for entry in _quarantine if entry is not error.entry]
+
+
+def clear_quarantine() -> None:
+    with _quarantine_lock:
+        _quarantine.clear()
+
+
+def log_report() -> None:
+    """ Logs the quarantined tasks, nothing if there are none """
+    entries = quarantined()
+    if len(entries) == 0:
+        return
+    logger.error("Quarantined %s tasks, their results are missing:", len(entries))
+    for entry in entries:
+        logger.error("    %s: %s after %.1fs", entry.task, entry.reason, entry.seconds)
+
+
+def write_report(location: str) -> None:
+    """ Writes the quarantine report as json """
+    with open(location, "w") as report_f:
+        json.dump([asdict(entry) for entry in quarantined()], report_f, indent=4)
+
+
+def describe(args: Any) -> str:
+    """ The files (or whatever strings) a task was given, for the report """
+    if isinstance(args, str):
+        return args
+    if isinstance(args, (list, tuple)):
+        return ", ".join(filter(None, (describe(arg) for arg in args)))
+    return ""
+
+
+########## WORKERS ##########
+
+
+def _work(conn: multiprocessing.connection.Connection, initializer, initargs) -> None:
+    """ Runs the tasks sent down conn until it's closed or sent None """
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        func, args, kwds = task
+        try:
+            result = (True, func(*args, **kwds))
+        except Exception as e:  # pylint: disable=broad-except
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:  # pylint: disable=broad-except
+            conn.send((False, RuntimeError(f"Could not send the result back: {e}")))
+
+
+@dataclass
+class _Task:
+    func: Callable
+    args: Tuple
+    kwds: Dict[str, Any]
+    callback: Optional[Callable]
+    error_callback: Optional[Callable]
+    weight: int = 1
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.Process
+    conn: multiprocessing.connection.Connection
+    task: Optional[_Task] = None
+    started: float = 0.0
+
+
+@dataclass
+class _Stats:
+    tasks: int = 0
+    killed: int = 0
+    crashed: int = 0
+    respawned: int = 0
+
+
+########## POOL ##########
+
+
+class SupervisedPool:
+    """
+    A pool of worker processes whose tasks time out, use it like logs.pool():
+
+        with supervisor.pool() as pool:
+            for result in admission.imap(pool, func, xml_files, sizes):
+                ...
+
+    Callbacks run on the supervisor thread, like they do on a Pool's result thread
+    """
+
+    def __init__(self, processes: Optional[int] = None, timeout: Optional[float] = None):
+        self._processes = processes or os.cpu_count() or 1
+        assert self._processes > 0
+        self.timeout = timeout
+        self.stats = _Stats()
+        self._initializer, self._initargs = logs.worker_initializer()
+        self._pending: Deque[_Task] = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stopped = False
+        self._wake_r, self._wake_w = multiprocessing.Pipe(duplex=False)
+        self._workers: List[_Worker] = [self._spawn() for _ in range(self._processes)]
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    @property
+    def processes(self) -> int:
+        """ The number of worker processes """
+        return self._processes
+
+    def apply_async(
+        self,
+        func: Callable,
+        args: Tuple = (),
+        kwds: Optional[Dict[str, Any]] = None,
+        callback: Optional[Callable] = None,
+        error_callback: Optional[Callable] = None,
+        weight: int = 1,
+    ) -> None:
+        """
+        Queues func(*args, **kwds), the result is passed to callback. The deadline is
+        weight times the timeout, e.g the number of files in a chunk
+        """
+        assert weight > 0
+        with self._lock:
+            assert not self._closed, "Pool is closed"
+            self._pending.append(
+                _Task(func, args, kwds or dict(), callback, error_callback, weight)
+            )
+            self._wake_w.send_bytes(b"")
+
+    def close(self) -> None:
+        """ No more tasks will be added, the workers exit once the queued ones are done """
+        with self._lock:
+            self._closed = True
+            self._wake_w.send_bytes(b"")
+
+    def join(self) -> None:
+        self._thread.join()
+        for worker in self._workers:
+            worker.process.join()
+            worker.conn.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def terminate(self) -> None:
+        """ Kills the workers, queued tasks are dropped without their callbacks """
+        with self._lock:
+            self._closed = True
+            self._stopped = True
+            self._wake_w.send_bytes(b"")
+        self._thread.join()
+        for worker in self._workers:
+            worker.process.kill()
+            worker.process.join()
+            worker.conn.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def __enter__(self) -> "SupervisedPool":
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+            self.join()
+        else:
+            self.terminate()
+
+    ########## SUPERVISOR THREAD ##########
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_work, args=(child_conn, self._initializer, self._initargs), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _deadline(self, worker: _Worker) -> float:
+        timeout = self.timeout if self.timeout is not None else _timeout
+        return worker.started + timeout * (worker.task.weight if worker.task is not None else 1)
+
+    def _supervise(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                for worker in self._workers:
+                    if worker.task is None and len(self._pending) > 0:
+                        self._start(worker, self._pending.popleft())
+                busy = [worker for worker in self._workers if worker.task is not None]
+                if self._closed and len(busy) == 0 and len(self._pending) == 0:
+                    break
+
+            now = time.monotonic()
+            wait = min((self._deadline(worker) - now for worker in busy), default=None)
+            ready = multiprocessing.connection.wait(
+                [self._wake_r]
+                + [worker.conn for worker in busy]
+                + [worker.process.sentinel for worker in self._workers],
+                timeout=max(wait, 0) if wait is not None else None,
+            )
+            if self._wake_r in ready:
+                while self._wake_r.poll():
+                    self._wake_r.recv_bytes()
+
+            for index, worker in enumerate(self._workers):
+                if worker.task is not None and worker.conn in ready:
+                    self._finish(worker)
+                if worker.process.sentinel in ready or not worker.process.is_alive():
+                    self._workers[index] = self._replace(worker, crashed=True)
+                elif worker.task is not None and time.monotonic() >= self._deadline(worker):
+                    if worker.conn.poll():
+                        self._finish(worker)
+                    else:
+                        self._workers[index] = self._replace(worker, crashed=False)
+
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+
+    def _start(self, worker: _Worker, task: _Task) -> None:
+        try:
+            worker.conn.send((task.func, task.args, task.kwds))
+        except OSError:
+            # The worker died between tasks, it's replaced before it's given another
+            self._pending.appendleft(task)
+            return
+        worker.task = task
+        worker.started = time.monotonic()
+        self.stats.tasks += 1
+
+    def _finish(self, worker: _Worker) -> None:
+        try:
+            ok, result = worker.conn.recv()
+        except (EOFError, OSError):
+            return  # Died while sending, the sentinel handles it
+        task, worker.task = worker.task, None
+        callback = task.callback if ok else task.error_callback
+        if callback is not None:
+            callback(result)
+
+    def _replace(self, worker: _Worker, crashed: bool) -> _Worker:
+        """ Replaces a crashed or stuck worker, quarantining the task it was running """
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+
+        task = worker.task
+        if task is not None:
+            seconds = time.monotonic() - worker.started
+            if crashed:
+                self.stats.crashed += 1
+                reason = _exit_reason(worker.process.exitcode)
+            else:
+                self.stats.killed += 1
+                reason = f"timed out after {seconds:.0f}s"
+            entry = QuarantinedTask(describe(task.args) or repr(task.args), reason, seconds)
+            with _quarantine_lock:
+                _quarantine.append(entry)
+            logger.error("Quarantined %s: %s", entry.task, reason)
+            if task.error_callback is not None:
+                task.error_callback(Quarantined(reason, task.args, worker.process.pid, entry))
+
+        self.stats.respawned += 1
+        return self._spawn()
+
+
+def _exit_reason(exitcode: Optional[int]) -> str:
+    if exitcode is not None and exitcode < 0:
+        try:
+            return f"worker killed by {signal.Signals(-exitcode).name}"
+        except ValueError:
+            pass
+    return f"worker exited with {exitcode}"
+
+
+def pool(processes: Optional[int] = None, timeout: Optional[float] = None) -> SupervisedPool:
+    """ A SupervisedPool whose workers log through the listener when it is running """
+    return SupervisedPool(processes, timeout)
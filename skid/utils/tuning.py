@@ -0,0 +1,136 @@
+"""
+Tuned profiles, the worker pool and doxygen settings that `skid.py tune` measured to be
+the fastest on this machine (see interface_recovery.calibration)
+
+A profile is a small json file:
+
+    {
+        "processes": 8,
+        "chunksizes": {"constants": 4, "fingerprint": 64, "scan": 16},
+        "doxygen": {"NUM_PROC_THREADS": "4", "LOOKUP_CACHE_SIZE": "3", "DOT_NUM_THREADS": "4"},
+        "cpu_count": 8,
+        "worker_rss": 52428800
+    }
+
+Once a profile is applied with apply() the pools look their chunksize up with
+get_chunksize() and the doxygen settings are merged over the default doxygen config
+(a user supplied --doxyconf still wins). The process count is handed to the stages by
+the caller (skid.py ir --profile=<path>).
+
+Author: Luke Goddard
+Date: 2020
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional
+
+PROFILE_LOCATION = "/tmp/skid-profile.json"
+
+# The pools whose chunksize can be tuned, see get_chunksize
+CHUNKSIZE_NAMES = ("constants", "fingerprint", "scan")
+
+# The doxygen settings a profile may set, everything else comes from doxygen.config
+DOXYGEN_SETTINGS = ("NUM_PROC_THREADS", "LOOKUP_CACHE_SIZE", "DOT_NUM_THREADS")
+
+_profile: Optional["Profile"] = None
+
+
+@dataclass(frozen=True)
+class Profile:
+    """
+    A tuned profile
+
+    Attributes:
+        processes: Number of worker processes the stages use
+        chunksizes: The chunksize of each pool in CHUNKSIZE_NAMES, the rest keep their default
+        doxygen: Doxygen settings (DOXYGEN_SETTINGS) as the strings written to the config
+        cpu_count: The cpu count of the machine the profile was tuned on
+        worker_rss: The largest private RSS of a worker seen while tuning in bytes
+    """
+
+    processes: int
+    chunksizes: Dict[str, int] = field(default_factory=dict)
+    doxygen: Dict[str, str] = field(default_factory=dict)
+    cpu_count: Optional[int] = None
+    worker_rss: Optional[int] = None
+
+    def __post_init__(self):
+        if not isinstance(self.processes, int) or self.processes <= 0:
+            raise ValueError("The number of processes must be a positive integer")
+        for name, chunksize in self.chunksizes.items():
+            if name not in CHUNKSIZE_NAMES:
+                raise ValueError(f"Unknown pool {name}, expected one of {CHUNKSIZE_NAMES}")
+            if not isinstance(chunksize, int) or chunksize <= 0:
+                raise ValueError(f"The chunksize of {name} must be a positive integer")
+        for key in self.doxygen:
+            if key not in DOXYGEN_SETTINGS:
+                raise ValueError(
+                    f"Unknown doxygen setting {key}, expected one of {DOXYGEN_SETTINGS}"
+                )
+
+
+########## LOAD AND SAVE ##########
+
+
+def save(profile: Profile, location: str = PROFILE_LOCATION) -> None:
+    """ Writes the profile as json """
+    dirname = os.path.dirname(location)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+    with open(location, "w") as f:
+        json.dump(asdict(profile), f, indent=4)
+
+
+def load(location: str = PROFILE_LOCATION) -> Profile:
+    """
+    Reads a profile written by save()
+    Raises: ValueError: If the profile can't be read or isn't a valid profile
+    """
+    try:
+        with open(location, "r") as f:
+            values = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Could not read the profile at {location}: {e}") from e
+
+    if not isinstance(values, dict):
+        raise ValueError(f"The profile at {location} is not a json object")
+    try:
+        return Profile(
+            processes=values["processes"],
+            chunksizes=dict(values.get("chunksizes", dict())),
+            doxygen={key: str(value) for key, value in values.get("doxygen", dict()).items()},
+            cpu_count=values.get("cpu_count"),
+            worker_rss=values.get("worker_rss"),
+        )
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"The profile at {location} is missing or has a bad value: {e}") from e
+
+
+########## CURRENT PROFILE ##########
+
+
+def apply(profile: Optional[Profile]) -> None:
+    """ Makes the profile the one the pools and doxygen config use, None restores the defaults """
+    global _profile  # pylint: disable=global-statement
+    _profile = profile
+
+
+def get_profile() -> Optional[Profile]:
+    return _profile
+
+
+def get_chunksize(name: str, default: int) -> int:
+    """ The tuned chunksize of the pool, default if there isn't one """
+    assert name in CHUNKSIZE_NAMES
+    if _profile is None:
+        return default
+    return _profile.chunksizes.get(name, default)
+
+
+def doxygen_settings() -> Dict[str, str]:
+    """ The tuned doxygen settings, empty if there is no profile """
+    if _profile is None:
+        return dict()
+    return dict(_profile.doxygen)
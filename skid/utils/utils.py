@@ -6,12 +6,20 @@ Date: 2020
 """
 
 import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from alive_progress import alive_bar  # type: ignore
 
 FORMAT_LJUST = 75
 FORMAT_PREFIX = '--------->'
 
 logger = logging.getLogger(__name__)
 
+# alive_progress raises if a second bar is started while one is showing
+_bar_lock = threading.Lock()
+
 def is_verbose() -> bool:
     """ Should be set to True if -v was passed to skid """
     root_logger = logging.getLogger("")
@@ -23,3 +31,33 @@ def format_alive_bar_title(title: str) -> str:
     assert isinstance(title, str)
     return FORMAT_PREFIX + title.ljust(FORMAT_LJUST, '-')
 
+
+class QuietBar:
+    """ Stands in for an alive_bar while another one is showing, it only counts """
+
+    def __init__(self, title: str):
+        self.title = title
+        self.count = 0
+
+    def __call__(self, *_, **__):
+        self.count += 1
+
+    def text(self, *_):
+        pass
+
+
+@contextmanager
+def progress_bar(total: Optional[int] = None, title: str = "") -> Iterator:
+    """
+    An alive_bar, unless another thread (e.g a concurrent stage, see utils.stages) is
+    already showing one, then a QuietBar is used and the title is logged instead
+    """
+    if not _bar_lock.acquire(blocking=False):
+        logger.info(title.strip("->"))
+        yield QuietBar(title)
+        return
+    try:
+        with alive_bar(total, title=title) as bar:
+            yield bar
+    finally:
+        _bar_lock.release()
@@ -7,6 +7,7 @@
 from tempfile import TemporaryDirectory, NamedTemporaryFile
 
 import os
+import shutil
 import pytest
 
 from skid.interface_recovery import doxygen
@@ -16,6 +17,13 @@ TEST_RESOURCES = "tests/resources/"
 VALID_SCHEMA_LOCATION = os.path.join(TEST_RESOURCES, "example_schema.xsd")
 TEST_XML_FILES = ("tests/resources/example_c_file.xml",)
 
+# Doxygen names each XML file after it's compound id
+COMPOUND_XML_FILES = {
+    "example__driver_8c.xml": "tests/resources/example_c_file.xml",
+    "watchdog_8h.xml": "tests/resources/uapi/example_watchdog_h.xml",
+    "structwatchdog__info.xml": "tests/resources/uapi/example_struct.xml",
+}
+
 @pytest.fixture
 def temp_dir():
     with TemporaryDirectory(prefix="/tmp/skid-deleteme") as tempd:
@@ -38,3 +46,12 @@ def xml_files():
 def xml_schema():
     return doxygen.xml_utils.get_schema(VALID_SCHEMA_LOCATION)
 
+
+@pytest.fixture
+def compound_xml_files(temp_dir):
+    """ A driver, the uapi header it uses and a struct as doxygen would name them """
+    locations = list()
+    for name, resource in COMPOUND_XML_FILES.items():
+        locations.append(os.path.join(temp_dir, name))
+        shutil.copy(resource, locations[-1])
+    return tuple(sorted(locations))
@@ -0,0 +1,204 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import struct
+
+import numpy as np
+import pytest
+
+from skid.fuzzer import arguments
+from skid.interface_recovery.doxygen import find_constraints
+from skid.interface_recovery.doxygen.find_constraints import Constraint
+from skid.interface_recovery.ioctl import evaluator, request
+from skid.interface_recovery.ioctl.evaluator import EnumValue, Record
+from skid.interface_recovery.ioctl.layouts import Member
+
+
+@pytest.fixture
+def consts():
+    table = evaluator.ConstantTable()
+    table.enums["MODE_OFF"] = EnumValue("4", 0)
+    table.enums["MODE_ON"] = EnumValue("4", 1)
+    table.enum_types["wdt_mode"] = ("MODE_OFF", "MODE_ON")
+    table.typedefs["word_t"] = "unsigned int"
+    table.records["watchdog_info"] = Record(
+        "struct",
+        (
+            Member("options", "__u32"),
+            Member("firmware_version", "__u32"),
+            Member("identity", "__u8", ("32",)),
+        ),
+    )
+    table.records["request"] = Record(
+        "struct",
+        (
+            Member("mode", "enum wdt_mode"),
+            Member("data_len", "__u16"),
+            Member("enabled", "unsigned int", (), "1"),
+            Member("level", "unsigned int", (), "3"),
+            Member("data", "__u8", ("5",)),
+            Member("value", "union request_value"),
+            Member("extra", "__u8", ("",)),
+        ),
+    )
+    table.records["request_value"] = Record(
+        "union", (Member("word", "word_t"), Member("bytes", "__s8", ("4",)))
+    )
+    return evaluator.ConstantEvaluator(table)
+
+
+def test_dtype_matches_layout(consts):
+    generator = arguments.ArgumentGenerator("struct request", consts)
+    layout = consts.layout("request")
+    assert generator.dtype.itemsize == layout.size == 16
+    assert generator.dtype.names == ("mode", "data_len", "enabled", "data", "value")
+    assert [generator.dtype.fields[name][1] for name in generator.dtype.names] == [0, 4, 6, 7, 12]
+    assert generator.dtype["mode"] == np.dtype("<i4")
+    # Only the byte the two bitfields use is filled, data starts straight after it
+    assert generator.dtype["enabled"] == np.dtype(("u1", (1,)))
+    assert generator.dtype["value"].itemsize == 4
+
+
+def test_batch_is_zero_copy(consts):
+    batch = arguments.ArgumentGenerator("struct watchdog_info", consts, seed=1).generate(64)
+    assert len(batch) == 64
+    assert batch.buffer.nbytes == 64 * 40
+    assert batch.buffer.contiguous
+    row = batch[3]
+    assert row.nbytes == 40
+    options, version = struct.unpack_from("<II", row)
+    assert (options, version) == (batch.array["options"][3], batch.array["firmware_version"][3])
+
+    # Writes through the row are seen by the array, e.g an ioctl filling the buffer
+    row[0:4] = b"\x01\x00\x00\x00"
+    assert batch.array["options"][3] == 1
+
+
+def test_enum_flags_and_lengths(consts):
+    generator = arguments.ArgumentGenerator(
+        "struct request", consts, flags={"value.word": [0x1, 0x4, 0x10]}, seed=2
+    )
+    array = generator.generate(4000).array
+    assert np.isin(array["mode"], [4, 5]).mean() > 0.9
+    assert np.isin(array["data_len"], [4, 5, 6]).mean() > 0.9
+
+    words = array["value"]["word"]
+    assert ((words & ~np.uint32(0x15)) == 0).mean() > 0.45
+
+
+def test_unresolved_enumerators_are_skipped(consts):
+    consts.table.enums["MODE_AUTO"] = EnumValue("UNDEFINED_MODE", 0)
+    consts.table.enum_types["wdt_mode"] += ("MODE_AUTO",)
+    array = arguments.ArgumentGenerator("struct request", consts, seed=2).generate(4000).array
+    assert np.isin(array["mode"], [4, 5]).mean() > 0.9
+
+
+def test_no_resolved_enumerators(consts):
+    consts.table.enums["MODE_AUTO"] = EnumValue("UNDEFINED_MODE", 0)
+    consts.table.enum_types["wdt_mode"] = ("MODE_AUTO",)
+    array = arguments.ArgumentGenerator("struct request", consts, seed=2).generate(100).array
+    assert len(array["mode"]) == 100
+
+
+def test_boundary_values():
+    values = arguments.boundary_values(np.dtype("<i2"))
+    assert {0, 1, -1, 127, 128, -128, 255, 256, 32767, -32768} <= set(values.tolist())
+    assert arguments.boundary_values(np.dtype("u1")).max() == 255
+
+
+@pytest.mark.parametrize(
+    "name, is_length",
+    [
+        ("len", True),
+        ("buf_size", True),
+        ("nr_pages", True),
+        ("nbytes", True),
+        ("nelem", True),
+        ("nents", True),
+        ("name", False),
+        ("next", False),
+        ("node", False),
+        ("nvram", False),
+        ("nsec", False),
+    ],
+)
+def test_length_fields(name, is_length):
+    assert bool(arguments._LENGTH_RE.search(name)) == is_length  # pylint: disable=protected-access
+
+
+def test_node_is_abstract():
+    with pytest.raises(TypeError):
+        arguments._Node()  # pylint: disable=abstract-class-instantiated,protected-access
+
+
+def test_same_seed_same_batch(consts):
+    first = arguments.ArgumentGenerator("struct request", consts, seed=7).generate(32)
+    second = arguments.ArgumentGenerator("struct request", consts, seed=7).generate(32)
+    assert bytes(first.buffer) == bytes(second.buffer)
+
+
+@pytest.mark.parametrize("argument, row_size", [("int", 4), ("word_t", 4), ("__u32[4]", 16)])
+def test_scalar_arguments(consts, argument, row_size):
+    batch = arguments.ArgumentGenerator(argument, consts, seed=1).generate(8)
+    assert batch.raw.shape == (8, row_size)
+    assert batch[7].nbytes == row_size
+
+
+def test_generators_for_commands(consts):
+    commands = [
+        request.IoctlCommand("GETSUPPORT", 0x80285700, "read", 0x57, 0, 40, "struct watchdog_info"),
+        request.IoctlCommand("GETINFO", 0x80285701, "read", 0x57, 1, 40, "struct watchdog_info"),
+        request.IoctlCommand("KEEPALIVE", 0x5705, "none", 0x57, 5, 0),
+        request.IoctlCommand("UNKNOWN", 0x80085702, "read", 0x57, 2, 8, "struct missing"),
+    ]
+    generators = arguments.generators_for_commands(commands, consts)
+    assert set(generators) == {"GETSUPPORT", "GETINFO"}
+    assert generators["GETSUPPORT"] is generators["GETINFO"]
+
+
+def test_dictionary(consts):
+    generator = arguments.ArgumentGenerator(
+        "struct watchdog_info",
+        consts,
+        dictionary={"options": [0x1234], arguments.ANY_FIELD: [0x5678]},
+        seed=0,
+    )
+    array = generator.generate(2000).array
+    options = np.mean(array["options"] == 0x1234)
+    assert 0.05 < options < 0.2
+    assert np.mean(array["firmware_version"] == 0x5678) > 0.05
+    assert not np.any(array["firmware_version"] == 0x1234)
+
+
+def test_hints_for_commands(consts):
+    consts.table.enums["REQ_MAGIC"] = EnumValue("0x55", 0)
+    consts.table.enums["REQ_FLAGS"] = EnumValue("0x5", 0)
+    handler = find_constraints.HandlerConstraints(
+        ("REQ_MAGIC", "UNKNOWN", '"reset"'),
+        (
+            Constraint("SUBMIT", "options", find_constraints.KIND_EQUAL, "!=", "REQ_MAGIC"),
+            Constraint("SUBMIT", "options", find_constraints.KIND_EQUAL, "!=", "UNKNOWN"),
+            Constraint("SUBMIT", "firmware_version", find_constraints.KIND_MASK, "&~", "REQ_FLAGS"),
+            Constraint("", "", find_constraints.KIND_BOUND, ">", "16"),
+        ),
+    )
+    commands = [
+        request.IoctlCommand("SUBMIT", 0x40285700, "write", 0x57, 0, 40, "struct watchdog_info"),
+        request.IoctlCommand("SET", 0x40045701, "write", 0x57, 1, 4, "int"),
+    ]
+    hints = arguments.hints_for_commands(handler, consts, commands)
+    assert hints["SUBMIT"] == arguments.Hints(
+        {"options": [0x55]},
+        {"firmware_version": [1, 4]},
+        {arguments.ANY_FIELD: [0x55], "": [15, 16, 17]},
+    )
+    assert hints["SET"] == arguments.Hints(
+        dict(), dict(), {arguments.ANY_FIELD: [0x55], "": [15, 16, 17]}
+    )
+
+    generators = arguments.generators_for_commands(commands, consts, seed=0, hints=hints)
+    array = generators["SUBMIT"].generate(1000).array
+    assert np.mean(array["options"] == 0x55) > 0.9
+    assert np.mean((array["firmware_version"] & 0xFFFFFFFA) == 0) > 0.9
@@ -0,0 +1,85 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from skid.fuzzer import campaign
+from skid.fuzzer.campaign import HandlerFeatures
+from skid.interface_recovery.doxygen import find_commands
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+SMALL = """
+static long small_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+    if (cmd != SMALL_PING)
+        return -ENOTTY;
+    return 0;
+}
+"""
+
+
+def body_of(source):
+    return [(i, line) for i, line in enumerate(source.splitlines(), 1)]
+
+
+def test_handler_features(xml_files):
+    body = find_commands.FunctionSource(xml_files[0]).body(REFID)
+    features = campaign.handler_features(body)
+    # get_user twice, copy_to_user and put_user copy out rather than in
+    assert features.copies == 2
+    assert features.commands == 7
+    assert features.callees == 6
+    assert features.lines == sum(1 for _, text in body if text.strip())
+
+
+def test_score():
+    assert campaign.score(HandlerFeatures(0, 0, 0, 0)) > 0
+    small = campaign.score(HandlerFeatures(10, 2, 0, 1))
+    large = campaign.score(HandlerFeatures(3000, 80, 40, 120))
+    assert small < large < 300 * small
+
+
+def test_rank_handlers(xml_files):
+    bodies = {
+        "small": body_of(SMALL),
+        REFID: find_commands.FunctionSource(xml_files[0]).body(REFID),
+        "missing": (),
+    }
+    ranked = campaign.rank_handlers(bodies)
+    assert [refid for refid, _ in ranked] == [REFID, "small"]
+
+
+def test_shares_start_from_scores():
+    scheduler = campaign.CampaignScheduler(["a", "b"], [1, 3], min_share=0)
+    assert scheduler.shares() == pytest.approx([0.25, 0.75])
+    assert scheduler.allocate(10) == {"a": 3, "b": 7}
+    assert sum(scheduler.allocate(7).values()) == 7
+
+
+def test_shares_follow_new_outcomes():
+    scheduler = campaign.CampaignScheduler(["a", "b"], [1, 3])
+    for round_ in range(10):
+        scheduler.record("a", [("A", round_ * 10 + i) for i in range(10)])
+        scheduler.record("b", [("B", 0)] * 10)
+    shares = scheduler.shares()
+    assert shares[0] > 0.7
+    # b only repeats itself but is never starved
+    assert shares[1] >= campaign.MIN_SHARE / 2
+    assert scheduler.summary()[0] == {
+        "target": "a",
+        "share": shares[0],
+        "executions": 100,
+        "discovered": 100,
+    }
+
+
+def test_unrun_targets_are_optimistic():
+    scheduler = campaign.CampaignScheduler(["a", "b"], [1, 1], adapt_rate=1, min_share=0)
+    scheduler.record("a", [1, 2], executions=4)
+    assert scheduler.shares() == pytest.approx([0.5, 0.5])
+    scheduler.record("b", [], executions=0)
+    assert scheduler.shares() == pytest.approx([0.5, 0.5])
+    scheduler.record("b", [1], executions=4)
+    assert scheduler.shares()[0] > scheduler.shares()[1]
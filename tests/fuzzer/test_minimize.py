@@ -0,0 +1,101 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import random
+import struct
+
+import pytest
+
+from skid.fuzzer import minimize
+from skid.fuzzer.minimize import Call
+from skid.interface_recovery.ioctl import evaluator
+from skid.interface_recovery.ioctl.evaluator import Record
+from skid.interface_recovery.ioctl.layouts import Member
+
+ENABLE = 0x5701
+SETTIMEOUT = 0xC0105702
+SPANS = ((0, 4), (4, 4), (8, 8))
+
+
+def simulated_driver(calls):
+    """ Crashes if SETTIMEOUT is called with a timeout over 100 and flag 0x40 after ENABLE """
+    enabled = False
+    for call in calls:
+        if call.number == ENABLE:
+            enabled = True
+        elif call.number == SETTIMEOUT and enabled and len(call.argument) == 16:
+            flags, _, timeout = struct.unpack("<IIQ", call.argument)
+            if flags & 0x40 and timeout > 100:
+                return "BUG: unable to handle page fault in wdt_settimeout+0x3c"
+    return ""
+
+
+def crashes(calls):
+    return simulated_driver(calls) != ""
+
+
+def reproducer(seed=0, length=200):
+    rng = random.Random(seed)
+    calls = list()
+    for _ in range(length):
+        number = rng.choice([ENABLE, SETTIMEOUT, 0x5703])
+        calls.append(Call(number, bytes(rng.getrandbits(8) for _ in range(16)), SPANS))
+    calls.insert(10, Call(ENABLE))
+    calls.append(Call(SETTIMEOUT, struct.pack("<IIQ", 0xFFFF, 7, 1 << 40 | 0x1FF), SPANS))
+    return calls
+
+
+def test_split():
+    assert minimize.split((1, 2, 3, 4, 5), 2) == [(1, 2), (3, 4, 5)]
+    assert minimize.split((1, 2, 3), 3) == [(1,), (2,), (3,)]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_minimize(processes):
+    calls = reproducer()
+    oracle = minimize.SignatureOracle(simulated_driver, r"BUG: .* in wdt_settimeout")
+    minimized = minimize.minimize(calls, oracle, processes=processes)
+
+    assert crashes(minimized)
+    assert [call.number for call in minimized] == [ENABLE, SETTIMEOUT]
+    argument = minimized[1].argument
+    assert len(argument) == 16
+    # Only the byte with the 0x40 flag and one byte of the timeout are left
+    assert sum(byte != 0 for byte in argument) == 2
+    assert argument[0] & 0x40 and argument[4:8] == bytes(4)
+
+
+def test_minimize_caches_oracle_runs():
+    with minimize.Minimizer(crashes, processes=1) as minimizer:
+        minimizer.minimize(reproducer(seed=1))
+        runs = minimizer.runs
+        minimizer.minimize(reproducer(seed=1))
+    assert minimizer.runs == runs
+    assert runs < 500
+
+
+def test_minimize_not_crashing():
+    with pytest.raises(ValueError):
+        minimize.minimize([Call(ENABLE)], crashes, processes=1)
+
+
+def test_field_spans():
+    table = evaluator.ConstantTable()
+    table.records["timeout"] = Record(
+        "struct",
+        (
+            Member("flags", "__u32"),
+            Member("enable", "__u32", (), "1"),
+            Member("pretimeout", "__u32", (), "1"),
+            Member("value", "union timeout_value"),
+            Member("extra", "__u8", ("",)),
+        ),
+    )
+    table.records["timeout_value"] = Record(
+        "union", (Member("seconds", "__u64"), Member("parts", "__u32", ("2",)))
+    )
+    consts = evaluator.ConstantEvaluator(table)
+    layout = consts.layout("timeout")
+    assert minimize.field_spans(layout) == ((0, 4), (4, 4), (8, 8))
+    assert minimize.field_spans(layout, consts) == ((0, 4), (4, 4), (8, 8))
@@ -0,0 +1,145 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import errno
+
+import pytest
+
+from skid.fuzzer import probe
+from skid.interface_recovery.ioctl import request
+
+GETSUPPORT = request.decode("WDIOC_GETSUPPORT", 0x80285700, "struct watchdog_info")
+KEEPALIVE = request.decode("WDIOC_KEEPALIVE", 0x80045705, "int")
+# Handled by the driver but missed by static recovery
+SETTIMEOUT = 0xC0045706
+SETPRETIMEOUT = 0xC0045708
+LEGACY = 0x5720
+
+
+class FakeDevice(probe.Device):
+    """ A watchdog driver that handles a few commands, EINVAL for bad arguments """
+
+    def __init__(self, handled, unknown_errno=errno.ENOTTY):
+        self.handled = handled
+        self.unknown_errno = unknown_errno
+        self.addresses = set()
+        self.calls = 0
+        self.closed = False
+
+    def ioctl(self, number, address):
+        self.calls += 1
+        self.addresses.add(address)
+        if number not in self.handled:
+            return -self.unknown_errno
+        return self.handled[number]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def device():
+    return FakeDevice(
+        {
+            GETSUPPORT.number: 0,
+            KEEPALIVE.number: 0,
+            SETTIMEOUT: -errno.EINVAL,
+            SETPRETIMEOUT: -errno.EFAULT,
+            LEGACY: 0,
+        }
+    )
+
+
+def test_device_is_abstract():
+    with pytest.raises(TypeError):
+        probe.Device()  # pylint: disable=abstract-class-instantiated
+
+
+def test_candidates():
+    numbers = probe.candidates([0x57], sizes=(4, 40))
+    assert len(numbers) == 256 + 256 * 2 * 3
+    for number in (GETSUPPORT.number, KEEPALIVE.number, SETTIMEOUT, LEGACY):
+        assert number in numbers
+    # _IO commands have no size and sized commands always have a direction
+    assert 0x00045706 not in numbers
+    assert 0x40005706 not in numbers
+    assert list(numbers) == sorted(numbers)
+
+
+def test_candidate_sizes():
+    assert {4, 40} <= probe.candidate_sizes([GETSUPPORT, KEEPALIVE])
+    assert probe.candidate_types([GETSUPPORT, KEEPALIVE]) == {0x57}
+
+
+def test_probe(device):
+    prober = probe.Prober(device)
+    handled = prober.probe(probe.candidates([0x57], sizes=(4, 40)))
+    assert handled == {
+        GETSUPPORT.number: 0,
+        KEEPALIVE.number: 0,
+        SETTIMEOUT: errno.EINVAL,
+        SETPRETIMEOUT: errno.EFAULT,
+        LEGACY: 0,
+    }
+    # Every call used the same preallocated buffer
+    assert device.addresses == {prober.address}
+    assert prober.calls == device.calls
+
+
+def test_calibrate_einval():
+    device = FakeDevice({GETSUPPORT.number: 0}, unknown_errno=errno.EINVAL)
+    prober = probe.Prober(device)
+    assert errno.EINVAL in prober.calibrate([0x57])
+    assert prober.probe(probe.candidates([0x57], sizes=(40,))) == {GETSUPPORT.number: 0}
+
+
+def test_calibrate_enotty(device):
+    prober = probe.Prober(device)
+    assert prober.calibrate([0x57]) == set(probe.UNKNOWN_ERRNOS)
+
+
+def test_probe_device(device):
+    found = probe.probe_device("/dev/watchdog", [GETSUPPORT, KEEPALIVE], device=device)
+    assert [command.number for command in found] == [LEGACY, SETTIMEOUT, SETPRETIMEOUT]
+    assert found[0] == request.decode("0x00005720", LEGACY)
+    assert found[1].direction == "read|write" and found[1].size == 4
+    assert device.closed
+
+
+def test_probe_device_without_commands(device):
+    assert probe.probe_device("/dev/watchdog", [], device=device) == tuple()
+    assert device.calls == 0
+
+
+def test_file_device():
+    with probe.FileDevice("/dev/null") as device:
+        assert device.ioctl(GETSUPPORT.number, 0) == -errno.ENOTTY
+        assert probe.Prober(device).probe(probe.candidates([0x57], sizes=(4,))) == dict()
+    assert device.fd == -1
+
+
+def test_merge_probed():
+    other = request.decode("OTHER", 0x80045701)
+    commands = {"wdt": (GETSUPPORT,), "other": (other,)}
+    found = probe.to_commands([SETTIMEOUT, GETSUPPORT.number])
+    merged = probe.merge_probed(commands, found, ("wdt",))
+    assert merged["wdt"] == (GETSUPPORT, request.decode("0xC0045706", SETTIMEOUT))
+    assert merged["other"] == (other,)
+
+
+def test_merge_probed_handler_without_commands():
+    found = probe.to_commands([SETTIMEOUT])
+    merged = probe.merge_probed({"other": (GETSUPPORT,)}, found, ("wdt",))
+    assert merged == {"other": (GETSUPPORT,), "wdt": found}
+
+
+def test_handler_refids():
+    fileop_structs = [
+        {"function": "wdt_ioctl", "refid": "wdt_8c_1a"},
+        {"function": "compat_ptr_ioctl", "refid": "compat_8c_1b"},
+        {"function": "wdt_ioctl", "refid": "wdt_8c_1a"},
+    ]
+    assert probe.handler_refids(fileop_structs, "wdt_ioctl") == ("wdt_8c_1a",)
+    assert probe.handler_refids(fileop_structs, "compat_8c_1b") == ("compat_8c_1b",)
+    assert probe.handler_refids(fileop_structs, "fop_ioctl") == tuple()
@@ -0,0 +1,69 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import errno
+
+import numpy as np
+import pytest
+
+from skid.fuzzer import scheduler
+from skid.fuzzer.scheduler import Arm
+
+
+@pytest.mark.parametrize(
+    "result, error, expected",
+    [
+        (0, 0, scheduler.SUCCESS),
+        (12, 0, scheduler.SUCCESS),
+        (-1, errno.EINVAL, errno.EINVAL),
+        (-errno.ENOTTY, 0, errno.ENOTTY),
+        (-1, 100000, scheduler.OTHER),
+    ],
+)
+def test_outcome(result, error, expected):
+    assert scheduler.outcome(result, error) == expected
+
+
+def test_record_histograms():
+    sched = scheduler.ErrnoScheduler([Arm("A"), Arm("B", "null")], seed=0)
+    sched.record(np.array([0, 0, 1, 0]), np.array([0, errno.EINVAL, errno.ENOTTY, 0]))
+    assert sched.executions().tolist() == [3, 1]
+    assert sched.outcomes(0) == {"SUCCESS": 2, "EINVAL": 1}
+    assert sched.summary() == [
+        {
+            "command": "A",
+            "shape": "default",
+            "executions": 3,
+            "outcomes": {"SUCCESS": 2, "EINVAL": 1},
+        },
+        {"command": "B", "shape": "null", "executions": 1, "outcomes": {"ENOTTY": 1}},
+    ]
+
+
+def test_rare_outcomes_are_worth_more():
+    sched = scheduler.ErrnoScheduler([Arm("A")], seed=0)
+    sched.record(np.zeros(1000, dtype=int), np.full(1000, errno.EBUSY))
+    common, rare = sched.rewards(np.array([errno.EBUSY, errno.EIO]))
+    assert rare > common
+
+    # Once they are just as common, deeper outcomes are still worth more
+    sched.record(np.zeros(2000, dtype=int), np.repeat([errno.ENOTTY, errno.EFAULT], 1000))
+    enotty, efault = sched.rewards(np.array([errno.ENOTTY, errno.EFAULT]))
+    assert efault > enotty
+
+
+def test_budget_moves_to_deeper_commands():
+    arms = [Arm(f"C{i}") for i in range(20)]
+    sched = scheduler.ErrnoScheduler(arms, seed=1)
+    for _ in range(50):
+        chosen = sched.choose(128)
+        assert chosen.shape == (128,)
+        # Only C3 is handled, the rest are unknown commands
+        outcomes = np.where(chosen == 3, errno.EFAULT, errno.ENOTTY)
+        sched.record(chosen, outcomes)
+
+    executions = sched.executions()
+    assert executions[3] > executions.sum() / 2
+    # The other arms still get some budget
+    assert (executions > 0).sum() > 10
@@ -0,0 +1,217 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import errno
+import os
+
+import pytest
+
+from skid.fuzzer import probe, scheduler, sequences
+from skid.fuzzer.sequences import Dependency
+from skid.interface_recovery.doxygen import find_commands, xml_utils
+from skid.interface_recovery.ioctl import request
+from skid.interface_recovery.scan import lexer
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+HANDLER = """
+static long foo_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+    struct foo_priv *priv = file->private_data;
+    struct foo_config cfg;
+
+    switch (cmd) {
+    case FOO_ALLOC:
+        priv->buf = kzalloc(PAGE_SIZE, GFP_KERNEL);
+        return priv->buf ? 0 : -ENOMEM;
+    case FOO_CONFIG:
+    case FOO_CONFIG_OLD:
+        if (copy_from_user(&cfg, (void __user *)arg, sizeof(cfg)))
+            return -EFAULT;
+        if (cfg.len > FOO_MAX_LEN)
+            return -EINVAL;
+        priv->mode = cfg.mode;
+        return 0;
+    case FOO_SUBMIT:
+        if (!priv->buf || priv->mode != FOO_MODE_RUN)
+            return -EINVAL;
+        submitted++;
+        return 0;
+    case FOO_STATUS:
+        return put_user(submitted, (int __user *)arg);
+    default:
+        return -ENOTTY;
+    }
+}
+"""
+
+ALLOC = request.decode("FOO_ALLOC", 0x4601)
+SUBMIT = request.decode("FOO_SUBMIT", 0x4602)
+STATUS = request.decode("FOO_STATUS", 0x80044603)
+COMMANDS = {command.name: command for command in (ALLOC, SUBMIT, STATUS)}
+
+
+class StatefulDevice(probe.Device):
+    """ SUBMIT only succeeds once ALLOC has, the state is lost when it's closed """
+
+    def __init__(self):
+        self.allocated = False
+        self.closed = False
+
+    def ioctl(self, number, address):
+        if number == ALLOC.number:
+            self.allocated = True
+            return 0
+        if number == SUBMIT.number:
+            return 0 if self.allocated else -errno.EINVAL
+        if number == STATUS.number:
+            return 0
+        return -errno.ENOTTY
+
+    def close(self):
+        self.closed = True
+
+
+def body_of(source):
+    return [(i, line) for i, line in enumerate(source.splitlines(), 1)]
+
+
+def test_local_names():
+    tokens = list(lexer.tokenize(HANDLER))
+    assert sequences.local_names(tokens) == {"file", "cmd", "arg", "priv", "cfg"}
+
+
+def test_case_accesses():
+    accesses = sequences.case_accesses(body_of(HANDLER))
+    assert accesses["FOO_ALLOC"].writes == {"buf"}
+    # Cases that share a body share the access, cfg is a local struct rather than state
+    assert accesses["FOO_CONFIG"] == accesses["FOO_CONFIG_OLD"]
+    assert accesses["FOO_CONFIG"].writes == {"mode"}
+    assert accesses["FOO_SUBMIT"].checks == {"buf", "mode"}
+    assert accesses["FOO_SUBMIT"].writes == {"submitted"}
+    assert accesses["FOO_STATUS"].reads == {"submitted"}
+    assert "default" not in accesses
+
+
+def test_static_dependencies():
+    assert set(sequences.static_dependencies(body_of(HANDLER))) == {
+        Dependency("FOO_ALLOC", "FOO_SUBMIT", sequences.STATIC_CHECKS, "buf"),
+        Dependency("FOO_CONFIG", "FOO_SUBMIT", sequences.STATIC_CHECKS, "mode"),
+        Dependency("FOO_CONFIG_OLD", "FOO_SUBMIT", sequences.STATIC_CHECKS, "mode"),
+        Dependency("FOO_SUBMIT", "FOO_STATUS", sequences.STATIC_READS, "submitted"),
+    }
+
+
+def test_static_dependencies_example(xml_files):
+    body = find_commands.get_function_body(xml_utils.get_root(xml_files[0]), REFID)
+    assert sequences.static_dependencies(body) == [
+        Dependency("WDIOC_SETTIMEOUT", "WDIOC_GETTIMEOUT", sequences.STATIC_READS, "timeout")
+    ]
+
+
+def chain(*names):
+    return [Dependency(a, b, sequences.RUNTIME) for a, b in zip(names, names[1:])]
+
+
+def test_setup_orders_prerequisites():
+    generator = sequences.SequenceGenerator(["A", "B", "C", "D"], chain("A", "B", "C"), seed=0)
+    assert generator.setup_commands() == ("A", "B")
+    assert generator.operational_commands() == ("C", "D")
+    assert generator.setup("C") == ["A", "B"]
+    assert generator.setup("C", done=["A"]) == ["B"]
+    assert generator.setup("D") == []
+
+
+def test_setup_breaks_cycles():
+    generator = sequences.SequenceGenerator(["A", "B"], chain("A", "B", "A"), seed=0)
+    assert generator.setup("B") == ["A"]
+
+
+def test_generate_calls_setup_first():
+    generator = sequences.SequenceGenerator(
+        ["A", "B", "C", "D"], chain("A", "B", "C"), max_length=6, seed=0
+    )
+    for sequence in generator.generate_batch(200):
+        assert 0 < len(sequence) <= 6
+        if "C" in sequence:
+            index = sequence.index("C")
+            assert "A" in sequence[:index] and "B" in sequence[:index]
+            assert sequence.index("A") < sequence.index("B")
+
+
+def test_generate_starts_from_cached_states():
+    generator = sequences.SequenceGenerator(["A", "B"], cached=[("B", "B", "B")], seed=0)
+    starts = [sequence[:3] for sequence in generator.generate_batch(200)]
+    assert 50 < starts.count(("B", "B", "B")) < 150
+
+
+def test_run_sequence():
+    device = StatefulDevice()
+    calls = sequences.to_calls(["FOO_SUBMIT", "FOO_ALLOC", "FOO_SUBMIT"], COMMANDS, dict())
+    assert [call.number for call in calls] == [SUBMIT.number, ALLOC.number, SUBMIT.number]
+    assert all(call.argument == b"" for call in calls)
+    assert sequences.run_sequence(lambda: device, calls) == [errno.EINVAL, 0, 0]
+    assert device.closed
+
+
+def test_to_calls_zeroes_unknown_arguments():
+    (call,) = sequences.to_calls(["FOO_STATUS"], COMMANDS, dict())
+    assert call.argument == bytes(4)
+
+
+def test_learner():
+    generator = sequences.SequenceGenerator(list(COMMANDS), seed=0)
+    learner = sequences.DependencyLearner(list(COMMANDS))
+    for batch in range(3):
+        for sequence in generator.generate_batch(200):
+            calls = sequences.to_calls(sequence, COMMANDS, dict())
+            learner.observe(sequence, sequences.run_sequence(StatefulDevice, calls))
+        # STATUS tends to come before SUBMIT in longer sequences, which tend to have ALLOC
+        assert learner.dependencies() == [
+            Dependency("FOO_ALLOC", "FOO_SUBMIT", sequences.RUNTIME)
+        ], batch
+
+
+def test_reached():
+    assert sequences.reached(
+        ["A", "B", "C", "A"], [scheduler.SUCCESS, errno.EINVAL, errno.EFAULT, scheduler.SUCCESS]
+    ) == ("A", "A")
+
+
+def test_cache_location():
+    assert sequences.cache_location("/dev/foo/0", "/tmp/x") == "/tmp/x/dev_foo_0.json"
+
+
+@pytest.fixture
+def cache_loc(temp_dir):
+    return os.path.join(temp_dir, "cache", "foo.json")
+
+
+def test_cache(cache_loc):
+    cache = sequences.SequenceCache("/dev/foo", ["B", "A"], cache_loc)
+    assert cache.add(["A", "B"], [0, 0])
+    assert not cache.add(["A", "C", "B"], [0, errno.EINVAL, 0])
+    assert not cache.add(["B"], [errno.EINVAL])
+    assert cache.add(["A"], [0])
+    cache.dependencies = chain("A", "B")
+    cache.save()
+
+    loaded = sequences.SequenceCache("/dev/foo", ["A", "B"], cache_loc)
+    assert loaded.deepest() == [("A", "B"), ("A",)]
+    assert loaded.states[("A", "B")] == 2
+    assert loaded.dependencies == chain("A", "B")
+
+    # The commands changed so the states might not mean the same thing
+    assert sequences.SequenceCache("/dev/foo", ["A", "B", "C"], cache_loc).states == dict()
+
+
+def test_cache_keeps_deepest(cache_loc, monkeypatch):
+    monkeypatch.setattr(sequences, "MAX_CACHED", 2)
+    cache = sequences.SequenceCache("/dev/foo", ["A"], cache_loc)
+    cache.add(["A"] * 3, [0] * 3)
+    cache.add(["A"] * 2, [0] * 2)
+    assert not cache.add(["A"], [0])
+    assert cache.add(["A"] * 4, [0] * 4)
+    assert cache.deepest() == [("A",) * 4, ("A",) * 3]
@@ -0,0 +1,205 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import faulthandler
+import os
+import shutil
+import signal
+import threading
+import time
+import zlib
+
+import pytest
+
+from skid.interface_recovery.distributed import coordinator, protocol, worker
+from skid.interface_recovery.doxygen import xml_archive
+from skid.utils import supervisor
+
+EXAMPLE_XML = "tests/resources/example_c_file.xml"
+
+
+@pytest.fixture
+def xml_files(tmp_path):
+    files = list()
+    for i in range(10):
+        location = str(tmp_path / f"example_{i}.xml")
+        shutil.copy(EXAMPLE_XML, location)
+        files.append(location)
+    broken = tmp_path / "broken.xml"
+    broken.write_bytes(b"<doxygen><compounddef>")
+    return files + [str(broken)]
+
+
+def start_workers(address, count, **kwargs):
+    threads = [
+        threading.Thread(
+            target=worker.run, args=(address, 1, f"worker{i}"), kwargs=kwargs, daemon=True
+        )
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def lost_worker(address):
+    """ Takes a batch and disconnects without returning it """
+    with worker.connect(address) as sock:
+        protocol.send(sock, {"type": protocol.HELLO, "name": "flaky"})
+        protocol.recv(sock)
+
+
+def malformed_worker(address):
+    """ Takes a batch and returns a result without it's includes """
+    with worker.connect(address) as sock:
+        protocol.send(sock, {"type": protocol.HELLO, "name": "malformed"})
+        batch, _ = protocol.recv(sock)
+        structs = [{"function": "fop_ioctl"}]
+        protocol.send(sock, {"type": protocol.RESULT, "id": batch["id"], "structs": structs})
+        try:
+            protocol.recv(sock)
+        except ConnectionError:
+            pass
+
+
+EXTRACT = worker.extract
+
+
+def bad_extract(item):
+    """ Hangs on hang.xml and segfaults on crash.xml """
+    if item[0] == "hang.xml":
+        time.sleep(60)
+    if item[0] == "crash.xml":
+        faulthandler.disable()  # pytest's would print the workers stack
+        os.kill(os.getpid(), signal.SIGSEGV)
+    return EXTRACT(item)
+
+
+def test_bad_compounds_are_quarantined(monkeypatch):
+    monkeypatch.setattr(worker, "extract", bad_extract)
+    with open(EXAMPLE_XML, "rb") as f:
+        blob = zlib.compress(f.read())
+    files = ["a.xml", "hang.xml", "crash.xml", "b.xml"]
+    message = {"type": protocol.BATCH, "id": 7, "files": files}
+    try:
+        with supervisor.pool(2, timeout=1) as pool:
+            result = worker.process_batch(message, [blob] * len(files), pool)
+        assert result["failed"] == ["hang.xml", "crash.xml"]
+        assert sorted(result["includes"]) == ["a.xml", "b.xml"]
+        assert len(result["structs"]) == 2 * 2
+        assert {entry.task for entry in supervisor.quarantined()} == {"hang.xml", "crash.xml"}
+    finally:
+        supervisor.clear_quarantine()
+
+
+def test_local_workers(xml_files):
+    coord = coordinator.Coordinator(xml_files, ("127.0.0.1", 0), batch_size=3)
+    threads = start_workers(coord.address, 3)
+    results = coord.run()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+
+    assert len(results.structs) == 2 * 10
+    assert {s["function"] for s in results.structs} == {"fop_ioctl", "compat_ptr_ioctl"}
+    assert results.failed == [xml_files[-1]]
+    assert results.files_including("linux/miscdevice.h") == tuple(sorted(xml_files[:-1]))
+    assert sum(stats.files for stats in results.workers) == len(xml_files)
+    assert results.retries == 0
+    assert len(results.report()) == 1 + len(results.workers) + 1
+
+
+def test_worker_loss_is_retried(xml_files):
+    coord = coordinator.Coordinator(xml_files, ("127.0.0.1", 0), batch_size=4)
+    run = threading.Thread(target=coord.run, daemon=True)
+    run.start()
+    lost_worker(coord.address)
+
+    start_workers(coord.address, 2)
+    run.join(timeout=30)
+    assert not run.is_alive()
+    assert coord.results.retries == 1
+    assert len(coord.results.structs) == 2 * 10
+    assert {stats.name: stats.lost for stats in coord.results.workers}["flaky"] == 1
+
+
+def test_malformed_result_is_retried_without_duplicates(xml_files):
+    coord = coordinator.Coordinator(xml_files, ("127.0.0.1", 0), batch_size=4)
+    run = threading.Thread(target=coord.run, daemon=True)
+    run.start()
+    malformed_worker(coord.address)
+
+    start_workers(coord.address, 2)
+    run.join(timeout=30)
+    assert not run.is_alive()
+    assert coord.results.retries == 1
+    assert len(coord.results.structs) == 2 * 10
+
+
+def result_with(**fields):
+    result = {"type": protocol.RESULT, "id": 1, "structs": [], "includes": {}, "failed": []}
+    return {**result, "seconds": 1, **fields}
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        [],
+        result_with(id=2),
+        {"type": protocol.RESULT, "id": 1, "structs": [], "includes": {}, "failed": []},
+        result_with(structs=3),
+        result_with(structs=[1]),
+        result_with(seconds="x"),
+    ],
+)
+def test_parse_result_malformed(result):
+    with pytest.raises(protocol.ProtocolError):
+        coordinator.parse_result(result, 1)
+
+
+def test_parse_result():
+    result = {
+        "type": protocol.RESULT,
+        "id": 1,
+        "structs": [{"function": "fop_ioctl"}],
+        "includes": {"a.xml": ["linux/fs.h"]},
+        "failed": ["b.xml"],
+        "seconds": 2,
+    }
+    assert coordinator.parse_result(result, 1) == (
+        [{"function": "fop_ioctl"}],
+        {"a.xml": ["linux/fs.h"]},
+        ["b.xml"],
+        2.0,
+    )
+
+
+def test_gives_up_after_max_attempts(xml_files):
+    coord = coordinator.Coordinator(
+        xml_files[:2], ("127.0.0.1", 0), batch_size=2, max_attempts=2
+    )
+    run = threading.Thread(target=coord.run, daemon=True)
+    run.start()
+    lost_worker(coord.address)
+    lost_worker(coord.address)
+    run.join(timeout=10)
+    assert not run.is_alive()
+    assert sorted(coord.results.failed) == sorted(xml_files[:2])
+    assert coord.results.structs == []
+
+
+def test_archive_members(xml_files, tmp_path):
+    archive = xml_archive.pack(str(tmp_path), str(tmp_path / "xml.pack"), compress=True)
+    members = [m for m in xml_archive.list_members(archive) if "broken" not in m]
+    coord = coordinator.Coordinator(members, ("127.0.0.1", 0))
+    start_workers(coord.address, 1)
+    results = coord.run()
+    assert len(results.structs) == 2 * 10
+    assert results.failed == []
+
+
+def test_no_files():
+    coord = coordinator.Coordinator([], ("127.0.0.1", 0))
+    assert coord.run().structs == []
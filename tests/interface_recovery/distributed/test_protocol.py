@@ -0,0 +1,70 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import socket
+import struct
+
+import pytest
+
+from skid.interface_recovery.distributed import protocol
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_round_trip(pair):
+    left, right = pair
+    message = {"type": protocol.BATCH, "id": 3, "files": ["a.xml", "b.xml"]}
+    sent = protocol.send(left, message, [b"\x00" * 10, b""])
+    assert protocol.recv(right) == (message, [b"\x00" * 10, b""])
+    header = b'{"type":"batch","id":3,"files":["a.xml","b.xml"]}'
+    assert sent == protocol.HEADER.size + len(header) + 2 * protocol.BLOB_LENGTH.size + 10
+
+
+def test_closed_connection(pair):
+    left, right = pair
+    left.sendall(protocol.HEADER.pack(10, 0) + b"{")
+    left.close()
+    with pytest.raises(ConnectionError):
+        protocol.recv(right)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        protocol.HEADER.pack(5, 0) + b"nope!",
+        protocol.HEADER.pack(2, 0) + b"[]",
+        protocol.HEADER.pack(protocol.MAX_LENGTH + 1, 0),
+        protocol.HEADER.pack(13, 1) + b'{"type":"hi"}' + struct.pack("!I", 1 << 31),
+    ],
+)
+def test_invalid_messages(pair, data):
+    left, right = pair
+    left.sendall(data)
+    with pytest.raises(protocol.ProtocolError):
+        protocol.recv(right)
+
+
+@pytest.mark.parametrize(
+    "address, expected",
+    [
+        ("build01:9000", ("build01", 9000)),
+        ("build01", ("build01", protocol.DEFAULT_PORT)),
+        (":9000", ("0.0.0.0", 9000)),
+        ("[::1]:9000", ("::1", 9000)),
+    ],
+)
+def test_parse_address(address, expected):
+    assert protocol.parse_address(address) == expected
+
+
+def test_parse_address_bad_port():
+    with pytest.raises(ValueError):
+        protocol.parse_address("build01:http")
@@ -10,6 +10,7 @@ import os
 import pytest
 
 from skid.interface_recovery.doxygen import config
+from skid.utils import tuning
 
 
 @pytest.fixture
@@ -73,6 +74,19 @@ def test_get_config_real(good_config):
     assert dconfig["TAB_SIZE"] == 69
 
 
+def test_get_config_tuned(temp_file):
+    with open(temp_file, "w") as f:
+        json.dump({"LOOKUP_CACHE_SIZE": "1"}, f)
+    tuning.apply(tuning.Profile(2, doxygen={"NUM_PROC_THREADS": "2", "LOOKUP_CACHE_SIZE": "4"}))
+    try:
+        dconfig = config.get(".", temp_file)
+    finally:
+        tuning.apply(None)
+    assert dconfig["NUM_PROC_THREADS"] == "2"
+    assert dconfig["LOOKUP_CACHE_SIZE"] == "1"
+    assert config.get(".", None)["NUM_PROC_THREADS"] == "0"
+
+
 def test_get_config_bad(bad_config):
     with pytest.raises(json.JSONDecodeError):
         config.get(".", bad_config)
@@ -0,0 +1,58 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+from skid.interface_recovery.doxygen import doxygen, find_commands
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+LABELS = (
+    "WDIOC_GETSUPPORT",
+    "WDIOC_GETSTATUS",
+    "WDIOC_GETBOOTSTATUS",
+    "WDIOC_SETOPTIONS",
+    "WDIOC_KEEPALIVE",
+    "WDIOC_SETTIMEOUT",
+    "WDIOC_GETTIMEOUT",
+)
+
+
+def test_compound_id():
+    assert find_commands.compound_id(REFID) == "example__driver_8c"
+
+
+def test_index_xml_files():
+    index = find_commands.index_xml_files(("/a/b/file_8c.xml", "/a/xml.skidpack::struct_8h.xml"))
+    assert index == {"file_8c": "/a/b/file_8c.xml", "struct_8h": "/a/xml.skidpack::struct_8h.xml"}
+
+
+def test_find_commands_in_file(xml_files):
+    assert find_commands.find_commands_in_file((xml_files[0], [REFID])) == {REFID: LABELS}
+
+
+def test_find_commands_in_file_unknown_refid(xml_files):
+    assert find_commands.find_commands_in_file((xml_files[0], ["nope_1a"])) == {"nope_1a": tuple()}
+
+
+def test_find_case_labels():
+    body = [
+        (1, "switch (cmd) {"),
+        (2, "case _IOR('a', 1, int): case A ? B : C:"),
+        (3, "case 1 ... 5: case A ? B : C:"),
+        (4, "default: break; }"),
+    ]
+    assert find_commands.find_case_labels(body) == ("_IOR ( 'a' , 1 , int )", "A ? B : C")
+
+
+def test_find_commands(compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    assert find_commands.find_commands(compound_xml_files, fileop_structs, processes=1) == {
+        REFID: LABELS
+    }
+
+
+def test_find_handler_bodies(compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    bodies = find_commands.find_handler_bodies(compound_xml_files, fileop_structs, processes=1)
+    assert list(bodies) == [REFID]
+    assert bodies[REFID][0][0] == 234
+    assert find_commands.find_case_labels(bodies[REFID]) == LABELS
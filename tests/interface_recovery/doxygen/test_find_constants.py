@@ -0,0 +1,85 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+from lxml import etree
+
+from skid.interface_recovery.doxygen import find_constants
+from skid.interface_recovery.ioctl.evaluator import EnumValue, Macro
+from skid.interface_recovery.ioctl.layouts import Member
+
+HEADER_XML = "tests/resources/uapi/example_watchdog_h.xml"
+STRUCT_XML = "tests/resources/uapi/example_struct.xml"
+
+
+def test_programlisting_defines(xml_files):
+    table = find_constants.find_constants_in_file(xml_files[0])
+    assert table.macros["WDT_ENABLE"] == Macro("WDT_ENABLE", None, "0x9C")
+    assert table.macros["WATCHDOG_TIMEOUT"].body == "30"
+    assert table.macros["pr_fmt"].params == ("fmt",)
+
+
+def test_continuation_lines():
+    table = find_constants.find_constants_in_file(HEADER_XML)
+    assert table.macros["WDIOC_SETPRETIMEOUT"].body.split() == [
+        "_IOWR(WATCHDOG_IOCTL_BASE,",
+        "8,",
+        "wdt_word_t)",
+    ]
+    assert table.macros["WATCHDOG_IOCTL_BASE"].body == "'W'"
+
+
+def test_enums_and_typedefs():
+    table = find_constants.find_constants_in_file(HEADER_XML)
+    assert table.enums == {
+        "WDT_REG_CTRL": EnumValue("4", 0),
+        "WDT_REG_COUNT": EnumValue("4", 1),
+        "WDT_REG_LAST": EnumValue("4", 2),
+    }
+    assert table.typedefs == {"wdt_word_t": "unsigned int"}
+
+
+def test_struct_compound():
+    table = find_constants.find_constants_in_file(STRUCT_XML)
+    record = table.records["watchdog_info"]
+    assert record.kind == "struct"
+    assert record.members == (
+        Member("options", "__u32"),
+        Member("firmware_version", "__u32"),
+        Member("identity", "__u8", ("32",)),
+    )
+
+
+def test_define_memberdef():
+    element = etree.fromstring(
+        "<memberdef kind='define'><name>ADD</name><param><defname>a</defname></param>"
+        "<param><defname>b</defname></param><initializer>((a) + <ref>b</ref>)</initializer>"
+        "</memberdef>"
+    )
+    assert find_constants.parse_define_memberdef(element) == Macro("ADD", ("a", "b"), "((a) + b)")
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("#define A 1 /* one */", Macro("A", None, "1")),
+        ("  #  define A (1)", Macro("A", None, "(1)")),
+        ("#define A(x, y) x", Macro("A", ("x", "y"), "x")),
+        ("#define EMPTY", Macro("EMPTY", None, "")),
+        ("#include <linux/fs.h>", None),
+    ],
+)
+def test_parse_define(line, expected):
+    assert find_constants.parse_define(line) == expected
+
+
+def test_find_constants_all(compound_xml_files):
+    table = find_constants.find_constants(compound_xml_files, processes=2)
+    assert "WDT_ENABLE" in table.macros
+    assert "WDIOC_GETSUPPORT" in table.macros
+    assert "watchdog_info" in table.records
+
+
+def test_find_constants_no_files():
+    assert len(find_constants.find_constants(tuple())) == 0
@@ -0,0 +1,212 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from skid.interface_recovery.doxygen import doxygen, find_commands, find_constraints
+from skid.interface_recovery.doxygen.find_constraints import Constraint
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+HANDLER = """
+static long foo_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+    void __user *argp = (void __user *)arg;
+    struct foo_info __user *uinfo = argp;
+    struct foo_req req;
+    char *name;
+    int mode;
+
+    switch (cmd) {
+    case FOO_SUBMIT:
+    case FOO_SUBMIT_OLD:
+        if (copy_from_user(&req, argp, sizeof(req)))
+            return -EFAULT;
+        if (req.magic != REQ_MAGIC || req.flags & ~REQ_FLAGS)
+            return -EINVAL;
+        if (FOO_MAX_LEN < req.hdr.len)
+            return -EINVAL;
+        switch (req.type) {
+        case REQ_READ:
+        case REQ_WRITE:
+            return foo_submit(&req);
+        default:
+            return -EINVAL;
+        }
+    case FOO_MODE:
+        if (get_user(mode, &uinfo->mode))
+            return -EFAULT;
+        return mode == FOO_MODE_RUN ? 0 : -EINVAL;
+    case FOO_NAME:
+        name = memdup_user(argp, FOO_NAME_LEN);
+        if (strcmp(name, "reset") == 0)
+            return 0;
+        return -EINVAL;
+    }
+    return -ENOTTY;
+}
+"""
+
+CALLEE = """
+static int foo_submit(struct foo_req *req)
+{
+    if (req->len > FOO_QUEUE_LEN)
+        return -ENOSPC;
+    return 0;
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    find_constraints.configure(None)
+    yield
+    find_constraints.configure(None)
+
+
+def body_of(source):
+    return [(i, line) for i, line in enumerate(source.splitlines(), 1)]
+
+
+def test_parameters():
+    assert find_constraints.parameters(find_constraints.tokenize(body_of(HANDLER))) == [
+        "file",
+        "cmd",
+        "arg",
+    ]
+
+
+def test_argument_fields():
+    tokens = find_constraints.tokenize(body_of(HANDLER))
+    assert find_constraints.argument_fields(tokens, "arg") == {
+        "arg": "",
+        "req": "",
+        "mode": "mode",
+        "name": "",
+    }
+
+
+def test_called_functions():
+    tokens = find_constraints.tokenize(body_of(HANDLER))
+    assert find_constraints.called_functions(tokens) == [
+        "copy_from_user",
+        "foo_submit",
+        "get_user",
+        "memdup_user",
+        "strcmp",
+    ]
+
+
+def test_extract():
+    found = find_constraints.extract(body_of(HANDLER), [("foo_submit", body_of(CALLEE))])
+    submit = [
+        ("magic", find_constraints.KIND_EQUAL, "!=", "REQ_MAGIC"),
+        ("flags", find_constraints.KIND_MASK, "&~", "REQ_FLAGS"),
+        ("hdr.len", find_constraints.KIND_BOUND, ">", "FOO_MAX_LEN"),
+        ("type", find_constraints.KIND_EQUAL, "==", "REQ_READ"),
+        ("type", find_constraints.KIND_EQUAL, "==", "REQ_WRITE"),
+    ]
+    assert set(found.constraints) == {
+        Constraint(command, *check)
+        for command in ("FOO_SUBMIT", "FOO_SUBMIT_OLD")
+        for check in submit
+    } | {Constraint("FOO_MODE", "mode", find_constraints.KIND_EQUAL, "==", "FOO_MODE_RUN")}
+    # The callee can't be attributed to the argument so it's only in the dictionary
+    assert found.dictionary == (
+        "REQ_MAGIC",
+        "REQ_FLAGS",
+        "FOO_MAX_LEN",
+        "REQ_READ",
+        "REQ_WRITE",
+        "FOO_MODE_RUN",
+        '"reset"',
+        "FOO_QUEUE_LEN",
+    )
+
+
+def test_extract_example(xml_files):
+    source = find_commands.FunctionSource(xml_files[0])
+    body = source.body(REFID)
+    callees = find_constraints.read_callees(source, body)
+    assert [name for name, _ in callees] == [
+        "wdt_turnoff",
+        "wdt_startup",
+        "wdt_keepalive",
+        "wdt_change",
+    ]
+
+    found = find_constraints.extract(body, callees)
+    # new_options and new_timeout are read with get_user(x, p) so they are the argument
+    assert found.constraints == (
+        Constraint("WDIOC_SETOPTIONS", "", find_constraints.KIND_MASK, "&", "WDIOS_DISABLECARD"),
+        Constraint("WDIOC_SETOPTIONS", "", find_constraints.KIND_MASK, "&", "WDIOS_ENABLECARD"),
+        Constraint("WDIOC_SETTIMEOUT", "", find_constraints.KIND_BOUND, "<", "1"),
+        Constraint("WDIOC_SETTIMEOUT", "", find_constraints.KIND_BOUND, ">", "3600"),
+    )
+    assert "WDT_ENABLE" in found.dictionary and "ALI_WDT_ARM" in found.dictionary
+
+
+def test_is_constant():
+    def is_constant(expression):
+        return find_constraints.is_constant(find_constraints.tokenize([(1, expression)]))
+
+    assert is_constant("FOO_MAX - 1")
+    assert is_constant("sizeof(struct foo) * 2")
+    assert is_constant("'a'")
+    assert not is_constant("len")
+    assert not is_constant("foo(1)")
+    assert not is_constant("")
+
+
+def test_cache(temp_dir, xml_files, monkeypatch):
+    cache_loc = os.path.join(temp_dir, "constraints.cache")
+    find_constraints.configure(cache_loc)
+    expected = find_constraints.find_constraints_in_file((xml_files[0], [REFID]))
+
+    find_constraints.configure(cache_loc)
+    monkeypatch.setattr(find_constraints, "extract", lambda *args: pytest.fail("not cached"))
+    assert find_constraints.find_constraints_in_file((xml_files[0], [REFID])) == expected
+
+
+def test_damaged_cache(temp_file):
+    with open(temp_file, "w") as cache_f:
+        cache_f.write("abc [[], [\n")
+        cache_f.write('def [["A"], [["C", "", "bound", ">", "1"]]]\n')
+    constraint = Constraint("C", "", "bound", ">", "1")
+    assert find_constraints.load_cache(temp_file) == {
+        "def": find_constraints.HandlerConstraints(("A",), (constraint,))
+    }
+
+
+def test_find_handler_constraints(compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    found = doxygen.find_handler_constraints(
+        compound_xml_files, fileop_structs, processes=1, cache_loc=None
+    )
+    assert list(found) == [REFID]
+    assert len(found[REFID].constraints) == 4
+
+
+def test_command_labels_fall_through():
+    body = [
+        (1, "long f(unsigned int cmd, unsigned long arg) {"),
+        (2, "switch (cmd) {"),
+        (3, "case A: a(); fallthrough;"),
+        (4, "case B: if (x) return 1; b(); break;"),
+        (5, "case C: { return c(); }"),
+        (6, "case D: switch (arg) { case 1: return 0; default: return 1; }"),
+        (7, "case E: e();"),
+        (8, "}"),
+        (9, "}"),
+    ]
+    tokens = find_constraints.tokenize(body)
+    labels = find_constraints.command_labels(tokens, "cmd")
+    called = {token.value: labels[i] for i, token in enumerate(tokens) if len(token.value) == 1}
+    assert called["a"] == ("A",)
+    assert called["b"] == ("A", "B")
+    assert called["c"] == ("C",)
+    assert called["e"] == ("E",)
@@ -0,0 +1,169 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+from skid.interface_recovery.doxygen import doxygen, find_commands, find_directions
+from skid.interface_recovery.doxygen.find_directions import ArgumentAccess
+from skid.interface_recovery.ioctl import evaluator, request
+from skid.interface_recovery.ioctl.evaluator import Record
+from skid.interface_recovery.ioctl.layouts import Member
+from skid.interface_recovery.scan import lexer
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+HANDLER = """
+static long foo_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+    struct foo_info __user *uinfo = (struct foo_info __user *)arg;
+    struct foo_info info;
+    char name[FOO_NAME_LEN];
+    u32 mode;
+
+    switch (cmd) {
+    case FOO_GET:
+        if (copy_to_user(uinfo, &info, sizeof(info)))
+            return -EFAULT;
+        return 0;
+    case FOO_SET_MODE:
+        if (get_user(mode, &uinfo->mode))
+            return -EFAULT;
+        return 0;
+    case FOO_SET_NAME:
+        return foo_set_name(file, (void __user *)arg);
+    case FOO_RESET:
+        foo_reset();
+        break;
+    case FOO_XFER:
+        if (copy_from_user(&info, uinfo, sizeof(struct foo_info)))
+            return -EFAULT;
+        fallthrough;
+    case FOO_PEEK:
+        return put_user(info.mode, (u32 __user *)arg);
+    }
+    return 0;
+}
+"""
+
+CALLEE = """
+static int foo_set_name(struct file *file, void __user *buf)
+{
+    char name[FOO_NAME_LEN];
+
+    if (copy_from_user(name, buf, sizeof(name)))
+        return -EFAULT;
+    return 0;
+}
+"""
+
+
+def body_of(source):
+    return [(i, line) for i, line in enumerate(source.splitlines(), 1)]
+
+
+def callees(name):
+    return body_of(CALLEE) if name == "foo_set_name" else []
+
+
+def test_declared_types():
+    types = find_directions.declared_types(list(lexer.tokenize(HANDLER)))
+    assert types == {
+        "file": "struct file *",
+        "cmd": "unsigned int",
+        "arg": "unsigned long",
+        "uinfo": "struct foo_info *",
+        "info": "struct foo_info",
+        "name": "char [FOO_NAME_LEN]",
+        "mode": "u32",
+    }
+
+
+def test_extract():
+    assert find_directions.extract(body_of(HANDLER), callees) == (
+        ArgumentAccess("FOO_GET", "read", (), ("sizeof(struct foo_info)",)),
+        # A single field has no size of it's own
+        ArgumentAccess("FOO_SET_MODE", "write"),
+        ArgumentAccess("FOO_SET_NAME", "write", ("sizeof(char [FOO_NAME_LEN])",)),
+        ArgumentAccess("FOO_RESET", "none"),
+        ArgumentAccess(
+            "FOO_XFER", "read|write", ("sizeof(struct foo_info)",), ("sizeof(u32)",)
+        ),
+        ArgumentAccess("FOO_PEEK", "read", (), ("sizeof(u32)",)),
+    )
+
+
+def test_extract_without_switch():
+    body = body_of(CALLEE.replace("struct file *file", "unsigned int cmd"))
+    assert find_directions.extract(body) == (
+        ArgumentAccess("", "write", ("sizeof(char [FOO_NAME_LEN])",)),
+    )
+
+
+def test_size_expression_without_brackets():
+    types = {"info": "struct foo_info", "uinfo": "struct foo_info *"}
+
+    def size(source):
+        return find_directions.size_expression(list(lexer.tokenize(source)), types)
+
+    assert size("sizeof info") == "sizeof(struct foo_info)"
+    assert size("sizeof *uinfo") == "sizeof(struct foo_info)"
+    assert size("sizeof info * 2") == "sizeof(struct foo_info) * 2"
+    assert size("sizeof info.name[0] + 1") == "sizeof(info . name [ 0 ]) + 1"
+
+
+def test_extract_sizeof_without_brackets():
+    body = body_of(HANDLER.replace("sizeof(info)", "sizeof info"))
+    assert find_directions.extract(body, callees)[0] == ArgumentAccess(
+        "FOO_GET", "read", (), ("sizeof(struct foo_info)",)
+    )
+
+
+def test_extract_example(xml_files):
+    source = find_commands.FunctionSource(xml_files[0])
+    accesses = find_directions.extract(source.body(REFID), source.body_by_name)
+    directions = {access.command: access.direction for access in accesses}
+    assert directions == {
+        "WDIOC_GETSUPPORT": "read",
+        "WDIOC_GETSTATUS": "read",
+        "WDIOC_GETBOOTSTATUS": "read",
+        "WDIOC_SETOPTIONS": "write",
+        "WDIOC_KEEPALIVE": "none",
+        # Falls through to WDIOC_GETTIMEOUT
+        "WDIOC_SETTIMEOUT": "read|write",
+        "WDIOC_GETTIMEOUT": "read",
+    }
+    assert accesses[0].copied_out == ("sizeof(struct watchdog_info)",)
+
+
+def test_reconcile():
+    table = evaluator.ConstantTable()
+    table.records["foo_info"] = Record("struct", (Member("mode", "u32"), Member("len", "u32")))
+    consts = evaluator.ConstantEvaluator(table)
+
+    command = request.decode("FOO_GET", 0x80084601, "struct foo_info")
+    access = ArgumentAccess("FOO_GET", "read", (), ("sizeof(struct foo_info)",))
+    assert find_directions.reconcile(command, access, consts) == (command, True)
+    assert find_directions.reconcile(command, None, consts) == (command, True)
+
+    # Declared with _IO, the handler copies a struct in
+    command = request.decode("FOO_SET", 0x4602)
+    access = ArgumentAccess("FOO_SET", "write", ("sizeof(struct foo_info)", "len"))
+    merged, agrees = find_directions.reconcile(command, access, consts)
+    assert not agrees
+    assert (merged.direction, merged.size, merged.argument) == ("write", 8, "struct foo_info")
+    assert merged.number == command.number
+
+    # _IOR but the handler only reads it
+    command = request.decode("FOO_OPT", 0x80044604, "int")
+    access = ArgumentAccess("FOO_OPT", "write", ("sizeof(int)",))
+    merged, agrees = find_directions.reconcile(command, access, consts)
+    assert not agrees
+    assert (merged.direction, merged.size) == ("read|write", 4)
+
+
+def test_infer_argument_directions(compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    commands = doxygen.infer_argument_directions(compound_xml_files, fileop_structs, processes=1)
+    by_name = {command.name: command for command in commands[REFID]}
+    assert by_name["WDIOC_SETOPTIONS"].direction == "read|write"
+    assert by_name["WDIOC_GETSUPPORT"].direction == "read"
+    assert by_name["WDIOC_GETSUPPORT"].size == 40
@@ -115,6 +115,17 @@ def test_find_fileop_stucts_empty():
         assert find_structs.find_fileop_structs([]) == []
 
 
+def test_iter_fileop_structs(xml_files):
+    res = find_structs.iter_fileop_structs(xml_files * 4, processes=2)
+    assert next(res)["function"] == "fop_ioctl"
+    assert len(list(res)) == 7
+
+
+def test_iter_fileop_structs_empty():
+    with pytest.raises(AssertionError):
+        next(find_structs.iter_fileop_structs(tuple()))
+
+
 ################## TEST FIND FILEOP STRUCTS IN FILE ##################
 
 
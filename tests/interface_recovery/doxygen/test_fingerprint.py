@@ -0,0 +1,104 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from skid.interface_recovery.doxygen import config, fingerprint
+
+
+@pytest.fixture
+def source_tree(temp_dir):
+    os.mkdir(os.path.join(temp_dir, "drivers"))
+    for name, content in (("drivers/a.c", "int a;"), ("drivers/a.h", "int b;"), ("README", "x")):
+        with open(os.path.join(temp_dir, name), "w") as f:
+            f.write(content)
+    yield temp_dir
+
+
+@pytest.fixture
+def output_dir(temp_dir):
+    out = os.path.join(temp_dir, "out")
+    os.mkdir(out)
+    yield out
+
+
+#################### CONFIG ####################
+
+
+def test_config_fingerprint_stable():
+    conf = config.get_default_config("/src")
+    assert fingerprint.config_fingerprint(conf) == fingerprint.config_fingerprint(dict(conf))
+
+
+def test_config_fingerprint_order_independent():
+    assert fingerprint.config_fingerprint({"A": 1, "B": 2}) == fingerprint.config_fingerprint(
+        {"B": 2, "A": 1}
+    )
+
+
+def test_config_fingerprint_changes():
+    conf = config.get_default_config("/src")
+    other = {**conf, "TAB_SIZE": "8"}
+    assert fingerprint.config_fingerprint(conf) != fingerprint.config_fingerprint(other)
+
+
+def test_config_fingerprint_non_dict():
+    with pytest.raises(AssertionError):
+        fingerprint.config_fingerprint("a")
+
+
+#################### SOURCE ####################
+
+
+def test_list_source_files(source_tree):
+    assert fingerprint.list_source_files(source_tree) == ["drivers/a.c", "drivers/a.h"]
+
+
+def test_source_entries(source_tree):
+    entries = fingerprint.source_entries(source_tree, processes=2)
+    assert set(entries) == {"drivers/a.c", "drivers/a.h"}
+    assert entries["drivers/a.c"][1] == len("int a;")
+
+
+def test_source_entries_reuses_hash(source_tree):
+    entries = fingerprint.source_entries(source_tree, processes=2)
+    stale = {k: (v[0], v[1], "cached") for k, v in entries.items()}
+    assert fingerprint.source_entries(source_tree, stale, processes=2) == stale
+
+
+def test_source_fingerprint_content_change(source_tree):
+    before = fingerprint.source_fingerprint(fingerprint.source_entries(source_tree, processes=2))
+    with open(os.path.join(source_tree, "drivers/a.c"), "w") as f:
+        f.write("int c;")
+    after = fingerprint.source_fingerprint(fingerprint.source_entries(source_tree, processes=2))
+    assert before != after
+
+
+def test_source_fingerprint_touch_only(source_tree):
+    before = fingerprint.source_fingerprint(fingerprint.source_entries(source_tree, processes=2))
+    os.utime(os.path.join(source_tree, "drivers/a.c"), ns=(1, 1))
+    after = fingerprint.source_fingerprint(fingerprint.source_entries(source_tree, processes=2))
+    assert before == after
+
+
+#################### STORE ####################
+
+
+def test_load_missing(output_dir):
+    assert fingerprint.load(output_dir) is None
+
+
+def test_save_load_matches(source_tree, output_dir):
+    conf = config.get_default_config(source_tree)
+    current = fingerprint.compute(source_tree, conf, output_dir, processes=2)
+    assert not fingerprint.matches(current, output_dir)
+    fingerprint.save(current, output_dir)
+    assert fingerprint.load(output_dir) == current
+    assert fingerprint.matches(current, output_dir)
+
+    changed = fingerprint.compute(source_tree, {**conf, "TAB_SIZE": "8"}, output_dir, processes=2)
+    assert not fingerprint.matches(changed, output_dir)
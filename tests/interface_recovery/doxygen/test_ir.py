@@ -0,0 +1,176 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from skid.interface_recovery.doxygen import (
+    doxygen,
+    find_commands,
+    find_constants,
+    find_constraints,
+    find_directions,
+    find_device_name,
+    find_structs,
+    ir,
+    validation,
+    xml_archive,
+    xml_utils,
+)
+from tests.conftest import VALID_SCHEMA_LOCATION
+
+REFID = "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"
+
+
+@pytest.fixture
+def ir_loc(temp_dir):
+    return os.path.join(temp_dir, "xml.skidir")
+
+
+@pytest.fixture
+def ir_files(compound_xml_files, ir_loc):
+    return ir.transcode(compound_xml_files, ir_loc, processes=2)
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    yield
+    validation.configure(None)
+
+
+def pairs(compound_xml_files, ir_files):
+    assert [ir.member_name(f) for f in compound_xml_files] == [ir.member_name(f) for f in ir_files]
+    return zip(compound_xml_files, ir_files)
+
+
+def test_transcode(compound_xml_files, ir_files, ir_loc):
+    assert all(ir.is_ir(ir_file) for ir_file in ir_files)
+    assert not any(ir.is_ir(xml_file) for xml_file in compound_xml_files)
+    assert ir_loc + xml_archive.MEMBER_SEPARATOR + "example__driver_8c.xml" in ir_files
+    # index.xml and the stamps are not compounds
+    assert xml_archive.list_members(ir_loc) == ir_files
+
+
+def test_compact(compound_xml_files, ir_files):
+    xml_size = sum(xml_archive.sizes(compound_xml_files))
+    assert sum(xml_archive.sizes(ir_files)) * 4 < xml_size
+
+
+def test_compound(ir_files):
+    compound = ir.load(next(f for f in ir_files if f.endswith("example__driver_8c.xml")))
+    assert compound.trusted
+    assert compound.compounds() == [("file", "example_driver.c")]
+    (fops,) = [
+        member
+        for member in compound.members(("variable",))
+        if compound.string(member.name) == "wdt_fops"
+    ]
+    assert compound.lead(fops, ir.FIELD_TYPE) == "const struct file_operations"
+    assert '<ref refid="' in compound.markup(fops, ir.FIELD_INITIALIZER)
+    assert compound.member_by_id(REFID).bodystart > 0
+    assert compound.member_by_id("nope") is None
+    assert ("#include<linux/fs.h>", True) in compound.includes()
+
+
+def test_find_structs(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_structs.find_fileop_structs_in_file(xml_file)
+        assert find_structs.find_fileop_structs_in_file(ir_file) == expected
+
+
+def test_find_constants(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_constants.find_constants_in_file(xml_file)
+        assert find_constants.find_constants_in_file(ir_file) == expected
+
+
+def test_find_commands(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_commands.find_commands_in_file((xml_file, [REFID, "nope_1a"]))
+        assert find_commands.find_commands_in_file((ir_file, [REFID, "nope_1a"])) == expected
+
+
+def test_find_bodies(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_commands.find_bodies_in_file((xml_file, [REFID, "nope_1a"]))
+        assert find_commands.find_bodies_in_file((ir_file, [REFID, "nope_1a"])) == expected
+
+
+def test_find_constraints(compound_xml_files, ir_files):
+    find_constraints.configure(None)
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_constraints.find_constraints_in_file((xml_file, [REFID]))
+        assert find_constraints.find_constraints_in_file((ir_file, [REFID])) == expected
+
+
+def test_find_directions(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        expected = find_directions.find_directions_in_file((xml_file, [REFID]))
+        assert find_directions.find_directions_in_file((ir_file, [REFID])) == expected
+
+
+def test_includes(compound_xml_files, ir_files):
+    for xml_file, ir_file in pairs(compound_xml_files, ir_files):
+        for header in ("linux/fs.h", "linux/types.h", "nope.h"):
+            has_header = xml_utils.xml_file_has_header((xml_file, header))[0]
+            assert xml_utils.xml_file_has_header((ir_file, header)) == (has_header, ir_file)
+            assert find_device_name.xml_file_includes((ir_file, header)) == (has_header, ir_file)
+
+
+def test_resolve_commands(compound_xml_files, ir_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    assert doxygen.find_fileop_structs(ir_files) == fileop_structs
+    expected = doxygen.resolve_ioctl_commands(compound_xml_files, fileop_structs)
+    assert doxygen.resolve_ioctl_commands(ir_files, fileop_structs) == expected
+
+
+def test_transcode_packed(compound_xml_files, temp_dir, ir_loc):
+    xml_dir = os.path.dirname(compound_xml_files[0])
+    archive_loc = xml_archive.pack(xml_dir, os.path.join(temp_dir, "xml.skidpack"), True)
+    members = xml_archive.list_members(archive_loc)
+    ir_files = ir.transcode(members, ir_loc, processes=2)
+    assert [ir.member_name(f) for f in ir_files] == [ir.member_name(f) for f in members]
+    for member, ir_file in zip(members, ir_files):
+        expected = find_structs.find_fileop_structs_in_file(member)
+        assert find_structs.find_fileop_structs_in_file(ir_file) == expected
+
+
+def fail(xml_file):
+    raise AssertionError(f"{xml_file} should have been reused")
+
+
+def test_transcode_reuses_unchanged(compound_xml_files, ir_files, ir_loc, monkeypatch):
+    monkeypatch.setattr(ir, "transcode_file", fail)
+    assert ir.transcode(compound_xml_files, ir_loc, processes=2) == ir_files
+    assert find_structs.find_fileop_structs_in_file(ir_files[0]) == (
+        find_structs.find_fileop_structs_in_file(compound_xml_files[0])
+    )
+
+    # A new validation mode could change the verdicts
+    validation.configure(validation.MODE_STRUCTURAL)
+    with pytest.raises(AssertionError, match="reused"):
+        ir.transcode(compound_xml_files, ir_loc, processes=2)
+
+
+def test_transcode_untrusted(compound_xml_files, temp_dir, ir_loc):
+    (driver,) = [f for f in compound_xml_files if f.endswith("example__driver_8c.xml")]
+    with open(driver) as xml_f:
+        xml = xml_f.read()
+    with open(driver, "w") as xml_f:
+        xml_f.write(xml.replace("<briefdescription>", "<unexpected/><briefdescription>", 1))
+
+    cache = os.path.join(temp_dir, "validation.cache")
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    ir_files = ir.transcode((driver,), ir_loc, processes=1)
+    assert not ir.load(ir_files[0]).trusted
+    assert find_structs.find_fileop_structs_in_file(ir_files[0]) == list()
+
+
+def test_corrupt():
+    with pytest.raises(ir.IRError):
+        ir.Compound(b"SKIR")
+    with pytest.raises(ir.IRError):
+        ir.Compound(b"NOPE" + bytes(ir.HEADER.size))
@@ -0,0 +1,95 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from skid.interface_recovery.doxygen import find_structs, validation, xml_utils
+from tests.conftest import TEST_XML_FILES, VALID_SCHEMA_LOCATION
+
+
+class NoSchema:
+    def validate(self, root):
+        raise AssertionError("The verdict should have come from the cache")
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    yield
+    validation.configure(None)
+
+
+@pytest.fixture
+def broken_xml(temp_dir):
+    """ The example compound with an element the schema doesn't allow """
+    with open(TEST_XML_FILES[0]) as xml_f:
+        xml = xml_f.read()
+    location = os.path.join(temp_dir, "broken.xml")
+    with open(location, "w") as xml_f:
+        xml_f.write(xml.replace("<briefdescription>", "<unexpected/><briefdescription>", 1))
+    return location
+
+
+@pytest.fixture
+def cache(temp_dir):
+    return os.path.join(temp_dir, "validation.cache")
+
+
+def test_trusted_without_validation():
+    root = xml_utils.get_root(TEST_XML_FILES[0])
+    for mode in (None, validation.MODE_FULL):
+        validation.configure(mode)
+        assert validation.trusted(TEST_XML_FILES[0], root)
+
+
+def test_lazy_valid(cache):
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    assert validation.trusted(TEST_XML_FILES[0], xml_utils.get_root(TEST_XML_FILES[0]))
+    with open(cache) as cache_f:
+        (line,) = cache_f.readlines()
+    assert line.endswith(" 1\n")
+
+
+def test_lazy_invalid(broken_xml, cache):
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    assert not validation.trusted(broken_xml, xml_utils.get_root(broken_xml))
+    assert list(validation.load_cache(cache).values()) == [False]
+
+
+def test_lazy_cached_across_runs(broken_xml, cache):
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    for xml_file in (TEST_XML_FILES[0], broken_xml):
+        validation.trusted(xml_file, xml_utils.get_root(xml_file))
+
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    validation._schema = NoSchema()
+    assert validation.trusted(TEST_XML_FILES[0], xml_utils.get_root(TEST_XML_FILES[0]))
+    assert not validation.trusted(broken_xml, xml_utils.get_root(broken_xml))
+
+
+def test_load_cache_damaged(cache):
+    with open(cache, "w") as cache_f:
+        cache_f.write("a:b 1\ngarbage\nc:d 0\ne:f 2\n")
+    assert validation.load_cache(cache) == {"a:b": True, "c:d": False}
+    assert validation.load_cache(cache + ".missing") == dict()
+
+
+def test_structural(temp_dir):
+    validation.configure(validation.MODE_STRUCTURAL)
+    root = xml_utils.get_root(TEST_XML_FILES[0])
+    assert validation.trusted(TEST_XML_FILES[0], root)
+
+    for location in root.iter("location"):
+        del location.attrib["line"]
+        break
+    assert not validation.trusted(TEST_XML_FILES[0], root)
+
+
+def test_find_structs_drops_untrusted(broken_xml, cache):
+    assert len(find_structs.find_fileop_structs_in_file(broken_xml)) > 0
+    validation.configure(validation.MODE_LAZY, VALID_SCHEMA_LOCATION, cache)
+    assert find_structs.find_fileop_structs_in_file(broken_xml) == list()
+    assert len(find_structs.find_fileop_structs_in_file(TEST_XML_FILES[0])) > 0
@@ -0,0 +1,140 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import mmap
+import os
+
+import pytest
+from lxml import etree
+
+from skid.interface_recovery.doxygen import find_structs, xml_archive, xml_utils
+from tests.conftest import TEST_RESOURCES, TEST_XML_FILES
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "compressed"])
+def archive(request, temp_dir):
+    return xml_archive.pack(TEST_RESOURCES, os.path.join(temp_dir, "xml.skidpack"), request.param)
+
+
+@pytest.fixture
+def member(archive):
+    return xml_archive.member_path(archive, os.path.basename(TEST_XML_FILES[0]))
+
+
+###################### TEST PACK ######################
+
+
+def test_pack_bad_dir(temp_dir):
+    with pytest.raises(AssertionError):
+        xml_archive.pack("/asdf/asdf/asdf", os.path.join(temp_dir, "a"))
+
+
+def test_pack_is_archive(archive):
+    assert xml_archive.is_archive(archive)
+    assert not os.path.exists(archive + ".tmp")
+
+
+def test_is_archive_plain_file():
+    assert not xml_archive.is_archive(TEST_XML_FILES[0])
+    assert not xml_archive.is_archive("/asdf/asdf/asdf")
+
+
+###################### TEST MEMBERS ######################
+
+
+def test_list_members(archive, member):
+    assert xml_archive.list_members(archive) == (member,)
+
+
+def test_split_member_path(archive, member):
+    assert xml_archive.split_member_path(member) == (archive, "example_c_file.xml")
+
+
+def test_member_exists(archive, member):
+    assert xml_archive.exists(member)
+    assert xml_archive.exists(TEST_XML_FILES[0])
+    assert not xml_archive.exists(xml_archive.member_path(archive, "fake.xml"))
+
+
+def test_member_exists_not_an_archive(temp_file):
+    assert not xml_archive.exists(xml_archive.member_path("/asdf/asdf/asdf", "fake.xml"))
+    assert not xml_archive.exists(xml_archive.member_path(temp_file, "fake.xml"))
+    assert not xml_archive.exists(xml_archive.member_path(TEST_XML_FILES[0], "fake.xml"))
+
+
+def test_member_exists_uses_cached_index(archive, member, monkeypatch):
+    assert xml_archive.exists(member)
+    monkeypatch.setattr(xml_archive, "is_archive", pytest.fail)
+    monkeypatch.setattr(xml_archive.os.path, "isfile", pytest.fail)
+    assert xml_archive.exists(member)
+
+
+def test_write_closes_cached_archive(archive, member):
+    mapped, _, _ = xml_archive._open(archive)  # pylint: disable=protected-access
+    xml_archive.write(archive, [("other.xml", b"<doxygen/>")])
+    assert mapped.closed
+    assert not xml_archive.exists(member)
+    assert xml_archive.exists(xml_archive.member_path(archive, "other.xml"))
+
+
+def test_read_member_matches_file(member):
+    with open(TEST_XML_FILES[0], "rb") as xml_f:
+        expected = xml_f.read()
+    assert xml_archive.read(member) == expected
+    assert xml_archive.size(member) == len(expected)
+
+
+def test_read_missing_member(archive):
+    with pytest.raises(xml_archive.ArchiveError):
+        xml_archive.read(xml_archive.member_path(archive, "fake.xml"))
+
+
+def test_open_bad_archive(temp_file):
+    with open(temp_file, "wb") as f:
+        f.write(b"SKIDPACK")
+    with pytest.raises(xml_archive.ArchiveError):
+        xml_archive.read(xml_archive.member_path(temp_file, "a.xml"))
+
+
+def test_open_corrupt_index(temp_file, monkeypatch):
+    index = b"{not json"
+    header = xml_archive.ARCHIVE_HEADER.pack(
+        xml_archive.ARCHIVE_MAGIC,
+        xml_archive.ARCHIVE_VERSION,
+        0,
+        xml_archive.ARCHIVE_HEADER.size,
+        len(index),
+    )
+    with open(temp_file, "wb") as f:
+        f.write(header + index)
+
+    mapped = list()
+
+    class RecordedMmap(mmap.mmap):
+        def __new__(cls, *args, **kwargs):
+            mapped.append(super().__new__(cls, *args, **kwargs))
+            return mapped[-1]
+
+    monkeypatch.setattr(xml_archive.mmap, "mmap", RecordedMmap)
+    with pytest.raises(xml_archive.ArchiveError):
+        xml_archive.read(xml_archive.member_path(temp_file, "a.xml"))
+    assert len(mapped) == 1 and mapped[0].closed
+
+
+###################### TEST TRANSPARENT ACCESS ######################
+
+
+def test_get_root_member(member):
+    assert isinstance(xml_utils.get_root(member), etree._ElementTree)  # pylint: disable=protected-access
+
+
+def test_get_schema_member(archive):
+    schema = xml_utils.get_schema(xml_archive.member_path(archive, "example_schema.xsd"))
+    assert isinstance(schema, etree.XMLSchema)
+
+
+def test_find_structs_in_member(member):
+    expected = find_structs.find_fileop_structs_in_file(TEST_XML_FILES[0])
+    assert find_structs.find_fileop_structs_in_file(member) == expected
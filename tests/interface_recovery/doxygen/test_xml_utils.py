@@ -94,3 +94,10 @@ def test_filter_xml_file_by_header_none(xml_files):
         False,
         xml_files[0],
     )
+
+
+def test_find_includes():
+    root = xml_utils.get_root("tests/resources/example_c_file.xml")
+    includes = xml_utils.find_includes(root)
+    assert includes[:2] == ["linux/module.h", "linux/moduleparam.h"]
+    assert "linux/miscdevice.h" in includes
@@ -0,0 +1,112 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import pytest
+from lxml import etree
+
+from skid.interface_recovery.doxygen import find_structs, xml_utils, xpath
+
+MEMBERDEF = """
+<memberdef kind="{kind}" id="fops">
+  {type}
+  <name>wdt_fops</name>
+  {initializer}
+  <location file="driver.c" line="10"/>
+</memberdef>
+"""
+
+TYPE = "<type>const struct file_operations</type>"
+INITIALIZER = '<initializer>= { .unlocked_ioctl = <ref refid="a">wdt_ioctl</ref>, }</initializer>'
+
+
+def compound(*memberdefs):
+    return etree.ElementTree(
+        etree.fromstring(
+            "<doxygen><compounddef><sectiondef>"
+            + "".join(memberdefs)
+            + "</sectiondef></compounddef></doxygen>"
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "kind, type_xml, initializer",
+    [
+        ("variable", TYPE, INITIALIZER),
+        ("function", TYPE, INITIALIZER),
+        ("variable", "", INITIALIZER),
+        ("variable", TYPE, ""),
+        ("variable", "<type/>", INITIALIZER),
+        ("variable", "<type>const struct FILE_OPERATIONS</type>", INITIALIZER),
+        ("variable", '<type>const struct <ref refid="f">file_operations</ref></type>', INITIALIZER),
+        ("variable", TYPE + "<type>int</type>", INITIALIZER),
+        ("variable", TYPE + TYPE, INITIALIZER),
+    ],
+)
+def test_fileops_memberdefs_matches_python(kind, type_xml, initializer):
+    root = compound(MEMBERDEF.format(kind=kind, type=type_xml, initializer=initializer))
+    expected = [
+        element
+        for element in root.iter("memberdef")
+        if find_structs.is_memberdef_a_file_ops_struct(element)
+    ]
+    assert xpath.FILEOPS_MEMBERDEFS(root) == expected
+
+
+def test_fileops_memberdefs_only_candidates():
+    other = MEMBERDEF.format(kind="variable", type="<type>int</type>", initializer=INITIALIZER)
+    fops = MEMBERDEF.format(kind="variable", type=TYPE, initializer=INITIALIZER)
+    root = compound(*([other] * 100 + [fops] + [other] * 100))
+    (element,) = xpath.FILEOPS_MEMBERDEFS(root)
+    assert element.find("type").text == "const struct file_operations"
+
+
+def test_include_directives(xml_files):
+    root = xml_utils.get_root(xml_files[0])
+    expected = [
+        highlight
+        for codeline in root.iter("codeline")
+        for highlight in codeline.iter("highlight")
+        if highlight.text is not None
+        and "include" in highlight.text
+        and "#" in highlight.text
+        and highlight.attrib["class"] == "preprocessor"
+    ]
+    assert len(expected) > 0
+    assert xpath.INCLUDE_DIRECTIVES(root) == expected
+
+
+def test_memberdef_by_id():
+    root = compound(
+        MEMBERDEF.format(kind="variable", type=TYPE, initializer=""),
+        '<memberdef kind="function" id="wdt_ioctl"><name>wdt_ioctl</name></memberdef>',
+    )
+    (element,) = xpath.MEMBERDEF_BY_ID(root, id="wdt_ioctl")
+    assert element.find("name").text == "wdt_ioctl"
+    assert xpath.MEMBERDEF_BY_ID(root, id="missing") == []
+
+
+def test_codelines_between():
+    root = etree.ElementTree(
+        etree.fromstring(
+            "<doxygen><compounddef><programlisting>"
+            + "".join(f'<codeline lineno="{line}"/>' for line in range(1, 21))
+            + "</programlisting></compounddef></doxygen>"
+        )
+    )
+    codelines = xpath.CODELINES_BETWEEN(root, start=9, end=12)
+    assert [int(codeline.attrib["lineno"]) for codeline in codelines] == [9, 10, 11, 12]
+
+
+def test_constant_memberdefs_in_order():
+    root = compound(
+        '<memberdef kind="typedef" id="a"/>',
+        '<memberdef kind="variable" id="b"/>',
+        '<memberdef kind="define" id="c"/>',
+        '<memberdef kind="enum" id="d"/>',
+        '<memberdef kind="function" id="e"/>',
+    )
+    ids = [element.attrib["id"] for element in xpath.CONSTANT_MEMBERDEFS(root)]
+    assert ids == ["a", "c", "d"]
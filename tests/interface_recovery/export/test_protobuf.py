@@ -0,0 +1,178 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from skid.interface_recovery.doxygen import doxygen
+from skid.interface_recovery.export import protobuf
+from skid.interface_recovery.ioctl import evaluator, request
+from skid.interface_recovery.ioctl.evaluator import Macro, Record
+from skid.interface_recovery.ioctl.layouts import Member
+
+RECORD = {
+    "function": "fop_ioctl",
+    "refid": "example__driver_8c_1a243d17718e8710d65139b4ac93320c5a",
+    "struct_name": "wdt_fops",
+    "struct_line_number": 290,
+    "file_path": "tests/resources/example_driver.c",
+    "fop_type": "unlocked_ioctl",
+}
+
+COMMANDS = (
+    request.decode("WDIOC_GETSUPPORT", 0x80285700, "struct watchdog_info"),
+    request.decode("WDIOC_KEEPALIVE", 0x5705),
+    request.decode("WDIOC_SETTIMEOUT", 0xC0045706, "int"),
+    request.decode("WDIOC_OPAQUE", 0x80085709, "struct not_recovered"),
+)
+
+
+@pytest.fixture
+def consts():
+    table = evaluator.ConstantTable(
+        macros={"LEN": Macro("LEN", None, "32")},
+        records={
+            "watchdog_info": Record(
+                "struct",
+                (
+                    Member("options", "__u32"),
+                    Member("timeouts", "unsigned long", ("2",)),
+                    Member("identity", "__u8", ("LEN",)),
+                    Member("value", "union wdt_value"),
+                    Member("next", "struct watchdog_info *"),
+                ),
+            ),
+            "wdt_value": Record("union", (Member("word", "s32"), Member("raw", "u16", ("2",)))),
+        },
+    )
+    return evaluator.ConstantEvaluator(table)
+
+
+def test_interface_round_trip():
+    data = protobuf.encode_interface(RECORD, COMMANDS, "a.proto")
+    decoded = protobuf.decode_interface(data)
+    commands = decoded.pop("commands")
+    assert decoded == {**RECORD, "proto_file": "a.proto"}
+    assert commands[0] == {
+        "name": "WDIOC_GETSUPPORT",
+        "number": 0x80285700,
+        "direction": "read",
+        "size": 40,
+        "argument": "struct watchdog_info",
+    }
+    assert commands[1]["direction"] == "none"
+    assert commands[2]["direction"] == "read|write"
+
+
+def test_generate_interface_proto(consts):
+    proto = protobuf.generate_interface_proto(RECORD, COMMANDS, consts, package="wdt")
+    assert "package skid.wdt;" in proto
+    assert "  uint32 options = 1;  // __u32, offset 0, 4 bytes" in proto
+    assert "  repeated uint64 timeouts = 2;  // unsigned long[2], offset 8, 16 bytes" in proto
+    assert "  bytes identity = 3;  // __u8[LEN], offset 24, 32 bytes" in proto
+    assert "  oneof value {" in proto
+    assert "    bytes raw = 2;  // u16[2]" in proto
+    assert "  uint64 next = 5;" in proto
+    assert "  uint32 value = 4;" not in proto
+    assert "  WdtValue value = 4;  // union wdt_value, offset 56, 4 bytes" in proto
+    assert "// struct not_recovered was not recovered\nmessage NotRecovered {" in proto
+    assert "message WdiocKeepaliveCommand {\n}" in proto
+    assert "    WdiocGetsupportCommand wdioc_getsupport = 1;  // 0x80285700 read, 40 bytes" in proto
+    # Each struct is only generated once
+    assert proto.count("message WatchdogInfo {") == 1
+
+
+def test_generate_interface_proto_unnamed_members():
+    table = evaluator.ConstantTable(
+        records={
+            "regs": Record(
+                "struct",
+                (
+                    Member("", "struct regs_lo"),
+                    Member("anon1", "int"),
+                    Member("", "int", bits="3"),
+                    Member("", "int", bits="0"),
+                    Member("", "int"),
+                    Member("flags", "int", bits="4"),
+                ),
+            ),
+            "regs_lo": Record("struct", (Member("lo", "int"),)),
+        }
+    )
+    commands = (request.decode("REGS_GET", 0x80106101, "struct regs"),)
+    proto = protobuf.generate_interface_proto(RECORD, commands, evaluator.ConstantEvaluator(table))
+    assert "  RegsLo anon2 = 1;  // struct regs_lo, offset 0, 4 bytes" in proto
+    assert "  int32 anon1 = 2;  // int, offset 4, 4 bytes" in proto
+    assert "  int32 anon3 = 3;  // int, offset 12, 4 bytes" in proto
+    assert "  int32 flags = 4;  // int, offset 16, 4 bytes" in proto
+
+
+def test_unique_names():
+    assert protobuf.unique_names(["", "anon1", "", "x"]) == ["anon2", "anon1", "anon3", "x"]
+
+
+def test_generate_interface_proto_without_layouts():
+    proto = protobuf.generate_interface_proto(RECORD, COMMANDS)
+    assert "// struct watchdog_info was not recovered" in proto
+    assert "  int32 arg = 1;  // int" in proto
+
+
+@pytest.mark.parametrize(
+    "name, camel", [("WDIOC_GETSUPPORT", "WdiocGetsupport"), ("watchdog_info", "WatchdogInfo"), ("_", "Unnamed")]
+)
+def test_camel_case(name, camel):
+    assert protobuf.camel_case(name) == camel
+
+
+def test_identifier():
+    assert protobuf.identifier("_IOR('a', 1, int)") == "IOR_a_1_int"
+    assert protobuf.identifier("1abc") == "_1abc"
+
+
+def test_export(temp_dir, consts):
+    records = [RECORD, {**RECORD, "fop_type": "compat_ioctl"}, {**RECORD, "function": "b", "refid": ""}]
+    export_dir = os.path.join(temp_dir, "export")
+    written = protobuf.export(iter(records), export_dir, {RECORD["refid"]: COMMANDS}, consts)
+    assert written == 3
+    assert sorted(os.listdir(export_dir)) == [
+        "example_driver_wdt_fops_b.proto",
+        "example_driver_wdt_fops_fop_ioctl.proto",
+        "interfaces.pb",
+        "skid.proto",
+    ]
+
+    with open(os.path.join(export_dir, protobuf.RECORDS_FILENAME), "rb") as records_f:
+        exported = list(protobuf.iter_interfaces(records_f))
+    assert [len(record["commands"]) for record in exported] == [4, 4, 0]
+    assert exported[1]["proto_file"] == "example_driver_wdt_fops_fop_ioctl.proto"
+
+
+def test_export_name_clash(temp_dir):
+    records = [RECORD, {**RECORD, "file_path": "other/example_driver.c"}]
+    protobuf.export(records, temp_dir)
+    assert "example_driver_wdt_fops_fop_ioctl_2.proto" in os.listdir(temp_dir)
+
+
+def test_export_from_doxygen(temp_dir, compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    consts = doxygen.get_constant_evaluator(compound_xml_files, processes=1)
+    commands = doxygen.resolve_ioctl_commands(compound_xml_files, fileop_structs, 1, consts)
+    export_dir = os.path.join(temp_dir, "export")
+    protobuf.export(fileop_structs, export_dir, commands, consts)
+    with open(os.path.join(export_dir, "example_driver_wdt_fops_fop_ioctl.proto")) as proto_f:
+        assert "bytes identity = 3;  // __u8[32], offset 8, 32 bytes" in proto_f.read()
+
+
+@pytest.mark.skipif(shutil.which("protoc") is None, reason="protoc is not installed")
+def test_protoc_accepts_export(temp_dir, consts):
+    protobuf.export([RECORD], temp_dir, {RECORD["refid"]: COMMANDS}, consts)
+    protos = [name for name in os.listdir(temp_dir) if name.endswith(".proto")]
+    subprocess.run(
+        ["protoc", f"--proto_path={temp_dir}", "--descriptor_set_out=/dev/null"] + protos,
+        check=True,
+    )
@@ -0,0 +1,76 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import io
+
+import pytest
+
+from skid.interface_recovery.export import protowire
+
+
+@pytest.mark.parametrize(
+    "value, encoded",
+    [
+        (0, b"\x00"),
+        (1, b"\x01"),
+        (127, b"\x7f"),
+        (128, b"\x80\x01"),
+        (300, b"\xac\x02"),
+        (0xFFFFFFFF, b"\xff\xff\xff\xff\x0f"),
+        (-1, b"\xff\xff\xff\xff\xff\xff\xff\xff\xff\x01"),
+    ],
+)
+def test_varint(value, encoded):
+    assert protowire.encode_varint(value) == encoded
+    decoded, pos = protowire.decode_varint(encoded, 0)
+    assert pos == len(encoded)
+    assert decoded == value & 0xFFFFFFFFFFFFFFFF
+
+
+@pytest.mark.parametrize("value, encoded", [(0, 0), (-1, 1), (1, 2), (-2, 3), (2147483647, 4294967294)])
+def test_zigzag(value, encoded):
+    assert protowire.zigzag(value) == encoded
+
+
+def test_fields():
+    # The example from the protobuf encoding documentation, field 1 = 150
+    assert protowire.varint_field(1, 150) == b"\x08\x96\x01"
+    assert protowire.string_field(2, "testing") == b"\x12\x07testing"
+    assert protowire.varint_field(3, True) == b"\x18\x01"
+
+
+def test_proto3_defaults_are_skipped():
+    assert protowire.varint_field(1, 0) == b""
+    assert protowire.string_field(1, "") == b""
+    assert protowire.message_field(1, b"") == b"\x0a\x00"
+
+
+def test_iter_fields():
+    message = protowire.varint_field(1, 150) + protowire.string_field(2, "a") + b"\x1d\x01\x00\x00\x00"
+    assert list(protowire.iter_fields(message)) == [
+        (1, protowire.WIRE_VARINT, 150),
+        (2, protowire.WIRE_LEN, b"a"),
+        (3, protowire.WIRE_I32, 1),
+    ]
+
+
+@pytest.mark.parametrize("message", [b"\x08", b"\x12\x05ab", b"\x0b", b"\x08\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff"])
+def test_iter_fields_malformed(message):
+    with pytest.raises(protowire.WireFormatError):
+        list(protowire.iter_fields(message))
+
+
+def test_delimited_round_trip():
+    stream = io.BytesIO()
+    messages = [b"", b"a", b"b" * 300]
+    written = sum(protowire.write_delimited(stream, message) for message in messages)
+    assert written == len(stream.getvalue()) == 1 + 2 + 302
+    stream.seek(0)
+    assert list(protowire.iter_delimited(stream)) == messages
+
+
+def test_delimited_truncated():
+    stream = io.BytesIO(b"\x05abc")
+    with pytest.raises(protowire.WireFormatError):
+        list(protowire.iter_delimited(stream))
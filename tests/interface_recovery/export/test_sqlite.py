@@ -0,0 +1,117 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import sqlite3
+
+import pytest
+
+from skid.interface_recovery.export import sqlite
+from skid.interface_recovery.ioctl import request
+
+
+def fops(function, struct_name, file_path, fop_type="unlocked_ioctl", refid="", line=10):
+    return {
+        "function": function,
+        "refid": refid,
+        "struct_name": struct_name,
+        "struct_line_number": line,
+        "file_path": file_path,
+        "fop_type": fop_type,
+    }
+
+
+RECORDS = (
+    fops("wdt_ioctl", "wdt_fops", "drivers/watchdog/wdt.c", refid="wdt_8c_1a"),
+    fops("compat_ptr_ioctl", "wdt_fops", "drivers/watchdog/wdt.c", "compat_ioctl"),
+    fops("pi433_ioctl", "pi433_fops", "drivers/staging/pi433/pi433_if.c", refid="pi433_1a"),
+    fops("compat_ptr_ioctl", "pi433_fops", "drivers/staging/pi433/pi433_if.c", "compat_ioctl"),
+    fops("other_ioctl", "other_fops", "drivers/Staging/other.c", line=20),
+)
+
+COMMANDS = {
+    "wdt_8c_1a": (
+        request.decode("WDIOC_GETSUPPORT", 0x80285700, "struct watchdog_info"),
+        request.decode("WDIOC_KEEPALIVE", 0x5705),
+    ),
+    "pi433_1a": (request.decode("PI433_IOC_RD_TX_CFG", 0x80107000, "struct pi433_tx_cfg"),),
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "skid.db")
+    sqlite.export(iter(RECORDS), path, COMMANDS, {"drivers/watchdog/wdt.c": ["watchdog"]})
+    return path
+
+
+def test_export_counts(database):
+    connection = sqlite3.connect(database)
+    count = lambda table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    assert count("files") == 3
+    assert count("fops_structs") == 3
+    assert count("handlers") == 5
+    # compat_ptr_ioctl is one function shared by both structs
+    assert count("functions") == 4
+    assert count("commands") == 3
+    assert count("device_names") == 1
+
+
+def test_export_replaces_database(database):
+    assert sqlite.export(RECORDS[:1], database) == 1
+    assert len(sqlite.query(database)) == 1
+
+
+def test_export_batches(database, monkeypatch):
+    monkeypatch.setattr(sqlite, "BATCH_SIZE", 2)
+    assert sqlite.export(RECORDS, database, COMMANDS) == len(RECORDS)
+    assert len(sqlite.query(database)) == len(RECORDS)
+
+
+def test_query_compat_ptr_ioctl(database):
+    found = sqlite.query(database, fop_type="compat_ioctl", function="compat_ptr_ioctl")
+    assert [i["struct_name"] for i in found] == ["pi433_fops", "wdt_fops"]
+    assert found[0]["commands"] == []
+
+
+def test_query_path_glob_is_case_sensitive(database):
+    found = sqlite.query(database, path="drivers/staging/*")
+    assert {i["function"] for i in found} == {"pi433_ioctl", "compat_ptr_ioctl"}
+
+
+def test_query_commands(database):
+    (found,) = sqlite.query(database, command="WDIOC_KEEPALIVE")
+    assert found["function"] == "wdt_ioctl"
+    assert [c["name"] for c in found["commands"]] == ["WDIOC_KEEPALIVE", "WDIOC_GETSUPPORT"]
+    assert sqlite.query(database, command="0x80107000")[0]["function"] == "pi433_ioctl"
+    assert sqlite.query(database, command="NOT_A_COMMAND") == []
+
+
+def test_query_uses_indexes(tmp_path):
+    database = str(tmp_path / "large.db")
+    records = [fops(f"f{i}", f"s{i}", f"drivers/d{i % 50}/f{i}.c", line=i) for i in range(2000)]
+    records += [
+        fops("compat_ptr_ioctl", f"s{i}", f"drivers/f{i}.c", "compat_ioctl") for i in range(50)
+    ]
+    sqlite.export(records, database)
+    connection = sqlite3.connect(database)
+    plan = connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM interfaces WHERE fop_type = ? AND function = ?",
+        ("compat_ioctl", "compat_ptr_ioctl"),
+    ).fetchall()
+    assert not any(row[-1].startswith("SCAN handlers") for row in plan)
+
+
+def test_execute(database):
+    columns, rows = sqlite.execute(
+        database,
+        "SELECT device_names.name, files.path FROM device_names JOIN files ON files.id = file_id",
+    )
+    assert columns == ("name", "path")
+    assert rows == [("watchdog", "drivers/watchdog/wdt.c")]
+
+
+def test_missing_database(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        sqlite.query(str(tmp_path / "missing.db"))
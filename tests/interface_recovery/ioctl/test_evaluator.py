@@ -0,0 +1,142 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+# pylint: disable=protected-access
+
+import pytest
+
+from skid.interface_recovery.ioctl import evaluator
+from skid.interface_recovery.ioctl.evaluator import EnumValue, Macro, Record, UnresolvedConstant
+from skid.interface_recovery.ioctl.layouts import Member
+
+
+@pytest.fixture
+def table():
+    table = evaluator.ConstantTable()
+    for name, params, body in (
+        ("BASE", None, "'W'"),
+        ("GETSUPPORT", None, "_IOR(BASE, 0, struct watchdog_info)"),
+        ("SETTIMEOUT", None, "_IOWR(BASE, 6, int)"),
+        ("KEEPALIVE", None, "_IO(BASE, 5)"),
+        ("REG", ("reg",), "_IO(BASE, (reg) + 16)"),
+        ("LASTREG", None, "REG(REG_LAST)"),
+        ("ARRAY", None, "_IOW(BASE, 9, __u32[4])"),
+        ("TYPED", None, "_IOR(BASE, 10, word_t)"),
+        ("INFO_T", None, "struct watchdog_info"),
+        ("VIA_MACRO", None, "_IOR(BASE, 11, INFO_T)"),
+        ("RAW", None, "_IOC(_IOC_READ | _IOC_WRITE, 0x12, 3, sizeof(long))"),
+        ("LOOP_A", None, "LOOP_B + 1"),
+        ("LOOP_B", None, "LOOP_A"),
+        ("STR", ("x",), "#x"),
+        ("LEN", None, "(8 * 2)"),
+    ):
+        table.macros[name] = Macro(name, params, body)
+    table.enums["REG_CTRL"] = EnumValue("4", 0)
+    table.enums["REG_LAST"] = EnumValue("4", 2)
+    table.typedefs["word_t"] = "unsigned int"
+    table.records["watchdog_info"] = Record(
+        "struct",
+        (
+            Member("options", "__u32"),
+            Member("firmware_version", "__u32"),
+            Member("identity", "__u8", ("LEN", "2")),
+        ),
+    )
+    return table
+
+
+@pytest.fixture
+def consts(table):
+    return evaluator.ConstantEvaluator(table)
+
+
+@pytest.mark.parametrize(
+    "name, number, direction, size",
+    [
+        ("GETSUPPORT", 0x80285700, "read", 40),
+        ("SETTIMEOUT", 0xC0045706, "read|write", 4),
+        ("KEEPALIVE", 0x5705, "none", 0),
+        ("LASTREG", 0x5716, "none", 0),
+        ("ARRAY", 0x40105709, "write", 16),
+        ("TYPED", 0x8004570A, "read", 4),
+        ("VIA_MACRO", 0x8028570B, "read", 40),
+        ("RAW", 0xC0081203, "read|write", 8),
+    ],
+)
+def test_command(consts, name, number, direction, size):
+    command = consts.command(name)
+    assert (command.name, command.number, command.direction, command.size) == (
+        name,
+        number,
+        direction,
+        size,
+    )
+
+
+@pytest.mark.parametrize(
+    "expression, value",
+    [
+        ("1 + 2 * 3", 7),
+        ("(1 + 2) * 3", 9),
+        ("1 << 4 | 1", 17),
+        ("-7 / 2", -3),
+        ("-7 % 2", -1),
+        ("~0 & 0xff", 255),
+        ("!0 && 3 > 2", 1),
+        ("0 ? 1 : 2 ? 3 : 4", 3),
+        ("(unsigned long)10UL", 10),
+        ("010 + 0b11 + 0x1F", 42),
+        ("'\\n'", 10),
+        ("sizeof(struct watchdog_info *)", 8),
+        ("REG_CTRL + REG_LAST", 10),
+    ],
+)
+def test_evaluate(consts, expression, value):
+    assert consts.evaluate(expression) == value
+
+
+@pytest.mark.parametrize(
+    "expression", ["NOT_DEFINED", "1 / 0", "LOOP_A", "STR(a)", "REG", "1.5", "sizeof(struct nope)", "1 +"]
+)
+def test_unresolved(consts, expression):
+    with pytest.raises(UnresolvedConstant):
+        consts.evaluate(expression)
+
+
+def test_layout(consts):
+    layout = consts.layout("watchdog_info")
+    assert (layout.size, layout.align) == (40, 4)
+    assert [field.offset for field in layout.fields] == [0, 4, 8]
+
+
+def test_memoized(consts, table):
+    consts.command("GETSUPPORT")
+    assert consts._values["BASE"] == ord("W")
+    assert "struct watchdog_info" in consts._layouts
+
+    # Later changes to the table don't matter once a value is cached
+    table.macros["BASE"] = Macro("BASE", None, "'X'")
+    assert consts.command("SETTIMEOUT").type == ord("W")
+
+
+def test_failures_memoized(consts, table):
+    with pytest.raises(UnresolvedConstant):
+        consts.value("LATER")
+    table.macros["LATER"] = Macro("LATER", None, "1")
+    with pytest.raises(UnresolvedConstant):
+        consts.value("LATER")
+
+
+def test_commands_skips_unresolved(consts):
+    assert list(consts.commands(["KEEPALIVE", "NOT_DEFINED", "LOOP_A"])) == ["KEEPALIVE"]
+
+
+def test_table_merge_first_wins():
+    first = evaluator.ConstantTable(macros={"A": Macro("A", None, "1")})
+    second = evaluator.ConstantTable(
+        macros={"A": Macro("A", None, "2"), "B": Macro("B", None, "3")}, typedefs={"t": "int"}
+    )
+    first.merge(second)
+    assert first.macros["A"].body == "1"
+    assert len(first) == 3
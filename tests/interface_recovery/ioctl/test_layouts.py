@@ -0,0 +1,95 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from skid.interface_recovery.ioctl import layouts
+from skid.interface_recovery.ioctl.layouts import Field, Member
+
+
+def sizeof(type_str):
+    size = layouts.primitive_size(type_str)
+    return size, size
+
+
+def layout(kind, *members):
+    return layouts.compute_layout("a", kind, members, sizeof, int)
+
+
+@pytest.mark.parametrize(
+    "type_str, expected",
+    [
+        ("const  struct foo __user *", "struct foo *"),
+        ("volatile unsigned   int", "unsigned int"),
+        ("char**", "char * *"),
+    ],
+)
+def test_normalize_type(type_str, expected):
+    assert layouts.normalize_type(type_str) == expected
+
+
+def test_split_dimensions():
+    assert layouts.split_dimensions("[2][ WDT_LEN ]") == ("2", "WDT_LEN")
+    assert layouts.split_dimensions("") == tuple()
+
+
+@pytest.mark.parametrize(
+    "type_str, size",
+    [("__u32", 4), ("unsigned long", 8), ("const char *", 8), ("enum foo", 4), ("struct a", None)],
+)
+def test_primitive_size(type_str, size):
+    assert layouts.primitive_size(type_str) == size
+
+
+def test_padding():
+    res = layout("struct", Member("a", "char"), Member("b", "u64"), Member("c", "u16"))
+    assert [f.offset for f in res.fields] == [0, 8, 16]
+    assert (res.size, res.align) == (24, 8)
+
+
+def test_arrays():
+    res = layout("struct", Member("a", "u32"), Member("b", "u8", ("4", "2")), Member("c", "u8", ("",)))
+    assert res.fields[1] == Field("b", "u8", 4, 8, 8)
+    assert res.fields[2] == Field("c", "u8", 12, 0, 0)
+    assert res.size == 12
+
+
+def test_union():
+    res = layout("union", Member("a", "u8"), Member("b", "u32"), Member("c", "u8", ("6",)))
+    assert [f.offset for f in res.fields] == [0, 0, 0]
+    assert (res.size, res.align) == (8, 4)
+
+
+def test_bitfields():
+    res = layout(
+        "struct",
+        Member("a", "u32", bits="3"),
+        Member("b", "u32", bits="30"),
+        Member("c", "u8"),
+        Member("d", "u8", bits="0"),
+        Member("e", "u8", bits="1"),
+    )
+    assert [(f.name, f.offset, f.bits) for f in res.fields] == [
+        ("a", 0, 3),
+        ("b", 4, 30),
+        ("c", 8, 0),
+        ("e", 9, 1),
+    ]
+    assert res.size == 12
+
+
+def test_bitfield_shift():
+    res = layout(
+        "struct",
+        Member("a", "u16"),
+        Member("b", "u32", bits="1"),
+        Member("c", "u32", bits="3"),
+        Member("d", "u8"),
+    )
+    assert [(f.name, f.offset, f.shift) for f in res.fields] == [
+        ("a", 0, 0),
+        ("b", 0, 16),
+        ("c", 0, 17),
+        ("d", 3, 0),
+    ]
@@ -0,0 +1,32 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from skid.interface_recovery.ioctl import request
+
+
+def test_ioc():
+    # WDIOC_GETSUPPORT = _IOR('W', 0, struct watchdog_info)
+    assert request.ioc(request.IOC_READ, ord("W"), 0, 40) == 0x80285700
+
+
+def test_ioc_none():
+    assert request.ioc(request.IOC_NONE, ord("W"), 5, 0) == 0x5705
+
+
+@pytest.mark.parametrize("args", [(4, 0, 0, 0), (0, 256, 0, 0), (0, 0, 256, 0), (0, 0, 0, 1 << 14)])
+def test_ioc_too_big(args):
+    with pytest.raises(ValueError):
+        request.ioc(*args)
+
+
+def test_decode():
+    assert request.decode("WDIOC_SETTIMEOUT", 0xC0045706) == request.IoctlCommand(
+        name="WDIOC_SETTIMEOUT", number=0xC0045706, direction="read|write", type=0x57, nr=6, size=4
+    )
+
+
+def test_decode_truncates():
+    assert request.decode("A", -1).number == 0xFFFFFFFF
@@ -0,0 +1,59 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import json
+import os
+
+import pytest
+
+from skid.interface_recovery.libclang import compile_commands
+
+
+@pytest.fixture
+def database(temp_dir):
+    entries = [
+        {
+            "directory": "/linux",
+            "command": "gcc -Wp,-MMD,a.d -nostdinc -I./include -D__KERNEL__ -fconserve-stack "
+            "-c -o drivers/a.o drivers/a.c",
+            "file": "drivers/a.c",
+        },
+        {
+            "directory": "/linux",
+            "arguments": ["gcc", "-DX=1", "-c", "drivers/b.c"],
+            "file": "drivers/b.c",
+        },
+        {"directory": "/linux", "command": "as -o a.o a.S", "file": "arch/a.S"},
+    ]
+    location = os.path.join(temp_dir, "compile_commands.json")
+    with open(location, "w") as f:
+        json.dump(entries, f)
+    yield location
+
+
+def test_load(database):
+    commands = compile_commands.load(database)
+    assert len(commands) == 2
+    assert commands[0].arguments == ("-nostdinc", "-I./include", "-D__KERNEL__")
+    assert commands[1].arguments == ("-DX=1",)
+
+
+def test_path(database):
+    assert compile_commands.load(database)[0].path == "/linux/drivers/a.c"
+
+
+def test_load_missing():
+    with pytest.raises(FileNotFoundError):
+        compile_commands.load("/asdf/asdf/compile_commands.json")
+
+
+def test_load_non_str():
+    with pytest.raises(AssertionError):
+        compile_commands.load(None)
+
+
+def test_clean_arguments_drops_output():
+    argv = ["clang", "-o", "a.o", "-MF", "a.d", "-I.", "a.c"]
+    assert compile_commands.clean_arguments(argv, "a.c") == ["-I."]
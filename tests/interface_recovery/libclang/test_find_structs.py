@@ -0,0 +1,53 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import json
+import os
+
+import pytest
+
+from skid.interface_recovery.libclang import find_structs
+
+pytestmark = pytest.mark.skipif(not find_structs.is_available(), reason="libclang is not installed")
+
+DRIVER = os.path.abspath("tests/resources/example_clang_driver.c")
+
+
+@pytest.fixture
+def database(temp_dir):
+    entries = [{"directory": os.path.dirname(DRIVER), "arguments": ["cc", "-std=gnu89", DRIVER],
+                "file": DRIVER}]
+    location = os.path.join(temp_dir, "compile_commands.json")
+    with open(location, "w") as f:
+        json.dump(entries, f)
+    yield location
+
+
+def test_find_fileop_structs(database):
+    res = find_structs.find_fileop_structs(database, processes=2)
+    res = sorted(res, key=lambda record: record["fop_type"])
+    assert res == [
+        {
+            "function": "compat_ptr_ioctl",
+            "refid": "",
+            "struct_name": "wdt_fops",
+            "struct_line_number": 14,
+            "file_path": "tests/resources/example_clang_driver.c",
+            "fop_type": "compat_ioctl",
+        },
+        {
+            "function": "fop_ioctl",
+            "refid": "c:example_clang_driver.c@F@fop_ioctl",
+            "struct_name": "wdt_fops",
+            "struct_line_number": 14,
+            "file_path": "tests/resources/example_clang_driver.c",
+            "fop_type": "unlocked_ioctl",
+        },
+    ]
+
+
+def test_iter_fileop_structs_resolves_macros(database):
+    functions = {r["function"] for r in find_structs.iter_fileop_structs(database, processes=1)}
+    assert "fop_ioctl" in functions
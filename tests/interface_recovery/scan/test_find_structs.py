@@ -0,0 +1,84 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+
+from skid.interface_recovery.scan import find_structs, lexer
+
+DRIVER = "tests/resources/example_driver.c"
+
+EXPECTED = [
+    {
+        "function": "compat_ptr_ioctl",
+        "refid": "",
+        "struct_name": "wdt_fops",
+        "struct_line_number": 290,
+        "file_path": DRIVER,
+        "fop_type": "compat_ioctl",
+    },
+    {
+        "function": "fop_ioctl",
+        "refid": "",
+        "struct_name": "wdt_fops",
+        "struct_line_number": 290,
+        "file_path": DRIVER,
+        "fop_type": "unlocked_ioctl",
+    },
+]
+
+
+def scan(source):
+    return find_structs.find_fileop_structs_in_tokens(list(lexer.tokenize(source)), "a.c")
+
+
+def test_list_c_files():
+    c_files = find_structs.list_c_files("tests/resources")
+    assert os.path.join("tests/resources", "example_driver.c") in c_files
+    assert all(c_file.endswith(".c") for c_file in c_files)
+
+
+def test_find_fileop_structs_in_file():
+    res = find_structs.find_fileop_structs_in_file(DRIVER)
+    assert sorted(res, key=lambda record: record["fop_type"]) == EXPECTED
+
+
+def test_find_fileop_structs_in_file_missing():
+    assert find_structs.find_fileop_structs_in_file("tests/resources/does_not_exist.c") == []
+
+
+def test_find_fileop_structs():
+    res = find_structs.find_fileop_structs("tests/resources", processes=2)
+    res = [record for record in res if record["file_path"] == DRIVER]
+    assert sorted(res, key=lambda record: record["fop_type"]) == EXPECTED
+
+
+def test_iter_fileop_structs():
+    functions = {r["function"] for r in find_structs.iter_fileop_structs("tests/resources", 1)}
+    assert "fop_ioctl" in functions
+
+
+def test_attributes_are_skipped():
+    res = scan(
+        "static const struct file_operations __maybe_unused x_fops __section(\".a\") = {\n"
+        "    .unlocked_ioctl = (void *)x_ioctl,\n"
+        "};"
+    )
+    assert [(r["struct_name"], r["function"]) for r in res] == [("x_fops", "x_ioctl")]
+
+
+def test_not_definitions():
+    assert scan("static struct file_operations *fops = &other;") == []
+    assert scan("static struct file_operations fops[] = { { .unlocked_ioctl = a } };") == []
+    assert scan("void f(struct file_operations fops);") == []
+    assert scan("extern const struct file_operations fops;") == []
+
+
+def test_only_ioctl_members():
+    res = scan("struct file_operations f = { .open = a, .read = b, .owner = THIS_MODULE };")
+    assert res == []
+
+
+def test_nested_commas():
+    res = scan("struct file_operations f = { .open = F(a, b), .compat_ioctl = c };")
+    assert [r["function"] for r in res] == ["c"]
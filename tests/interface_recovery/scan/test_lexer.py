@@ -0,0 +1,68 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+from skid.interface_recovery.scan import lexer
+
+
+def values(text, **kwargs):
+    return [token.value for token in lexer.tokenize(text, **kwargs)]
+
+
+def test_tokenize():
+    assert values("int x = a->b << 2;") == ["int", "x", "=", "a", "->", "b", "<<", "2", ";"]
+
+
+def test_tokenize_kinds():
+    tokens = list(lexer.tokenize('f("a\\"b", \'c\', 0x1fUL)'))
+    assert [token.kind for token in tokens] == [
+        lexer.IDENT,
+        lexer.PUNCT,
+        lexer.STRING,
+        lexer.PUNCT,
+        lexer.CHAR,
+        lexer.PUNCT,
+        lexer.NUMBER,
+        lexer.PUNCT,
+    ]
+
+
+def test_tokenize_drops_comments():
+    assert values("a /* b\n c */ d // e\nf") == ["a", "d", "f"]
+
+
+def test_tokenize_line_numbers():
+    tokens = list(lexer.tokenize("a\n/* b\n c */ d\n#define X \\\n 1\ne"))
+    assert [(token.value, token.line) for token in tokens] == [("a", 1), ("d", 3), ("e", 6)]
+
+
+def test_tokenize_directives():
+    tokens = list(lexer.tokenize("#include <linux/fs.h>\nx", keep_directives=True))
+    assert tokens == [
+        lexer.Token(lexer.DIRECTIVE, "#include <linux/fs.h>", 1),
+        lexer.Token(lexer.IDENT, "x", 2),
+    ]
+
+
+def test_tokenize_never_raises():
+    assert values("a @ b") == ["a", "@", "b"]
+
+
+def test_split_directive():
+    token = lexer.Token(lexer.DIRECTIVE, "#define A \\\n (1 << 2) /* two */", 1)
+    assert lexer.split_directive(token) == ("define", "A   (1 << 2)")
+
+
+def test_split_directive_empty():
+    assert lexer.split_directive(lexer.Token(lexer.DIRECTIVE, "#", 1)) == ("", "")
+
+
+def test_find_matching():
+    tokens = lexer.tokenize_expression("{ a, (b), { c } } d")
+    assert lexer.find_matching(tokens, 0) == 10
+    assert lexer.find_matching(tokens, 3) == 5
+
+
+def test_find_matching_unbalanced():
+    tokens = lexer.tokenize_expression("( a, b")
+    assert lexer.find_matching(tokens, 0) == len(tokens) - 1
@@ -0,0 +1,241 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import pytest
+
+from skid.interface_recovery import api, entry
+from skid.interface_recovery.doxygen import doxygen
+from skid.utils import stages, tuning
+from tests.conftest import TEST_XML_FILES
+
+
+@pytest.fixture
+def options():
+    return api.RecoveryOptions(source=".", processes=2)
+
+
+@pytest.fixture
+def many_xml_files():
+    return TEST_XML_FILES * 20
+
+
+################## TEST OPTIONS ##################
+
+
+def test_options_from_args():
+    args = {
+        "--source": "/src",
+        "--doxyconf": None,
+        "--dont-validate": True,
+        "--validation": "lazy",
+        "--pack": True,
+        "--compress": False,
+        "--transcode": True,
+        "--reuse": "never",
+        "--frontend": "scan",
+        "--compile-commands": None,
+        "--export": "/tmp/out",
+        "--probe": "/dev/watchdog",
+        "--probe-handler": "watchdog_ioctl",
+        "--database": "/tmp/skid.db",
+        "--coordinator": None,
+        "--memory-budget": "512M",
+        "--file-timeout": "60",
+        "--quarantine": None,
+        "--profile": "/tmp/skid-profile.json",
+    }
+    options = api.RecoveryOptions.from_args(args)
+    assert options.source == "/src"
+    assert not options.validate
+    assert options.validation_mode == "lazy"
+    assert options.pack
+    assert options.transcode
+    assert options.processes is None
+    assert options.reuse == "never"
+    assert options.frontend == api.FRONTEND_SCAN
+    assert options.compile_commands_location == "/src/compile_commands.json"
+    assert options.export == "/tmp/out"
+    assert options.probe == "/dev/watchdog"
+    assert options.probe_handler == "watchdog_ioctl"
+    assert options.database == "/tmp/skid.db"
+    assert options.memory_budget == 512 << 20
+    assert options.file_timeout == 60.0
+    assert options.profile == "/tmp/skid-profile.json"
+
+
+def test_options_bad_frontend():
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(source=".", frontend="gcc")
+
+
+@pytest.mark.parametrize(
+    "output", [{"export": "/tmp/out"}, {"database": "/tmp/skid.db"}, {"probe": "/dev/watchdog"}]
+)
+def test_options_clang_without_commands(output):
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(
+            source=".", frontend=api.FRONTEND_CLANG, probe_handler="watchdog_ioctl", **output
+        )
+
+
+def test_options_transcode_with_coordinator():
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(source=".", transcode=True, coordinator="localhost:5000")
+
+
+def test_options_probe_without_handler():
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(source=".", probe="/dev/watchdog")
+
+
+def test_options_bad_validation_mode():
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(source=".", validation_mode="sometimes")
+
+
+def test_options_bad_reuse():
+    with pytest.raises(ValueError):
+        api.RecoveryOptions(source=".", reuse="sometimes")
+
+
+def test_options_frozen(options):
+    with pytest.raises(AttributeError):
+        options.source = "a"
+
+
+################## TEST PROFILE ##################
+
+
+@pytest.fixture
+def profile(temp_dir):
+    location = f"{temp_dir}/profile.json"
+    tuning.save(tuning.Profile(3, chunksizes={"constants": 2}), location)
+    yield location
+    tuning.apply(None)
+
+
+def test_apply_profile(profile):
+    options = api.apply_profile(api.RecoveryOptions(source=".", profile=profile))
+    assert options.processes == 3
+    assert tuning.get_chunksize("constants", 8) == 2
+
+
+def test_apply_profile_keeps_processes(profile):
+    options = api.apply_profile(api.RecoveryOptions(source=".", processes=1, profile=profile))
+    assert options.processes == 1
+
+
+def test_apply_profile_none(options):
+    assert api.apply_profile(options) is options
+    assert tuning.get_profile() is None
+
+
+def test_apply_profile_missing():
+    with pytest.raises(ValueError):
+        api.apply_profile(api.RecoveryOptions(source=".", profile="/asdf/asdf/profile.json"))
+
+
+################## TEST PREPARE ##################
+
+
+def test_prepare_bad_source():
+    with pytest.raises(doxygen.DoxygenException):
+        api.prepare(api.RecoveryOptions(source="/asdf/asdf/asdf"))
+
+
+def test_prepare_bad_options():
+    with pytest.raises(AssertionError):
+        api.prepare({"--source": "."})
+
+
+def test_preparation_stages(options):
+    pipeline = api.preparation_stages(options)
+    stages.check(pipeline)
+    outputs = {output for stage in pipeline for output in stage.outputs}
+    assert "xml_files" in outputs
+
+
+@pytest.mark.parametrize(
+    "reuse, prior_results, fingerprinted",
+    [
+        (doxygen.REUSE_AUTO, True, True),
+        (doxygen.REUSE_NEVER, True, True),
+        (doxygen.REUSE_ALWAYS, False, True),
+        (doxygen.REUSE_ALWAYS, True, False),
+    ],
+)
+def test_fingerprint_whenever_doxygen_runs(monkeypatch, reuse, prior_results, fingerprinted):
+    monkeypatch.setattr(doxygen, "has_prior_results", lambda: prior_results)
+    monkeypatch.setattr(doxygen, "get_fingerprint", lambda *_: {"source": "a"})
+    pipeline = api.preparation_stages(api.RecoveryOptions(source=".", reuse=reuse))
+    stage = next(stage for stage in pipeline if stage.name == "fingerprint")
+    assert (stage.func(1) is not None) == fingerprinted
+
+
+def test_preparation_stages_transcode():
+    pipeline = api.preparation_stages(api.RecoveryOptions(source=".", transcode=True))
+    stages.check(pipeline)
+    assert pipeline[-1].name == "transcode"
+    assert pipeline[-1].outputs == ("xml_files",)
+
+
+def test_recovery_stages_match_sequential(options, many_xml_files):
+    values, timings = stages.run(
+        entry.recovery_stages(options), {"xml_files": many_xml_files}, options.processes
+    )
+    fileop_structs = doxygen.find_fileop_structs(many_xml_files)
+    assert values["fileop_structs"] == fileop_structs
+    assert values["commands"] == doxygen.resolve_ioctl_commands(many_xml_files, fileop_structs)
+    assert {timing.name for timing in timings} >= {"find fileop structs", "resolve commands"}
+
+
+################## TEST RECOVER ##################
+
+
+def test_iter_fileop_structs_is_lazy(options):
+    res = api.iter_fileop_structs(options, TEST_XML_FILES)
+    assert not isinstance(res, (list, tuple))
+    assert len(list(res)) == 2
+
+
+def test_iter_fileop_structs_no_files(options):
+    assert list(api.iter_fileop_structs(options, tuple())) == []
+
+
+def test_recover_all(options):
+    functions = {fops["function"] for fops in api.recover(options, xml_files=TEST_XML_FILES)}
+    assert functions == {"fop_ioctl", "compat_ptr_ioctl"}
+
+
+def test_recover_limit(options, many_xml_files):
+    assert len(list(api.recover(options, limit=3, xml_files=many_xml_files))) == 3
+
+
+def test_recover_limit_zero(options):
+    assert list(api.recover(options, limit=0, xml_files=TEST_XML_FILES)) == []
+
+
+def test_recover_where(options, many_xml_files):
+    res = api.recover(
+        options,
+        limit=1,
+        where=lambda fops: fops["fop_type"] == "compat_ioctl",
+        xml_files=many_xml_files,
+    )
+    assert [fops["function"] for fops in res] == ["compat_ptr_ioctl"]
+
+
+def test_recover_early_close(options, many_xml_files):
+    res = api.recover(options, xml_files=many_xml_files)
+    assert next(res)["struct_name"] == "wdt_fops"
+    res.close()
+    with pytest.raises(StopIteration):
+        next(res)
+
+
+def test_recover_scan_frontend():
+    options = api.RecoveryOptions(source="tests/resources", frontend=api.FRONTEND_SCAN, processes=1)
+    functions = {fops["function"] for fops in api.recover(options)}
+    assert {"fop_ioctl", "compat_ptr_ioctl"} <= functions
@@ -0,0 +1,228 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+import signal
+import stat
+import subprocess
+
+import pytest
+
+from skid.interface_recovery import calibration
+from skid.interface_recovery.doxygen import doxygen
+from skid.utils import tuning
+from tests.conftest import TEST_RESOURCES, TEST_XML_FILES
+
+
+#################### SAMPLE ####################
+
+
+def test_sample_source_repeatable():
+    files = [f"drivers/{i}.c" for i in range(100)]
+    sample = calibration.sample_source(files, 10)
+    assert len(sample) == 10
+    assert sample == sorted(sample)
+    assert sample == calibration.sample_source(files, 10)
+    assert set(sample) <= set(files)
+
+
+def test_sample_source_small_tree():
+    assert calibration.sample_source(["b.c", "a.h"], 10) == ["a.h", "b.c"]
+
+
+def test_copy_sample(temp_dir):
+    calibration.copy_sample(TEST_RESOURCES, ["example_driver.c"], temp_dir)
+    assert os.path.isfile(os.path.join(temp_dir, "example_driver.c"))
+
+
+#################### MEASUREMENTS ####################
+
+
+@pytest.mark.parametrize(
+    "cpu_count, expected", [(1, (1,)), (2, (1, 2)), (6, (1, 2, 4, 6)), (8, (1, 2, 4, 8))]
+)
+def test_process_candidates(cpu_count, expected):
+    assert calibration.process_candidates(cpu_count) == expected
+
+
+def test_measure():
+    calls = list()
+
+    def run(setting):
+        calls.append(setting)
+        return setting * 10
+
+    measurements = calibration.measure(run, (1, 2), repeats=3)
+    assert calls == [1, 1, 1, 2, 2, 2]
+    assert [measurement.setting for measurement in measurements] == [1, 2]
+    assert [measurement.peak_rss for measurement in measurements] == [10, 20]
+
+
+def test_measure_single_candidate():
+    calls = list()
+    calibration.measure(calls.append, (4,), repeats=3)
+    assert calls == [4]
+
+
+def test_choose_fastest():
+    measurements = [
+        calibration.Measurement(1, 4.0, 0),
+        calibration.Measurement(2, 2.0, 0),
+        calibration.Measurement(4, 1.0, 0),
+    ]
+    assert calibration.choose(measurements) == 4
+
+
+def test_choose_smallest_within_tolerance():
+    measurements = [
+        calibration.Measurement(4, 1.0, 0),
+        calibration.Measurement(2, 1.02, 0),
+        calibration.Measurement(1, 2.0, 0),
+    ]
+    assert calibration.choose(measurements) == 2
+    assert calibration.choose(measurements, tolerance=0) == 4
+
+
+#################### DOXYGEN ####################
+
+
+@pytest.mark.parametrize(
+    "output, scale, expected",
+    [
+        ("lookup cache used 1000/65536 hits=10 misses=1000", 1, 0),
+        ("lookup cache used 40000/65536 hits=10 misses=1000", 4, 2),
+        ("lookup cache used 65536/65536 hits=10 misses=1000", 1 << 20, 9),
+        ("Note: based on cache misses the ideal setting for LOOKUP_CACHE_SIZE is 2", 4, 4),
+        ("Generating XML output...", 4, None),
+    ],
+)
+def test_lookup_cache_size(output, scale, expected):
+    assert calibration.lookup_cache_size(output, scale) == expected
+
+
+@pytest.fixture
+def fake_doxygen(temp_dir, monkeypatch):
+    """ A doxygen on the PATH that prints it's lookup cache and exits with $EXIT """
+    bin_dir = os.path.join(temp_dir, "bin")
+    os.makedirs(bin_dir)
+    location = os.path.join(bin_dir, "doxygen")
+    with open(location, "w") as f:
+        f.write("#!/bin/sh\n")
+        f.write("echo 'lookup cache used 70000/65536 hits=1 misses=1'\n")
+        f.write("exit ${EXIT:-0}\n")
+    os.chmod(location, os.stat(location).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return os.path.join(temp_dir, "out")
+
+
+@pytest.mark.parametrize(
+    "command, expected", [("exit 0", 0), ("exit 3", 3), ("kill -9 $$", -signal.SIGKILL)]
+)
+def test_exit_code(command, expected):
+    proc = subprocess.Popen(["sh", "-c", command])
+    _, status, _ = os.wait4(proc.pid, 0)
+    proc.returncode = calibration.exit_code(status)
+    assert proc.returncode == expected
+
+
+def test_run_doxygen(fake_doxygen):
+    settings = {"NUM_PROC_THREADS": "1"}
+    peak_rss, output = calibration.run_doxygen(TEST_RESOURCES, fake_doxygen, settings)
+    assert peak_rss > 0
+    assert calibration.lookup_cache_size(output, 1) == 1
+    with open(os.path.join(fake_doxygen, "doxyconf")) as f:
+        assert "NUM_PROC_THREADS = 1\n" in f.readlines()
+
+
+def test_run_doxygen_fails(fake_doxygen, monkeypatch):
+    monkeypatch.setenv("EXIT", "2")
+    with pytest.raises(doxygen.DoxygenException):
+        calibration.run_doxygen(TEST_RESOURCES, fake_doxygen, dict())
+
+
+def test_calibrate_doxygen(monkeypatch, temp_dir):
+    runs = list()
+
+    def run_doxygen(sample_dir, output_dir, settings, user_config_location=None):
+        runs.append(settings["NUM_PROC_THREADS"])
+        return 1 << 20, "lookup cache used 50000/65536 hits=1 misses=1"
+
+    monkeypatch.setattr(calibration, "run_doxygen", run_doxygen)
+    settings, xml_dir = calibration.calibrate_doxygen(TEST_RESOURCES, temp_dir, 2.0, 2)
+    assert set(runs) == {"1", "2"}
+    assert settings["NUM_PROC_THREADS"] == settings["DOT_NUM_THREADS"]
+    assert settings["LOOKUP_CACHE_SIZE"] == "1"
+    assert xml_dir == os.path.join(temp_dir, "doxygen", "xml")
+
+
+def test_calibrate_doxygen_missing(monkeypatch, temp_dir):
+    def run_doxygen(*_):
+        raise FileNotFoundError("doxygen")
+
+    monkeypatch.setattr(calibration, "run_doxygen", run_doxygen)
+    assert calibration.calibrate_doxygen(TEST_RESOURCES, temp_dir, 1.0, 1) is None
+
+
+def test_calibrate_doxygen_fails(monkeypatch, temp_dir):
+    def run_doxygen(*_):
+        raise doxygen.DoxygenException("Doxygen returned 1 on the sample")
+
+    monkeypatch.setattr(calibration, "run_doxygen", run_doxygen)
+    assert calibration.calibrate_doxygen(TEST_RESOURCES, temp_dir, 1.0, 1) is None
+
+
+#################### WORKER POOLS ####################
+
+
+def test_calibrate_pools(monkeypatch):
+    monkeypatch.setattr(calibration, "CHUNKSIZE_CANDIDATES", (1, 4))
+    processes, chunksizes, worker_rss = calibration.calibrate_pools(
+        TEST_RESOURCES, TEST_XML_FILES, 1
+    )
+    assert processes == 1
+    assert set(chunksizes) == set(tuning.CHUNKSIZE_NAMES)
+    assert set(chunksizes.values()) <= {1, 4}
+    assert worker_rss > 0
+    assert tuning.get_profile() is None
+
+
+def test_calibrate_pools_without_xml(monkeypatch):
+    monkeypatch.setattr(calibration, "CHUNKSIZE_CANDIDATES", (1,))
+    _, chunksizes, worker_rss = calibration.calibrate_pools(TEST_RESOURCES, tuple(), 1)
+    assert set(chunksizes) == {"fingerprint", "scan"}
+    assert worker_rss is None
+
+
+def test_worker_footprint():
+    assert calibration.worker_footprint(TEST_XML_FILES) > 0
+
+
+#################### PROFILE ####################
+
+
+def test_calibrate(monkeypatch):
+    monkeypatch.setattr(calibration, "CHUNKSIZE_CANDIDATES", (1,))
+    monkeypatch.setattr(calibration, "calibrate_doxygen", lambda *_: None)
+    previous = tuning.Profile(2)
+    tuning.apply(previous)
+    try:
+        profile = calibration.calibrate(TEST_RESOURCES, sample_size=2, cpu_count=1)
+        assert tuning.get_profile() is previous
+    finally:
+        tuning.apply(None)
+    assert profile.processes == 1
+    assert profile.cpu_count == 1
+    assert profile.doxygen == dict()
+    assert profile.chunksizes == {"fingerprint": 1, "scan": 1}
+
+
+def test_calibrate_bad_source():
+    with pytest.raises(ValueError):
+        calibration.calibrate("/asdf/asdf/asdf")
+
+
+def test_calibrate_no_source_files(temp_dir):
+    with pytest.raises(ValueError):
+        calibration.calibrate(temp_dir)
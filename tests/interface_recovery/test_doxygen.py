@@ -7,11 +7,10 @@
 import logging
 import os
 import shutil
-from unittest.mock import patch
 
 import pytest
 from lxml import etree
-from skid.interface_recovery.doxygen import config, doxygen
+from skid.interface_recovery.doxygen import config, doxygen, fingerprint
 from tests.conftest import TEST_RESOURCES, VALID_SCHEMA_LOCATION, TEST_XML_FILES
 
 @pytest.fixture
@@ -88,51 +87,67 @@ def test_real_configure(temp_file):
 ################## TEST OVERWRITE ##################
 
 
-@patch(
-    "skid.interface_recovery.doxygen.doxygen.ask_for_overwrite",
-    {"method.return_value": "y"},
-)
-def test_overwrite_fake_yes(change_output_dir):
-    assert doxygen.overwrite_prior_doxygen()
+@pytest.fixture
+def prior_results(change_output_dir):
+    with open(os.path.join(change_output_dir, "index.xml"), "w") as f:
+        f.write("<doxygenindex/>")
+    yield change_output_dir
 
 
-@patch(
-    "skid.interface_recovery.doxygen.doxygen.ask_for_overwrite",
-    {"method.return_value": "n"},
-)
-def test_overwrite_fake_no(change_output_dir):
-    assert doxygen.overwrite_prior_doxygen()
+@pytest.fixture
+def current_fingerprint():
+    return {"config": "a", "source": "b", "files": dict()}
 
 
-@patch(
-    "skid.interface_recovery.doxygen.doxygen.ask_for_overwrite",
-    {"method.return_value": "y"},
-)
-def test_overwrite_yes(change_output_dir):
-    try:
-        os.mkdir(change_output_dir)
-        assert doxygen.overwrite_prior_doxygen()
-    except OSError:
-        pass  # test failed
-    finally:
-        if os.path.exists(change_output_dir):
-            shutil.rmtree(change_output_dir)
+def test_overwrite_no_prior_results(change_output_dir):
+    for policy in doxygen.REUSE_POLICIES:
+        assert doxygen.overwrite_prior_doxygen(policy)
 
 
-@patch(
-    "skid.interface_recovery.doxygen.doxygen.ask_for_overwrite",
-    {"method.return_value": "n"},
-)
-def test_overwrite_no(change_output_dir):
+def test_overwrite_missing_output_dir(change_output_dir):
+    shutil.rmtree(change_output_dir)
     try:
-        os.mkdir(change_output_dir)
         assert doxygen.overwrite_prior_doxygen()
-    except OSError:
-        # Test failed
-        return
     finally:
-        if os.path.exists(change_output_dir):
-            shutil.rmtree(change_output_dir)
+        os.mkdir(change_output_dir)
+
+
+def test_has_prior_results(change_output_dir):
+    assert not doxygen.has_prior_results()
+    with open(os.path.join(change_output_dir, "index.xml"), "w") as f:
+        f.write("<doxygenindex/>")
+    assert doxygen.has_prior_results()
+
+
+def test_overwrite_bad_policy(change_output_dir):
+    with pytest.raises(AssertionError):
+        doxygen.overwrite_prior_doxygen("y")
+
+
+def test_overwrite_always_reuses(prior_results):
+    assert not doxygen.overwrite_prior_doxygen(doxygen.REUSE_ALWAYS)
+    assert os.listdir(prior_results) == ["index.xml"]
+
+
+def test_overwrite_never_deletes(prior_results):
+    assert doxygen.overwrite_prior_doxygen(doxygen.REUSE_NEVER)
+    assert os.listdir(prior_results) == []
+
+
+def test_overwrite_auto_matching_fingerprint(prior_results, current_fingerprint):
+    fingerprint.save(current_fingerprint, prior_results)
+    assert not doxygen.overwrite_prior_doxygen(doxygen.REUSE_AUTO, current_fingerprint)
+
+
+def test_overwrite_auto_changed_fingerprint(prior_results, current_fingerprint):
+    fingerprint.save(current_fingerprint, prior_results)
+    changed = {**current_fingerprint, "source": "c"}
+    assert doxygen.overwrite_prior_doxygen(doxygen.REUSE_AUTO, changed)
+    assert os.listdir(prior_results) == []
+
+
+def test_overwrite_auto_no_fingerprint(prior_results):
+    assert doxygen.overwrite_prior_doxygen(doxygen.REUSE_AUTO, None)
 
 
 ################## TEST GET SCHEMA ##################
@@ -185,6 +200,19 @@ def test_get_all_xml_files_valid_location():
     assert files == TEST_XML_FILES
 
 
+def test_get_all_xml_files_archive(temp_dir):
+    archive = doxygen.pack_xml_files(TEST_RESOURCES, os.path.join(temp_dir, "xml.skidpack"))
+    files = doxygen.get_all_xml_files(xml_dir=archive)
+    assert files == (f"{archive}::example_c_file.xml",)
+
+
+def test_filter_bad_schema_archive(temp_dir):
+    archive = doxygen.pack_xml_files(TEST_RESOURCES, os.path.join(temp_dir, "xml.skidpack"))
+    schema = doxygen.get_archive_schema(archive, "example_schema.xsd")
+    files = doxygen.get_all_xml_files(xml_dir=archive)
+    assert doxygen.filter_xml_files_bad_schema(files, schema) == files
+
+
 ################## TEST FILTER XML FILES ##################
 
 
@@ -219,6 +247,24 @@ def test_find_fileop_structs_bad():
         doxygen.find_fileop_structs(0)
 
 
+################## TEST RESOLVE IOCTL COMMANDS ##################
+
+
+def test_resolve_ioctl_commands(compound_xml_files):
+    fileop_structs = doxygen.find_fileop_structs(compound_xml_files)
+    resolved = doxygen.resolve_ioctl_commands(compound_xml_files, fileop_structs, processes=1)
+    commands = {c.name: c for c in resolved["example__driver_8c_1a243d17718e8710d65139b4ac93320c5a"]}
+    assert len(commands) == 7
+    assert commands["WDIOC_GETSUPPORT"].number == 0x80285700
+    assert commands["WDIOC_GETSUPPORT"].size == 40
+    assert commands["WDIOC_SETTIMEOUT"].direction == "read|write"
+
+
+def test_resolve_ioctl_commands_without_header():
+    fileop_structs = doxygen.find_fileop_structs(TEST_XML_FILES)
+    assert doxygen.resolve_ioctl_commands(TEST_XML_FILES, fileop_structs, processes=1) == {}
+
+
 ################## TEST FIND DEVICE NAMES ##################
 
 # TODO
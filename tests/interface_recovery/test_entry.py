@@ -0,0 +1,149 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import errno
+import os
+import socket
+import threading
+
+import pytest
+
+from skid.fuzzer import probe
+from skid.interface_recovery import api, entry
+from skid.interface_recovery.distributed import coordinator, worker
+from skid.interface_recovery.doxygen import find_device_name
+from skid.interface_recovery.ioctl import request
+from skid.utils import stages, tuning
+from tests.conftest import TEST_RESOURCES
+
+
+def ir_args(**overrides):
+    args = {
+        "--source": TEST_RESOURCES,
+        "--doxyconf": None,
+        "--dont-validate": False,
+        "--validation": "full",
+        "--pack": False,
+        "--compress": False,
+        "--transcode": False,
+        "--reuse": "auto",
+        "--frontend": "doxygen",
+        "--compile-commands": None,
+        "--export": None,
+        "--probe": None,
+        "--probe-handler": None,
+        "--database": None,
+        "--coordinator": None,
+        "--memory-budget": None,
+        "--file-timeout": None,
+        "--quarantine": None,
+        "--profile": None,
+    }
+    return {**args, **overrides}
+
+
+@pytest.fixture(autouse=True)
+def reset_profile():
+    yield
+    tuning.apply(None)
+
+
+#################### INTERFACE RECOVERY ####################
+
+
+def test_scan_frontend_exports(temp_dir):
+    database = os.path.join(temp_dir, "skid.db")
+    export_dir = os.path.join(temp_dir, "export")
+    args = ir_args(**{"--frontend": "scan", "--database": database, "--export": export_dir})
+    assert entry.start_interface_recovery(args)
+    assert os.path.isfile(database)
+    assert len(os.listdir(export_dir)) > 0
+
+
+def test_bad_options():
+    assert not entry.start_interface_recovery(ir_args(**{"--reuse": "sometimes"}))
+
+
+#################### STAGES ####################
+
+
+def test_coordinated_device_names(monkeypatch):
+    found = list()
+    monkeypatch.setattr(find_device_name, "find_all", found.append)
+    options = api.RecoveryOptions(source=".", coordinator="127.0.0.1:0")
+    stage = next(s for s in entry.recovery_stages(options) if s.name == "find device names")
+    results = coordinator.Results()
+    results.includes["a.xml"] = ["linux/fs.h"]
+    results.includes["b.xml"] = ["linux/ioctl.h"]
+    stage.func(results)
+    assert found == [("a.xml",)]
+
+
+class HandlesEverything(probe.Device):
+    def ioctl(self, number, address):
+        return 0 if number & 0xFF < 0x10 else -errno.ENOTTY
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_concurrent_stages_show_progress(monkeypatch, compound_xml_files):
+    """ The coordinator, constants and probe stages overlap, only one of them gets a bar """
+    probe_device = probe.probe_device
+    monkeypatch.setattr(
+        probe,
+        "probe_device",
+        lambda path, commands: probe_device(path, commands, HandlesEverything()),
+    )
+    address = ("127.0.0.1", free_port())
+    options = api.RecoveryOptions(
+        source=".",
+        coordinator="%s:%s" % address,
+        probe="/dev/watchdog",
+        probe_handler="fop_ioctl",
+    )
+    workers = threading.Thread(target=worker.run, args=(address, 1), daemon=True)
+    workers.start()
+    values, _ = stages.run(
+        entry.recovery_stages(options), {"xml_files": compound_xml_files}, processes=1
+    )
+    workers.join(timeout=5)
+    assert len(values["fileop_structs"]) > 0
+    assert sum(len(commands) for commands in values["commands"].values()) > 0
+
+
+#################### PROBE ####################
+
+
+FILEOP_STRUCTS = (
+    {"function": "wdt_ioctl", "refid": "wdt"},
+    {"function": "other_ioctl", "refid": "other"},
+)
+GETSUPPORT = request.decode("WDIOC_GETSUPPORT", 0x80285700)
+OTHER = request.decode("OTHER_GET", 0x80046101)
+
+
+def test_probe_commands_only_the_handler(monkeypatch):
+    probed_with = list()
+
+    def probe_device(device, commands):
+        probed_with.extend(commands)
+        return probe.to_commands([0xC0045706])
+
+    monkeypatch.setattr(probe, "probe_device", probe_device)
+    commands = {"wdt": (GETSUPPORT,), "other": (OTHER,)}
+    merged = entry.probe_commands("/dev/watchdog", "wdt_ioctl", FILEOP_STRUCTS, commands)
+    assert probed_with == [GETSUPPORT]
+    assert [command.number for command in merged["wdt"]] == [0x80285700, 0xC0045706]
+    assert merged["other"] == (OTHER,)
+
+
+def test_probe_commands_unknown_handler(monkeypatch):
+    monkeypatch.setattr(probe, "probe_device", pytest.fail)
+    commands = {"wdt": (GETSUPPORT,)}
+    assert entry.probe_commands("/dev/watchdog", "fop_ioctl", FILEOP_STRUCTS, commands) is commands
@@ -0,0 +1,19 @@
+#include "example_clang_fs.h"
+
+struct wdt_info { unsigned int options; unsigned int fw; char identity[32]; };
+
+static long fop_ioctl(struct file *file, unsigned int cmd, unsigned long arg)
+{
+	return 0;
+}
+
+static int fop_open(struct file *f) { return 0; }
+
+#define MY_IOCTL fop_ioctl
+
+static const struct file_operations wdt_fops = {
+	.owner = 0,
+	.open = fop_open,
+	.unlocked_ioctl = MY_IOCTL,
+	.compat_ioctl = compat_ptr_ioctl,
+};
@@ -0,0 +1,8 @@
+struct file;
+struct file_operations {
+	void *owner;
+	long (*unlocked_ioctl) (struct file *, unsigned int, unsigned long);
+	long (*compat_ioctl) (struct file *, unsigned int, unsigned long);
+	int (*open) (struct file *);
+};
+long compat_ptr_ioctl(struct file *file, unsigned int cmd, unsigned long arg);
@@ -0,0 +1,102 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import time
+
+import pytest
+
+from skid.utils import admission, logs
+
+
+def timed_square(value):
+    start = time.monotonic()
+    time.sleep(0.02)
+    return value * value, start, time.monotonic()
+
+
+def fail_on_three(value):
+    if value == 3:
+        raise ZeroDivisionError(value)
+    return value
+
+
+class TextBar:
+    def __init__(self):
+        self.texts = list()
+
+    def text(self, message):
+        self.texts.append(message)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with logs.pool(4) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [("1048576", 1 << 20), ("512M", 512 << 20), ("8G", 8 << 30), ("1.5k", 1536), ("2GiB", 2 << 30)],
+)
+def test_parse_size(size, expected):
+    assert admission.parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        admission.parse_size("lots")
+
+
+def test_budget():
+    admission.set_budget(1 << 30)
+    try:
+        assert admission.get_budget() == 1 << 30
+    finally:
+        admission.set_budget(None)
+
+
+def test_estimator():
+    estimator = admission.FootprintEstimator(default_expansion=5)
+    assert estimator.estimate(1 << 20) == (5 << 20) + admission.FILE_OVERHEAD
+    # Small files and unmeasured footprints are ignored
+    estimator.observe(1024, 1 << 30)
+    estimator.observe(1 << 20, 0)
+    assert estimator.ratios == []
+
+    for ratio in (2, 3, 3, 4, 20):
+        estimator.observe(1 << 20, ratio * (1 << 20) + admission.FILE_OVERHEAD)
+    assert estimator.expansion == 20
+
+
+def test_imap_unordered(pool):
+    results = admission.imap(pool, timed_square, range(20), [1] * 20, budget=1 << 40)
+    assert sorted(result for result, _, _ in results) == [i * i for i in range(20)]
+
+
+def test_imap_ordered_chunks(pool):
+    results = admission.imap(
+        pool, timed_square, range(20), [1] * 20, ordered=True, chunksize=3, budget=1 << 40
+    )
+    assert [result for result, _, _ in results] == [i * i for i in range(20)]
+
+
+def test_imap_over_budget_runs_one_at_a_time(pool):
+    bar = TextBar()
+    results = list(admission.imap(pool, timed_square, range(6), [1 << 20] * 6, budget=1, bar=bar))
+    spans = sorted((start, end) for _, start, end in results)
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    assert len(bar.texts) == 6
+    assert bar.texts[-1].startswith("memory headroom -")
+
+
+def test_imap_within_budget_runs_in_parallel(pool):
+    results = list(admission.imap(pool, timed_square, range(8), [1] * 8, budget=1 << 40))
+    spans = sorted((start, end) for _, start, end in results)
+    assert any(next_start < end for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+
+def test_imap_raises(pool):
+    with pytest.raises(ZeroDivisionError):
+        list(admission.imap(pool, fail_on_three, range(6), [1] * 6))
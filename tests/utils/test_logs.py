@@ -0,0 +1,85 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import logging
+import os
+
+import pytest
+
+from skid.utils import logs
+
+logger = logging.getLogger(__name__)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = list()
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_from_worker(value):
+    logger.debug("debug %s from %s", value, os.getpid())
+    logger.info("info %s", value)
+    return os.getpid()
+
+
+@pytest.fixture
+def root_handler():
+    root = logging.getLogger("")
+    level = root.level
+    handler = ListHandler(logging.INFO)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    yield handler
+    root.removeHandler(handler)
+    root.setLevel(level)
+
+
+def test_worker_records_reach_the_parent(root_handler):
+    with logs.listening():
+        with logs.pool(2) as pool:
+            pids = set(pool.map(log_from_worker, range(8)))
+
+    messages = sorted(r.getMessage() for r in root_handler.records if r.name == __name__)
+    assert messages == [f"info {i}" for i in range(8)]
+    assert os.getpid() not in pids
+    assert {r.process for r in root_handler.records if r.name == __name__} <= pids
+
+
+def test_handled_level(root_handler):
+    root = logging.getLogger("")
+    others = [h for h in root.handlers if h is not root_handler]
+    for handler in others:
+        root.removeHandler(handler)
+    try:
+        assert logs.handled_level() == logging.INFO
+        root_handler.setLevel(logging.DEBUG)
+        assert logs.handled_level() == logging.DEBUG
+    finally:
+        for handler in others:
+            root.addHandler(handler)
+
+
+def test_pool_without_listener():
+    with logs.pool(1) as pool:
+        assert pool.map(abs, [-1, -2]) == [1, 2]
+
+
+def test_stop_listener_twice():
+    logs.start_listener()
+    logs.stop_listener()
+    logs.stop_listener()
+
+
+def test_listening_abandoned_on_error(root_handler):
+    with pytest.raises(ZeroDivisionError):
+        with logs.listening():
+            with logs.pool(2) as pool:
+                pool.map(log_from_worker, range(4))
+                raise ZeroDivisionError
+    assert logs._listener is None  # pylint: disable=protected-access
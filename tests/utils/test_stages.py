@@ -0,0 +1,153 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import threading
+import time
+
+import pytest
+
+from skid.utils import stages, utils
+from skid.utils.stages import Stage
+
+
+def sleep_then(value, seconds=0.2):
+    def func(**_):
+        time.sleep(seconds)
+        return value
+
+    return func
+
+
+def test_run_passes_values():
+    values, timings = stages.run(
+        [
+            Stage("add", lambda a, b: a + b, ("a", "b"), ("sum",)),
+            Stage("split", lambda sum: (sum, -sum), ("sum",), ("pos", "neg")),
+        ],
+        {"a": 1, "b": 2},
+    )
+    assert values == {"a": 1, "b": 2, "sum": 3, "pos": 3, "neg": -3}
+    assert [timing.name for timing in timings] == ["add", "split"]
+
+
+def test_run_independent_stages_concurrently():
+    start = time.perf_counter()
+    _, timings = stages.run(
+        [
+            Stage("one", sleep_then(1), outputs=("one",)),
+            Stage("two", sleep_then(2), outputs=("two",)),
+            Stage("three", sleep_then(3), outputs=("three",)),
+        ]
+    )
+    assert time.perf_counter() - start < 0.5
+    assert len(timings) == 3
+
+
+def test_run_waits_for_inputs():
+    _, timings = stages.run(
+        [
+            Stage("last", lambda first: first, ("first",)),
+            Stage("first", sleep_then(1), outputs=("first",)),
+        ]
+    )
+    first, last = sorted(timings, key=lambda timing: timing.start)
+    assert (first.name, last.name) == ("first", "last")
+    assert last.start >= first.end
+
+
+def test_run_shares_processes():
+    shares = dict()
+
+    def record(name):
+        def func(processes):
+            shares[name] = processes
+            time.sleep(0.1)
+
+        return func
+
+    stages.run(
+        [
+            Stage("serial", lambda: None),
+            Stage("a", record("a"), parallel=True),
+            Stage("b", record("b"), parallel=True),
+            Stage("c", record("c"), parallel=True),
+        ],
+        processes=8,
+    )
+    assert sorted(shares.values()) == [2, 3, 3]
+
+
+def test_run_waits_for_a_share():
+    running = list()
+    lock = threading.Lock()
+
+    def func(processes):
+        with lock:
+            running.append(processes)
+            assert len(running) == 1
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    _, timings = stages.run(
+        [Stage(str(i), func, parallel=True) for i in range(3)], processes=1
+    )
+    assert [timing.processes for timing in timings] == [1, 1, 1]
+
+
+def test_run_raises_after_running_stages_finish():
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.1)
+        finished.set()
+
+    def fail():
+        raise ZeroDivisionError()
+
+    with pytest.raises(ZeroDivisionError):
+        stages.run(
+            [
+                Stage("slow", slow),
+                Stage("fail", fail, outputs=("x",)),
+                Stage("never", lambda x: pytest.fail("Ran after a failure"), ("x",)),
+            ]
+        )
+    assert finished.is_set()
+
+
+@pytest.mark.parametrize(
+    "pipeline, message",
+    [
+        ([Stage("a", print, ("missing",))], "Nothing produces"),
+        ([Stage("a", print, outputs=("x",)), Stage("b", print, outputs=("x",))], "more than once"),
+        ([Stage("a", print, ("y",), ("x",)), Stage("b", print, ("x",), ("y",))], "cycle"),
+    ],
+)
+def test_check(pipeline, message):
+    with pytest.raises(stages.StageError, match=message):
+        stages.run(pipeline)
+
+
+def test_report():
+    lines = stages.report(
+        [stages.Timing("second", 1.0, 1.0, 2), stages.Timing("first", 0.0, 1.0, 0)]
+    )
+    assert lines[0].split() == ["stage", "start", "seconds", "procs"]
+    assert lines[1].startswith("first")
+    assert lines[2].startswith("second")
+    assert lines[1].endswith("|" + "#" * 20 + " " * 20 + "|")
+    assert lines[2].endswith("|" + " " * 20 + "#" * 20 + "|")
+
+
+def test_progress_bar_quiet_while_another_shows():
+    with utils.progress_bar(2, title="outer") as outer:
+        outer()
+        with utils.progress_bar(3, title="inner") as inner:
+            assert isinstance(inner, utils.QuietBar)
+            inner()
+            inner.text("ignored")
+        assert inner.count == 1
+        outer()
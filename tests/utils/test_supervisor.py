@@ -0,0 +1,191 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import faulthandler
+import json
+import os
+import queue
+import signal
+import time
+
+import pytest
+
+from skid.utils import admission, supervisor
+
+
+def square(value):
+    return value * value
+
+
+def hang_on_three(value):
+    if value == 3:
+        time.sleep(60)
+    return value
+
+
+def hang_on_file(xml_file):
+    if xml_file == "hang.xml":
+        time.sleep(60)
+    return xml_file
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def crash_on_three(value):
+    if value == 3:
+        faulthandler.disable()  # pytest's would print the workers stack
+        os.kill(os.getpid(), signal.SIGSEGV)
+    return value
+
+
+def fail_on_three(value):
+    if value == 3:
+        raise ZeroDivisionError(value)
+    return value
+
+
+@pytest.fixture(autouse=True)
+def quarantine():
+    supervisor.clear_quarantine()
+    yield
+    supervisor.clear_quarantine()
+
+
+def run(pool, func, values):
+    """ Submits every value and returns the outcome of each as (ok, result) """
+    done = queue.Queue()
+    for value in values:
+        pool.apply_async(
+            func,
+            (value,),
+            callback=lambda out, v=value: done.put((v, True, out)),
+            error_callback=lambda e, v=value: done.put((v, False, e)),
+        )
+    outcomes = dict()
+    for _ in values:
+        value, ok, out = done.get(timeout=30)
+        outcomes[value] = (ok, out)
+    return outcomes
+
+
+def test_results():
+    with supervisor.pool(2) as pool:
+        outcomes = run(pool, square, range(10))
+    assert outcomes == {value: (True, value * value) for value in range(10)}
+    assert pool.stats.tasks == 10
+    assert pool.stats.respawned == 0
+
+
+def test_exception_is_passed_back():
+    with supervisor.pool(2) as pool:
+        outcomes = run(pool, fail_on_three, range(5))
+    ok, error = outcomes[3]
+    assert not ok
+    assert isinstance(error, ZeroDivisionError)
+    assert supervisor.quarantined() == tuple()
+
+
+def test_timeout_quarantines_and_continues():
+    start = time.monotonic()
+    with supervisor.pool(2, timeout=0.5) as pool:
+        outcomes = run(pool, hang_on_three, range(8))
+    assert time.monotonic() - start < 10
+
+    ok, error = outcomes[3]
+    assert not ok
+    assert isinstance(error, supervisor.Quarantined)
+    assert error.task_args == (3,)
+    assert all(outcomes[value] == (True, value) for value in range(8) if value != 3)
+    assert pool.stats.killed == 1
+    assert pool.stats.respawned == 1
+
+    (entry,) = supervisor.quarantined()
+    assert "timed out" in entry.reason
+    assert entry.seconds >= 0.5
+
+
+def test_crash_quarantines_and_continues():
+    with supervisor.pool(2) as pool:
+        outcomes = run(pool, crash_on_three, range(8))
+    assert isinstance(outcomes[3][1], supervisor.Quarantined)
+    assert all(outcomes[value] == (True, value) for value in range(8) if value != 3)
+    assert pool.stats.crashed == 1
+
+    (entry,) = supervisor.quarantined()
+    assert entry.reason == "worker killed by SIGSEGV"
+
+
+def test_global_timeout():
+    supervisor.set_timeout(0.5)
+    try:
+        with supervisor.pool(1) as pool:
+            outcomes = run(pool, hang_on_three, [3, 4])
+    finally:
+        supervisor.set_timeout(None)
+    assert not outcomes[3][0]
+    assert outcomes[4] == (True, 4)
+    assert supervisor.get_timeout() == supervisor.DEFAULT_TIMEOUT
+
+
+def test_terminate_on_error():
+    with pytest.raises(KeyError):
+        with supervisor.pool(2) as pool:
+            pool.apply_async(hang_on_three, (3,))
+            raise KeyError()
+    assert all(not worker.process.is_alive() for worker in pool._workers)
+
+
+def test_admission_skips_quarantined():
+    with supervisor.pool(2, timeout=0.5) as pool:
+        results = list(admission.imap(pool, hang_on_three, range(6), [1] * 6, ordered=True))
+    assert results == [0, 1, 2, 4, 5]
+
+
+def test_admission_reports_files():
+    files = ["a.xml", "hang.xml", "b.xml"]
+    with supervisor.pool(2, timeout=0.5) as pool:
+        results = list(admission.imap(pool, hang_on_file, files, [1] * 3))
+    assert sorted(results) == ["a.xml", "b.xml"]
+    assert [entry.task for entry in supervisor.quarantined()] == ["hang.xml"]
+
+
+def test_weight_scales_the_deadline():
+    done = queue.Queue()
+    with supervisor.pool(1, timeout=0.5) as pool:
+        pool.apply_async(sleep_for, (1.0,), callback=done.put, error_callback=done.put, weight=4)
+    assert done.get(timeout=30) == 1.0
+    assert supervisor.quarantined() == ()
+
+
+def test_admission_reruns_quarantined_chunk():
+    files = ["a.xml", "b.xml", "hang.xml", "c.xml", "d.xml"]
+    with supervisor.pool(2, timeout=0.3) as pool:
+        results = list(
+            admission.imap(pool, hang_on_file, files, [1] * 5, ordered=True, chunksize=3)
+        )
+    assert results == ["a.xml", "b.xml", "c.xml", "d.xml"]
+    assert [entry.task for entry in supervisor.quarantined()] == ["hang.xml"]
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [(("a.xml",), "a.xml"), (([("a.xml", "fs.h")],), "a.xml, fs.h"), ((1,), "")],
+)
+def test_describe(args, expected):
+    assert supervisor.describe(args) == expected
+
+
+def test_write_report(tmp_path):
+    with supervisor.pool(1, timeout=0.5) as pool:
+        run(pool, hang_on_file, ["hang.xml"])
+    location = tmp_path / "quarantine.json"
+    supervisor.write_report(str(location))
+    with open(location) as report_f:
+        (entry,) = json.load(report_f)
+    assert entry["task"] == "hang.xml"
+    assert "timed out" in entry["reason"]
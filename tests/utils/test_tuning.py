@@ -0,0 +1,101 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import json
+import os
+
+import pytest
+
+from skid.utils import tuning
+
+
+@pytest.fixture
+def profile():
+    return tuning.Profile(
+        processes=4,
+        chunksizes={"constants": 2, "scan": 32},
+        doxygen={"NUM_PROC_THREADS": "4", "LOOKUP_CACHE_SIZE": "3"},
+        cpu_count=4,
+        worker_rss=64 << 20,
+    )
+
+
+@pytest.fixture
+def applied(profile):
+    tuning.apply(profile)
+    yield profile
+    tuning.apply(None)
+
+
+#################### PROFILE ####################
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"processes": 0},
+        {"processes": "4"},
+        {"processes": 1, "chunksizes": {"constants": 0}},
+        {"processes": 1, "chunksizes": {"xpath": 4}},
+        {"processes": 1, "doxygen": {"TAB_SIZE": "4"}},
+    ],
+)
+def test_profile_bad_values(kwargs):
+    with pytest.raises(ValueError):
+        tuning.Profile(**kwargs)
+
+
+def test_save_and_load(profile, temp_dir):
+    location = os.path.join(temp_dir, "tuned", "profile.json")
+    tuning.save(profile, location)
+    assert tuning.load(location) == profile
+
+
+def test_load_defaults(temp_file):
+    with open(temp_file, "w") as f:
+        json.dump({"processes": 2, "doxygen": {"LOOKUP_CACHE_SIZE": 3}}, f)
+    profile = tuning.load(temp_file)
+    assert profile.chunksizes == dict()
+    assert profile.doxygen == {"LOOKUP_CACHE_SIZE": "3"}
+    assert profile.cpu_count is None
+
+
+@pytest.mark.parametrize("content", ["Hello", "[1, 2]", '{"chunksizes": {}}', '{"processes": -1}'])
+def test_load_bad(temp_file, content):
+    with open(temp_file, "w") as f:
+        f.write(content)
+    with pytest.raises(ValueError):
+        tuning.load(temp_file)
+
+
+def test_load_missing():
+    with pytest.raises(ValueError):
+        tuning.load("/asdf/asdf/profile.json")
+
+
+#################### CURRENT PROFILE ####################
+
+
+def test_defaults_without_profile():
+    assert tuning.get_profile() is None
+    assert tuning.get_chunksize("constants", 8) == 8
+    assert tuning.doxygen_settings() == dict()
+
+
+def test_applied(applied):
+    assert tuning.get_profile() is applied
+    assert tuning.get_chunksize("constants", 8) == 2
+    assert tuning.get_chunksize("fingerprint", 64) == 64
+    assert tuning.doxygen_settings() == {"NUM_PROC_THREADS": "4", "LOOKUP_CACHE_SIZE": "3"}
+
+
+def test_doxygen_settings_copy(applied):
+    tuning.doxygen_settings()["NUM_PROC_THREADS"] = "1"
+    assert applied.doxygen["NUM_PROC_THREADS"] == "4"
+
+
+def test_unknown_chunksize():
+    with pytest.raises(AssertionError):
+        tuning.get_chunksize("xpath", 1)